@@ -38,6 +38,14 @@ app.register_blueprint(market_bp)
 app.register_blueprint(strategy_bp)
 app.register_blueprint(tv_udf_bp, url_prefix='/tv_udf')
 
+# 收盘后全A日线批量入库（次日扫描直接读本地日线历史）
+from eod_ingest import start_eod_ingest_scheduler
+start_eod_ingest_scheduler()
+
+# 每日数据库整理：过期缓存分批删除、历史数据归档、表空间回收
+from db_maintenance import start_maintenance_scheduler
+start_maintenance_scheduler()
+
 # ==================== AI 分析接口（保留在 app.py，与蓝图不冲突） ====================
 
 @app.route('/api/ai/config', methods=['GET'])
@@ -1311,7 +1319,7 @@ def _enrich_stocks_with_scan_data(structured: dict, all_stocks: list) -> dict:
         if code and code not in scan_map:
             codes_to_fetch.append(code)
 
-    # 用 akshare 实时查询涨跌幅
+    # 批量查询实时涨跌幅
     realtime_data = {}
     if codes_to_fetch:
         try:
@@ -1351,47 +1359,19 @@ def _enrich_stocks_with_scan_data(structured: dict, all_stocks: list) -> dict:
 
 def _fetch_realtime_quotes(codes: list) -> dict:
     """
-    用 akshare 实时查询股票现价和涨跌幅（并行，最多5秒超时）。
-    返回 {code: {current_price, change_pct}}
+    批量查询股票现价和涨跌幅（统一行情服务，一次批量请求）。
+    返回 {code: {current_price, change_pct}}，仅包含有效价格。
     """
     if not codes:
         return {}
 
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    import akshare as ak
-    import datetime
+    from utils.quote_service import get_quotes
 
     result = {}
-
-    def fetch_one(code: str) -> tuple:
-        try:
-            today = datetime.date.today()
-            start = (today - datetime.timedelta(days=5)).strftime('%Y%m%d')
-            end = today.strftime('%Y%m%d')
-            df = ak.stock_zh_a_hist(
-                symbol=code, period="daily",
-                start_date=start, end_date=end, adjust=""
-            )
-            if df is not None and not df.empty:
-                latest = df.iloc[-1]
-                return code, float(latest['收盘']), float(latest['涨跌幅'])
-        except Exception:
-            pass
-        return code, 0, 0
-
-    try:
-        with ThreadPoolExecutor(max_workers=min(len(codes), 10)) as pool:
-            futures = {pool.submit(fetch_one, c): c for c in codes}
-            for f in as_completed(futures, timeout=5):
-                try:
-                    code, price, chg = f.result()
-                    if code:
-                        result[code] = {'current_price': price, 'change_pct': chg}
-                except Exception:
-                    pass
-    except Exception:
-        pass
-
+    for code, q in get_quotes(codes).items():
+        price = q.get('close')
+        if price and price > 0:
+            result[code] = {'current_price': price, 'change_pct': q.get('pct_change') or 0}
     return result
 
 
@@ -1409,47 +1389,13 @@ def _normalize_stock_chg(s: dict):
 
 def _fetch_realtime_quotes_safe(codes: list) -> dict:
     """
-    用 akshare 批量实时查询股票现价和涨跌幅（安全版，最多8秒超时）。
+    批量查询股票现价和涨跌幅（安全版，异常时返回空字典）。
     返回 {code: {current_price, change_pct}}
     """
-    if not codes:
-        return {}
-
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    import akshare as ak
-    import datetime as dt
-
-    result = {}
-
-    def fetch_one(code: str) -> tuple:
-        try:
-            today = dt.date.today()
-            start = (today - dt.timedelta(days=5)).strftime('%Y%m%d')
-            end = today.strftime('%Y%m%d')
-            df = ak.stock_zh_a_hist(
-                symbol=code, period="daily",
-                start_date=start, end_date=end, adjust=""
-            )
-            if df is not None and not df.empty:
-                latest = df.iloc[-1]
-                return code, float(latest['收盘']), float(latest['涨跌幅'])
-        except Exception:
-            pass
-        return code, 0, 0
-
     try:
-        with ThreadPoolExecutor(max_workers=min(len(codes), 10)) as pool:
-            futures = {pool.submit(fetch_one, c): c for c in codes}
-            for f in as_completed(futures, timeout=8):
-                try:
-                    code, price, chg = f.result()
-                    if code and price > 0:
-                        result[code] = {'current_price': price, 'change_pct': chg}
-                except Exception:
-                    pass
+        return _fetch_realtime_quotes(codes)
     except Exception:
-        pass
-    return result
+        return {}
 
 
 def _format_scan_data_for_agent(all_stocks):
@@ -1682,7 +1628,7 @@ def api_delete_holding(code):
 def api_get_agent_performance(agent_id):
     """计算 Agent 胜率与收益率（基于历史分析持仓快照）"""
     try:
-        records = db.get_agent_analysis_history(agent_id, limit=30)
+        records = db.get_agent_analysis_history(agent_id, limit=30, fields=('holdings_snapshot',))
         if not records:
             return jsonify({'success': True, 'data': {'winRate': 0, 'returnPct': 0, 'analysisCount': 0}})
 
@@ -1762,10 +1708,22 @@ def api_get_latest_agent_analysis(agent_id):
 
 @app.route('/api/agents/<agent_id>/analysis/history', methods=['GET'])
 def api_get_agent_analysis_history(agent_id):
-    """获取某 Agent 所有历史分析记录"""
+    """
+    获取某 Agent 历史分析记录（键集分页）。
+
+    Query params:
+        limit   每页条数（默认 10，最大 100）
+        before  上一页返回的 next_before（report_date），不传为第一页
+        fields  投影 meta / list / full（默认 list：不含原始返回与思考过程，
+                需要时按 id 调 /analysis/<id>/<field> 单独取）
+    """
     try:
-        limit = request.args.get('limit', 10, type=int)
-        records = db.get_agent_analysis_history(agent_id, limit=limit)
+        limit = max(1, min(100, request.args.get('limit', 10, type=int)))
+        before = request.args.get('before') or None
+        fields = request.args.get('fields', 'list')
+        if fields not in db.AGENT_HISTORY_PROJECTIONS:
+            return jsonify({'success': False, 'error': f'fields 仅支持 {list(db.AGENT_HISTORY_PROJECTIONS)}'}), 400
+        records = db.get_agent_analysis_history(agent_id, limit=limit, before=before, fields=fields)
         for record in records:
             # holdings_snapshot 字段映射：数据库 → Vue 期望
             if record.get('holdings_snapshot'):
@@ -1779,13 +1737,29 @@ def api_get_agent_analysis_history(agent_id):
                     }
                     for h in record['holdings_snapshot']
                 ]
-        return jsonify({'success': True, 'data': records})
+        next_before = records[-1]['report_date'] if len(records) == limit else None
+        return jsonify({'success': True, 'data': records, 'next_before': next_before})
     except Exception as e:
         import traceback
         logging.error(f"获取 Agent 分析历史失败 [{agent_id}]: {e}\n{traceback.format_exc()}")
         return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
 
 
+@app.route('/api/agents/<agent_id>/analysis/<int:record_id>/<field>', methods=['GET'])
+def api_get_agent_analysis_blob(agent_id, record_id, field):
+    """按需获取单条分析记录的大字段：raw_response_text / thinking_text / analysis_result / holdings_snapshot"""
+    if field not in db.AGENT_HISTORY_BLOBS:
+        return jsonify({'success': False, 'error': f'field 仅支持 {list(db.AGENT_HISTORY_BLOBS)}'}), 400
+    try:
+        record = db.get_agent_analysis_blob(agent_id, record_id, field)
+        if record is None:
+            return jsonify({'success': False, 'error': '未找到该分析记录'}), 404
+        return jsonify({'success': True, 'data': record.get(field)})
+    except Exception as e:
+        logging.error(f"获取分析记录字段失败 [{agent_id}/{record_id}/{field}]: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/agents/<agent_id>/holdings', methods=['GET'])
 def api_get_agent_holdings(agent_id):
     """
@@ -1796,7 +1770,7 @@ def api_get_agent_holdings(agent_id):
         import datetime as dt
 
         # 1. 取最新分析快照
-        latest = db.get_latest_agent_analysis(agent_id)
+        latest = db.get_latest_agent_analysis(agent_id, fields='list')
         snap = latest.get('holdings_snapshot') if latest else None
         ar = (latest or {}).get('analysis_result') or {}
 
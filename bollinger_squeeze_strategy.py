@@ -23,11 +23,12 @@ import logging
 
 # 导入重试工具
 from utils.retry import retry_request
+from utils.data_replay import wrap_akshare
 
 # Lazy import of akshare to avoid py_mini_racer crash on import
 def _get_ak():
     import akshare as _ak
-    return _ak
+    return wrap_akshare(_ak)
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -3,15 +3,33 @@
 """
 统一缓存层
 - 优先使用 Redis（跨进程、跨 worker 共享）
+- Redis 前加一层进程内 L1 LRU（短 TTL），热点 key 直接从内存返回，免去 Redis 往返与 JSON 解码
+- L1 一致性：set / delete / invalidate 经 Redis pub/sub 广播，各 worker 丢弃对应 L1 条目；
+  订阅断开期间 L1 的短 TTL 兜底（最多陈旧 L1 TTL 秒）
 - Redis 不可用时自动降级为进程内 dict（TTL 精确，不影响功能）
+- cached(..., swr=N)：过期后 N 秒内先返回旧值，后台单飞刷新（stale-while-revalidate）
+- Redis 中的 key 带命名空间版本（'junge/kline:600000' → 'junge:v0.3/kline:600000'），
+  invalidate('junge/') 只需一次 INCR，旧版本 key 随 TTL 自然过期，不再 SCAN / FLUSHDB
+- 值经 utils.cache_codec 编码（msgpack / orjson + 可选压缩，DataFrame / ndarray 按列存），
+  可直接缓存 DataFrame；旧的 JSON 条目照常读取
+- route_cached 按白名单查询参数分 key，缓存序列化好的响应 body + ETag，If-None-Match 命中返回 304
 - 业务层只需调用 get / set / invalidate，不关心底层实现
+
+注意：L1 / 降级 dict 命中时返回的是同一个对象，调用方不要原地修改返回值。
 """
 
+import hashlib
 import json
+import os
+import threading
 import time
 import logging
+import uuid
+from collections import OrderedDict
 from typing import Any, Optional, Callable
 
+from utils.cache_codec import encode as _encode, decode as _decode
+
 logger = logging.getLogger(__name__)
 
 # ─── 底层驱动 ────────────────────────────────────────────────────────────────
@@ -37,11 +55,12 @@ def _init_redis():
             host=host, port=port, password=password or None, db=db,
             socket_connect_timeout=2,
             socket_timeout=3,
-            decode_responses=True,
+            decode_responses=False,   # 值为二进制编码，见 utils.cache_codec
         )
         _redis.ping()
         _redis_available = True
         logger.info('[Cache] Redis connected: %s:%d', host, port)
+        _start_l1_listener()
     except Exception as e:
         _redis = None
         _redis_available = False
@@ -49,58 +68,538 @@ def _init_redis():
     return _redis_available
 
 
-# ─── 进程内 dict 降级缓存 ─────────────────────────────────────────────────────
+# ─── 进程内降级缓存（有界 LRU + TTL） ────────────────────────────────────────
+
+MEM_MAX_ENTRIES = int(os.environ.get('CACHE_MEM_MAX_ENTRIES', 10000))
+MEM_MAX_BYTES = int(os.environ.get('CACHE_MEM_MAX_BYTES', 256 * 1024 * 1024))
+MEM_SWEEP_INTERVAL = float(os.environ.get('CACHE_MEM_SWEEP_INTERVAL', 30))
+
+
+def _prefix_bucket(key: str) -> str:
+    """前缀索引桶：key 的第一段（'junge/kline:600000' → 'junge'）。"""
+    return key.split('/', 1)[0]
+
+
+class _BoundedMemCache:
+    """
+    Redis 不可用时的降级缓存：条目数 + 近似字节数双上限的 LRU，带 TTL。
+    - 读到过期条目即删；后台线程定期清扫未被再次读取的过期条目
+    - 按 key 第一段建前缀索引，invalidate(prefix) 只扫描对应桶
+    - 字节数取写入时的编码长度（近似值）
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: 'OrderedDict[str, tuple[Any, float, int]]' = OrderedDict()
+        self._index: dict[str, dict] = {}   # 桶 → {key: None}（模块内 set 被缓存 API 占用）
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+        self._sweeper_started = False
+
+    # 以下 _xxx_locked 方法需在持锁时调用
+    def _remove_locked(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        bucket = self._index.get(_prefix_bucket(key))
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._index[_prefix_bucket(key)]
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_entry(key)[0]
+
+    def get_entry(self, key: str) -> tuple[Optional[Any], float]:
+        """返回 (值, 过期时间戳)；未命中 / 已过期返回 (None, 0)。"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, 0
+            if time.time() > entry[1]:
+                self._remove_locked(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None, 0
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0], entry[1]
 
-_mem: dict[str, tuple[Any, float]] = {}   # key → (value, expire_ts)
+    def set(self, key: str, value: Any, ttl: float, size: int):
+        with self._lock:
+            self._remove_locked(key)
+            self._data[key] = (value, time.time() + ttl, size)
+            self._bytes += size
+            self._index.setdefault(_prefix_bucket(key), {})[key] = None
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove_locked(oldest)
+                self._stats['evictions'] += 1
+        self._ensure_sweeper()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove_locked(key)
+
+    def invalidate(self, prefix: Optional[str] = None):
+        with self._lock:
+            if prefix is None:
+                self._data.clear()
+                self._index.clear()
+                self._bytes = 0
+                return
+            bucket = _prefix_bucket(prefix)
+            if '/' in prefix:
+                candidates = list(self._index.get(bucket, ()))
+            else:
+                # 前缀不含 '/' 时可能跨越多个桶（如 'jun' 同时匹配 'junge' 桶）
+                candidates = [k for b, keys in self._index.items() if b.startswith(prefix) for k in keys]
+            for k in candidates:
+                if k.startswith(prefix):
+                    self._remove_locked(k)
+
+    def sweep(self) -> int:
+        """清除全部过期条目，返回清除数量。"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp, _) in self._data.items() if now > exp]
+            for k in expired:
+                self._remove_locked(k)
+            self._stats['expired'] += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                **self._stats,
+            }
+
+    def _ensure_sweeper(self):
+        if self._sweeper_started:
+            return
+        self._sweeper_started = True
+
+        def _run():
+            while True:
+                time.sleep(MEM_SWEEP_INTERVAL)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.debug('[Cache] mem sweep failed: %s', e)
+
+        threading.Thread(target=_run, daemon=True, name='cache-mem-sweeper').start()
+
+
+_mem = _BoundedMemCache(MEM_MAX_ENTRIES, MEM_MAX_BYTES)
 
 
 def _mem_get(key: str) -> Optional[Any]:
     """内存缓存读取，过期返回 None。"""
-    entry = _mem.get(key)
-    if entry is None:
-        return None
-    value, expire_ts = entry
-    if time.time() > expire_ts:
-        _mem.pop(key, None)
-        return None
-    return value
+    return _mem.get(key)
 
 
-def _mem_set(key: str, value: Any, ttl: int):
-    """内存缓存写入，TTL 秒。"""
-    _mem[key] = (value, time.time() + ttl)
+def _mem_set(key: str, value: Any, ttl: int, size: int = 0):
+    """内存缓存写入，TTL 秒；size 为近似字节数。"""
+    _mem.set(key, value, ttl, size)
 
 
 def _mem_invalidate(prefix: Optional[str] = None):
     """内存缓存清除。prefix=None 时清全部。"""
-    global _mem
-    if prefix is None:
-        _mem = {}
-    else:
-        _mem = {k: v for k, v in _mem.items() if not k.startswith(prefix)}
+    _mem.invalidate(prefix)
+
+
+
+
+# ─── L1：Redis 前的进程内 LRU ──────────────────────────────────────────────────
+
+L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES', 2048))
+L1_DEFAULT_TTL = float(os.environ.get('CACHE_L1_TTL', 2))
+
+# 按前缀覆盖 L1 TTL（秒，最长匹配优先；0 表示该前缀不进 L1）。实际 TTL 不超过 key 自身 TTL。
+L1_TTL_RULES: dict[str, float] = {
+    'market/': 5,
+    'scan/': 5,
+}
+
+_L1_CHANNEL = 'cache:l1:invalidate'
+_L1_ORIGIN = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+# key → (值, L1 过期时间戳, key 本身的过期时间戳)；后者供 swr 判断新鲜度
+_l1: 'OrderedDict[str, tuple[Any, float, float]]' = OrderedDict()
+_l1_lock = threading.Lock()
+_l1_listener_started = False
+
+
+def _l1_ttl_for(key: str, ttl: float) -> float:
+    best, best_len = L1_DEFAULT_TTL, -1
+    for prefix, rule_ttl in L1_TTL_RULES.items():
+        if key.startswith(prefix) and len(prefix) > best_len:
+            best, best_len = rule_ttl, len(prefix)
+    return min(best, ttl)
+
+
+def _l1_get(key: str) -> tuple[Optional[Any], float]:
+    """返回 (值, key 过期时间戳)；未命中返回 (None, 0)。"""
+    with _l1_lock:
+        entry = _l1.get(key)
+        if entry is None:
+            return None, 0
+        value, expire_ts, key_expire_ts = entry
+        if time.time() > expire_ts:
+            del _l1[key]
+            return None, 0
+        _l1.move_to_end(key)
+        return value, key_expire_ts
+
+
+def _l1_set(key: str, value: Any, ttl: float):
+    l1_ttl = _l1_ttl_for(key, ttl)
+    if l1_ttl <= 0:
+        return
+    now = time.time()
+    with _l1_lock:
+        _l1[key] = (value, now + l1_ttl, now + ttl)
+        _l1.move_to_end(key)
+        while len(_l1) > L1_MAX_ENTRIES:
+            _l1.popitem(last=False)
+
+
+def _l1_drop(key: Optional[str] = None, prefix: Optional[str] = None):
+    """丢弃 L1 条目：key 精确匹配；prefix 前缀匹配；两者都为 None 时清空。"""
+    with _l1_lock:
+        if key is not None:
+            _l1.pop(key, None)
+        elif prefix is not None:
+            for k in [k for k in _l1 if k.startswith(prefix)]:
+                del _l1[k]
+        else:
+            _l1.clear()
+
+
+def _l1_publish(key: Optional[str] = None, prefix: Optional[str] = None, **extra):
+    """广播失效消息，其他 worker 的 L1 随之丢弃（本进程已同步丢弃）。extra 随消息附带（如命名空间新版本）。"""
+    try:
+        _redis.publish(_L1_CHANNEL, json.dumps({'o': _L1_ORIGIN, 'k': key, 'p': prefix, **extra}))
+    except Exception as e:
+        logger.debug('[Cache] L1 publish failed: %s', e)
+
+
+def _l1_apply(raw: Any):
+    """处理一条失效广播（本进程发出的忽略）。"""
+    try:
+        data = json.loads(raw or '{}')
+    except Exception:
+        return
+    if data.get('o') == _L1_ORIGIN:
+        return
+    if data.get('ns') is not None:
+        _ns_remember(data['ns'], data.get('v') or 0)
+    if data.get('ks'):
+        for k in data['ks']:
+            _l1_drop(key=k)
+        return
+    _l1_drop(key=data.get('k'), prefix=data.get('p'))
+
+
+def _l1_listen(client: Any):
+    """
+    订阅失效频道并逐条处理，直到连接出错（异常上抛）。
+    用 get_message(timeout) 轮询而非 listen()：共享连接池带 socket_timeout，
+    listen() 在频道空闲超过该时长时会读超时，被误当成断线。
+    """
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(_L1_CHANNEL)
+        while True:
+            msg = pubsub.get_message(timeout=1.0)
+            if msg is not None:
+                _l1_apply(msg.get('data'))
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+
+def _start_l1_listener():
+    """后台订阅失效频道；真正断线时清空 L1 与命名空间版本并重连（错过的消息由清空兜底）。"""
+    global _l1_listener_started
+    if _l1_listener_started:
+        return
+    _l1_listener_started = True
+
+    def _run():
+        import redis
+        while True:
+            try:
+                _l1_listen(_redis)
+            except (redis.ConnectionError, redis.TimeoutError, OSError) as e:
+                logger.info('[Cache] L1 listener disconnected, flushing L1: %s', e)
+                _l1_drop()
+                _ns_forget()
+            except Exception as e:
+                logger.warning('[Cache] L1 listener error: %s', e)
+            time.sleep(1)
+
+    threading.Thread(target=_run, daemon=True, name='cache-l1-listener').start()
+
+
+# ─── 命名空间版本 ──────────────────────────────────────────────────────────────
+#
+# 命名空间 = key 的第一段（同 _prefix_bucket）。Redis 中实际 key 为 '{ns}:v{全局代数}.{命名空间版本}/{其余}'，
+# 版本计数器为 nsver:{ns}（全局代数 nsver:*，供 invalidate(None)）。本进程缓存版本号 NS_VERSION_TTL 秒，
+# 其他 worker 的 INCR 经 L1 失效频道即时同步；订阅断开时最多沿用旧版本 NS_VERSION_TTL 秒。
+
+NS_VERSION_TTL = float(os.environ.get('CACHE_NS_VERSION_TTL', 2))
+_NS_ALL = '*'
+
+_ns_versions: dict[str, tuple[int, float]] = {}   # ns → (版本, 读取时间)
+_ns_lock = threading.Lock()
+
+
+def _ns_remember(ns: str, version: int):
+    """记录命名空间版本；只前进不后退（乱序到达的旧广播忽略）。"""
+    with _ns_lock:
+        current = _ns_versions.get(ns)
+        if current is None or int(version) >= current[0]:
+            _ns_versions[ns] = (int(version), time.time())
+
+
+def _ns_forget():
+    with _ns_lock:
+        _ns_versions.clear()
+
+
+def _ns_version(ns: str) -> str:
+    """'{全局代数}.{命名空间版本}'；本地缓存过期时一次 MGET 取回两个计数器。"""
+    now = time.time()
+    with _ns_lock:
+        g, n = _ns_versions.get(_NS_ALL), _ns_versions.get(ns)
+    if g is None or n is None or now - g[1] > NS_VERSION_TTL or now - n[1] > NS_VERSION_TTL:
+        try:
+            raw_g, raw_n = _redis.mget(f'nsver:{_NS_ALL}', f'nsver:{ns}')
+            g, n = (int(raw_g or 0), now), (int(raw_n or 0), now)
+            with _ns_lock:
+                _ns_versions[_NS_ALL], _ns_versions[ns] = g, n
+        except Exception as e:
+            logger.debug('[Cache] namespace version %s failed: %s', ns, e)
+            g, n = g or (0, now), n or (0, now)
+    return f'{g[0]}.{n[0]}'
+
+
+def _redis_key(key: str) -> str:
+    """逻辑 key → Redis 中带命名空间版本的 key。"""
+    ns, _, rest = key.partition('/')
+    return f'{ns}:v{_ns_version(ns)}/{rest}'
+
+
+def _bump_namespace(ns: str) -> int:
+    """INCR 命名空间版本（ns=_NS_ALL 时为全局代数），返回新版本。"""
+    version = int(_redis.incr(f'nsver:{ns}'))
+    _ns_remember(ns, version)
+    return version
+
+
+def _namespace_of_prefix(prefix: str) -> Optional[str]:
+    """prefix 恰好是整个命名空间（'junge/'）时返回 'junge'，否则 None。"""
+    ns, sep, rest = prefix.partition('/')
+    return ns if sep and not rest and ns else None
+
+
+# ─── 观测指标（按命名空间） ───────────────────────────────────────────────────
+#
+# 每个命名空间（key 第一段）累计：命中（L1 / Redis / 降级内存）、未命中、swr 陈旧返回、Redis 异常、
+# 读写字节数（编码后）、get / set 耗时直方图。进程内累计，重启清零；多 worker 时各自统计。
+
+_LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+_COUNTER_FIELDS = ('hits_l1', 'hits_redis', 'hits_memory', 'misses', 'stale',
+                   'sets', 'deletes', 'redis_errors', 'bytes_read', 'bytes_written')
+
+_metrics: dict[str, dict] = {}
+_metrics_lock = threading.Lock()
+
+
+def _new_ns_metrics() -> dict:
+    m = {f: 0 for f in _COUNTER_FIELDS}
+    for op in ('get', 'set'):
+        m[f'{op}_latency'] = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0,
+                              'buckets': [0] * (len(_LATENCY_BUCKETS_MS) + 1)}
+    return m
+
+
+def _record(key: str, op: Optional[str] = None, elapsed_ms: Optional[float] = None, **counts):
+    """累计一次操作：counts 为计数增量；op='get'|'set' 时同时记录耗时。"""
+    ns = _prefix_bucket(key)
+    with _metrics_lock:
+        m = _metrics.get(ns)
+        if m is None:
+            m = _metrics[ns] = _new_ns_metrics()
+        for field, n in counts.items():
+            m[field] += n
+        if op is not None and elapsed_ms is not None:
+            lat = m[f'{op}_latency']
+            lat['count'] += 1
+            lat['sum_ms'] += elapsed_ms
+            lat['max_ms'] = max(lat['max_ms'], elapsed_ms)
+            idx = next((i for i, b in enumerate(_LATENCY_BUCKETS_MS) if elapsed_ms <= b), len(_LATENCY_BUCKETS_MS))
+            lat['buckets'][idx] += 1
+
+
+def _metrics_snapshot() -> dict:
+    with _metrics_lock:
+        return {ns: {**m, **{f'{op}_latency': dict(m[f'{op}_latency'], buckets=list(m[f'{op}_latency']['buckets']))
+                             for op in ('get', 'set')}}
+                for ns, m in _metrics.items()}
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _latency_summary(lat: dict) -> dict:
+    """直方图 → count / avg / max / 近似 p50、p95（取所在桶上界）。"""
+    count = lat['count']
+
+    def _quantile(q: float) -> Optional[float]:
+        if not count:
+            return None
+        target, seen = q * count, 0
+        for i, n in enumerate(lat['buckets']):
+            seen += n
+            if seen >= target:
+                return _LATENCY_BUCKETS_MS[i] if i < len(_LATENCY_BUCKETS_MS) else lat['max_ms']
+        return lat['max_ms']
+
+    return {
+        'count': count,
+        'avg_ms': round(lat['sum_ms'] / count, 3) if count else None,
+        'max_ms': round(lat['max_ms'], 3),
+        'p50_ms': _quantile(0.5),
+        'p95_ms': _quantile(0.95),
+    }
+
+
+def namespace_stats() -> dict:
+    """
+    各命名空间的缓存效果：命中率、命中来源、陈旧返回、Redis 异常、平均读写字节数与耗时。
+    用于按数据调整 TTL / swr：命中率低且 set 频繁 → TTL 偏短；stale 多 → swr 窗口在起作用。
+    """
+    result = {}
+    for ns, m in sorted(_metrics_snapshot().items()):
+        hits = m['hits_l1'] + m['hits_redis'] + m['hits_memory']
+        lookups = hits + m['misses']
+        result[ns] = {
+            **{f: m[f] for f in _COUNTER_FIELDS},
+            'hits': hits,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'avg_bytes_read': round(m['bytes_read'] / m['hits_redis']) if m['hits_redis'] else None,
+            'avg_bytes_written': round(m['bytes_written'] / m['sets']) if m['sets'] else None,
+            'get_latency': _latency_summary(m['get_latency']),
+            'set_latency': _latency_summary(m['set_latency']),
+        }
+    return result
+
+
+def prometheus_metrics(prefix: str = 'facstock_cache') -> str:
+    """按命名空间的指标，Prometheus 文本格式。"""
+    snapshot = _metrics_snapshot()
+    lines = [
+        f'# HELP {prefix}_lookups_total Cache lookups by namespace and result',
+        f'# TYPE {prefix}_lookups_total counter',
+    ]
+    for ns, m in sorted(snapshot.items()):
+        for result, field in (('hit_l1', 'hits_l1'), ('hit_redis', 'hits_redis'),
+                              ('hit_memory', 'hits_memory'), ('miss', 'misses'), ('stale', 'stale')):
+            lines.append(f'{prefix}_lookups_total{{namespace="{ns}",result="{result}"}} {m[field]}')
+
+    for name, field, help_text in (
+        ('sets_total', 'sets', 'Cache writes'),
+        ('deletes_total', 'deletes', 'Cache deletes'),
+        ('redis_errors_total', 'redis_errors', 'Redis command failures'),
+        ('read_bytes_total', 'bytes_read', 'Encoded bytes read from Redis'),
+        ('written_bytes_total', 'bytes_written', 'Encoded bytes written'),
+    ):
+        lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} counter']
+        for ns, m in sorted(snapshot.items()):
+            lines.append(f'{prefix}_{name}{{namespace="{ns}"}} {m[field]}')
+
+    lines += [f'# HELP {prefix}_op_duration_seconds Cache get/set latency',
+              f'# TYPE {prefix}_op_duration_seconds histogram']
+    for ns, m in sorted(snapshot.items()):
+        for op in ('get', 'set'):
+            lat = m[f'{op}_latency']
+            labels = f'namespace="{ns}",op="{op}"'
+            cumulative = 0
+            for bound, n in zip(_LATENCY_BUCKETS_MS, lat['buckets']):
+                cumulative += n
+                lines.append(f'{prefix}_op_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'{prefix}_op_duration_seconds_bucket{{{labels},le="+Inf"}} {lat["count"]}')
+            lines.append(f'{prefix}_op_duration_seconds_sum{{{labels}}} {lat["sum_ms"] / 1000:.6f}')
+            lines.append(f'{prefix}_op_duration_seconds_count{{{labels}}} {lat["count"]}')
+    return '\n'.join(lines) + '\n'
 
 
 # ─── 统一缓存 API ─────────────────────────────────────────────────────────────
 
-import os
 
-def get(key: str) -> Optional[Any]:
+def _get_entry(key: str) -> tuple[Optional[Any], float]:
     """
-    读取缓存。
-    - Redis 可用 → Redis GET
-    - 降级 → 进程内 dict
+    读取缓存及其剩余 TTL（秒）。未命中返回 (None, 0)；Redis 中无过期时间的 key 剩余 TTL 为 inf。
     """
     _init_redis()
+    start = time.perf_counter()
 
     if _redis_available:
+        hit, expire_ts = _l1_get(key)
+        if hit is not None:
+            _record(key, 'get', _elapsed_ms(start), hits_l1=1)
+            return hit, expire_ts - time.time()
         try:
-            raw = _redis.get(key)
+            rkey = _redis_key(key)
+            pipe = _redis.pipeline(transaction=False)
+            pipe.get(rkey)
+            pipe.ttl(rkey)
+            raw, remaining = pipe.execute()
             if raw is not None:
-                return json.loads(raw)
+                value = _decode(raw)
+                _record(key, 'get', _elapsed_ms(start), hits_redis=1, bytes_read=len(raw))
+                if remaining and remaining > 0:
+                    _l1_set(key, value, remaining)
+                    return value, remaining
+                return value, float('inf')
         except Exception as e:
+            _record(key, redis_errors=1)
             logger.warning('[Cache] Redis GET %s failed: %s', key, e)
 
-    return _mem_get(key)
+    value, expire_ts = _mem.get_entry(key)
+    if value is not None:
+        _record(key, 'get', _elapsed_ms(start), hits_memory=1)
+        return value, expire_ts - time.time()
+    _record(key, 'get', _elapsed_ms(start), misses=1)
+    return None, 0
+
+
+def get_with_ttl(key: str) -> tuple[Optional[Any], float]:
+    """读取缓存及其剩余 TTL（秒）；未命中返回 (None, 0)。返回值与 get 相同为共享对象，不要原地修改。"""
+    return _get_entry(key)
+
+
+def get(key: str) -> Optional[Any]:
+    """
+    读取缓存。
+    - Redis 可用 → L1 命中直接返回，否则 Redis GET（同时取剩余 TTL）并回填 L1
+    - 降级 → 进程内 dict
+    """
+    return _get_entry(key)[0]
 
 
 def set(key: str, value: Any, ttl: int = 60):
@@ -110,50 +609,187 @@ def set(key: str, value: Any, ttl: int = 60):
     - 降级 → 进程内 dict
     """
     _init_redis()
+    start = time.perf_counter()
 
-    payload = json.dumps(value, ensure_ascii=False)
+    payload = _encode(value)
 
     if _redis_available:
         try:
-            _redis.setex(key, ttl, payload)
+            _redis.setex(_redis_key(key), ttl, payload)
+            _l1_set(key, value, ttl)
+            _l1_publish(key=key)
+            _record(key, 'set', _elapsed_ms(start), sets=1, bytes_written=len(payload))
             return
         except Exception as e:
+            _record(key, redis_errors=1)
             logger.warning('[Cache] Redis SET %s failed: %s', key, e)
 
-    _mem_set(key, value, ttl)
+    _mem_set(key, value, ttl, len(payload))
+    _record(key, 'set', _elapsed_ms(start), sets=1, bytes_written=len(payload))
 
 
 def delete_key(key: str):
     """删除单个 key（Redis 与内存降级缓存）。"""
     _init_redis()
+    _record(key, deletes=1)
     if _redis_available:
         try:
-            _redis.delete(key)
+            _redis.delete(_redis_key(key))
         except Exception as e:
+            _record(key, redis_errors=1)
             logger.warning('[Cache] Redis DELETE %s failed: %s', key, e)
-    _mem.pop(key, None)
+        _l1_drop(key=key)
+        _l1_publish(key=key)
+    _mem.delete(key)
+
+
+def get_many(keys: list) -> dict:
+    """
+    批量读取缓存，返回 {key: value}（未命中的 key 不在结果中）。
+    - Redis 可用 → 先查 L1，剩余 key 一个 pipeline（GET + TTL）一次往返取回并回填 L1
+    - 降级 → 进程内 dict
+    指标：命中 / 未命中按 key 计；耗时按整批计一次（记在第一个 key 的命名空间）。
+    """
+    _init_redis()
+    start = time.perf_counter()
+    result = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        if _redis_available:
+            hit, _ = _l1_get(key)
+            if hit is not None:
+                result[key] = hit
+                _record(key, hits_l1=1)
+                continue
+        missing.append(key)
+    if not missing:
+        if result:
+            _record(next(iter(result)), 'get', _elapsed_ms(start))
+        return result
+
+    if _redis_available:
+        try:
+            pipe = _redis.pipeline(transaction=False)
+            for key in missing:
+                rkey = _redis_key(key)
+                pipe.get(rkey)
+                pipe.ttl(rkey)
+            replies = pipe.execute()
+            for i, key in enumerate(missing):
+                raw, remaining = replies[2 * i], replies[2 * i + 1]
+                if raw is None:
+                    _record(key, misses=1)
+                    continue
+                value = _decode(raw)
+                _record(key, hits_redis=1, bytes_read=len(raw))
+                if remaining and remaining > 0:
+                    _l1_set(key, value, remaining)
+                result[key] = value
+            _record(missing[0], 'get', _elapsed_ms(start))
+            return result
+        except Exception as e:
+            _record(missing[0], redis_errors=1)
+            logger.warning('[Cache] Redis GET many (%d keys) failed: %s', len(missing), e)
+
+    for key in missing:
+        value = _mem_get(key)
+        if value is not None:
+            result[key] = value
+            _record(key, hits_memory=1)
+        else:
+            _record(key, misses=1)
+    _record(missing[0], 'get', _elapsed_ms(start))
+    return result
+
+
+def set_many(items: dict, ttl: int = 60):
+    """
+    批量写入缓存（同一 TTL）。
+    - Redis 可用 → 一个 pipeline 完成全部 SETEX 与 L1 失效广播
+    - 降级 → 进程内 dict
+    """
+    if not items:
+        return
+    _init_redis()
+    start = time.perf_counter()
+    payloads = {key: _encode(value) for key, value in items.items()}
+    for key, payload in payloads.items():
+        _record(key, sets=1, bytes_written=len(payload))
+    first = next(iter(items))
+
+    if _redis_available:
+        try:
+            pipe = _redis.pipeline(transaction=False)
+            for key, payload in payloads.items():
+                pipe.setex(_redis_key(key), ttl, payload)
+            pipe.publish(_L1_CHANNEL, json.dumps({'o': _L1_ORIGIN, 'k': None, 'p': None, 'ks': list(items)}))
+            pipe.execute()
+            for key, value in items.items():
+                _l1_set(key, value, ttl)
+            _record(first, 'set', _elapsed_ms(start))
+            return
+        except Exception as e:
+            _record(first, redis_errors=1)
+            logger.warning('[Cache] Redis SET many (%d keys) failed: %s', len(items), e)
+
+    for key, value in items.items():
+        _mem_set(key, value, ttl, len(payloads[key]))
+    _record(first, 'set', _elapsed_ms(start))
+
+
+def delete_many(keys: list):
+    """批量删除 key（一次 DEL，Redis 与内存降级缓存）。"""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return
+    _init_redis()
+    for key in keys:
+        _record(key, deletes=1)
+    if _redis_available:
+        try:
+            _redis.delete(*[_redis_key(k) for k in keys])
+        except Exception as e:
+            _record(keys[0], redis_errors=1)
+            logger.warning('[Cache] Redis DELETE many (%d keys) failed: %s', len(keys), e)
+        for key in keys:
+            _l1_drop(key=key)
+        _l1_publish(ks=keys)
+    for key in keys:
+        _mem.delete(key)
 
 
 def invalidate(prefix: Optional[str] = None):
     """
     清除缓存。
-    - prefix=None → 清全部
-    - prefix='abc/' → 清所有以 'abc/' 开头的 key
+    - prefix=None → 清全部（全局代数 INCR，不影响同库其他数据）
+    - prefix='abc/' → 整个命名空间失效（一次 INCR，与 key 数量无关）
+    - 其他前缀（'abc/x'、'ab'）→ SCAN 当前版本的匹配 key 后删除，代价 O(keyspace)；
+      热路径请按命名空间失效，单个 key 用 delete_key
     """
     _init_redis()
 
     if _redis_available:
         try:
-            if prefix is None:
-                _redis.flushdb()
-            else:
-                cursor = 0
-                while True:
-                    cursor, keys = _redis.scan(cursor, match=f'{prefix}*', count=200)
-                    if keys:
-                        _redis.delete(*keys)
-                    if cursor == 0:
-                        break
+            ns = _NS_ALL if prefix is None else _namespace_of_prefix(prefix)
+            if ns is not None:
+                version = _bump_namespace(ns)
+                _l1_drop(prefix=prefix)
+                _l1_publish(prefix=prefix, ns=ns, v=version)
+                return
+
+            # 不含 '/' 的前缀可能横跨多个命名空间（'jun' 匹配 'junge:v…/'），直接按原前缀匹配
+            match = f'{_redis_key(prefix)}*' if '/' in prefix else f'{prefix}*'
+            cursor = 0
+            while True:
+                cursor, keys = _redis.scan(cursor, match=match, count=200)
+                # 版本计数器 / 租约不能删：计数器归零会让旧版本 key 复活
+                keys = [k for k in keys if not (k.decode() if isinstance(k, bytes) else k).startswith(('nsver:', 'lease:'))]
+                if keys:
+                    _redis.delete(*keys)
+                if cursor == 0:
+                    break
+            _l1_drop(prefix=prefix)
+            _l1_publish(prefix=prefix)
             return
         except Exception as e:
             logger.warning('[Cache] Redis invalidate(%s) failed: %s', prefix, e)
@@ -161,31 +797,303 @@ def invalidate(prefix: Optional[str] = None):
     _mem_invalidate(prefix)
 
 
-def cached(key: str, ttl: int = 60, fetch_fn: Optional[Callable[[], Any]] = None):
+# ─── 击穿保护（singleflight） ──────────────────────────────────────────────────
+
+LEASE_TTL = int(os.environ.get('CACHE_LEASE_TTL', 30))          # 跨 worker 重算租约有效秒数（计算期间自动续期）
+# 等他人重算的上限秒数：持有方续期但迟迟算不完（上游挂起）时，不无限占住等待线程
+LEASE_WAIT_MAX = float(os.environ.get('CACHE_LEASE_WAIT_MAX', LEASE_TTL))
+_LEASE_POLL = 0.05
+_LEASE_POLL_MAX = 0.5
+
+# 仅当租约仍归自己时才删除 / 续期，避免误操作他人续上的租约
+_RELEASE_LEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+_RENEW_LEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+
+
+class _Flight:
+    """本进程内同一 key 的一次计算；跟随者等待 done 后取 value / error"""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def _acquire_lease(key: str) -> Optional[str]:
+    """Redis SET NX 租约；拿到返回 token，被他人持有返回 None，Redis 异常时视为拿到（降级为各自重算）。"""
+    token = uuid.uuid4().hex
+    try:
+        if _redis.set(f'lease:{key}', token, nx=True, ex=LEASE_TTL):
+            return token
+        return None
+    except Exception as e:
+        logger.debug('[Cache] lease %s failed: %s', key, e)
+        return token
+
+
+def _release_lease(key: str, token: str):
+    try:
+        _redis.eval(_RELEASE_LEASE_LUA, 1, f'lease:{key}', token)
+    except Exception as e:
+        logger.debug('[Cache] release lease %s failed: %s', key, e)
+
+
+def _keep_lease(key: str, token: str) -> threading.Event:
+    """计算期间每 LEASE_TTL/3 秒续期一次租约，返回的 Event 置位后停止；进程崩溃时租约随 TTL 过期"""
+    stop = threading.Event()
+
+    def _renew():
+        while not stop.wait(max(LEASE_TTL / 3, 1)):
+            try:
+                if not _redis.eval(_RENEW_LEASE_LUA, 1, f'lease:{key}', token, LEASE_TTL):
+                    return
+            except Exception as e:
+                logger.debug('[Cache] renew lease %s failed: %s', key, e)
+
+    threading.Thread(target=_renew, daemon=True, name=f'cache-lease-{key}').start()
+    return stop
+
+
+def _compute_with_lease(key: str, compute: Callable[[], Any]) -> tuple[Optional[Any], Any]:
+    """
+    跨 worker：拿到租约的计算；未拿到的轮询缓存，最多等 LEASE_WAIT_MAX 秒
+    （持有方崩溃则租约过期后接手；持有方一直续期却算不完时，到时不持租约自己算）。
+    """
+    token = None
+    if _redis_available:
+        poll = _LEASE_POLL
+        deadline = time.monotonic() + LEASE_WAIT_MAX
+        while True:
+            token = _acquire_lease(key)
+            if token is not None:
+                break
+            if time.monotonic() >= deadline:
+                logger.warning('[Cache] lease %s held over %.0fs, computing locally', key, LEASE_WAIT_MAX)
+                break
+            time.sleep(poll)
+            poll = min(poll * 2, _LEASE_POLL_MAX)
+            hit = get(key)
+            if hit is not None:
+                return hit, None
+        # 拿到租约前对方可能刚写完并释放
+        hit = get(key)
+        if hit is not None:
+            if token is not None:
+                _release_lease(key, token)
+            return hit, None
+
+    stop = _keep_lease(key, token) if token is not None else None
+    try:
+        return None, compute()
+    finally:
+        if stop is not None:
+            stop.set()
+            _release_lease(key, token)
+
+
+def _singleflight(key: str, compute: Callable[[], Any]) -> tuple[Optional[Any], Any]:
+    """
+    同一 key 同时只有一个调用方执行 compute：
+    - 本进程：按 key 登记进行中的计算（_Flight），后来者不持任何锁等待其结果 / 异常
+    - 跨 worker：Redis SET NX 租约（计算期间续期），未拿到租约的轮询缓存直到结果写入、租约失效
+      或等满 LEASE_WAIT_MAX 秒
+    - 本进程跟随者最多等 2 × LEASE_WAIT_MAX 秒（领头者可能先等满租约再自己算），
+      超时时缓存已有值则返回，否则抛 TimeoutError，不无限占住请求线程
+
+    Returns:
+        (缓存值, None) —— 等到了他人的结果；(None, compute()) —— 由自己计算
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(2 * LEASE_WAIT_MAX):
+            hit = get(key)
+            if hit is not None:
+                return hit, None
+            raise TimeoutError(f'等待 {key} 重算超时')
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, None
+
+    try:
+        hit = get(key)
+        result = (hit, None) if hit is not None else _compute_with_lease(key, compute)
+        flight.value = result[0] if result[0] is not None else result[1]
+        return result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# ─── 过期后先返回旧值（stale-while-revalidate） ─────────────────────────────────
+#
+# swr=N 时 key 实际存活 ttl + N 秒：剩余 TTL > N 为新鲜；≤ N 为陈旧，直接返回旧值，
+# 同时由一个后台线程重算（本进程按 key 去重，跨 worker 用非阻塞租约去重）。
+
+_swr_stats = {'fresh': 0, 'stale': 0, 'miss': 0, 'refreshes': 0, 'refresh_errors': 0, 'refresh_skipped': 0}
+_swr_lock = threading.Lock()
+_swr_inflight: dict[str, None] = {}
+
+
+def _swr_count(name: str):
+    with _swr_lock:
+        _swr_stats[name] += 1
+
+
+def _lookup_swr(key: str, swr: int) -> tuple[Optional[Any], bool]:
+    """返回 (缓存值, 是否陈旧)。swr<=0 时永不陈旧。"""
+    if swr <= 0:
+        return get(key), False
+    value, remaining = _get_entry(key)
+    if value is None:
+        _swr_count('miss')
+        return None, False
+    stale = remaining <= swr
+    _swr_count('stale' if stale else 'fresh')
+    if stale:
+        _record(key, stale=1)
+    return value, stale
+
+
+def _refresh_in_background(key: str, compute: Callable[[], Any]):
+    """后台重算陈旧 key；同 key 已有刷新在进行（本进程或其他 worker）时跳过。"""
+    with _swr_lock:
+        if key in _swr_inflight:
+            _swr_stats['refresh_skipped'] += 1
+            return
+        _swr_inflight[key] = None
+
+    def _run():
+        token = stop = None
+        try:
+            if _redis_available:
+                token = _acquire_lease(key)
+                if token is None:
+                    _swr_count('refresh_skipped')
+                    return
+                stop = _keep_lease(key, token)
+            compute()
+            _swr_count('refreshes')
+        except Exception as e:
+            _swr_count('refresh_errors')
+            logger.warning('[Cache] swr refresh %s failed: %s', key, e)
+        finally:
+            if stop is not None:
+                stop.set()
+            if token is not None:
+                _release_lease(key, token)
+            with _swr_lock:
+                _swr_inflight.pop(key, None)
+
+    threading.Thread(target=_run, daemon=True, name=f'cache-swr-{key}').start()
+
+
+def cached(key: str, ttl: int = 60, fetch_fn: Optional[Callable[[], Any]] = None, swr: int = 0):
     """
     读-通模式：命中缓存直接返回；未命中则调用 fetch_fn，将结果写入缓存后返回。
+    并发未命中时只有一个调用方执行 fetch_fn（见 _singleflight），其余等待其结果。
+
+    Args:
+        swr: 过期后仍可返回旧值的秒数。此窗口内命中旧值立即返回，并在后台刷新一次；
+             超出窗口（或从未缓存）才同步调用 fetch_fn。
 
     用法示例：
-        data = cached('market/overview', ttl=15, fetch_fn=get_market_overview)
+        data = cached('market/overview', ttl=15, fetch_fn=get_market_overview, swr=60)
 
-    等价于：
+    swr=0 时等价于：
         data = get('market/overview')
         if data is None:
             data = get_market_overview()
             set('market/overview', data, ttl=15)
     """
-    data = get(key)
+    def _compute():
+        value = fetch_fn()
+        set(key, value, ttl + swr)
+        return value
+
+    data, stale = _lookup_swr(key, swr)
     if data is not None:
+        if stale and fetch_fn is not None:
+            _refresh_in_background(key, _compute)
         return data
-    if fetch_fn is not None:
-        data = fetch_fn()
-        set(key, data, ttl)
-    return data
+    if fetch_fn is None:
+        return None
+
+    hit, data = _singleflight(key, _compute)
+    return hit if hit is not None else data
+
+
+def stats() -> dict:
+    """
+    缓存运行状态：
+    - backend: 'redis' | 'memory'
+    - l1: L1 条目数与上限
+    - memory: 降级内存缓存的条目数、近似字节数、命中 / 未命中 / 淘汰 / 过期次数
+    - swr: swr 读取的新鲜 / 陈旧 / 未命中次数，后台刷新成功 / 失败 / 去重跳过次数
+    - namespaces: 本进程已知的命名空间版本（'*' 为全局代数）
+    - by_namespace: 各命名空间命中率、耗时、读写字节数（见 namespace_stats）
+    """
+    _init_redis()
+    with _l1_lock:
+        l1_entries = len(_l1)
+    with _swr_lock:
+        swr_stats = dict(_swr_stats, inflight=len(_swr_inflight))
+    with _ns_lock:
+        namespaces = {ns: v for ns, (v, _) in _ns_versions.items()}
+    return {
+        'backend': 'redis' if _redis_available else 'memory',
+        'l1': {'entries': l1_entries, 'max_entries': L1_MAX_ENTRIES},
+        'memory': _mem.stats(),
+        'swr': swr_stats,
+        'namespaces': namespaces,
+        'by_namespace': namespace_stats(),
+    }
 
 
 # ─── 路由装饰器（简化 market_routes / strategy_routes） ───────────────────────
 
-def route_cached(blueprint, rule: str, key: str, ttl: int = 60):
+def _route_key(key: str, query_args: tuple) -> str:
+    """按白名单拼入查询参数：'market/x' + ?kind=concept → 'market/x?kind=concept'（参数按名排序，缺省不拼）。"""
+    from flask import request
+
+    parts = [f'{name}={request.args.get(name)}' for name in sorted(query_args)
+             if request.args.get(name) not in (None, '')]
+    return f"{key}?{'&'.join(parts)}" if parts else key
+
+
+def _route_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def _route_response(entry: dict):
+    """由缓存条目构造响应：If-None-Match 命中 ETag 时返回空 304，否则直接回写已序列化的 body。"""
+    from flask import Response, request
+
+    etag = entry['e']
+    if etag in request.headers.get('If-None-Match', ''):
+        resp = Response(status=304)
+    else:
+        resp = Response(entry['b'], mimetype='application/json')
+    resp.headers['ETag'] = etag
+    # 浏览器每次都带 If-None-Match 回源校验，数据未变时只收到 304
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def route_cached(blueprint, rule: str, key: str, ttl: int = 60, swr: int = 0, query_args: tuple = ()):
     """
     Flask 路由装饰器：自动为 endpoint 加上 Redis 缓存。
 
@@ -196,36 +1104,59 @@ def route_cached(blueprint, rule: str, key: str, ttl: int = 60):
             return jsonify({'success': True, 'data': data})
 
     装饰器内部已处理：
-    - 从 Redis / dict 读缓存
-    - 缓存未命中时执行原函数
-    - 将结果写入缓存后返回 JSON
-    - 异常 → 降级执行原函数（不写缓存）
+    - 缓存的是序列化好的响应 body 及其 ETag，命中时不再 jsonify
+    - query_args 中的查询参数拼入缓存 key（其余参数不影响缓存）
+    - 请求带 If-None-Match 且与 ETag 一致时返回 304（无 body）
+    - 缓存未命中时执行原函数（同 key 并发未命中只执行一次）
+    - 只缓存 200 且 success 为真的 JSON 响应；其余原样返回、不写缓存
+    - swr>0 → 过期后 swr 秒内先返回旧值，后台刷新（见 cached）
     """
-    from flask import jsonify
+    from flask import current_app, request
 
     def decorator(fn):
         import functools
 
         @functools.wraps(fn)
         def wrapper(*args, **kwargs):
-            # 先读缓存
-            hit = get(key)
-            if hit is not None:
-                return jsonify({'success': True, 'data': hit})
+            cache_key = _route_key(key, query_args)
 
-            # 未命中，执行原函数
-            try:
-                result = fn(*args, **kwargs)
-                # 正常返回 Flask Response 时才缓存（排除重定向等）
-                if hasattr(result, 'get_json'):
-                    payload = result.get_json()
+            # 未命中，执行原函数（并发未命中只执行一次，其余等待结果）
+            def _compute():
+                resp = current_app.make_response(fn(*args, **kwargs))
+                if resp.status_code == 200 and resp.is_json:
+                    payload = resp.get_json(silent=True)
                     if isinstance(payload, dict) and payload.get('success'):
-                        set(key, payload.get('data'), ttl)
-                return result
+                        body = resp.get_data()
+                        entry = {'b': body.decode('utf-8'), 'e': _route_etag(body)}
+                        set(cache_key, entry, ttl + swr)
+                        return entry
+                return resp
+
+            # 先读缓存（非 dict 条目是旧版按 data 缓存的值，视为未命中）
+            hit, stale = _lookup_swr(cache_key, swr)
+            if isinstance(hit, dict) and 'e' in hit:
+                if stale:
+                    app, path = current_app._get_current_object(), request.full_path
+
+                    def _refresh():
+                        # 后台线程没有请求上下文，按原 URL（含查询参数）重建一个
+                        with app.test_request_context(path):
+                            _compute()
+
+                    _refresh_in_background(cache_key, _refresh)
+                return _route_response(hit)
+
+            try:
+                hit, result = _singleflight(cache_key, _compute)
             except Exception as e:
                 # 出错降级：不走缓存，直接抛
-                logger.warning('[Cache] route_cached(%s) error, bypass: %s', key, e)
+                logger.warning('[Cache] route_cached(%s) error, bypass: %s', cache_key, e)
                 raise
+            if isinstance(hit, dict) and 'e' in hit:
+                result = hit
+            elif hit is not None:
+                result = _compute()
+            return _route_response(result) if isinstance(result, dict) else result
 
         # 注册路由（让 blueprint 自动收集）
         blueprint.add_url_rule(rule, view_func=wrapper, methods=['GET'])
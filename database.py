@@ -2,17 +2,26 @@
 # -*- coding: utf-8 -*-
 """
 MySQL 数据库模块 - 扫描结果存储
-支持 MySQL 5.7+
+支持 MySQL 5.7+；DB_BACKEND=sqlite 时改用本地 SQLite 文件（SQLITE_PATH，WAL 模式，见 utils.sqlite_backend）
 """
 
 import pymysql
 import json
 import math
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, date
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
+from utils.kline_adjust import apply_adjustment, fetch_hfq_factors, normalize_adjust
+from utils.db_pool import ConnectionPool, pool_size_from_env
+from utils import kline_store
+from utils import sqlite_backend
+from utils.stock_search import StockSearchIndex
+from utils.write_behind import WriteBehindQueue
 
 
 def _safe_json_dumps(obj) -> str:
@@ -49,24 +58,159 @@ def get_db_config() -> Dict:
     return DB_CONFIG.copy()
 
 
+# 存储后端：mysql（默认）| sqlite（单机零依赖，供本地基准 / CI；SQL 方言由 utils.sqlite_backend 转换）
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').strip().lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join('data', 'stock_scanner.db'))
+if DB_BACKEND not in ('mysql', 'sqlite'):
+    raise ValueError(f'DB_BACKEND 仅支持 mysql / sqlite: {DB_BACKEND}')
+
+
+def _connect():
+    """按后端新建一个连接"""
+    if DB_BACKEND == 'sqlite':
+        # 数据库文件随首次连接创建，目录须先存在
+        if os.path.dirname(SQLITE_PATH):
+            os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
+        return sqlite_backend.connect(SQLITE_PATH)
+    return pymysql.connect(**DB_CONFIG)
+
+
+# 连接池（每个 worker 一个；MYSQL_POOL_SIZE=0 时退回每次新建连接）
+POOL_SIZE = pool_size_from_env()
+POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', 10))
+POOL_MAX_LIFETIME = float(os.environ.get('MYSQL_POOL_MAX_LIFETIME', 1800))
+POOL_PING_INTERVAL = float(os.environ.get('MYSQL_POOL_PING_INTERVAL', 30))
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ConnectionPool]:
+    global _pool
+    if POOL_SIZE <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    max_size=POOL_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                    ping_interval=POOL_PING_INTERVAL,
+                )
+    return _pool
+
+
+def pool_stats() -> Dict:
+    """连接池状态（本 worker）：大小、借出中、空闲、使用率、等待耗时等"""
+    pool = _get_pool()
+    return pool.stats() if pool is not None else {'enabled': False}
+
+
 @contextmanager
 def get_connection():
-    """获取数据库连接的上下文管理器"""
-    conn = pymysql.connect(**DB_CONFIG)
+    """获取数据库连接的上下文管理器（从连接池借出，结束时提交 / 回滚后归还）"""
+    pool = _get_pool()
+    conn = pool.acquire() if pool is not None else _connect()
+    broken = False
     try:
         yield conn
         conn.commit()
     except Exception:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
         raise
     finally:
-        conn.close()
+        if pool is not None:
+            pool.release(conn, broken=broken)
+        else:
+            conn.close()
+
+
+_local_named_locks: Dict[str, threading.Lock] = {}
+
+
+@contextmanager
+def named_lock(name: str):
+    """
+    跨进程互斥（非阻塞），yield 是否拿到锁。多 worker 的定时任务用它保证同一时刻只有一个在执行。
+    MySQL 为 GET_LOCK（会话级，连接断开即释放）；SQLite 单机部署为进程内锁。
+    """
+    if DB_BACKEND == 'sqlite':
+        with _pool_lock:
+            lock = _local_named_locks.setdefault(name, threading.Lock())
+        ok = lock.acquire(blocking=False)
+        try:
+            yield ok
+        finally:
+            if ok:
+                lock.release()
+        return
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT GET_LOCK(%s, 0) AS ok', (name,))
+        ok = bool((cursor.fetchone() or {}).get('ok'))
+        try:
+            yield ok
+        finally:
+            if ok:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', (name,))
+                cursor.fetchall()
+
+
+# 批量写入每块行数：pymysql 的 executemany 会把 INSERT / REPLACE ... VALUES 改写为多行 VALUES，
+# 每块一条语句、一次往返；块太大可能超过 max_allowed_packet
+BULK_CHUNK_SIZE = int(os.environ.get('DB_BULK_CHUNK_SIZE', 500))
+
+
+def executemany_chunked(sql: str, rows: List[tuple], chunk_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    分块批量写入，每块单独提交（chunk_size 默认 BULK_CHUNK_SIZE）。
+
+    某块整体失败时回滚该块并逐行重试，只跳过出错的行，不影响其它块。
+
+    Returns:
+        {'rows': 成功写入的行数, 'affected': 数据库报告的影响行数, 'failed': 失败行数}
+        （INSERT IGNORE 的 affected 即实际新增条数）
+    """
+    stats = {'rows': 0, 'affected': 0, 'failed': 0}
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    if not rows:
+        return stats
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            try:
+                cursor.executemany(sql, chunk)
+                stats['affected'] += max(cursor.rowcount, 0)
+                conn.commit()
+                stats['rows'] += len(chunk)
+                continue
+            except Exception as e:
+                conn.rollback()
+                print(f"[DB] 批量写入失败，逐行重试 {len(chunk)} 行: {e}")
+            for row in chunk:
+                try:
+                    cursor.execute(sql, row)
+                    stats['affected'] += max(cursor.rowcount, 0)
+                    stats['rows'] += 1
+                except Exception:
+                    stats['failed'] += 1
+            conn.commit()
+    return stats
 
 
 def init_db(max_retries: int = 10, retry_delay: int = 3):
     """初始化数据库表（带重试机制，适配 Docker 环境）"""
-    import time
-    
+    if DB_BACKEND == 'sqlite':
+        # SQLite 文件随首次连接创建（见 _connect）
+        return _create_tables()
+
     # 先创建数据库（如果不存在）
     config_no_db = DB_CONFIG.copy()
     db_name = config_no_db.pop('database')
@@ -92,8 +236,11 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
         conn.commit()
     finally:
         conn.close()
-    
-    # 创建表
+    _create_tables()
+
+
+def _create_tables():
+    """建表与迁移（两种后端共用同一份 MySQL 方言 DDL）"""
     with get_connection() as conn:
         cursor = conn.cursor()
         
@@ -108,6 +255,12 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
                 hot_sectors_json LONGTEXT,
                 error TEXT,
                 params_json TEXT,
+                stock_count INT NULL COMMENT '写入时物化：股票数（NULL 表示旧记录待回填）',
+                sector_count INT NULL,
+                grade_s_count INT NULL,
+                grade_a_count INT NULL,
+                grade_b_count INT NULL,
+                grade_c_count INT NULL,
                 INDEX idx_scan_time (scan_time DESC)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
@@ -125,6 +278,32 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
         
+        # 扫描结果个股表（每只股票一行，常用字段建索引；payload_json 为完整个股 JSON，保持原响应结构）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_result_stocks (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                scan_id INT NOT NULL,
+                sector_name VARCHAR(100) NOT NULL,
+                sector_rank INT NOT NULL DEFAULT 0 COMMENT '板块内排序（按评分）',
+                code VARCHAR(10) NOT NULL,
+                name VARCHAR(50) DEFAULT '',
+                total_score DECIMAL(8,2) DEFAULT 0,
+                grade VARCHAR(4) DEFAULT '',
+                squeeze_days INT DEFAULT 0,
+                bb_width_pct DECIMAL(10,2),
+                pct_change DECIMAL(10,2),
+                close DECIMAL(12,3),
+                turnover DECIMAL(10,2),
+                is_leader TINYINT(1) DEFAULT 0,
+                payload_json LONGTEXT NOT NULL,
+                INDEX idx_scan_sector (scan_id, sector_name, sector_rank),
+                INDEX idx_scan_score (scan_id, total_score),
+                INDEX idx_scan_grade (scan_id, grade),
+                INDEX idx_code_scan (code, scan_id),
+                FOREIGN KEY (scan_id) REFERENCES scan_records(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''')
+
         # 板块成分股缓存表（sector_name 为主键，每日更新）
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS sector_stocks_cache (
@@ -140,7 +319,8 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
             CREATE TABLE IF NOT EXISTS kline_cache (
                 stock_code VARCHAR(20) PRIMARY KEY,
                 cache_date DATE NOT NULL,
-                data_json LONGTEXT NOT NULL,
+                data_json LONGTEXT NULL,
+                data_blob LONGBLOB NULL COMMENT 'utils.kline_store 压缩列式格式',
                 INDEX idx_cache_date (cache_date)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
@@ -150,10 +330,23 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
             CREATE TABLE IF NOT EXISTS kline_raw_cache (
                 stock_code VARCHAR(20) PRIMARY KEY,
                 cache_date DATE NOT NULL,
-                data_json LONGTEXT NOT NULL,
+                data_json LONGTEXT NULL,
+                data_blob LONGBLOB NULL COMMENT 'utils.kline_store 压缩列式格式',
                 INDEX idx_cache_date (cache_date)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
+
+        # 迁移：K 线缓存改存压缩列式二进制（data_blob），旧 JSON 行照常读取
+        _migrate_kline_blob_cols(cursor)
+
+        # 后复权因子表（每只股票一行，[{date, factor}]，配合不复权日线读取时复权）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kline_adj_factor (
+                stock_code VARCHAR(20) PRIMARY KEY,
+                cache_date DATE NOT NULL,
+                data_json LONGTEXT NOT NULL
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''')
         
         # 自选股表
         cursor.execute('''
@@ -248,17 +441,15 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
         ''')
 
         # 迁移：scan_records 缓存 DeepSeek 扫描小结（避免每次进入页面重复调用模型）
-        cursor.execute('''
-            SELECT COUNT(*) AS c FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE()
-              AND TABLE_NAME = 'scan_records'
-              AND COLUMN_NAME = 'ai_summary_json'
-        ''')
-        if cursor.fetchone()['c'] == 0:
+        if 'ai_summary_json' not in _get_table_columns(cursor, 'scan_records', refresh=True):
             cursor.execute(
                 'ALTER TABLE scan_records ADD COLUMN ai_summary_json LONGTEXT NULL, '
                 'ADD COLUMN ai_summary_time DATETIME NULL'
             )
+            _forget_table_columns('scan_records')
+
+        # 迁移：scan_records 物化股票数 / 板块数 / 评级分布，列表页不再逐条解析 stocks_json
+        _migrate_scan_record_counts(cursor)
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS bollinger_alert_rules (
@@ -278,6 +469,8 @@ def init_db(max_retries: int = 10, retry_delay: int = 3):
                 FOREIGN KEY (scan_id) REFERENCES scan_records(id) ON DELETE SET NULL
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
+
+        _create_news_cache_table(cursor)
         
         conn.commit()
 
@@ -295,8 +488,9 @@ def create_scan_record(params: Dict = None) -> int:
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO scan_records (scan_time, status, params_json)
-            VALUES (%s, 'scanning', %s)
+            INSERT INTO scan_records (scan_time, status, params_json, stock_count, sector_count,
+                                      grade_s_count, grade_a_count, grade_b_count, grade_c_count)
+            VALUES (%s, 'scanning', %s, 0, 0, 0, 0, 0, 0)
         ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), _safe_json_dumps(params or {})))
         return cursor.lastrowid
 
@@ -307,10 +501,11 @@ def update_scan_progress(scan_id: int, progress: int, current_sector: str) -> bo
     
     with get_connection() as conn:
         cursor = conn.cursor()
+        # 异步写入的进度可能晚于完成 / 出错状态到达，只更新进行中的扫描
         cursor.execute('''
             UPDATE scan_records 
             SET progress = %s, current_sector = %s
-            WHERE id = %s
+            WHERE id = %s AND status = 'scanning'
         ''', (progress, current_sector, scan_id))
         return cursor.rowcount > 0
 
@@ -320,6 +515,7 @@ def update_scan_status(scan_id: int, status: str, error: str = None) -> bool:
     valid_statuses = {'scanning', 'completed', 'error', 'cancelled'}
     if status not in valid_statuses:
         raise ValueError(f"无效的状态值: {status}")
+    _write_queue.discard('scan_progress', scan_id)
     
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -350,29 +546,144 @@ def save_hot_sectors(scan_id: int, hot_sectors: List[Dict]) -> bool:
         return cursor.rowcount > 0
 
 
+_SCAN_GRADES = ('S', 'A', 'B', 'C')
+_SCAN_COUNT_COLS = ('stock_count', 'sector_count') + tuple(f'grade_{g.lower()}_count' for g in _SCAN_GRADES)
+
+
+def _grade_counts(stocks: List[Dict]) -> Dict[str, int]:
+    counts = dict.fromkeys(_SCAN_GRADES, 0)
+    for st in stocks:
+        grade = str(st.get('grade') or '').upper() if isinstance(st, dict) else ''
+        if grade in counts:
+            counts[grade] += 1
+    return counts
+
+
+def _migrate_scan_record_counts(cursor):
+    """scan_records 补充物化计数列，并为旧记录（计数为 NULL）一次性回填"""
+    cols = _get_table_columns(cursor, 'scan_records', refresh=True)
+    missing = [c for c in _SCAN_COUNT_COLS if c not in cols]
+    if missing:
+        cursor.execute('ALTER TABLE scan_records ' + ', '.join(f'ADD COLUMN {c} INT NULL' for c in missing))
+        _forget_table_columns('scan_records')
+
+    cursor.execute('SELECT id FROM scan_records WHERE stock_count IS NULL')
+    for row in cursor.fetchall():
+        scan_id = row['id']
+        stocks, sectors = [], 0
+        cursor.execute('SELECT stocks_json FROM scan_results WHERE scan_id = %s', (scan_id,))
+        for sr in cursor.fetchall():
+            sectors += 1
+            if sr['stocks_json']:
+                try:
+                    stocks.extend(json.loads(sr['stocks_json']) or [])
+                except (json.JSONDecodeError, TypeError):
+                    pass
+        cursor.execute('SELECT grade FROM scan_result_stocks WHERE scan_id = %s', (scan_id,))
+        stocks.extend(cursor.fetchall())
+        grades = _grade_counts(stocks)
+        cursor.execute('''
+            UPDATE scan_records
+            SET stock_count = %s, sector_count = %s,
+                grade_s_count = %s, grade_a_count = %s, grade_b_count = %s, grade_c_count = %s
+            WHERE id = %s
+        ''', (len(stocks), sectors, grades['S'], grades['A'], grades['B'], grades['C'], scan_id))
+
+
+def _finite_or_none(v) -> Optional[float]:
+    """数值列入库：None / 空串 / NaN / Inf / 非数字 → None"""
+    if v is None or v == '':
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def _scan_stock_params(scan_id: int, sector_name: str, rank: int, stock: Dict) -> tuple:
+    """单只股票 → scan_result_stocks 一行的参数"""
+    return (
+        scan_id, sector_name, rank,
+        str(stock.get('code') or '')[:10],
+        str(stock.get('name') or '')[:50],
+        _finite_or_none(stock.get('total_score')) or 0,
+        str(stock.get('grade') or '')[:4],
+        int(_finite_or_none(stock.get('squeeze_days')) or 0),
+        _finite_or_none(stock.get('bb_width_pct')),
+        _finite_or_none(stock.get('pct_change')),
+        _finite_or_none(stock.get('close')),
+        _finite_or_none(stock.get('turnover')),
+        1 if stock.get('is_leader') else 0,
+        _safe_json_dumps(stock),
+    )
+
+
+def _scan_stock_from_row(row: Dict) -> Dict:
+    """scan_result_stocks 行 → 原个股 JSON（payload_json 解析失败时用索引列兜底）"""
+    try:
+        stock = json.loads(row['payload_json'])
+        if isinstance(stock, dict):
+            return stock
+    except (json.JSONDecodeError, TypeError, KeyError):
+        pass
+    return {
+        'code': row.get('code'),
+        'name': row.get('name'),
+        'sector_name': row.get('sector_name'),
+        'total_score': float(row['total_score']) if row.get('total_score') is not None else 0,
+        'grade': row.get('grade'),
+    }
+
+
 def save_sector_result(scan_id: int, sector_name: str, sector_change: float, stocks: List[Dict]) -> bool:
-    """保存板块扫描结果"""
+    """
+    保存板块扫描结果：scan_results 只存板块行，个股逐行批量写入 scan_result_stocks。
+    stocks 的顺序即板块内展示顺序（sector_rank）。
+    """
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO scan_results (scan_id, sector_name, sector_change, stocks_json)
-            VALUES (%s, %s, %s, %s)
-        ''', (scan_id, sector_name, sector_change, _safe_json_dumps(stocks)))
+            VALUES (%s, %s, %s, NULL)
+        ''', (scan_id, sector_name, sector_change))
+        valid = [s for s in stocks or [] if isinstance(s, dict) and s.get('code')]
+        dropped = len(stocks or []) - len(valid)
+        if dropped:
+            print(f"[WARN] 扫描 {scan_id} 板块 {sector_name}: {dropped} 条个股缺少 code，未入库")
+        rows = [_scan_stock_params(scan_id, sector_name, i, s) for i, s in enumerate(valid)]
+        if rows:
+            cursor.executemany('''
+                INSERT INTO scan_result_stocks
+                    (scan_id, sector_name, sector_rank, code, name, total_score, grade, squeeze_days,
+                     bb_width_pct, pct_change, close, turnover, is_leader, payload_json)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', rows)
+        # 同一事务内累加 scan_records 上的物化计数
+        grades = _grade_counts(valid)
+        cursor.execute('''
+            UPDATE scan_records
+            SET stock_count = IFNULL(stock_count, 0) + %s,
+                sector_count = IFNULL(sector_count, 0) + 1,
+                grade_s_count = IFNULL(grade_s_count, 0) + %s,
+                grade_a_count = IFNULL(grade_a_count, 0) + %s,
+                grade_b_count = IFNULL(grade_b_count, 0) + %s,
+                grade_c_count = IFNULL(grade_c_count, 0) + %s
+            WHERE id = %s
+        ''', (len(rows), grades['S'], grades['A'], grades['B'], grades['C'], scan_id))
         return True
 
 
 def get_scan_list(limit: int = 20) -> List[Dict]:
-    """获取扫描记录列表"""
+    """获取扫描记录列表（股票数 / 板块数 / 评级分布为写入时物化的列，单次查询）"""
     with get_connection() as conn:
         cursor = conn.cursor()
-        
-        # MySQL 5.7 不支持 json_array_length，使用子查询
         cursor.execute('''
-            SELECT r.id, r.scan_time, r.status, r.progress, r.current_sector, 
-                   r.hot_sectors_json, r.error, r.params_json,
-                   (SELECT COUNT(*) FROM scan_results WHERE scan_id = r.id) as sector_count
-            FROM scan_records r
-            ORDER BY r.scan_time DESC
+            SELECT id, scan_time, status, progress, current_sector,
+                   hot_sectors_json, error, params_json, stock_count, sector_count,
+                   grade_s_count, grade_a_count, grade_b_count, grade_c_count
+            FROM scan_records
+            ORDER BY scan_time DESC
             LIMIT %s
         ''', (limit,))
         
@@ -386,7 +697,8 @@ def get_scan_list(limit: int = 20) -> List[Dict]:
                 'current_sector': row['current_sector'],
                 'error': row['error'],
                 'sector_count': row['sector_count'] or 0,
-                'stock_count': 0,
+                'stock_count': row['stock_count'] or 0,
+                'grade_counts': {g: row[f'grade_{g.lower()}_count'] or 0 for g in _SCAN_GRADES},
             }
             
             # 解析热点板块
@@ -406,18 +718,6 @@ def get_scan_list(limit: int = 20) -> List[Dict]:
                     record['params'] = {}
             else:
                 record['params'] = {}
-            
-            # 计算股票数量
-            cursor.execute('''
-                SELECT stocks_json FROM scan_results WHERE scan_id = %s
-            ''', (row['id'],))
-            for sr in cursor.fetchall():
-                if sr['stocks_json']:
-                    try:
-                        stocks = json.loads(sr['stocks_json'])
-                        record['stock_count'] += len(stocks)
-                    except:
-                        pass
                 
             records.append(record)
             
@@ -469,10 +769,12 @@ def get_scan_detail(scan_id: int) -> Optional[Dict]:
             SELECT sector_name, sector_change, stocks_json
             FROM scan_results
             WHERE scan_id = %s
+            ORDER BY id
         ''', (scan_id,))
         
         results = {}
         for result_row in cursor.fetchall():
+            # 旧数据：个股 JSON 整块存在 stocks_json；新数据为 NULL，个股在 scan_result_stocks
             stocks = []
             if result_row['stocks_json']:
                 try:
@@ -484,11 +786,205 @@ def get_scan_detail(scan_id: int) -> Optional[Dict]:
                 'change': float(result_row['sector_change']) if result_row['sector_change'] else 0,
                 'stocks': stocks
             }
+
+        cursor.execute('''
+            SELECT sector_name, payload_json FROM scan_result_stocks
+            WHERE scan_id = %s
+            ORDER BY sector_name, sector_rank
+        ''', (scan_id,))
+        for stock_row in cursor.fetchall():
+            sector = results.setdefault(stock_row['sector_name'], {'change': 0, 'stocks': []})
+            sector['stocks'].append(_scan_stock_from_row(stock_row))
         
         record['results'] = results
         return record
 
 
+_SCAN_STOCK_ORDER = {
+    'score': 's.total_score DESC',
+    'pct_change': 's.pct_change DESC',
+    'bb_width': 's.bb_width_pct ASC',
+    'squeeze_days': 's.squeeze_days DESC',
+}
+
+
+def query_scan_stocks(scan_id: Optional[int] = None, grades: Optional[List[str]] = None,
+                      min_score: Optional[float] = None, max_bb_width: Optional[float] = None,
+                      min_squeeze_days: Optional[int] = None, sector: Optional[str] = None,
+                      leaders_only: bool = False, order_by: str = 'score',
+                      limit: int = 50) -> List[Dict]:
+    """
+    按条件筛选某次扫描的个股（SQL 过滤 + 排序，不反序列化整次扫描）。
+
+    Args:
+        scan_id: 扫描记录 ID；None 表示最新一次完成的扫描
+        grades: 评级白名单，如 ['S', 'A']
+        order_by: score / pct_change / bb_width / squeeze_days
+
+    Returns:
+        个股 JSON 列表（结构与 get_scan_detail 中 stocks 元素一致，缺 sector_name 时补上所属板块）
+    """
+    where, params = [], []
+    if scan_id is None:
+        where.append("s.scan_id = (SELECT id FROM scan_records WHERE status = 'completed' "
+                     "ORDER BY scan_time DESC LIMIT 1)")
+    else:
+        where.append('s.scan_id = %s')
+        params.append(scan_id)
+    if grades:
+        where.append(f"s.grade IN ({', '.join(['%s'] * len(grades))})")
+        params.extend(grades)
+    if min_score is not None:
+        where.append('s.total_score >= %s')
+        params.append(min_score)
+    if max_bb_width is not None:
+        where.append('s.bb_width_pct <= %s')
+        params.append(max_bb_width)
+    if min_squeeze_days is not None:
+        where.append('s.squeeze_days >= %s')
+        params.append(min_squeeze_days)
+    if sector:
+        where.append('s.sector_name = %s')
+        params.append(sector)
+    if leaders_only:
+        where.append('s.is_leader = 1')
+    order = _SCAN_STOCK_ORDER.get(order_by, _SCAN_STOCK_ORDER['score'])
+    params.append(max(1, min(int(limit), 1000)))
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT s.scan_id, s.code, s.name, s.sector_name, s.total_score, s.grade, s.payload_json
+            FROM scan_result_stocks s
+            WHERE {' AND '.join(where)}
+            ORDER BY {order}, s.id
+            LIMIT %s
+        ''', params)
+        stocks = []
+        for row in cursor.fetchall():
+            stock = _scan_stock_from_row(row)
+            stock.setdefault('sector_name', row['sector_name'])
+            stocks.append(stock)
+        return stocks
+
+
+def get_scan_top_stocks(scan_id: Optional[int] = None, limit: int = 20) -> List[Dict]:
+    """某次扫描（默认最新完成的一次）评分前 N 的个股"""
+    return query_scan_stocks(scan_id=scan_id, limit=limit)
+
+
+def scan_exists(scan_id: int) -> bool:
+    """扫描记录是否存在（主键查询，不读结果）"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM scan_records WHERE id = %s', (scan_id,))
+        return cursor.fetchone() is not None
+
+
+def get_scan_sectors(scan_id: int) -> Optional[Dict]:
+    """
+    单次扫描的记录头 + 板块涨跌（不读个股）：
+    {'scan_time', 'params', 'sectors': {板块名: 涨跌幅}}；扫描不存在返回 None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT scan_time, params_json FROM scan_records WHERE id = %s', (scan_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        try:
+            params = json.loads(row['params_json']) if row['params_json'] else {}
+        except json.JSONDecodeError:
+            params = {}
+        cursor.execute('''
+            SELECT sector_name, sector_change FROM scan_results
+            WHERE scan_id = %s
+            ORDER BY id
+        ''', (scan_id,))
+        sectors = {
+            r['sector_name']: float(r['sector_change']) if r['sector_change'] else 0
+            for r in cursor.fetchall()
+        }
+        return {
+            'scan_time': row['scan_time'].strftime('%Y-%m-%d %H:%M:%S') if row['scan_time'] else None,
+            'params': params,
+            'sectors': sectors,
+        }
+
+
+def get_scan_stock(scan_id: int, stock_code: str) -> Optional[Dict]:
+    """
+    单次扫描中的一只股票：{'stock': 个股 JSON, 'sector_name', 'sector_change'}；不在结果中返回 None。
+    按 (code, scan_id) 索引查询；旧数据（个股存在 scan_results.stocks_json）只解析这些旧行。
+    """
+    if not stock_code:
+        return None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.code, s.name, s.sector_name, s.total_score, s.grade, s.payload_json,
+                   r.sector_change
+            FROM scan_result_stocks s
+            LEFT JOIN scan_results r ON r.scan_id = s.scan_id AND r.sector_name = s.sector_name
+            WHERE s.code = %s AND s.scan_id = %s
+            ORDER BY s.sector_name, s.sector_rank
+            LIMIT 1
+        ''', (stock_code, scan_id))
+        row = cursor.fetchone()
+        if row:
+            return {
+                'stock': _scan_stock_from_row(row),
+                'sector_name': row['sector_name'],
+                'sector_change': float(row['sector_change']) if row['sector_change'] else 0,
+            }
+
+        cursor.execute('''
+            SELECT sector_name, sector_change, stocks_json FROM scan_results
+            WHERE scan_id = %s AND stocks_json IS NOT NULL
+            ORDER BY id
+        ''', (scan_id,))
+        for legacy in cursor.fetchall():
+            try:
+                stocks = json.loads(legacy['stocks_json'])
+            except json.JSONDecodeError:
+                continue
+            for stock in stocks if isinstance(stocks, list) else []:
+                if isinstance(stock, dict) and str(stock.get('code') or '').strip() == stock_code:
+                    return {
+                        'stock': stock,
+                        'sector_name': legacy['sector_name'],
+                        'sector_change': float(legacy['sector_change']) if legacy['sector_change'] else 0,
+                    }
+        return None
+
+
+def get_stock_scan_history(stock_code: str, limit: int = 30) -> List[Dict]:
+    """
+    某只股票在历次扫描中的结果（新→旧），每项为原个股 JSON 附加 scan_id / scan_time。
+    仅覆盖写入 scan_result_stocks 之后的扫描。
+    """
+    if not stock_code:
+        return []
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.scan_id, s.code, s.name, s.sector_name, s.total_score, s.grade,
+                   s.payload_json, r.scan_time
+            FROM scan_result_stocks s
+            JOIN scan_records r ON r.id = s.scan_id
+            WHERE s.code = %s
+            ORDER BY s.scan_id DESC
+            LIMIT %s
+        ''', (stock_code, max(1, min(int(limit), 500))))
+        history = []
+        for row in cursor.fetchall():
+            item = _scan_stock_from_row(row)
+            item['scan_id'] = row['scan_id']
+            item['scan_time'] = row['scan_time'].strftime('%Y-%m-%d %H:%M:%S') if row['scan_time'] else None
+            history.append(item)
+        return history
+
+
 def get_scan_ai_summary(scan_id: int) -> Optional[Dict[str, Any]]:
     """读取已保存的 DeepSeek 扫描小结 JSON；附带 stored_at（生成/保存时间）。"""
     with get_connection() as conn:
@@ -571,6 +1067,7 @@ def delete_scan(scan_id: int) -> bool:
     """删除指定扫描记录"""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute('DELETE FROM scan_result_stocks WHERE scan_id = %s', (scan_id,))
         cursor.execute('DELETE FROM scan_results WHERE scan_id = %s', (scan_id,))
         cursor.execute('DELETE FROM scan_records WHERE id = %s', (scan_id,))
         return cursor.rowcount > 0
@@ -580,6 +1077,7 @@ def delete_all_scans() -> int:
     """删除所有扫描记录"""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute('DELETE FROM scan_result_stocks')
         cursor.execute('DELETE FROM scan_results')
         cursor.execute('DELETE FROM scan_records')
         return cursor.rowcount
@@ -849,8 +1347,43 @@ def clear_all_cache() -> Dict:
 
 # ==================== K线缓存相关函数 ====================
 
-def save_kline_cache(stock_code: str, data: Dict) -> bool:
-    """保存K线数据到缓存（当日有效）"""
+# K 线缓存落库格式：binary（默认，utils.kline_store 压缩列式）| json（旧格式，滚动发布期间供旧 worker 读取）
+KLINE_CACHE_FORMAT = os.environ.get('KLINE_CACHE_FORMAT', 'binary').strip().lower()
+
+
+def _migrate_kline_blob_cols(cursor):
+    """kline_cache / kline_raw_cache 增加 data_blob 列，data_json 允许为空"""
+    for table in ('kline_cache', 'kline_raw_cache'):
+        if 'data_blob' not in _get_table_columns(cursor, table, refresh=True):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN data_blob LONGBLOB NULL, '
+                           f'MODIFY COLUMN data_json LONGTEXT NULL')
+            _forget_table_columns(table)
+
+
+def _kline_dump(payload) -> tuple:
+    """K 线缓存 payload → (data_json, data_blob)，二者只有一个非空"""
+    if KLINE_CACHE_FORMAT == 'json':
+        return _safe_json_dumps(payload), None
+    return None, kline_store.encode(payload)
+
+
+def _kline_load(row: Dict):
+    """读取 K 线缓存行：优先 data_blob，旧行回退 data_json"""
+    blob = row.get('data_blob')
+    if blob:
+        return kline_store.decode(blob)
+    return json.loads(row['data_json'])
+
+
+def _kline_cache_key(stock_code: str, interval: str = 'daily') -> str:
+    """kline_cache 主键：日线沿用纯代码，其它周期追加后缀（如 600519@weekly），互不覆盖"""
+    if not interval or interval == 'daily':
+        return stock_code
+    return f'{stock_code}@{interval}'
+
+
+def save_kline_cache(stock_code: str, data: Dict, interval: str = 'daily') -> bool:
+    """保存K线数据到缓存（当日有效，按周期分别存储）"""
     if not stock_code:
         raise ValueError("stock_code 不能为空")
     if not data:
@@ -861,9 +1394,9 @@ def save_kline_cache(stock_code: str, data: Dict) -> bool:
         with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                REPLACE INTO kline_cache (stock_code, cache_date, data_json)
-                VALUES (%s, %s, %s)
-            ''', (stock_code, today, _safe_json_dumps(data)))
+                REPLACE INTO kline_cache (stock_code, cache_date, data_json, data_blob)
+                VALUES (%s, %s, %s, %s)
+            ''', (_kline_cache_key(stock_code, interval), today, *_kline_dump(data)))
             return True
     except Exception:
         return False
@@ -875,41 +1408,42 @@ def save_kline_cache_batch(kline_data_list: List[tuple]) -> int:
         return 0
     
     today = datetime.now().strftime('%Y-%m-%d')
-    saved = 0
-    
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        for stock_code, data in kline_data_list:
-            try:
-                cursor.execute('''
-                    REPLACE INTO kline_cache (stock_code, cache_date, data_json)
-                    VALUES (%s, %s, %s)
-                ''', (stock_code, today, _safe_json_dumps(data)))
-                saved += 1
-            except:
-                continue
-        conn.commit()
-    
-    return saved
+    rows = []
+    for stock_code, data in kline_data_list:
+        try:
+            rows.append((stock_code, today, *_kline_dump(data)))
+        except Exception:
+            continue
 
+    # 单行可达数百 KB，块取小一些以免超过 max_allowed_packet
+    return executemany_chunked('''
+        REPLACE INTO kline_cache (stock_code, cache_date, data_json, data_blob)
+        VALUES (%s, %s, %s, %s)
+    ''', rows, chunk_size=50)['rows']
 
-def get_kline_cache(stock_code: str) -> Optional[Dict]:
-    """获取K线缓存数据（仅当日有效）"""
+
+def get_kline_cache(stock_code: str, interval: str = 'daily') -> Optional[Dict]:
+    """获取K线缓存数据（仅当日有效，按周期分别存储）"""
     if not stock_code:
         return None
     
+    key = _kline_cache_key(stock_code, interval)
+    pending = _write_queue.peek('kline_cache', key)
+    if pending:
+        return pending[1]
+
     today = datetime.now().strftime('%Y-%m-%d')
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT data_json FROM kline_cache
+            SELECT data_json, data_blob FROM kline_cache
             WHERE stock_code = %s AND cache_date = %s
-        ''', (stock_code, today))
+        ''', (key, today))
         
         row = cursor.fetchone()
         if row:
             try:
-                return json.loads(row['data_json'])
+                return _kline_load(row)
             except:
                 return None
         return None
@@ -927,13 +1461,13 @@ def get_kline_cache_batch(stock_codes: List[str]) -> Dict[str, Dict]:
         cursor = conn.cursor()
         placeholders = ','.join(['%s'] * len(stock_codes))
         cursor.execute(f'''
-            SELECT stock_code, data_json FROM kline_cache
+            SELECT stock_code, data_json, data_blob FROM kline_cache
             WHERE stock_code IN ({placeholders}) AND cache_date = %s
         ''', (*stock_codes, today))
         
         for row in cursor.fetchall():
             try:
-                result[row['stock_code']] = json.loads(row['data_json'])
+                result[row['stock_code']] = _kline_load(row)
             except:
                 continue
     
@@ -942,11 +1476,7 @@ def get_kline_cache_batch(stock_codes: List[str]) -> Dict[str, Dict]:
 
 def delete_expired_kline_cache() -> int:
     """删除过期的K线缓存（非当日）"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM kline_cache WHERE cache_date < %s', (today,))
-        return cursor.rowcount
+    return delete_rows_before('kline_cache', 'cache_date', datetime.now().strftime('%Y-%m-%d'))
 
 
 def get_kline_cache_stats() -> Dict:
@@ -985,65 +1515,448 @@ def _cell_value(v):
         return str(v)
 
 
-def save_kline_raw_cache(stock_code: str, df) -> bool:
-    """
-    保存原始K线DataFrame到缓存（当日有效，仅OHLCV）。
-    df: pandas.DataFrame 或 [{date,open,high,low,close,volume}, ...]
-    """
-    if not stock_code:
-        return False
+def _raw_column(series: pd.Series, name: str):
+    """DataFrame 列 → 可直接编码的列数组：日期列为字符串列表，数值列为 float64 ndarray"""
+    if name == 'date':
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series.dt.strftime('%Y-%m-%d').tolist()
+        return [_cell_value(v) for v in series.tolist()]
+    if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+        return series.to_numpy(dtype='int64')
+    values = pd.to_numeric(series, errors='coerce')
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _column_list(values) -> list:
+    """_raw_column 结果 → JSON 安全的列表（NaN → None）"""
+    if isinstance(values, np.ndarray) and values.dtype.kind != 'f':
+        return values.tolist()
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        obj = values.astype(object)
+        obj[np.isnan(values)] = None
+        return obj.tolist()
+    return values
 
+
+def _raw_cache_payload(df, adjust: str) -> Optional[Dict]:
+    """DataFrame / bar 列表 → kline_raw_cache 存储格式；数据不可用时返回 None"""
     cols = ['date', 'open', 'high', 'low', 'close', 'volume']
+    # 可选列：周/月线本地重采样与量能画像需要成交额、换手率
+    extra_cols = ['amount', 'turnover']
 
     if isinstance(df, pd.DataFrame):
         if df.empty:
-            return False
+            return None
         available = [c for c in cols if c in df.columns]
         # 必须包含 volume，否则图表没有成交量数据
         if len(available) < 6 or 'volume' not in available:
-            return False
-        out = []
-        for _, row in df.iterrows():
-            out.append({c: _cell_value(row[c]) for c in available})
+            return None
+        available += [c for c in extra_cols if c in df.columns]
+        # 按列向量化转换（日期列 → 'YYYY-MM-DD'，数值列 → float64，NaN 读回为 None）
+        columns = {c: _raw_column(df[c], c) for c in available}
+        out = kline_store.table(columns) if KLINE_CACHE_FORMAT != 'json' else \
+            [dict(zip(available, row)) for row in zip(*(_column_list(v) for v in columns.values()))]
     else:
         if not df:
-            return False
+            return None
+        available = cols
         out = [{c: _cell_value(item.get(c)) for c in cols} for item in df]
 
-    today = datetime.now().strftime('%Y-%m-%d')
-    payload = {'bars': out, 'cols': cols[:len(out[0])] if out else cols}
+    return {'bars': out, 'cols': available, 'adjust': normalize_adjust(adjust)}
+
+
+def save_kline_raw_cache(stock_code: str, df, adjust: str = 'qfq') -> bool:
+    """
+    保存原始K线DataFrame到缓存（当日有效，仅OHLCV）。
+    df: pandas.DataFrame 或 [{date,open,high,low,close,volume}, ...]
+    adjust: 数据的复权口径，'none' 表示不复权（读取时按 kline_adj_factor 复权）；
+            前复权数据不会覆盖已有的不复权历史
+    """
+    if not stock_code:
+        return False
+    # 排队中的异步写是更早的数据，撤销以免落库时覆盖本次写入
+    _write_queue.supersede('kline_raw_cache', stock_code)
+    return _store_kline_raw_cache(stock_code, df, adjust)
+
+
+def _store_kline_raw_cache(stock_code: str, df, adjust: str = 'qfq') -> bool:
+    """
+    写入 kline_raw_cache 一行（异步写队列直接调用，不再 supersede 自身）。
+    前复权数据不覆盖已有的不复权历史（视为跳过，返回 True）。
+    """
+    payload = _raw_cache_payload(df, adjust)
+    if payload is None:
+        return False
+    if payload['adjust'] != 'none' and _stored_raw_adjust(stock_code) == 'none':
+        return True
 
+    today = datetime.now().strftime('%Y-%m-%d')
     try:
         with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                REPLACE INTO kline_raw_cache (stock_code, cache_date, data_json)
-                VALUES (%s, %s, %s)
-            ''', (stock_code, today, _safe_json_dumps(payload)))
+                REPLACE INTO kline_raw_cache (stock_code, cache_date, data_json, data_blob)
+                VALUES (%s, %s, %s, %s)
+            ''', (stock_code, today, *_kline_dump(payload)))
         return True
     except Exception:
         return False
 
 
-def get_kline_raw_cache(stock_code: str) -> Optional[Dict]:
-    """获取原始K线缓存（当日有效）。返回 {'bars': [...], 'cols': [...]}。"""
-    if not stock_code:
+def _stored_raw_adjust(stock_code: str) -> Optional[str]:
+    """已落库的本地日线历史的复权口径；无记录 / 无法解析时返回 None"""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT data_json, data_blob FROM kline_raw_cache WHERE stock_code = %s
+            ''', (stock_code,))
+            row = cursor.fetchone()
+        return _kline_load(row).get('adjust', 'qfq') if row else None
+    except Exception:
         return None
 
-    today = datetime.now().strftime('%Y-%m-%d')
+
+def _unadjusted_raw_codes(stock_codes: List[str]) -> set:
+    """已存为不复权历史（adjust='none'）的代码；这类历史配合复权因子续写，不能被前复权数据整体覆盖"""
+    codes = [c for c in dict.fromkeys(stock_codes or []) if c]
+    found = set()
+    if not codes:
+        return found
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT data_json FROM kline_raw_cache
-            WHERE stock_code = %s AND cache_date = %s
-        ''', (stock_code, today))
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            cursor.execute(
+                f"SELECT stock_code, data_json, data_blob FROM kline_raw_cache "
+                f"WHERE stock_code IN ({','.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+            for r in cursor.fetchall():
+                try:
+                    if _kline_load(r).get('adjust') == 'none':
+                        found.add(r['stock_code'])
+                except Exception:
+                    continue
+    for code in codes:
+        pending = _write_queue.peek('kline_raw_cache', code)
+        if pending and normalize_adjust(pending[2]) == 'none':
+            found.add(code)
+    return found
+
 
+def save_kline_raw_cache_batch(items: List[tuple], adjust: str = 'qfq') -> int:
+    """
+    批量保存原始K线 [(stock_code, df), ...]，返回写入条数。
+    前复权数据跳过已有不复权历史的代码（停牌 / EOD 漏跑时历史偏旧，但不能被约 120 根前复权 K 线覆盖）。
+    """
+    adjust = normalize_adjust(adjust)
+    skip = _unadjusted_raw_codes([code for code, _ in items]) if adjust != 'none' else set()
+    today = datetime.now().strftime('%Y-%m-%d')
+    rows = []
+    for stock_code, df in items:
+        if stock_code in skip:
+            continue
+        _write_queue.supersede('kline_raw_cache', stock_code)
+        try:
+            payload = _raw_cache_payload(df, adjust)
+        except Exception:
+            continue
+        if stock_code and payload is not None:
+            rows.append((stock_code, today, *_kline_dump(payload)))
+
+    # 单行可达数百 KB，块取小一些以免超过 max_allowed_packet
+    return executemany_chunked('''
+        REPLACE INTO kline_raw_cache (stock_code, cache_date, data_json, data_blob)
+        VALUES (%s, %s, %s, %s)
+    ''', rows, chunk_size=50)['rows']
+
+
+def get_kline_raw_cache(stock_code: str, adjust: str = 'qfq', any_date: bool = False) -> Optional[Dict]:
+    """
+    获取原始K线缓存。返回 {'bars': [...], 'cols': [...], 'adjust': ...}。
+
+    - 默认只读当日数据；any_date=True 时忽略缓存日期（不复权历史可增量续写）
+    - 存储为不复权数据时，按 kline_adj_factor 向量化复权为请求的口径
+    - 旧数据没有 adjust 字段，视为前复权
+    """
+    if not stock_code:
+        return None
+
+    adjust = normalize_adjust(adjust)
+    pending = _pending_raw_payload(stock_code)
+    if pending is not None:
+        return _decode_raw_payload(stock_code, pending, adjust)
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if any_date:
+            cursor.execute('''
+                SELECT data_json, data_blob FROM kline_raw_cache WHERE stock_code = %s
+            ''', (stock_code,))
+        else:
+            cursor.execute('''
+                SELECT data_json, data_blob FROM kline_raw_cache
+                WHERE stock_code = %s AND cache_date = %s
+            ''', (stock_code, today))
         row = cursor.fetchone()
-        if row:
-            try:
-                return json.loads(row['data_json'])
-            except Exception:
-                return None
+
+    if not row:
+        return None
+    try:
+        payload = _kline_load(row)
+    except Exception:
+        return None
+    return _decode_raw_payload(stock_code, payload, adjust)
+
+
+def _pending_raw_payload(stock_code: str) -> Optional[Dict]:
+    """异步写队列中尚未落库的原始K线（读己之写），按落库格式编解码一次以与读库结果一致"""
+    pending = _write_queue.peek('kline_raw_cache', stock_code)
+    if not pending:
+        return None
+    try:
+        payload = _raw_cache_payload(pending[1], pending[2])
+        if payload is None:
+            return None
+        return _kline_load(dict(zip(('data_json', 'data_blob'), _kline_dump(payload))))
+    except Exception:
+        return None
+
+
+# 单只股票本地日线历史上限（约 6 年），EOD 追加时超出部分从头部裁掉
+KLINE_RAW_MAX_BARS = 1500
+
+
+def _decode_raw_payload(stock_code: str, payload: Dict, adjust: str,
+                        factors: Optional[List[Dict]] = None) -> Optional[Dict]:
+    """将 kline_raw_cache 数据转换为请求的复权口径（不可转换时返回 None）。"""
+    stored = payload.get('adjust', 'qfq')
+    if stored == adjust:
+        return payload
+    if stored != 'none' or not payload.get('bars'):
+        return None
+    if factors is None:
+        factors = get_adj_factors(stock_code)
+        if factors is None:
+            return None
+    adjusted = apply_adjustment(pd.DataFrame(payload['bars']), factors, adjust)
+    bars = [{c: _cell_value(v) for c, v in rec.items()} for rec in adjusted.to_dict('records')]
+    return {'bars': bars, 'cols': payload.get('cols'), 'adjust': adjust}
+
+
+def get_kline_raw_cache_batch(stock_codes: List[str], adjust: str = 'qfq') -> Dict[str, Dict]:
+    """
+    批量读取本地日线历史（不限缓存日期，调用方按最后一根 K 线日期判断新鲜度）。
+    返回 {code: {'bars': [...], 'cols': [...], 'adjust': ...}}。
+    """
+    codes = [c for c in dict.fromkeys(stock_codes or []) if c]
+    if not codes:
+        return {}
+
+    adjust = normalize_adjust(adjust)
+    payloads: Dict[str, Dict] = {}
+    factor_map: Dict[str, List[Dict]] = {}
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            cursor.execute(
+                f"SELECT stock_code, data_json, data_blob FROM kline_raw_cache "
+                f"WHERE stock_code IN ({','.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+            for r in cursor.fetchall():
+                try:
+                    payloads[r['stock_code']] = _kline_load(r)
+                except Exception:
+                    continue
+        for code in codes:
+            pending = _pending_raw_payload(code)
+            if pending is not None:
+                payloads[code] = pending
+
+        # 不复权历史需要配套的复权因子，同样一次批量读取
+        raw_codes = [c for c, p in payloads.items() if p.get('adjust') == 'none']
+        if adjust != 'none':
+            for i in range(0, len(raw_codes), 500):
+                chunk = raw_codes[i:i + 500]
+                cursor.execute(
+                    f"SELECT stock_code, data_json FROM kline_adj_factor "
+                    f"WHERE stock_code IN ({','.join(['%s'] * len(chunk))})",
+                    chunk,
+                )
+                for r in cursor.fetchall():
+                    try:
+                        factor_map[r['stock_code']] = json.loads(r['data_json'])
+                    except Exception:
+                        continue
+
+    result = {}
+    for code, payload in payloads.items():
+        if payload.get('adjust') == 'none' and adjust != 'none' and code not in factor_map:
+            continue   # 缺因子无法复权，调用方回退网络抓取
+        out = _decode_raw_payload(code, payload, adjust, factor_map.get(code))
+        if out and out.get('bars'):
+            result[code] = out
+    return result
+
+
+def _volume_per_lot(bar: Dict) -> Optional[float]:
+    """按 成交额 / (成交量 × 收盘价) 推断成交量单位：≈100 为「手」，≈1 为「股」。"""
+    try:
+        vol, amt, close = float(bar.get('volume') or 0), float(bar.get('amount') or 0), float(bar.get('close') or 0)
+    except (TypeError, ValueError):
+        return None
+    if vol <= 0 or amt <= 0 or close <= 0:
+        return None
+    return 100.0 if amt / (vol * close) > 10 else 1.0
+
+
+def append_daily_bars(bars: Dict[str, Dict], trade_date: str) -> Dict[str, int]:
+    """
+    将某交易日的日线批量追加到本地日线历史（kline_raw_cache），一次批量写回。
+
+    Args:
+        bars: {code: {open, high, low, close, volume(股), amount, turnover, prev_close}}，
+              价格为不复权实价
+        trade_date: 'YYYY-MM-DD'
+
+    规则：
+    - 只追加已有历史的股票；同一交易日的 bar 覆盖
+    - 昨收与本地最后收盘价不一致即当日除权：
+        前复权历史跳过，留给常规路径重抓；
+        不复权历史的实价仍然正确，但复权因子需包含当日，重新抓取因子后再追加，
+        因子未更新到当日则跳过并计入 stale（否则前 / 后复权读取会出现假缺口）
+    - 今日行情与本地最后一根完全相同（节假日重复快照），跳过
+    - 成交量按本地历史的单位（股/手）换算
+
+    Returns:
+        {'appended': n, 'skipped': n, 'missing': n, 'factors_refreshed': n, 'stale': n}
+    """
+    stats = {'appended': 0, 'skipped': 0, 'missing': 0, 'factors_refreshed': 0, 'stale': 0}
+    codes = list(bars.keys())
+    if not codes:
+        return stats
+
+    # 追加基于库中历史，排队中的异步写（更早抓取的整段历史）落库会覆盖追加结果，先撤销
+    for code in codes:
+        _write_queue.supersede('kline_raw_cache', code)
+
+    updates = []
+    ex_div = {}     # 不复权历史当日除权：code → 待写入行，因子刷新成功后再写
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            cursor.execute(
+                f"SELECT stock_code, data_json, data_blob FROM kline_raw_cache "
+                f"WHERE stock_code IN ({','.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+            found = {r['stock_code']: r for r in cursor.fetchall()}
+            stats['missing'] += len(chunk) - len(found)
+
+            for code, row in found.items():
+                try:
+                    payload = _kline_load(row)
+                except Exception:
+                    stats['skipped'] += 1
+                    continue
+                hist = payload.get('bars') or []
+                if not hist:
+                    stats['skipped'] += 1
+                    continue
+
+                new = bars[code]
+                hist = [b for b in hist if str(b.get('date', ''))[:10] != trade_date]
+                last = hist[-1] if hist else {}
+                if str(last.get('date', ''))[:10] > trade_date:
+                    stats['skipped'] += 1
+                    continue
+                if last and float(last.get('close') or 0) == float(new['close']) \
+                        and float(last.get('open') or 0) == float(new['open']) \
+                        and float(last.get('high') or 0) == float(new['high']):
+                    stats['skipped'] += 1
+                    continue
+                unadjusted = payload.get('adjust', 'qfq') == 'none'
+                adjusted_today = False
+                if last and new.get('prev_close'):
+                    last_close = float(last.get('close') or 0)
+                    adjusted_today = last_close <= 0 or abs(last_close / float(new['prev_close']) - 1) > 0.005
+                if adjusted_today and not unadjusted:
+                    stats['skipped'] += 1
+                    continue
+
+                lot = _volume_per_lot(last) or 1.0
+                cols = payload.get('cols') or ['date', 'open', 'high', 'low', 'close', 'volume']
+                bar = {
+                    'date': trade_date,
+                    'open': new['open'], 'high': new['high'], 'low': new['low'], 'close': new['close'],
+                    'volume': round(float(new['volume']) / lot, 2),
+                    'amount': new.get('amount'),
+                    'turnover': new.get('turnover'),
+                }
+                hist.append({c: _cell_value(bar.get(c)) for c in cols})
+                payload['bars'] = hist[-KLINE_RAW_MAX_BARS:]
+                row = (trade_date, *_kline_dump(payload), code)
+                if adjusted_today:
+                    ex_div[code] = row
+                else:
+                    updates.append(row)
+
+    # 因子抓取走网络，不占用数据库连接
+    for code, row in ex_div.items():
+        factors = fetch_hfq_factors(code)
+        if factors and max(str(f['date'])[:10] for f in factors) >= trade_date and save_adj_factors(code, factors):
+            stats['factors_refreshed'] += 1
+            updates.append(row)
+        else:
+            stats['stale'] += 1
+
+    if updates:
+        with get_connection() as conn:
+            conn.cursor().executemany(
+                'UPDATE kline_raw_cache SET cache_date = %s, data_json = %s, data_blob = %s WHERE stock_code = %s',
+                updates,
+            )
+    stats['appended'] = len(updates)
+    return stats
+
+
+def save_adj_factors(stock_code: str, factors: List[Dict]) -> bool:
+    """保存后复权因子序列 [{date, factor}]。"""
+    if not stock_code or factors is None:
+        return False
+    today = datetime.now().strftime('%Y-%m-%d')
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                REPLACE INTO kline_adj_factor (stock_code, cache_date, data_json)
+                VALUES (%s, %s, %s)
+            ''', (stock_code, today, _safe_json_dumps(factors)))
+        return True
+    except Exception:
+        return False
+
+
+def get_adj_factors(stock_code: str) -> Optional[List[Dict]]:
+    """获取后复权因子序列（不限日期）；从未保存过返回 None。"""
+    if not stock_code:
+        return None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT data_json FROM kline_adj_factor WHERE stock_code = %s', (stock_code,)
+        )
+        row = cursor.fetchone()
+    if not row:
+        return None
+    try:
+        return json.loads(row['data_json'])
+    except Exception:
         return None
 
 
@@ -1211,6 +2124,62 @@ def delete_all_ai_reports() -> int:
 
 # ==================== 股票搜索相关函数 ====================
 
+# 股票搜索内存索引（每个 worker 一份）：/api/stocks/sync 完成后显式刷新，
+# 其它 worker 超过 STOCK_INDEX_TTL 秒后台重建；重建期间继续用旧索引
+STOCK_INDEX_TTL = float(os.environ.get('STOCK_INDEX_TTL', 600))
+
+_stock_index: Optional[StockSearchIndex] = None
+_stock_index_built = 0.0
+_stock_index_lock = threading.Lock()
+
+
+def refresh_stock_search_index() -> int:
+    """从 stocks 表重建搜索索引，返回收录的股票数"""
+    global _stock_index, _stock_index_built
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT code, name, pinyin, pinyin_abbr, market_type, sector FROM stocks')
+        rows = cursor.fetchall()
+    index = StockSearchIndex(rows)
+    _stock_index, _stock_index_built = index, time.monotonic()
+    return len(index)
+
+
+def _refresh_stock_index_quietly():
+    try:
+        refresh_stock_search_index()
+    except Exception as e:
+        print(f"[DB] 股票搜索索引重建失败: {e}")
+    finally:
+        _stock_index_lock.release()
+
+
+def _get_stock_index() -> Optional[StockSearchIndex]:
+    """取当前索引；首次同步构建，过期时后台重建（同一时刻只有一个重建任务）"""
+    index = _stock_index
+    if index is not None and time.monotonic() - _stock_index_built < STOCK_INDEX_TTL:
+        return index
+    if not _stock_index_lock.acquire(blocking=index is None):
+        return index
+    if index is not None:
+        threading.Thread(target=_refresh_stock_index_quietly, daemon=True).start()
+        return index
+    try:
+        if _stock_index is None:
+            refresh_stock_search_index()
+    finally:
+        _stock_index_lock.release()
+    return _stock_index
+
+
+def stock_search_index_stats() -> Dict:
+    """搜索索引状态（本 worker）"""
+    index = _stock_index
+    if index is None:
+        return {'loaded': False}
+    return {'loaded': True, 'age_sec': round(time.monotonic() - _stock_index_built, 1), **index.stats()}
+
+
 def search_stocks(keyword: str, limit: int = 20) -> List[Dict]:
     """
     模糊搜索股票（支持代码、名称、拼音首字母）
@@ -1226,7 +2195,16 @@ def search_stocks(keyword: str, limit: int = 20) -> List[Dict]:
         return []
     
     keyword = keyword.strip()
-    
+
+    # 走内存索引（排序规则同下方 SQL）；索引不可用时退回数据库查询
+    try:
+        index = _get_stock_index()
+    except Exception as e:
+        print(f"[DB] 股票搜索索引不可用，改查数据库: {e}")
+        index = None
+    if index is not None and len(index):
+        return index.search(keyword, limit)
+
     with get_connection() as conn:
         cursor = conn.cursor()
         
@@ -1321,7 +2299,6 @@ def upsert_stocks_batch(stocks_data: List[Dict]) -> int:
         成功处理的条数
     """
     import pypinyin
-    saved = 0
     now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     def ensure_pinyin(item):
@@ -1337,29 +2314,27 @@ def upsert_stocks_batch(stocks_data: List[Dict]) -> int:
             ).lower()
         return item
     
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        for item in stocks_data:
-            try:
-                item = ensure_pinyin(item)
-                cursor.execute('''
-                    INSERT INTO stocks (code, name, pinyin, pinyin_abbr, market_type, sector, updatetime)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        name = VALUES(name),
-                        pinyin = VALUES(pinyin),
-                        pinyin_abbr = VALUES(pinyin_abbr),
-                        market_type = COALESCE(VALUES(market_type), market_type),
-                        sector = VALUES(sector),
-                        updatetime = VALUES(updatetime)
-                ''', (item['code'], item['name'], item.get('pinyin', ''),
-                      item.get('pinyin_abbr', ''), item.get('market_type'),
-                      item.get('sector'), now_str))
-                saved += 1
-            except Exception:
-                continue
-        conn.commit()
-        return saved
+    rows = []
+    for item in stocks_data:
+        try:
+            item = ensure_pinyin(item)
+            rows.append((item['code'], item['name'], item.get('pinyin', ''),
+                         item.get('pinyin_abbr', ''), item.get('market_type'),
+                         item.get('sector'), now_str))
+        except Exception:
+            continue
+
+    return executemany_chunked('''
+        INSERT INTO stocks (code, name, pinyin, pinyin_abbr, market_type, sector, updatetime)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            name = VALUES(name),
+            pinyin = VALUES(pinyin),
+            pinyin_abbr = VALUES(pinyin_abbr),
+            market_type = COALESCE(VALUES(market_type), market_type),
+            sector = VALUES(sector),
+            updatetime = VALUES(updatetime)
+    ''', rows)['rows']
 
 
 def get_stock_sectors_by_codes(codes: List[str]) -> Dict[str, str]:
@@ -1393,25 +2368,28 @@ def get_stock_sectors_by_codes(codes: List[str]) -> Dict[str, str]:
 # ==================== 新闻缓存 ====================
 
 def init_news_cache_table():
-    """初始化新闻缓存表"""
+    """初始化新闻缓存表（init_db 已包含，单独调用供只用新闻缓存的脚本）"""
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS news_cache (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                news_date DATE NOT NULL,
-                source VARCHAR(50) NOT NULL,
-                title VARCHAR(500) NOT NULL,
-                content TEXT,
-                time_str VARCHAR(50) DEFAULT '',
-                url VARCHAR(1000) DEFAULT '',
-                news_hash VARCHAR(64) NOT NULL,
-                fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY uk_hash_date (news_hash, news_date),
-                INDEX idx_news_date (news_date),
-                INDEX idx_source (source)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
+        _create_news_cache_table(conn.cursor())
+
+
+def _create_news_cache_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS news_cache (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            news_date DATE NOT NULL,
+            source VARCHAR(50) NOT NULL,
+            title VARCHAR(500) NOT NULL,
+            content TEXT,
+            time_str VARCHAR(50) DEFAULT '',
+            url VARCHAR(1000) DEFAULT '',
+            news_hash VARCHAR(64) NOT NULL,
+            fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uk_hash_date (news_hash, news_date),
+            INDEX idx_news_date (news_date),
+            INDEX idx_source (source)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
 
 
 def _compute_news_hash(title: str, content: str = "") -> str:
@@ -1445,37 +2423,29 @@ def save_news_items(news_list: List[Dict]) -> int:
     批量保存新闻到缓存（按新闻本身的 time 字段解析日期，实现去重）
     返回实际新增条数
     """
-    saved = 0
-    # 按日期分组，同一天合并一次连接
-    by_date: Dict[date, List[Dict]] = {}
+    rows = []
     for item in news_list:
         news_date = _parse_news_date(item.get("time") or "")
         if news_date is None:
             news_date = date.today()
-        by_date.setdefault(news_date, []).append(item)
-
-    for news_date, items in by_date.items():
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            for item in items:
-                title = (item.get("title") or "")[:500]
-                content = (item.get("content") or "")[:2000]
-                source = (item.get("source") or "")[:50]
-                time_str = (item.get("time") or "")[:50]
-                url = (item.get("url") or "")[:1000]
-                news_hash = _compute_news_hash(title, content)
+        title = (item.get("title") or "")[:500]
+        content = (item.get("content") or "")[:2000]
+        rows.append((
+            news_date,
+            (item.get("source") or "")[:50],
+            title,
+            content,
+            (item.get("time") or "")[:50],
+            (item.get("url") or "")[:1000],
+            _compute_news_hash(title, content),
+        ))
 
-                try:
-                    cursor.execute('''
-                        INSERT IGNORE INTO news_cache
-                        (news_date, source, title, content, time_str, url, news_hash)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ''', (news_date, source, title, content, time_str, url, news_hash))
-                    if cursor.rowcount > 0:
-                        saved += 1
-                except Exception:
-                    continue
-    return saved
+    # INSERT IGNORE 的影响行数即实际新增条数（重复 hash 不计）
+    return executemany_chunked('''
+        INSERT IGNORE INTO news_cache
+        (news_date, source, title, content, time_str, url, news_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ''', rows)['affected']
 
 
 def get_cached_news(days: int = 1) -> List[Dict]:
@@ -1511,19 +2481,35 @@ def get_cached_news(days: int = 1) -> List[Dict]:
 
 def delete_expired_news_cache(keep_days: int = 30) -> int:
     """删除过期新闻缓存（默认保留30天）"""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'DELETE FROM news_cache WHERE news_date < DATE_SUB(CURDATE(), INTERVAL %s DAY)',
-            (keep_days,)
-        )
-        return cursor.rowcount
+    cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+    return delete_rows_before('news_cache', 'news_date', cutoff)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 持仓数据管理
 # ─────────────────────────────────────────────────────────────────────────────
 
+_UPSERT_HOLDING_SQL = '''
+    INSERT INTO holdings
+        (stock_code, stock_name, sector, avg_cost, current_price,
+         position_ratio, profit_loss_pct, profit_loss_amount,
+         hold_days, position_type, remark)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        stock_name = VALUES(stock_name),
+        sector = VALUES(sector),
+        avg_cost = VALUES(avg_cost),
+        current_price = VALUES(current_price),
+        position_ratio = VALUES(position_ratio),
+        profit_loss_pct = VALUES(profit_loss_pct),
+        profit_loss_amount = VALUES(profit_loss_amount),
+        hold_days = VALUES(hold_days),
+        position_type = VALUES(position_type),
+        remark = IF(holdings.remark IS NULL OR holdings.remark = '' OR holdings.remark NOT LIKE 'AI推荐(%%)',
+                     VALUES(remark), holdings.remark)
+'''
+
+
 def upsert_holding(code: str, name: str, sector: str = '', avg_cost: float = 0,
                    current_price: float = 0, position_ratio: float = 0,
                    profit_loss_pct: float = 0, profit_loss_amount: float = 0,
@@ -1532,27 +2518,9 @@ def upsert_holding(code: str, name: str, sector: str = '', avg_cost: float = 0,
     """新增或更新一条持仓记录（code 唯一）"""
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO holdings
-                (stock_code, stock_name, sector, avg_cost, current_price,
-                 position_ratio, profit_loss_pct, profit_loss_amount,
-                 hold_days, position_type, remark)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                stock_name = VALUES(stock_name),
-                sector = VALUES(sector),
-                avg_cost = VALUES(avg_cost),
-                current_price = VALUES(current_price),
-                position_ratio = VALUES(position_ratio),
-                profit_loss_pct = VALUES(profit_loss_pct),
-                profit_loss_amount = VALUES(profit_loss_amount),
-                hold_days = VALUES(hold_days),
-                position_type = VALUES(position_type),
-                remark = IF(holdings.remark IS NULL OR holdings.remark = '' OR holdings.remark NOT LIKE 'AI推荐(%%)',
-                             VALUES(remark), holdings.remark)
-        ''', (code, name, sector, avg_cost, current_price,
-              position_ratio, profit_loss_pct, profit_loss_amount,
-              hold_days, position_type, remark))
+        cursor.execute(_UPSERT_HOLDING_SQL, (code, name, sector, avg_cost, current_price,
+                                             position_ratio, profit_loss_pct, profit_loss_amount,
+                                             hold_days, position_type, remark))
         return cursor.rowcount > 0
 
 
@@ -1601,25 +2569,26 @@ def delete_holding(code: str) -> bool:
 
 
 def upsert_holdings_batch(holdings_list: List[Dict]) -> int:
-    """批量新增或更新持仓（原子操作）"""
-    count = 0
+    """批量新增或更新持仓，返回成功写入的条数"""
+    rows = []
     for h in holdings_list:
-        ok = upsert_holding(
-            code=h.get('code', ''),
-            name=h.get('name', ''),
-            sector=h.get('sector', ''),
-            avg_cost=float(h.get('avgCost', 0)),
-            current_price=float(h.get('currentPrice', 0)),
-            position_ratio=float(h.get('positionRatio', 0)),
-            profit_loss_pct=float(h.get('profitLossPct', 0)),
-            profit_loss_amount=float(h.get('profitLossAmount', 0)),
-            hold_days=int(h.get('holdDays', 0)),
-            position_type=h.get('positionType', 'long'),
-            remark=h.get('remark', ''),
-        )
-        if ok:
-            count += 1
-    return count
+        try:
+            rows.append((
+                h.get('code', ''),
+                h.get('name', ''),
+                h.get('sector', ''),
+                float(h.get('avgCost', 0)),
+                float(h.get('currentPrice', 0)),
+                float(h.get('positionRatio', 0)),
+                float(h.get('profitLossPct', 0)),
+                float(h.get('profitLossAmount', 0)),
+                int(h.get('holdDays', 0)),
+                h.get('positionType', 'long'),
+                h.get('remark', ''),
+            ))
+        except (TypeError, ValueError):
+            continue
+    return executemany_chunked(_UPSERT_HOLDING_SQL, rows)['rows']
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1628,23 +2597,42 @@ def upsert_holdings_batch(holdings_list: List[Dict]) -> int:
 
 def _migrate_agent_analysis_history_cols(cursor):
     """迁移 agent_analysis_history 表缺失列（历史遗留问题）"""
-    cols = _get_table_columns(cursor, 'agent_analysis_history')
+    cols = _get_table_columns(cursor, 'agent_analysis_history', refresh=True)
     for col, typ in [
         ('thinking_text', 'LONGTEXT'),
         ('remark',         'TEXT'),
     ]:
         if col not in cols:
             cursor.execute(f'ALTER TABLE agent_analysis_history ADD COLUMN {col} {typ} NULL')
+            _forget_table_columns('agent_analysis_history')
 
 
-def _get_table_columns(cursor, table_name: str) -> set:
-    """获取表的所有列名（兼容历史迁移）"""
-    cursor.execute(
-        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
-        (table_name,)
-    )
-    return {row['COLUMN_NAME'] for row in cursor.fetchall()}
+# 表结构缓存：列只会在 init_db 的迁移里增加，进程内查一次即可（迁移 ALTER 后清掉对应项）
+_table_columns_cache: Dict[str, frozenset] = {}
+
+
+def _get_table_columns(cursor, table_name: str, refresh: bool = False) -> frozenset:
+    """获取表的所有列名（兼容历史迁移）；默认走进程内缓存，refresh=True 时重新查询"""
+    cols = None if refresh else _table_columns_cache.get(table_name)
+    if cols is None and DB_BACKEND == 'sqlite':
+        cursor.execute(f'PRAGMA table_info({table_name})')
+        cols = frozenset(row['name'] for row in cursor.fetchall())
+        if cols:
+            _table_columns_cache[table_name] = cols
+    elif cols is None:
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (table_name,)
+        )
+        cols = frozenset(row['COLUMN_NAME'] for row in cursor.fetchall())
+        if cols:
+            _table_columns_cache[table_name] = cols
+    return cols
+
+
+def _forget_table_columns(table_name: str):
+    _table_columns_cache.pop(table_name, None)
 
 
 def _snapshot_float(v, default: float = 0.0) -> float:
@@ -1833,29 +2821,83 @@ def save_agent_analysis_history(
         return cursor.lastrowid
 
 
+# agent_analysis_history 轻量列（列表页只需这些）
+_AGENT_HISTORY_META_COLS = ('id', 'agent_id', 'report_date', 'scan_id', 'stance',
+                            'confidence', 'tokens_used', 'model', 'report_time')
+
+# 大字段：返回键 → 列名（JSON 列读回后解码）
+AGENT_HISTORY_BLOBS = {
+    'holdings_snapshot': 'holdings_snapshot_json',
+    'analysis_result': 'analysis_result_json',
+    'raw_response_text': 'raw_response_text',
+    'thinking_text': 'thinking_text',
+}
+_AGENT_HISTORY_JSON_BLOBS = {'holdings_snapshot': [], 'analysis_result': {}}
+
+# 投影：meta 只含轻量列；list 附带持仓快照与结构化结果；full 含原始返回与思考过程
+AGENT_HISTORY_PROJECTIONS = {
+    'meta': (),
+    'list': ('holdings_snapshot', 'analysis_result'),
+    'full': tuple(AGENT_HISTORY_BLOBS),
+}
+
+
+def _agent_history_columns(cursor, fields) -> List[str]:
+    """
+    按投影计算要查询的列（只查存在的列，兼容历史迁移前的表结构）。
+
+    fields: 投影名（meta / list / full）或大字段键的列表，如 ('holdings_snapshot',)
+    """
+    if isinstance(fields, str):
+        if fields not in AGENT_HISTORY_PROJECTIONS:
+            raise ValueError(f'未知投影: {fields}')
+        blobs = AGENT_HISTORY_PROJECTIONS[fields]
+    else:
+        unknown = [f for f in fields if f not in AGENT_HISTORY_BLOBS]
+        if unknown:
+            raise ValueError(f'未知字段: {unknown}')
+        blobs = tuple(fields)
+    cols = _get_table_columns(cursor, 'agent_analysis_history')
+    wanted = list(_AGENT_HISTORY_META_COLS) + [AGENT_HISTORY_BLOBS[b] for b in blobs]
+    return [c for c in wanted if c in cols]
+
+
+def _agent_history_row(row: Dict) -> Dict:
+    """解码查询到的 JSON 大字段，并把日期 / 时间转成字符串"""
+    d = dict(row)
+    for key, empty in _AGENT_HISTORY_JSON_BLOBS.items():
+        col = AGENT_HISTORY_BLOBS[key]
+        if col in d:
+            raw = d.pop(col)
+            d[key] = json.loads(raw) if raw else empty
+    rd = d.get('report_date')
+    if hasattr(rd, 'isoformat'):
+        d['report_date'] = rd.isoformat()
+    rt = d.get('report_time')
+    if isinstance(rt, datetime):
+        d['report_time'] = rt.strftime('%Y-%m-%d %H:%M:%S')
+    return d
+
+
 def get_agent_analysis_history(
     agent_id: str,
     start_date: str = None,
     end_date: str = None,
     limit: int = 30,
+    before: str = None,
+    fields='full',
 ) -> List[Dict]:
     """
     查询 Agent 分析历史，支持按日期范围过滤。
     默认返回最近 limit 条。
-    """
-    import json as _json
 
+    - before: 键集分页游标，只返回 report_date 早于该日期的记录（传上一页最后一条的 report_date）；
+      (agent_id, report_date) 唯一，直接走 uk_agent_date 索引，翻页不随页数变慢
+    - fields: 投影（见 AGENT_HISTORY_PROJECTIONS），列表页用 'list' / 'meta' 避免读取大字段
+    """
     with get_connection() as conn:
         cursor = conn.cursor()
-        # 只查存在的列，兼容历史迁移前的数据
-        cols = _get_table_columns(cursor, 'agent_analysis_history')
-        sel_cols = []
-        for c in ['id', 'agent_id', 'report_date', 'scan_id',
-                  'holdings_snapshot_json', 'analysis_result_json',
-                  'raw_response_text', 'thinking_text', 'stance', 'confidence',
-                  'tokens_used', 'model', 'report_time']:
-            if c in cols:
-                sel_cols.append(c)
+        sel_cols = _agent_history_columns(cursor, fields)
         if not sel_cols:
             return []
 
@@ -1868,104 +2910,278 @@ def get_agent_analysis_history(
         if end_date:
             sql += ' AND report_date <= %s'
             args.append(end_date)
+        if before:
+            sql += ' AND report_date < %s'
+            args.append(before)
 
-        sql += ' ORDER BY report_date DESC, report_time DESC LIMIT %s'
+        sql += ' ORDER BY report_date DESC LIMIT %s'
         args.append(limit)
 
         cursor.execute(sql, tuple(args))
-        result = []
-        for row in cursor.fetchall():
-            # cursorclass=DictCursor 已返回 dict，直接使用
-            d = dict(row) if not isinstance(row, dict) else row
-            d['holdings_snapshot'] = _json.loads((d.pop('holdings_snapshot_json') or '[]')) if d.get('holdings_snapshot_json') else []
-            d['analysis_result']   = _json.loads((d.pop('analysis_result_json')   or '{}')) if d.get('analysis_result_json')  else {}
-            # thinking_text 直接保留在 d 中
-            rd = d.get('report_date')
-            if hasattr(rd, 'isoformat'):
-                d['report_date'] = rd.isoformat()
-            rt = d.get('report_time')
-            if isinstance(rt, datetime):
-                d['report_time'] = rt.strftime('%Y-%m-%d %H:%M:%S')
-            result.append(d)
-        return result
+        return [_agent_history_row(row) for row in cursor.fetchall()]
 
 
-def get_latest_agent_analysis(agent_id: str) -> Optional[Dict]:
-    """获取某 Agent 最新一次分析（含持仓快照和分析结果）"""
-    import json as _json
+def get_latest_agent_analysis(agent_id: str, fields='full') -> Optional[Dict]:
+    """获取某 Agent 最新一次分析（默认含持仓快照、分析结果及原始返回）"""
+    rows = get_agent_analysis_history(agent_id, limit=1, fields=fields)
+    return rows[0] if rows else None
+
+
+def get_today_agent_analysis(agent_id: str, fields='full') -> Optional[Dict]:
+    """获取某 Agent 今日分析记录（含持仓快照和分析结果），无则返回 None"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    rows = get_agent_analysis_history(agent_id, start_date=today, end_date=today, limit=1, fields=fields)
+    return rows[0] if rows else None
+
+
+def get_agent_analysis_blob(agent_id: str, record_id: int, field: str) -> Optional[Dict]:
+    """
+    按需读取单条分析记录的某个大字段（列表页点开详情时再取）。
 
+    Returns:
+        {'id', 'report_date', field: 值}；记录不存在返回 None；field 未知抛 ValueError
+    """
     with get_connection() as conn:
         cursor = conn.cursor()
-        cols = _get_table_columns(cursor, 'agent_analysis_history')
-        sel_cols = []
-        for c in ['id', 'agent_id', 'report_date', 'scan_id',
-                  'holdings_snapshot_json', 'analysis_result_json',
-                  'raw_response_text', 'thinking_text', 'stance', 'confidence',
-                  'tokens_used', 'model', 'report_time']:
-            if c in cols:
-                sel_cols.append(c)
-        if not sel_cols:
+        cols = _agent_history_columns(cursor, (field,))
+        if AGENT_HISTORY_BLOBS[field] not in cols:
             return None
-
-        sql = (f"SELECT {', '.join(sel_cols)} FROM agent_analysis_history "
-               f"WHERE agent_id = %s ORDER BY report_date DESC, report_time DESC LIMIT 1")
-        cursor.execute(sql, (agent_id,))
+        cursor.execute(
+            f"SELECT id, report_date, {AGENT_HISTORY_BLOBS[field]} FROM agent_analysis_history "
+            f"WHERE id = %s AND agent_id = %s",
+            (record_id, agent_id),
+        )
         row = cursor.fetchone()
-        if not row:
-            return None
-        d = dict(row) if not isinstance(row, dict) else row
-        d['holdings_snapshot'] = _json.loads(d.pop('holdings_snapshot_json') or '[]') if d.get('holdings_snapshot_json') else []
-        d['analysis_result']   = _json.loads(d.pop('analysis_result_json') or '{}')   if d.get('analysis_result_json')  else {}
-        rd = d.get('report_date')
-        if hasattr(rd, 'isoformat'):
-            d['report_date'] = rd.isoformat()
-        rt = d.get('report_time')
-        if isinstance(rt, datetime):
-            d['report_time'] = rt.strftime('%Y-%m-%d %H:%M:%S')
-        return d
+        return _agent_history_row(row) if row else None
 
 
-def get_today_agent_analysis(agent_id: str) -> Optional[Dict]:
-    """获取某 Agent 今日分析记录（含持仓快照和分析结果），无则返回 None"""
-    import json as _json
-    today = datetime.now().strftime('%Y-%m-%d')
+# ==================== 数据保留 / 表空间 ====================
+# 表名、列名均来自代码内常量（db_maintenance.RETENTION 等），不接受外部输入
+
+RETENTION_BATCH_SIZE = int(os.environ.get('DB_RETENTION_BATCH_SIZE', 5000))
 
+
+def delete_rows_before(table: str, date_col: str, cutoff: str, batch_size: int = None) -> int:
+    """
+    删除 date_col < cutoff 的行，按 LIMIT 分批、每批单独提交（走日期索引的范围删除，
+    不产生长事务与大量 undo，也不长时间锁表）。返回删除行数。
+    """
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    total = 0
     with get_connection() as conn:
         cursor = conn.cursor()
-        cols = _get_table_columns(cursor, 'agent_analysis_history')
-        sel_cols = []
-        for c in ['id', 'agent_id', 'report_date', 'scan_id',
-                  'holdings_snapshot_json', 'analysis_result_json',
-                  'raw_response_text', 'thinking_text', 'stance', 'confidence',
-                  'tokens_used', 'model', 'report_time']:
-            if c in cols:
-                sel_cols.append(c)
-        if not sel_cols:
-            return None
+        while True:
+            cursor.execute(f'DELETE FROM {table} WHERE {date_col} < %s LIMIT %s', (cutoff, batch_size))
+            deleted = cursor.rowcount
+            conn.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
 
-        sql = (f"SELECT {', '.join(sel_cols)} FROM agent_analysis_history "
-               f"WHERE agent_id = %s AND report_date = %s ORDER BY report_time DESC LIMIT 1")
-        cursor.execute(sql, (agent_id, today))
-        row = cursor.fetchone()
-        if not row:
-            return None
-        d = dict(row) if not isinstance(row, dict) else row
-        d['holdings_snapshot'] = _json.loads(d.pop('holdings_snapshot_json') or '[]') if d.get('holdings_snapshot_json') else []
-        d['analysis_result']   = _json.loads(d.pop('analysis_result_json') or '{}')   if d.get('analysis_result_json')  else {}
-        rd = d.get('report_date')
-        if hasattr(rd, 'isoformat'):
-            d['report_date'] = rd.isoformat()
-        rt = d.get('report_time')
-        if isinstance(rt, datetime):
-            d['report_time'] = rt.strftime('%Y-%m-%d %H:%M:%S')
-        return d
+
+def fetch_rows_before(table: str, date_col: str, cutoff: str, after_id: int = 0, limit: int = 500) -> List[Dict]:
+    """按 id 键集分页读取 date_col < cutoff 的整行（归档用）"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT * FROM {table} WHERE {date_col} < %s AND id > %s ORDER BY id LIMIT %s',
+            (cutoff, after_id, limit),
+        )
+        return list(cursor.fetchall())
 
 
-# 初始化新闻缓存表
-try:
-    init_news_cache_table()
-except Exception as e:
-    print(f"[WARN] 新闻缓存表初始化失败: {e}")
+def fetch_rows_by_ids(table: str, id_col: str, ids: List[int]) -> List[Dict]:
+    """读取 id_col IN ids 的整行（归档扫描子表用）"""
+    if not ids:
+        return []
+    placeholders = ','.join(['%s'] * len(ids))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {table} WHERE {id_col} IN ({placeholders}) ORDER BY id', tuple(ids))
+        return list(cursor.fetchall())
+
+
+def delete_rows_by_ids(table: str, ids: List[int]) -> int:
+    """按主键删除一批行"""
+    if not ids:
+        return 0
+    placeholders = ','.join(['%s'] * len(ids))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', tuple(ids))
+        return cursor.rowcount
+
+
+def delete_scans(scan_ids: List[int]) -> int:
+    """批量删除扫描记录及其板块 / 个股结果，返回删除的扫描记录数"""
+    if not scan_ids:
+        return 0
+    placeholders = ','.join(['%s'] * len(scan_ids))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'DELETE FROM scan_result_stocks WHERE scan_id IN ({placeholders})', tuple(scan_ids))
+        cursor.execute(f'DELETE FROM scan_results WHERE scan_id IN ({placeholders})', tuple(scan_ids))
+        cursor.execute(f'DELETE FROM scan_records WHERE id IN ({placeholders})', tuple(scan_ids))
+        return cursor.rowcount
+
+
+def get_table_sizes() -> List[Dict]:
+    """
+    当前库各表占用（information_schema 估算值，按总大小降序）：
+    [{table, rows, data_mb, index_mb, total_mb, free_mb}, ...]
+    """
+    if DB_BACKEND == 'sqlite':
+        return _sqlite_table_sizes()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT TABLE_NAME AS tbl, TABLE_ROWS AS row_count, DATA_LENGTH AS data_len,
+                   INDEX_LENGTH AS index_len, DATA_FREE AS data_free
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY DATA_LENGTH + INDEX_LENGTH DESC
+        ''')
+        mb = 1024 * 1024
+        return [{
+            'table': r['tbl'],
+            'rows': int(r['row_count'] or 0),
+            'data_mb': round((r['data_len'] or 0) / mb, 2),
+            'index_mb': round((r['index_len'] or 0) / mb, 2),
+            'total_mb': round(((r['data_len'] or 0) + (r['index_len'] or 0)) / mb, 2),
+            'free_mb': round((r['data_free'] or 0) / mb, 2),
+        } for r in cursor.fetchall()]
+
+
+def _sqlite_table_sizes() -> List[Dict]:
+    """SQLite：行数精确计数；页占用取自 dbstat（编译未启用时为 0），空闲页只有整库数值"""
+    mb = 1024 * 1024
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%%'", ())
+        tables = [r['name'] for r in cursor.fetchall()]
+        cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'", ())
+        index_table = {r['name']: r['tbl_name'] for r in cursor.fetchall()}
+        pages: Dict[str, int] = {}
+        try:
+            cursor.execute('SELECT name, SUM(pgsize) AS size FROM dbstat GROUP BY name', ())
+            pages = {r['name']: r['size'] or 0 for r in cursor.fetchall()}
+        except Exception:
+            pass
+        out = []
+        for t in tables:
+            cursor.execute(f'SELECT COUNT(*) AS n FROM {t}', ())
+            index_bytes = sum(v for k, v in pages.items() if index_table.get(k) == t)
+            data_bytes = pages.get(t, 0)
+            out.append({
+                'table': t,
+                'rows': cursor.fetchone()['n'],
+                'data_mb': round(data_bytes / mb, 2),
+                'index_mb': round(index_bytes / mb, 2),
+                'total_mb': round((data_bytes + index_bytes) / mb, 2),
+                'free_mb': 0.0,
+            })
+    return sorted(out, key=lambda r: r['total_mb'], reverse=True)
+
+
+def optimize_table(table: str) -> None:
+    """重建表回收删除后留下的空闲页（InnoDB 为在线重建）"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'OPTIMIZE TABLE {table}')
+        cursor.fetchall()
+
+
+# ─── 异步写（write-behind） ───────────────────────────────────────────────────
+#
+# K 线缓存、新闻入库、扫描进度等非关键写入交给后台线程攒批落库，请求 / 扫描线程不等数据库。
+# 同一 key 未落库前重复提交只写最新一次；进程退出时写完队列。详见 utils.write_behind。
+#   DB_WRITE_BEHIND=0                  关闭，*_deferred 改为同步写
+#   DB_WRITE_BEHIND_MAX_PENDING        队列上限（默认 5000），超出后新 key 同步写
+#   DB_WRITE_BEHIND_INTERVAL           攒批等待秒数（默认 0.5）
+
+WRITE_BEHIND_ENABLED = os.environ.get('DB_WRITE_BEHIND', '1') != '0'
+
+# 关闭时队列上限为 0，所有提交都在调用线程同步写
+_write_queue = WriteBehindQueue(
+    max_pending=int(os.environ.get('DB_WRITE_BEHIND_MAX_PENDING', 5000)) if WRITE_BEHIND_ENABLED else 0,
+    batch_size=BULK_CHUNK_SIZE,
+    flush_interval=float(os.environ.get('DB_WRITE_BEHIND_INTERVAL', 0.5)),
+)
+
+
+def _fail_on_false(fn):
+    """save_* 吞掉异常返回 False，转成异常以计入队列失败次数"""
+    def write(*args):
+        if fn(*args) is False:
+            raise RuntimeError(f'{fn.__name__} 写入失败')
+    return write
+
+
+def _fail_on_short(fn):
+    """批量写返回写入条数、逐行失败只少计数，少于提交条数时抛异常，由队列逐条重试并计失败"""
+    def write_many(rows):
+        written = fn(rows)
+        if written < len(rows):
+            raise RuntimeError(f'{fn.__name__} 仅写入 {written}/{len(rows)} 条')
+    return write_many
+
+
+_write_queue.register('kline_cache', _fail_on_false(save_kline_cache), _fail_on_short(save_kline_cache_batch))
+_write_queue.register('kline_raw_cache', _fail_on_false(_store_kline_raw_cache))
+_write_queue.register(
+    'news',
+    lambda item: save_news_items([item]),
+    lambda rows: save_news_items([item for (item,) in rows]),
+)
+_write_queue.register('scan_progress', update_scan_progress)
+
+
+def save_kline_cache_deferred(stock_code: str, data: Dict, interval: str = 'daily') -> bool:
+    """异步保存K线缓存；落库前 get_kline_cache 在本进程内即可读到。返回是否已入队"""
+    if not stock_code:
+        raise ValueError("stock_code 不能为空")
+    if not data:
+        raise ValueError("data 不能为空")
+    key = _kline_cache_key(stock_code, interval)
+    return _write_queue.submit('kline_cache', key, key, data)
+
+
+def save_kline_raw_cache_deferred(stock_code: str, df, adjust: str = 'qfq') -> bool:
+    """异步保存原始K线缓存（入队时复制 DataFrame，调用方之后可继续修改）"""
+    if not stock_code:
+        return False
+    df = df.copy() if isinstance(df, pd.DataFrame) else list(df or [])
+    return _write_queue.submit('kline_raw_cache', stock_code, stock_code, df, adjust)
+
+
+def save_news_items_deferred(news_list: List[Dict]) -> int:
+    """异步保存新闻（按标题 + 内容去重合并），返回入队条数"""
+    for item in news_list:
+        title = (item.get("title") or "")[:500]
+        content = (item.get("content") or "")[:2000]
+        _write_queue.submit('news', _compute_news_hash(title, content), item)
+    return len(news_list)
+
+
+def update_scan_progress_deferred(scan_id: int, progress: int, current_sector: str) -> bool:
+    """异步更新扫描进度（同一扫描只保留最新一次）"""
+    return _write_queue.submit('scan_progress', scan_id, scan_id, progress, current_sector)
+
+
+def flush_pending_writes(timeout: Optional[float] = None) -> bool:
+    """等待异步写队列清空；超时返回 False"""
+    return _write_queue.flush(timeout)
+
+
+def write_queue_stats() -> Dict:
+    """异步写队列状态（本 worker）：深度、峰值、合并 / 写入 / 失败次数、批次耗时"""
+    st = _write_queue.stats()
+    st['enabled'] = WRITE_BEHIND_ENABLED
+    return st
+
+
+# 初始化数据库（含新闻缓存表）
+init_db()
 
 # 启动时清理过期缓存（保留30天）
 try:
@@ -1974,6 +3190,3 @@ try:
         print(f"🧹 清理过期新闻缓存: 删除了{deleted}条")
 except Exception as e:
     print(f"[WARN] 清理过期新闻缓存失败: {e}")
-
-# 初始化数据库
-init_db()
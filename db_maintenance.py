@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库保留策略与整理
+====================
+
+缓存表与历史表只增不减，冷数据把热表挤出 buffer pool。每日定时执行一次：
+
+1. 缓存表（kline_cache / kline_raw_cache / sector_stocks_cache / news_cache）：
+   按日期列分批范围删除过期行（不归档，过期即失效）
+2. 历史表（scan_records 及其板块 / 个股结果、agent_analysis_history）：
+   超期数据先写入 gzip JSONL 归档文件，再删除
+3. 删除后空闲空间占比较大的表执行 OPTIMIZE TABLE 回收
+4. 前后各记录一次表大小（行数、数据 / 索引 / 空闲 MB）
+
+未采用 MySQL 分区：分区键须包含在每个唯一键中，且分区表不支持外键，
+现有表（自增主键、scan_id 外键）都需改结构；按日期索引分批删除可达到同样效果。
+
+- run_maintenance()                 立即执行一次（也供 /api/db/maintenance 手动触发）
+- start_maintenance_scheduler()     每日 DB_MAINTENANCE_AT（默认 03:30）自动执行
+多 worker 部署时用 database.named_lock（MySQL GET_LOCK）保证同一时刻只有一个 worker 在执行。
+
+环境变量：
+    RETENTION_<表名>_DAYS   各表保留天数，如 RETENTION_NEWS_CACHE_DAYS=30、RETENTION_SCANS_DAYS=90
+    DB_ARCHIVE_DIR          归档目录（默认 data/archive）
+    DB_COMPACT              0 关闭 OPTIMIZE（默认 1）
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DB_MAINTENANCE_AT = os.environ.get('DB_MAINTENANCE_AT', '03:30')
+ARCHIVE_DIR = os.environ.get('DB_ARCHIVE_DIR', os.path.join('data', 'archive'))
+COMPACT_ENABLED = os.environ.get('DB_COMPACT', '1') != '0'
+COMPACT_MIN_FREE_MB = float(os.environ.get('DB_COMPACT_MIN_FREE_MB', 64))
+COMPACT_MIN_FREE_RATIO = float(os.environ.get('DB_COMPACT_MIN_FREE_RATIO', 0.3))
+
+_ARCHIVE_BATCH = 500
+_LOCK_NAME = 'facstock_db_maintenance'
+
+
+def _keep_days(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.environ.get(f'RETENTION_{name.upper()}_DAYS', default)))
+    except ValueError:
+        return default
+
+
+# 缓存表：(表, 日期列, 默认保留天数)
+# kline_raw_cache 是本地日线历史，每只股票一行、每日追加时更新 cache_date；
+# 长期未更新的行即退市 / 长期停牌股票，删除后下次访问重新拉取
+CACHE_RETENTION = (
+    ('kline_cache', 'cache_date', 2),
+    ('kline_raw_cache', 'cache_date', 120),
+    ('sector_stocks_cache', 'cache_date', 7),
+    ('news_cache', 'news_date', 30),
+)
+
+# 归档后删除的历史数据默认保留天数
+SCANS_KEEP_DAYS = 90
+AGENT_HISTORY_KEEP_DAYS = 180
+
+
+def cutoff_date(keep_days: int, today: Optional[date] = None) -> str:
+    """保留最近 keep_days 天（含今天）时的删除界限：早于该日期的行过期"""
+    return ((today or date.today()) - timedelta(days=keep_days)).isoformat()
+
+
+def _json_default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (bytes, bytearray)):
+        return v.hex()
+    return str(v)
+
+
+class ArchiveWriter:
+    """
+    gzip JSONL 归档文件：每行 {"table": 表名, "row": 整行}。
+    先写临时文件，close() 时 fsync 并改名，确保删除源数据前归档已完整落盘。
+    """
+
+    def __init__(self, directory: str, name: str):
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.path = os.path.join(directory, f'{name}-{stamp}.jsonl.gz')
+        self._tmp = self.path + '.part'
+        self._raw = open(self._tmp, 'wb')
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        self.rows = 0
+
+    def write(self, table: str, rows: Iterable[Dict]):
+        for row in rows:
+            line = json.dumps({'table': table, 'row': row}, ensure_ascii=False, default=_json_default)
+            self._gz.write(line.encode('utf-8') + b'\n')
+            self.rows += 1
+
+    def close(self) -> Optional[str]:
+        """完成归档并返回文件路径；无数据时删除临时文件返回 None"""
+        self._gz.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        if not self.rows:
+            os.remove(self._tmp)
+            return None
+        os.replace(self._tmp, self.path)
+        return self.path
+
+
+def read_archive(path: str) -> List[Dict]:
+    """读取归档文件，返回 [{table, row}, ...]（恢复数据 / 核对用）"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def tables_to_compact(sizes: List[Dict], min_free_mb: float = None, min_free_ratio: float = None) -> List[str]:
+    """空闲空间超过阈值（MB 与占比同时满足）的表"""
+    min_free_mb = COMPACT_MIN_FREE_MB if min_free_mb is None else min_free_mb
+    min_free_ratio = COMPACT_MIN_FREE_RATIO if min_free_ratio is None else min_free_ratio
+    out = []
+    for t in sizes:
+        total = t['total_mb'] + t['free_mb']
+        if t['free_mb'] >= min_free_mb and total and t['free_mb'] / total >= min_free_ratio:
+            out.append(t['table'])
+    return out
+
+
+# ─── 各步骤 ───────────────────────────────────────────────────────────────────
+
+def _purge_caches(db, today: date) -> Dict[str, int]:
+    deleted = {}
+    for table, col, default in CACHE_RETENTION:
+        try:
+            deleted[table] = db.delete_rows_before(table, col, cutoff_date(_keep_days(table, default), today))
+        except Exception as e:
+            logger.warning('[DBMaint] 清理 %s 失败: %s', table, e)
+            deleted[table] = -1
+    return deleted
+
+
+def _archive_agent_history(db, today: date) -> Dict:
+    cutoff = cutoff_date(_keep_days('agent_analysis_history', AGENT_HISTORY_KEEP_DAYS), today)
+    writer = ArchiveWriter(ARCHIVE_DIR, 'agent_analysis_history')
+    ids, after = [], 0
+    try:
+        while True:
+            rows = db.fetch_rows_before('agent_analysis_history', 'report_date', cutoff, after, _ARCHIVE_BATCH)
+            if not rows:
+                break
+            writer.write('agent_analysis_history', rows)
+            ids.extend(r['id'] for r in rows)
+            after = rows[-1]['id']
+    finally:
+        path = writer.close()
+    deleted = 0
+    for i in range(0, len(ids), _ARCHIVE_BATCH):
+        deleted += db.delete_rows_by_ids('agent_analysis_history', ids[i:i + _ARCHIVE_BATCH])
+    return {'cutoff': cutoff, 'archived': writer.rows, 'deleted': deleted, 'file': path}
+
+
+def _archive_scans(db, today: date) -> Dict:
+    cutoff = cutoff_date(_keep_days('scans', SCANS_KEEP_DAYS), today)
+    writer = ArchiveWriter(ARCHIVE_DIR, 'scans')
+    scan_ids, after = [], 0
+    try:
+        while True:
+            records = db.fetch_rows_before('scan_records', 'scan_time', cutoff, after, _ARCHIVE_BATCH)
+            if not records:
+                break
+            batch = [r['id'] for r in records]
+            writer.write('scan_records', records)
+            writer.write('scan_results', db.fetch_rows_by_ids('scan_results', 'scan_id', batch))
+            writer.write('scan_result_stocks', db.fetch_rows_by_ids('scan_result_stocks', 'scan_id', batch))
+            scan_ids.extend(batch)
+            after = batch[-1]
+    finally:
+        path = writer.close()
+    deleted = 0
+    for i in range(0, len(scan_ids), _ARCHIVE_BATCH):
+        deleted += db.delete_scans(scan_ids[i:i + _ARCHIVE_BATCH])
+    return {'cutoff': cutoff, 'archived_rows': writer.rows, 'deleted_scans': deleted, 'file': path}
+
+
+def _compact(db, sizes: List[Dict]) -> List[str]:
+    done = []
+    for table in tables_to_compact(sizes):
+        try:
+            db.optimize_table(table)
+            done.append(table)
+        except Exception as e:
+            logger.warning('[DBMaint] OPTIMIZE %s 失败: %s', table, e)
+    return done
+
+
+# ─── 入口 ─────────────────────────────────────────────────────────────────────
+
+def _run(db, today: date) -> Dict:
+    start = time.time()
+    try:
+        tables_before = db.get_table_sizes()
+        result = {
+            'success': True,
+            'deleted': _purge_caches(db, today),
+            'agent_history': _archive_agent_history(db, today),
+            'scans': _archive_scans(db, today),
+        }
+        # information_schema 的空闲空间为估算值，可能滞后一轮；未达阈值的留到下次
+        tables_after = db.get_table_sizes()
+        result['optimized'] = _compact(db, tables_after) if COMPACT_ENABLED else []
+        if result['optimized']:
+            tables_after = db.get_table_sizes()
+        result.update({
+            'tables_before': tables_before,
+            'tables_after': tables_after,
+            'elapsed': round(time.time() - start, 2),
+        })
+        logger.info('[DBMaint] 整理完成: deleted=%s agent=%s scans=%s optimized=%s (%.1fs)',
+                    result['deleted'], result['agent_history'], result['scans'],
+                    result['optimized'], result['elapsed'])
+        return result
+    except Exception as e:
+        logger.error('[DBMaint] 整理失败: %s', e)
+        return {'success': False, 'error': str(e)}
+
+
+def run_maintenance(today: Optional[date] = None) -> Dict:
+    """
+    执行一次保留策略与整理。
+
+    Returns:
+        {'success', 'deleted', 'agent_history', 'scans', 'optimized', 'tables_before', 'tables_after', 'elapsed'}
+    """
+    try:
+        import database as db
+
+        with db.named_lock(_LOCK_NAME) as ok:
+            if not ok:
+                return {'success': False, 'error': '数据库整理正在其它进程中执行'}
+            return _run(db, today or date.today())
+    except Exception as e:
+        logger.error('[DBMaint] 整理失败: %s', e)
+        return {'success': False, 'error': str(e)}
+
+
+def start_maintenance_scheduler():
+    """启动每日数据库整理定时任务"""
+    try:
+        import schedule
+
+        # 独立调度器：默认调度器由其它定时线程共用，各线程都调 run_pending 可能重复执行
+        scheduler = schedule.Scheduler()
+
+        def run():
+            scheduler.every().day.at(DB_MAINTENANCE_AT).do(run_maintenance)
+            logger.info('[DBMaint] 数据库整理定时任务已启动（每日 %s）', DB_MAINTENANCE_AT)
+            while True:
+                scheduler.run_pending()
+                time.sleep(30)
+
+        threading.Thread(target=run, daemon=True).start()
+    except ImportError:
+        logger.warning('[DBMaint] schedule 模块未安装，数据库整理定时任务无法启动')
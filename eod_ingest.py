@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+收盘后日线批量入库
+==================
+
+收盘后拉一次全 A 现货快照（market_data._fetch_spot_em_dataframe，一次请求约 5000 只），
+转换为当日日线后一次性追加到本地日线历史（kline_raw_cache），次日扫描直接读本地历史，
+上一交易日无需再逐只请求 K 线。
+
+- ingest_eod_bars()            立即执行一次（也供 /api/kline/eod-ingest 手动触发）
+- start_eod_ingest_scheduler() 每个交易日 EOD_INGEST_AT（默认 15:10）自动执行
+多 worker 部署时每个 worker 都会启动定时任务，由 database.named_lock（MySQL GET_LOCK）保证同一时刻只有一个在入库；
+之后到点的 worker 重复追加同一交易日会因 bar 与本地最后一根相同而跳过。
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EOD_INGEST_AT = os.environ.get('EOD_INGEST_AT', '15:10')
+
+# 快照列 → 日线字段（东财 / 新浪 / push2 三个源列名一致）
+_SPOT_COLS = {
+    '代码': 'code', '今开': 'open', '最高': 'high', '最低': 'low', '最新价': 'close',
+    '成交量': 'volume', '成交额': 'amount', '换手率': 'turnover', '昨收': 'prev_close',
+}
+
+_LOCK_NAME = 'facstock_eod_ingest'
+
+
+def spot_to_daily_bars(df: pd.DataFrame) -> Dict[str, Dict]:
+    """
+    全 A 现货快照 → {code: {open, high, low, close, volume, amount, turnover, prev_close}}。
+
+    - 代码去掉 sh/sz/bj 前缀
+    - 停牌 / 无成交（成交量 ≤ 0 或价格 ≤ 0）的股票跳过
+    - 成交量统一为「股」（按 成交额 / (成交量 × 价格) 识别源数据是否为「手」）
+    """
+    if df is None or df.empty or not {'代码', '今开', '最高', '最低', '最新价', '成交量'} <= set(df.columns):
+        return {}
+
+    from market_data import _normalize_stock_code
+
+    spot = df[[c for c in _SPOT_COLS if c in df.columns]].rename(columns=_SPOT_COLS).copy()
+    for col in ('open', 'high', 'low', 'close', 'volume', 'amount', 'turnover', 'prev_close'):
+        if col in spot.columns:
+            spot[col] = pd.to_numeric(spot[col], errors='coerce')
+        else:
+            spot[col] = float('nan')
+    spot['code'] = spot['code'].map(_normalize_stock_code)
+    spot = spot[(spot['volume'] > 0) & (spot['close'] > 0) & (spot['open'] > 0)
+                & spot['code'].str.fullmatch(r'\d{6}')]
+    if spot.empty:
+        return {}
+
+    ratio = spot['amount'] / (spot['volume'] * spot['close'])
+    spot['volume'] = spot['volume'].where(~(ratio > 10), spot['volume'] * 100)
+
+    spot = spot.astype(object).where(spot.notna(), None)
+    return {
+        r['code']: {k: r[k] for k in ('open', 'high', 'low', 'close', 'volume', 'amount', 'turnover', 'prev_close')}
+        for r in spot.to_dict('records')
+    }
+
+
+def ingest_eod_bars(trade_date: Optional[str] = None) -> Dict:
+    """
+    拉取全 A 快照并批量追加当日日线。
+
+    Returns:
+        {'success', 'trade_date', 'snapshot', 'appended', 'skipped', 'missing',
+         'factors_refreshed', 'stale', 'elapsed'}
+    """
+    trade_date = trade_date or datetime.now().strftime('%Y-%m-%d')
+    try:
+        import database as db
+
+        with db.named_lock(_LOCK_NAME) as ok:
+            if not ok:
+                return {'success': False, 'error': '日线入库正在进行中'}
+            return _ingest(db, trade_date)
+    except Exception as e:
+        logger.error('[EOD] %s 日线入库失败: %s', trade_date, e)
+        return {'success': False, 'trade_date': trade_date, 'error': str(e)}
+
+
+def _ingest(db, trade_date: str) -> Dict:
+    try:
+        start = time.time()
+        from market_data import _fetch_spot_em_dataframe
+
+        bars = spot_to_daily_bars(_fetch_spot_em_dataframe())
+        if not bars:
+            logger.warning('[EOD] %s 全A快照为空，跳过入库', trade_date)
+            return {'success': False, 'trade_date': trade_date, 'error': '全A快照为空'}
+
+        stats = db.append_daily_bars(bars, trade_date)
+        result = {
+            'success': True,
+            'trade_date': trade_date,
+            'snapshot': len(bars),
+            **stats,
+            'elapsed': round(time.time() - start, 2),
+        }
+        logger.info('[EOD] %s 日线入库完成: %s', trade_date, result)
+        return result
+    except Exception as e:
+        logger.error('[EOD] %s 日线入库失败: %s', trade_date, e)
+        return {'success': False, 'trade_date': trade_date, 'error': str(e)}
+
+
+def start_eod_ingest_scheduler():
+    """启动收盘后日线入库定时任务（仅工作日）"""
+    try:
+        import schedule
+
+        def _job():
+            if datetime.now().weekday() < 5:
+                ingest_eod_bars()
+
+        # 独立调度器：默认调度器由其它定时线程共用，各线程都调 run_pending 会互相执行对方的任务
+        scheduler = schedule.Scheduler()
+
+        def run():
+            scheduler.every().day.at(EOD_INGEST_AT).do(_job)
+            logger.info('[EOD] 收盘日线入库定时任务已启动（每个交易日 %s）', EOD_INGEST_AT)
+            while True:
+                scheduler.run_pending()
+                time.sleep(30)
+
+        threading.Thread(target=run, daemon=True).start()
+    except ImportError:
+        logger.warning('[EOD] schedule 模块未安装，日线入库定时任务无法启动')
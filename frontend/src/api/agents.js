@@ -383,6 +383,22 @@ export async function fetchTodayAnalysis(agentId) {
   }
 }
 
+/**
+ * 按需获取某条分析记录的大字段（历史列表默认不返回原始返回 / 思考过程）
+ * @param {string} agentId
+ * @param {number} recordId
+ * @param {'raw_response_text'|'thinking_text'|'analysis_result'|'holdings_snapshot'} field
+ * @returns {Promise<any>}
+ */
+export async function fetchAnalysisField(agentId, recordId, field) {
+  try {
+    const json = await apiGet(`${BASE}/agents/${agentId}/analysis/${recordId}/${field}`)
+    return json.data ?? null
+  } catch {
+    return null
+  }
+}
+
 /**
  * 获取 Agent Prompt 详情
  * @param {string} agentId
@@ -28,7 +28,10 @@ import numpy as np
 
 from utils.retry import retry_request
 from bollinger_squeeze_strategy import BollingerSqueezeStrategy
-from cache import get as _cache_get, set as _cache_set, invalidate as _cache_invalidate
+from cache import (
+    get as _cache_get, set as _cache_set, get_many as _cache_get_many,
+    invalidate as _cache_invalidate, delete_key as _cache_delete,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -40,24 +43,8 @@ _CACHE_KEY_SECTOR_STOCKS = 'junge/sector_stocks:{sector_name}'
 _CACHE_KEY_KLINE = 'junge/kline:{code}'
 _CACHE_KEY_SCAN = 'junge/scan:{date}:{sectors}'
 
-def _df_to_dict(df: pd.DataFrame) -> dict:
-    """DataFrame → 普通 dict（用于 JSON 序列化）"""
-    if df is None:
-        return {}
-    return {
-        'columns': list(df.columns),
-        'data': df.values.tolist(),
-    }
-
-def _dict_to_df(d: dict) -> pd.DataFrame:
-    """dict → DataFrame"""
-    if not d or not d.get('columns') or not d.get('data'):
-        return pd.DataFrame()
-    df = pd.DataFrame(d['data'], columns=d['columns'])
-    for col in df.columns:
-        if df[col].dtype == object:
-            df[col] = pd.to_numeric(df[col], errors='ignore')
-    return df
+# 预取结果的最长使用期（秒）：板块扫描期间有效，之后回到逐个读缓存
+_PREFETCH_MAX_AGE = 60
 
 def _sector_stocks_key(name: str) -> str:
     return _CACHE_KEY_SECTOR_STOCKS.format(sector_name=name)
@@ -95,6 +82,8 @@ class DataFetcher:
 
     def __init__(self):
         self._ths_crawler = None
+        # 批量预取的缓存结果 key → (值或 None=已确认未命中, 预取时间)；逐只读取时不再访问 Redis
+        self._prefetched: Dict[str, Tuple[object, float]] = {}
 
     @property
     def ths(self):
@@ -104,6 +93,29 @@ class DataFetcher:
             self._ths_crawler = ths_crawler
         return self._ths_crawler
 
+    def _prefetch(self, keys: List[str]):
+        """一次 Redis 往返批量读取 keys，供随后的逐个 get_xxx 使用"""
+        hits = _cache_get_many(keys)
+        now = time.time()
+        self._prefetched = {k: v for k, v in self._prefetched.items() if now - v[1] <= _PREFETCH_MAX_AGE}
+        for k in keys:
+            self._prefetched[k] = (hits.get(k), now)
+
+    def _cache_lookup(self, key: str):
+        """读取缓存：优先用 _PREFETCH_MAX_AGE 秒内的预取结果（用后即弃），否则单独访问缓存"""
+        entry = self._prefetched.pop(key, None)
+        if entry is not None and time.time() - entry[1] <= _PREFETCH_MAX_AGE:
+            return entry[0]
+        return _cache_get(key)
+
+    def prefetch_sector_stocks(self, sector_names: List[str]):
+        """批量预取多个板块的成分股缓存"""
+        self._prefetch([_sector_stocks_key(n) for n in sector_names])
+
+    def prefetch_klines(self, codes: List[str]):
+        """批量预取一批股票的 K 线缓存（板块扫描前调用）"""
+        self._prefetch([_kline_key(c) for c in codes])
+
     def get_hot_sectors(self, top_n: int = 10) -> List[Dict]:
         """获取热点板块（带缓存，TTL 15分钟）"""
         cached = _cache_get(_CACHE_KEY_SECTORS)
@@ -141,7 +153,7 @@ class DataFetcher:
     def get_sector_stocks(self, sector_name: str, sector_code: str = '') -> List[Dict]:
         """获取板块成分股（带缓存，TTL 5分钟）"""
         key = _sector_stocks_key(sector_name)
-        cached = _cache_get(key)
+        cached = self._cache_lookup(key)
         if cached is not None:
             logger.info("板块 '%s' 成分股命中缓存", sector_name)
             return cached
@@ -210,12 +222,11 @@ class DataFetcher:
     def get_stock_kline(self, code: str, days: int = 120) -> Optional[pd.DataFrame]:
         """获取股票K线数据（带缓存，TTL 5分钟）"""
         key = _kline_key(code)
-        cached = _cache_get(key)
-        if cached is not None:
-            df = _dict_to_df(cached)
-            if not df.empty:
-                logger.info("股票 %s K线命中缓存", code)
-                return df
+        cached = self._cache_lookup(key)
+        # DataFrame 由缓存层按列编码直接存取；旧版 {'columns', 'data'} 条目视为未命中，5 分钟内自然过期
+        if isinstance(cached, pd.DataFrame) and not cached.empty:
+            logger.info("股票 %s K线命中缓存", code)
+            return cached.copy()   # L1 命中返回共享对象，下游会原地加指标列
 
         try:
             from utils.ths_crawler import get_stock_kline_sina
@@ -227,7 +238,7 @@ class DataFetcher:
 
             if df is not None and not df.empty:
                 logger.info("股票 %s K线存入缓存", code)
-                _cache_set(key, _df_to_dict(df), ttl=300)   # 5min
+                _cache_set(key, df, ttl=300)   # 5min
 
             return df
 
@@ -481,6 +492,9 @@ class JunGeScanner:
         if not stocks:
             return []
 
+        # 整个板块的 K 线缓存一次往返取回
+        self.fetcher.prefetch_klines([s['code'] for s in stocks if s.get('code')])
+
         results = []
 
         for stock in stocks:
@@ -520,6 +534,7 @@ class JunGeScanner:
                 return []
 
         results = []
+        self.fetcher.prefetch_klines(stock_codes[:50])
         for code in stock_codes[:50]:
             try:
                 result = self.analyze_stock(code=code, name='')
@@ -987,6 +1002,7 @@ class JunGeTrader:
         else:
             candidates = []
             scan_mode = 'hot_sectors'
+            self.fetcher.prefetch_sector_stocks([s['name'] for s in hot_sectors])
 
             for sector in hot_sectors:
                 logger.info(f"🔍 扫描板块: {sector['name']} ({sector.get('change', 0):+.2f}%)")
@@ -1192,7 +1208,7 @@ def register_junge_routes(bp, get_cache, set_cache, invalidate_cache, db_module)
                 })
                 if scan_id and result.get('hotSectors'):
                     db_module.save_hot_sectors(scan_id, result['hotSectors'])
-                invalidate_cache('scan/history')
+                _cache_delete('scan/history')   # 单个 key，无需前缀失效
             except Exception as db_err:
                 _logger.warning(f"保存扫描记录失败（非致命）: {db_err}")
 
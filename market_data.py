@@ -21,7 +21,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import logging
 
-from cache import set as cache_layer_set
+from cache import get as cache_layer_get, set as cache_layer_set
+from utils.data_replay import http_get, wrap_akshare
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,7 @@ MARKET_SNAPSHOT_REDIS_KEY = 'market/snapshot/v2'
 def _get_ak():
     """Lazy import of akshare to avoid py_mini_racer crash on import."""
     import akshare as _ak
-    return _ak
+    return wrap_akshare(_ak)
 
 
 @contextlib.contextmanager
@@ -100,23 +101,19 @@ def _ak_sina_direct():
         yield
 
 
-# 缓存相关
-_cache = {}
+# 缓存相关：上游数据集走统一缓存层（Redis 跨 worker 共享 + 有界 L1），每个周期全部署只拉一次
+_CACHE_NS = 'market/src/'
 _cache_timeout = 30  # 30秒，与 Redis TTL 保持一致
 
 
 def _get_cached(key: str) -> Optional[any]:
     """获取缓存数据"""
-    if key in _cache:
-        data, timestamp = _cache[key]
-        if datetime.now().timestamp() - timestamp < _cache_timeout:
-            return data
-    return None
+    return cache_layer_get(_CACHE_NS + key)
 
 
 def _set_cached(key: str, data: any):
     """设置缓存数据"""
-    _cache[key] = (data, datetime.now().timestamp())
+    cache_layer_set(_CACHE_NS + key, data, ttl=_cache_timeout)
 
 
 def _safe_float(val, default: float = 0.0) -> float:
@@ -158,8 +155,8 @@ def get_market_overview() -> List[Dict]:
         codes_str = ','.join(needed.keys())
         url = 'https://hq.sinajs.cn/list=' + codes_str
         from curl_cffi import requests as cr
-        resp = cr.get(url, impersonate='chrome110',
-                      headers={'Referer': 'https://finance.sina.com.cn'}, timeout=10)
+        resp = http_get(url, getter=cr.get, impersonate='chrome110',
+                        headers={'Referer': 'https://finance.sina.com.cn'}, timeout=10)
         text = resp.text
         import re
         # 解析每个hq_str_xxx="data"格式
@@ -409,7 +406,7 @@ def _apply_breadth_totals_from_spot_em_df(out: Dict, df: pd.DataFrame) -> bool:
 
 
 def peek_market_snapshot_cache() -> Optional[Dict]:
-    """返回进程内市场快照缓存（供路由层与 Redis 命中结果择优合并，不触发重新拉取）。"""
+    """返回上游层市场快照缓存（供路由层与 Redis 命中结果择优合并，不触发重新拉取）。"""
     c = _get_cached('market_snapshot')
     return c if isinstance(c, dict) else None
 
@@ -489,7 +486,7 @@ def _fetch_spot_push2_dataframe() -> Optional[pd.DataFrame]:
         'fs': 'm:0+t:6,m:0+t:80,m:1+t:2,m:1+t:23,m:0+t:81+s:2048',
         'fields': 'f1,f2,f3,f4,f5,f6,f7,f8,f9,f10,f12,f13,f14,f15,f16,f17,f18,f20,f21,f23,f24,f25,f22,f11,f62,f128,f136,f115,f152',
     }
-    r = _req.get(url, params=params, timeout=15)
+    r = http_get(url, getter=_req.get, params=params, timeout=15)
     r.raise_for_status()
     json_data = r.json()
     rows = (json_data.get('data', {}) or {}).get('diff', []) or []
@@ -633,7 +630,7 @@ def _fetch_sina_rankings(out: Dict):
 
     def _fetch_ranking(sort: str, asc: int, limit: int = 20) -> List[Dict]:
         try:
-            resp = requests.get(
+            resp = http_get(
                 SINA_BASE,
                 params={'page': 1, 'num': limit, 'sort': sort, 'asc': asc, 'node': 'hs_a'},
                 headers=SINA_HEADERS,
@@ -982,7 +979,7 @@ def get_hot_concept_sectors() -> List[Dict]:
         }
         # 新浪概念板块API（curl_cffi可以绕过IP封禁）
         url = 'https://vip.stock.finance.sina.com.cn/q/view/newFLJK.php?param=class'
-        resp = cr.get(url, headers=SINA_HEADERS, impersonate='chrome110', timeout=15)
+        resp = http_get(url, getter=cr.get, headers=SINA_HEADERS, impersonate='chrome110', timeout=15)
         if resp.status_code == 200 and resp.text and '<html>' not in resp.text[:50]:
             import re
             # 解析板块列表: <li><a href="...">板块名</a></li>
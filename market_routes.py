@@ -4,7 +4,10 @@
 市场数据路由模块
 """
 
+import copy
 import logging
+import math
+import os
 from datetime import datetime
 
 from flask import Blueprint, jsonify, request
@@ -29,13 +32,16 @@ from market_data import (
 )
 from utils.ths_crawler import get_ths_industry_list
 from ticai.news_fetcher import fetch_all_news
-from cache import get, set, delete_key
+from cache import get, get_with_ttl, set, delete_key, cached, route_cached
 
 market_bp = Blueprint('market', __name__)
 
 # 与旧版区分：此前 Redis 里可能长期缓存了 industry 为空的快照（key 定义见 market_data.MARKET_SNAPSHOT_REDIS_KEY）
 SNAPSHOT_REDIS_KEY = MARKET_SNAPSHOT_REDIS_KEY
 
+# 过期后仍可先返回旧值的秒数（stale-while-revalidate）：期间请求不等上游，后台刷新一次
+MARKET_SWR = int(os.environ.get('MARKET_CACHE_SWR', 60))
+
 
 @market_bp.route('/')
 def index():
@@ -59,126 +65,107 @@ def api_market_session():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/overview')
+@route_cached(market_bp, '/api/market/overview', 'market/overview', ttl=15, swr=MARKET_SWR)
 def api_market_overview():
     """获取大盘指数概览（Redis 缓存 15s）"""
-    hit = get('market/overview')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_market_overview()
-        set('market/overview', data, ttl=15)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _resave_snapshot(snap: dict):
+    """择优 / 补全后的快照写回缓存，沿用剩余 TTL：不把陈旧快照续成新鲜，SWR 后台刷新照常触发。"""
+    _, remaining = get_with_ttl(SNAPSHOT_REDIS_KEY)
+    if math.isinf(remaining):
+        remaining = 30 + MARKET_SWR
+    if remaining >= 1:
+        set(SNAPSHOT_REDIS_KEY, snap, ttl=int(remaining))
+
+
 @market_bp.route('/api/market/snapshot')
 def api_market_snapshot():
     """A 股全市场快照（Redis 缓存 30s）；命中缓存仍会对缺行业的排行做补全。"""
-    hit = get(SNAPSHOT_REDIS_KEY)
-    if hit is not None:
-        # Redis 可能仍是「仅新浪、涨跌家数为 0」；进程内缓存或已被东财后台线程更新，择优返回
-        mem = peek_market_snapshot_cache()
-        if isinstance(mem, dict):
-            r_breadth = int(hit.get('up_count') or 0) + int(hit.get('down_count') or 0)
-            m_breadth = int(mem.get('up_count') or 0) + int(mem.get('down_count') or 0)
-            if m_breadth > r_breadth:
-                hit = mem
-                set(SNAPSHOT_REDIS_KEY, hit, ttl=30)
-        if snapshot_rankings_need_industry_enrich(hit):
-            try:
-                enrich_snapshot_industries(hit)
-            except Exception as e:
-                logger.warning('Redis 快照行业补全失败: %s', e)
-            set(SNAPSHOT_REDIS_KEY, hit, ttl=30)
-        return jsonify({'success': True, 'data': hit})
-
     try:
-        data = get_market_snapshot()
-        set(SNAPSHOT_REDIS_KEY, data, ttl=30)
-        return jsonify({'success': True, 'data': data})
+        # 过期窗口内先返回旧快照，后台刷新
+        hit = cached(SNAPSHOT_REDIS_KEY, ttl=30, fetch_fn=get_market_snapshot, swr=MARKET_SWR)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    # hit 为 L1 共享对象（其他请求可能正在序列化），只在副本上修改
+    snap = hit
+    # Redis 可能仍是「仅新浪、涨跌家数为 0」；上游层缓存或已被东财后台线程更新，择优返回
+    mem = peek_market_snapshot_cache()
+    if isinstance(mem, dict) and mem is not hit:
+        r_breadth = int(hit.get('up_count') or 0) + int(hit.get('down_count') or 0)
+        m_breadth = int(mem.get('up_count') or 0) + int(mem.get('down_count') or 0)
+        if m_breadth > r_breadth:
+            snap = copy.deepcopy(mem)
+    if snapshot_rankings_need_industry_enrich(snap):
+        if snap is hit:
+            snap = copy.deepcopy(hit)
+        try:
+            enrich_snapshot_industries(snap)
+        except Exception as e:
+            logger.warning('Redis 快照行业补全失败: %s', e)
+    if snap is not hit and snap != hit:
+        _resave_snapshot(snap)
+    return jsonify({'success': True, 'data': snap})
 
-@market_bp.route('/api/market/flow')
+
+@route_cached(market_bp, '/api/market/flow', 'market/flow', ttl=15, swr=MARKET_SWR)
 def api_money_flow():
     """获取资金流向（Redis 缓存 15s）"""
-    hit = get('market/flow')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_money_flow()
-        set('market/flow', data, ttl=15)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/limit')
+@route_cached(market_bp, '/api/market/limit', 'market/limit', ttl=15, swr=MARKET_SWR)
 def api_limit_up():
     """获取涨跌停数据（Redis 缓存 15s）"""
-    hit = get('market/limit')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_limit_up_data()
-        set('market/limit', data, ttl=15)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/turnover')
+@route_cached(market_bp, '/api/market/turnover', 'market/turnover', ttl=30, swr=MARKET_SWR)
 def api_turnover():
     """获取换手率排行（Redis 缓存 30s）"""
-    hit = get('market/turnover')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_turnover_rate()
-        set('market/turnover', data, ttl=30)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/sectors')
+@route_cached(market_bp, '/api/market/sectors', 'market/sectors', ttl=30, swr=MARKET_SWR)
 def api_hot_sectors():
     """获取热点行业板块（Redis 缓存 30s）"""
-    hit = get('market/sectors')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_hot_sectors()
-        set('market/sectors', data, ttl=30)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/sectors/concept')
+@route_cached(market_bp, '/api/market/sectors/concept', 'market/sectors/concept', ttl=30, swr=MARKET_SWR)
 def api_hot_concept_sectors():
     """获取热点概念板块（Redis 缓存 30s）"""
-    hit = get('market/sectors/concept')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_hot_concept_sectors()
-        set('market/sectors/concept', data, ttl=30)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/sectors/main-fund-flow')
+@route_cached(market_bp, '/api/market/sectors/main-fund-flow', 'market/sectors/main-fund-flow',
+              ttl=30, swr=MARKET_SWR, query_args=('kind',))
 def api_sector_main_fund_flow():
     """
     板块主力净流入柱状图数据（亿）。
@@ -187,14 +174,8 @@ def api_sector_main_fund_flow():
     kind = (request.args.get('kind') or 'industry').strip().lower()
     if kind not in ('industry', 'concept', 'region'):
         kind = 'industry'
-    cache_key = f'market/sectors/main-fund-flow/{kind}'
-    hit = get(cache_key)
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_sector_main_fund_flow(kind)
-        set(cache_key, data, ttl=30)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -207,16 +188,11 @@ def sectors():
     return redirect('/frontend/sectors')
 
 
-@market_bp.route('/api/market/summary')
+@route_cached(market_bp, '/api/market/summary', 'market/summary', ttl=60, swr=MARKET_SWR)
 def api_market_summary():
     """获取市场综合摘要（Redis 缓存 60s）"""
-    hit = get('market/summary')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = get_ai_summary()
-        set('market/summary', data, ttl=60)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -228,93 +204,85 @@ def api_news():
     force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
     if force:
         delete_key('news/all')
-    if not force:
-        hit = get('news/all')
-        if hit is not None:
-            return jsonify({'success': True, 'data': hit})
 
     try:
-        news = fetch_all_news(limit_per_source=50, force=force)
-        set('news/all', news, ttl=180)
+        news = cached('news/all', ttl=180,
+                      fetch_fn=lambda: fetch_all_news(limit_per_source=50, force=force), swr=MARKET_SWR)
         return jsonify({'success': True, 'data': news})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/macro/summary')
+@route_cached(market_bp, '/api/macro/summary', 'macro/summary', ttl=60, swr=MARKET_SWR)
 def api_macro_summary():
     """每日宏观视角：综合评分 + 摘要文字（Redis 缓存 60s）"""
-    hit = get('macro/summary')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = compute_macro_sentiment()
-        set('macro/summary', data, ttl=60)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@market_bp.route('/api/market/index-mini')
+def _build_index_mini() -> dict:
+    """三大指数分时；腾讯 / 东财分时失败时降级为新浪 overview 单点。"""
+    from utils.ths_crawler import get_index_intraday_em
+
+    INDEX_MAP = {
+        'SSE:000001': ('000001', '1', '上证指数'),
+        'SZSE:399001': ('399001', '0', '深证成指'),
+        'SZSE:399006': ('399006', '0', '创业板指'),
+    }
+
+    result = {}
+    for symbol, (code, market, name) in INDEX_MAP.items():
+        klines = get_index_intraday_em(code, market)
+        if klines:
+            result[symbol] = {
+                'name': name,
+                'times':  [k['time'] for k in klines],
+                'closes': [k['close'] for k in klines],
+                'high':   klines[-1].get('high') or 0,
+                'low':    klines[-1].get('low') or 0,
+            }
+
+    if not result:
+        overview = get_market_overview() or []
+        name_to_symbol = {
+            '上证指数': 'SSE:000001',
+            '深证成指': 'SZSE:399001',
+            '创业板指': 'SZSE:399006',
+        }
+        today = datetime.now().strftime('%Y-%m-%d')
+        for item in overview:
+            name = item.get('name', '')
+            symbol = name_to_symbol.get(name)
+            if not symbol:
+                continue
+            price = item.get('price', 0)
+            if not price:
+                continue
+            result[symbol] = {
+                'name': name,
+                'times':  [f'{today} 00:00'],
+                'closes': [price],
+                'high':   price,
+                'low':    price,
+                'fallback': True,
+            }
+            logger.info(f'指数分时降级（Sina overview）: {name} = {price}')
+
+    return result
+
+
+@route_cached(market_bp, '/api/market/index-mini', 'market/index-mini', ttl=60, swr=MARKET_SWR)
 def api_index_mini():
     """
     三大指数近3天分时（5分钟K线）数据，供首页展示真实分时走势。
     若腾讯分时数据获取失败，降级为新浪 overview 数据（当日单点价格/涨跌幅）。
     """
-    hit = get('market/index-mini')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
-        from utils.ths_crawler import get_index_intraday_em
-
-        INDEX_MAP = {
-            'SSE:000001': ('000001', '1', '上证指数'),
-            'SZSE:399001': ('399001', '0', '深证成指'),
-            'SZSE:399006': ('399006', '0', '创业板指'),
-        }
-
-        result = {}
-        for symbol, (code, market, name) in INDEX_MAP.items():
-            klines = get_index_intraday_em(code, market)
-            if klines:
-                result[symbol] = {
-                    'name': name,
-                    'times':  [k['time'] for k in klines],
-                    'closes': [k['close'] for k in klines],
-                    'high':   klines[-1].get('high') or 0,
-                    'low':    klines[-1].get('low') or 0,
-                }
-
-        if not result:
-            overview = get_market_overview() or []
-            name_to_symbol = {
-                '上证指数': 'SSE:000001',
-                '深证成指': 'SZSE:399001',
-                '创业板指': 'SZSE:399006',
-            }
-            today = datetime.now().strftime('%Y-%m-%d')
-            for item in overview:
-                name = item.get('name', '')
-                symbol = name_to_symbol.get(name)
-                if not symbol:
-                    continue
-                price = item.get('price', 0)
-                if not price:
-                    continue
-                result[symbol] = {
-                    'name': name,
-                    'times':  [f'{today} 00:00'],
-                    'closes': [price],
-                    'high':   price,
-                    'low':    price,
-                    'fallback': True,
-                }
-                logger.info(f'指数分时降级（Sina overview）: {name} = {price}')
-
-        set('market/index-mini', result, ttl=60)
-        return jsonify({'success': True, 'data': result})
+        data = _build_index_mini()
+        return jsonify({'success': True, 'data': data})
     except Exception as e:
         logger.exception('market index mini kline')
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -721,19 +689,14 @@ def pd_notna(val) -> bool:
         return val is not None
 
 
-@market_bp.route('/api/macro/flash-report')
+@route_cached(market_bp, '/api/macro/flash-report', 'macro/flash-report', ttl=60, swr=MARKET_SWR)
 def api_macro_flash_report():
     """
     宏观同步快讯 — Editorial Intelligence 专用数据接口（Redis 缓存 60s）。
     返回: title, subtitle, international[], domestic[], events[], agents[], sectors[], synthesis{}
     """
-    hit = get('macro/flash-report')
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
-
     try:
         data = _fetch_macro_flash_report()
-        set('macro/flash-report', data, ttl=60)
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         logger.exception('macro flash report')
@@ -17,9 +17,13 @@ import random
 from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as _pd
-from cache import get, set as _cache_set, invalidate
+from cache import (
+    get, set as _cache_set, invalidate, delete_key, cached as _cached,
+    stats as cache_stats, prometheus_metrics as cache_prometheus_metrics,
+)
 import logging
 from utils.feishu_notifier import send_feishu_scan_alert, send_feishu_test
+from utils.quote_service import get_quotes, get_quote
 
 logger = logging.getLogger(__name__)
 strategy_bp = Blueprint('strategy', __name__)
@@ -93,22 +97,6 @@ def _safe_json_dumps(obj):
     ))
 
 
-def _eastmoney_mkt_cap_yuan(item: dict) -> Optional[float]:
-    """东财 ulist 条目：总市值优先 f20，其次 f62（单位：元）。"""
-    if not item:
-        return None
-    for k in ('f20', 'f62'):
-        v = item.get(k)
-        if v is None or v == '' or v == '-':
-            continue
-        try:
-            x = float(v)
-            if x > 0:
-                return x
-        except (TypeError, ValueError):
-            continue
-    return None
-
 # 全局变量存储当前扫描状态
 last_api_request_time = 0.0
 API_REQUEST_INTERVAL = 1.0
@@ -206,7 +194,7 @@ def analyze_single_stock(strategy, stock_info, precache_kline=True):
                 try:
                     kline_data = prepare_kline_data(df)
                     if kline_data:
-                        db.save_kline_cache(code, kline_data)
+                        db.save_kline_cache_deferred(code, kline_data)
                 except Exception as e:
                     print(f"[WARN] 预缓存K线数据失败 {code}: {e}")
             
@@ -406,7 +394,7 @@ def start_scan():
         'bb_width_max': bb_width_max,
     }
     scan_id = db.create_scan_record(params)
-    invalidate('scan/history')
+    delete_key('scan/history')
 
     with scan_lock:
         scan_status = {
@@ -468,6 +456,93 @@ def _fetch_kline_worker(code: str, fetch_days: int, period: int):
         return (code, None)
 
 
+def _last_closed_session(now: Optional[datetime] = None) -> str:
+    """最近一个已收盘交易日（工作日 15:00 后为当天，否则为前一个工作日；不含节假日判断）。"""
+    from datetime import timedelta
+    now = now or datetime.now()
+    day = now.date()
+    if now.weekday() >= 5 or now.hour < 15:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def _is_trading_hours(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    return now.weekday() < 5 and (9, 30) <= (now.hour, now.minute) < (15, 0)
+
+
+def _load_local_scan_klines(codes: list, fetch_days: int, period: int) -> dict:
+    """
+    扫描优先读本地日线历史（收盘后 EOD 批量入库，见 eod_ingest.py）。
+    历史需覆盖到最近一个已收盘交易日；盘中再用批量实时行情补一根当日临时 K 线。
+    返回 {code: DataFrame}，未命中的代码由调用方走网络抓取。
+    """
+    from utils.ths_crawler import _normalize_kline_df
+
+    try:
+        payloads = db.get_kline_raw_cache_batch(codes)
+    except Exception as e:
+        print(f"  [WARN] 本地日线历史读取失败: {e}")
+        return {}
+
+    need_date = _last_closed_session()
+    local = {}
+    for code, payload in payloads.items():
+        bars = payload.get('bars') or []
+        if len(bars) < period + 10 or str(bars[-1].get('date', ''))[:10] < need_date:
+            continue
+        local[code] = _pd.DataFrame(bars)
+
+    if local and _is_trading_hours():
+        today = datetime.now().strftime('%Y-%m-%d')
+        quotes = get_quotes(list(local.keys()))
+        for code, df in local.items():
+            q = quotes.get(code)
+            if not q or not q.get('close') or not q.get('open') or str(df['date'].iloc[-1])[:10] >= today:
+                continue
+            last = df.iloc[-1]
+            # 本地成交量单位与历史保持一致（行情为「手」）
+            try:
+                per_lot = float(last.get('amount') or 0) / (float(last['volume']) * float(last['close']))
+            except (TypeError, ValueError, ZeroDivisionError, KeyError):
+                per_lot = 0
+            volume = float(q.get('volume') or 0) * (1 if per_lot > 10 else 100)
+            live_bar = {'date': today, 'open': q['open'], 'high': q['high'], 'low': q['low'],
+                        'close': q['close'], 'volume': volume, 'amount': q.get('amount') or 0,
+                        'turnover': q.get('turnover') or 0}
+            local[code] = _pd.concat([df, _pd.DataFrame([live_bar])], ignore_index=True)
+
+    out = {}
+    for code, df in local.items():
+        df = _normalize_kline_df(df, fetch_days)
+        if df is not None and len(df) >= period + 10:
+            out[code] = df
+    return out
+
+
+def _persist_scan_klines(fetched: dict) -> int:
+    """
+    网络抓取的日线历史（前复权）批量写入本地日线历史，之后由 EOD 入库逐日续写，
+    下次扫描直接命中本地。已有不复权历史的代码（停牌、EOD 漏跑等）不写，避免覆盖长历史与复权因子。
+    须在计算指标前调用（指标计算会在 DataFrame 上追加列）。
+    """
+    if not fetched:
+        return 0
+    try:
+        return db.save_kline_raw_cache_batch(list(fetched.items()))
+    except Exception as e:
+        print(f"  [WARN] 日线历史入库失败: {e}")
+        return 0
+
+
+def _set_scan_progress(scan_id: int, progress: int):
+    """更新内存中的扫描进度，并经异步写队列落库（同一扫描只写最新一次，不阻塞扫描线程）"""
+    scan_status['progress'] = progress
+    db.update_scan_progress_deferred(scan_id, progress, scan_status.get('current_sector') or '')
+
+
 def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_width_max: int = 20):
     """高效扫描任务"""
     global scan_status
@@ -520,7 +595,7 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
         # 获取成分股
         print(f"\n📥 获取 {len(hot_sectors_list)} 个板块的成分股...")
         scan_status['current_sector'] = '获取成分股...'
-        scan_status['progress'] = 10
+        _set_scan_progress(scan_id, 10)
         
         cached_sectors = db.get_all_sector_stocks_cache(sector_names)
         sectors_to_fetch = [s for s in hot_sectors_list if s['name'] not in cached_sectors]
@@ -571,21 +646,27 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
         # 获取K线数据
         print(f"📈 获取K线数据...")
         scan_status['current_sector'] = '获取K线数据...'
-        scan_status['progress'] = 25
+        _set_scan_progress(scan_id, 25)
         
         kline_data = {}
+        fetch_days = max(120, int(period) + 40)
 
+        # 本地日线历史（收盘后批量入库）命中的股票无需逐只请求
         if stock_codes:
-            print(f"  🌐 需要获取: {len(stock_codes)} 只股票K线")
+            kline_data.update(_load_local_scan_klines(stock_codes, fetch_days, period))
+            print(f"  💾 本地日线命中: {len(kline_data)}/{len(stock_codes)} 只")
+        remote_codes = [c for c in stock_codes if c not in kline_data]
 
-            fetch_days = max(120, int(period) + 40)
+        if remote_codes:
+            print(f"  🌐 需要获取: {len(remote_codes)} 只股票K线")
 
             fetched_count = 0
+            fetched = {}
 
             with ProcessPoolExecutor(max_workers=5) as executor:
                 futures = {
                     executor.submit(_fetch_kline_worker, code, fetch_days, period): code
-                    for code in stock_codes
+                    for code in remote_codes
                 }
 
                 for future in as_completed(futures):
@@ -594,18 +675,21 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
                     code, df = future.result()
                     if df is not None:
                         kline_data[code] = df
+                        fetched[code] = df
                         fetched_count += 1
                         if fetched_count % 50 == 0:
-                            progress = 25 + int(fetched_count / len(stock_codes) * 30)
-                            scan_status['progress'] = min(55, progress)
-                            print(f"  📊 K线进度: {fetched_count}/{len(stock_codes)}")
+                            progress = 25 + int(fetched_count / len(remote_codes) * 30)
+                            _set_scan_progress(scan_id, min(55, progress))
+                            print(f"  📊 K线进度: {fetched_count}/{len(remote_codes)}")
 
-            print(f"  ✅ K线获取完成: {fetched_count}/{len(stock_codes)}")
+            print(f"  ✅ K线获取完成: {fetched_count}/{len(remote_codes)}")
+            saved = _persist_scan_klines(fetched)
+            print(f"  💾 日线历史入库: {saved}/{len(fetched)} 只")
         
         # 计算指标并筛选
         print(f"\n📈 计算技术指标...")
         scan_status['current_sector'] = '计算指标...'
-        scan_status['progress'] = 60
+        _set_scan_progress(scan_id, 60)
         
         analyzed_results = []
         total = len(kline_data)
@@ -739,7 +823,7 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
                 
                 if (idx + 1) % 100 == 0:
                     progress = 60 + int((idx + 1) / total * 30)
-                    scan_status['progress'] = min(90, progress)
+                    _set_scan_progress(scan_id, min(90, progress))
                     
             except Exception:
                 continue
@@ -804,29 +888,13 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
         all_codes = [r['code'] for r in analyzed_results if r.get('code')]
         if all_codes:
             try:
-                secids = [
-                    f"{'1' if c.startswith(('6','9')) else '0'}.{c}"
-                    for c in all_codes
-                ]
-                live_resp = requests.get(
-                    "http://push2.eastmoney.com/api/qt/ulist/get",
-                    params={
-                        "fltt": "2",
-                        "secids": ",".join(secids),
-                        "fields": "f2,f3,f12",
-                    },
-                    timeout=10,
-                )
-                live_map = {}
-                live_items = json.loads(live_resp.text).get('data', {}).get('diff', [])
-                for it in live_items:
-                    live_map[str(it.get('f12', ''))] = it
+                live_map = get_quotes(all_codes)
                 updated = 0
                 for r in analyzed_results:
                     live = live_map.get(r['code'])
-                    if live:
-                        r['pct_change'] = round(float(live.get('f3') or 0), 2)
-                        r['close'] = round(float(live.get('f2') or r.get('close')), 2)
+                    if live and live.get('close'):
+                        r['pct_change'] = round(float(live.get('pct_change') or 0), 2)
+                        r['close'] = round(float(live['close']), 2)
                         updated += 1
                 print(f"  📡 实时行情更新: {updated}/{len(all_codes)} 只")
             except Exception as e:
@@ -834,7 +902,7 @@ def run_scan(scan_id: int, top_sectors: int, min_days: int, period: int, bb_widt
 
         # 保存结果
         scan_status['current_sector'] = '保存结果...'
-        scan_status['progress'] = 95
+        _set_scan_progress(scan_id, 95)
 
         sector_results = {}
         for r in analyzed_results:
@@ -926,7 +994,7 @@ def create_bollinger_alert():
         if scan_id is not None and scan_id != '':
             try:
                 sid = int(scan_id)
-                if not db.get_scan_detail(sid):
+                if not db.scan_exists(sid):
                     scan_id = None
                 else:
                     scan_id = sid
@@ -962,7 +1030,7 @@ def update_bollinger_alert(rule_id: int):
             if sid is not None and sid != '':
                 try:
                     sid = int(sid)
-                    payload['scan_id'] = sid if db.get_scan_detail(sid) else None
+                    payload['scan_id'] = sid if db.scan_exists(sid) else None
                 except (TypeError, ValueError):
                     payload['scan_id'] = None
             else:
@@ -1024,6 +1092,41 @@ def get_scan_results():
     })
 
 
+@strategy_bp.route('/api/scan/stocks')
+def get_scan_stocks():
+    """
+    按条件筛选扫描个股（SQL 过滤，不加载整次扫描）。
+    Query: scan_id（默认最新完成的扫描）、grade=S,A、min_score、max_bb_width、min_squeeze_days、
+           sector、leader=1、order=score|pct_change|bb_width|squeeze_days、limit（默认 50）
+    """
+    grades = [g.strip().upper() for g in (request.args.get('grade') or '').split(',') if g.strip()]
+    try:
+        stocks = db.query_scan_stocks(
+            scan_id=request.args.get('scan_id', type=int),
+            grades=grades or None,
+            min_score=request.args.get('min_score', type=float),
+            max_bb_width=request.args.get('max_bb_width', type=float),
+            min_squeeze_days=request.args.get('min_squeeze_days', type=int),
+            sector=(request.args.get('sector') or '').strip() or None,
+            leaders_only=request.args.get('leader', default=0, type=int) == 1,
+            order_by=request.args.get('order', 'score'),
+            limit=request.args.get('limit', default=50, type=int),
+        )
+        return jsonify({'success': True, 'data': stocks})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@strategy_bp.route('/api/scan/stocks/<code>/history')
+def get_stock_scan_history(code: str):
+    """单只股票在历次扫描中的评分 / 评级（新→旧）。Query: limit（默认 30）"""
+    try:
+        history = db.get_stock_scan_history(code.strip(), limit=request.args.get('limit', default=30, type=int))
+        return jsonify({'success': True, 'data': history})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @strategy_bp.route('/api/scan/history')
 def get_scan_history():
     """获取历史扫描记录列表（Redis 缓存 60s，扫描开始/删除时失效）"""
@@ -1044,41 +1147,64 @@ def get_scan_history():
 
 # ── AI 摘要辅助函数（必须在路由前定义）──────────────────────────────────────
 
-def _scan_valid_stock_codes(detail: dict) -> set:
-    """扫描结果中出现的 6 位股票代码集合，用于过滤模型幻觉推荐。"""
+_SCAN_LLM_STOCK_LIMIT = 120
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _scan_llm_stocks(scan_id: int) -> list:
+    """
+    送入模型的扫描个股（评分前 _SCAN_LLM_STOCK_LIMIT 只，带 sector_name）。
+    新数据走 scan_result_stocks 索引查询；旧扫描个股在 stocks_json 中，才整块读取。
+    """
+    stocks = db.get_scan_top_stocks(scan_id, limit=_SCAN_LLM_STOCK_LIMIT)
+    if stocks:
+        return stocks
+    detail = db.get_scan_detail(scan_id) or {}
+    legacy = [
+        {**s, 'sector_name': s.get('sector_name') or sec_name}
+        for sec_name, block in (detail.get('results') or {}).items()
+        for s in block.get('stocks') or [] if isinstance(s, dict)
+    ]
+    legacy.sort(key=lambda s: _to_float(s.get('total_score', s.get('score'))), reverse=True)
+    return legacy[:_SCAN_LLM_STOCK_LIMIT]
+
+
+def _scan_valid_stock_codes(stocks: list) -> set:
+    """送入模型的 6 位股票代码集合，用于过滤模型幻觉推荐。"""
     import builtins
     from agent_prompts import normalize_agent_stock_code
     valid = builtins.set()
-    for _, block in (detail.get('results') or {}).items():
-        for s in block.get('stocks') or []:
-            c = normalize_agent_stock_code(s.get('code'))
-            if c:
-                valid.add(c)
+    for s in stocks:
+        c = normalize_agent_stock_code(s.get('code'))
+        if c:
+            valid.add(c)
     return valid
 
 
-def _build_scan_llm_payload(detail: dict) -> tuple:
-    """(板块概要文本, 股票行列表)"""
+def _build_scan_llm_payload(sectors: dict, stocks: list) -> tuple:
+    """(板块概要文本, 股票行列表)；sectors 为 {板块名: 涨跌幅}"""
     sector_lines = []
-    for name, block in (detail.get('results') or {}).items():
-        try:
-            ch = float(block.get('change') or 0)
-        except (TypeError, ValueError):
-            ch = 0.0
-        sector_lines.append(f"- {name}：板块涨跌 {ch:+.2f}%")
+    for name, ch in (sectors or {}).items():
+        sector_lines.append(f"- {name}：板块涨跌 {_to_float(ch):+.2f}%")
     stock_rows = []
-    for sec_name, block in (detail.get('results') or {}).items():
-        for s in block.get('stocks') or []:
-            code = s.get('code', '')
-            nm = s.get('name', '')
-            gr = s.get('grade', '')
-            pct = s.get('pct_change', '')
-            sq = s.get('squeeze_days', '')
-            bw = s.get('bandwidth_pct', s.get('bandwidth', ''))
-            sc = s.get('total_score', s.get('score', ''))
-            stock_rows.append(
-                f"{code}\t{nm}\t{sec_name}\tgrade={gr}\tpct={pct}\tsqueeze={sq}\tbw={bw}\tscore={sc}"
-            )
+    for s in stocks:
+        sec_name = s.get('sector_name', '')
+        code = s.get('code', '')
+        nm = s.get('name', '')
+        gr = s.get('grade', '')
+        pct = s.get('pct_change', '')
+        sq = s.get('squeeze_days', '')
+        bw = s.get('bandwidth_pct', s.get('bandwidth', ''))
+        sc = s.get('total_score', s.get('score', ''))
+        stock_rows.append(
+            f"{code}\t{nm}\t{sec_name}\tgrade={gr}\tpct={pct}\tsqueeze={sq}\tbw={bw}\tscore={sc}"
+        )
     return '\n'.join(sector_lines), stock_rows
 
 
@@ -1093,13 +1219,11 @@ def scan_ai_summary(scan_id: int):
 
     refresh = request.args.get('refresh', default=0, type=int) == 1
 
-    detail = db.get_scan_detail(scan_id)
-    if not detail:
+    header = db.get_scan_sectors(scan_id)
+    if not header:
         return jsonify({'success': False, 'error': '扫描记录不存在'}), 404
 
-    stock_rows_all = []
-    for _, block in (detail.get('results') or {}).items():
-        stock_rows_all.extend(block.get('stocks') or [])
+    stock_rows_all = _scan_llm_stocks(scan_id)
 
     # 无成分股：写入静态 empty 小结，不调用模型
     if not stock_rows_all:
@@ -1134,12 +1258,11 @@ def scan_ai_summary(scan_id: int):
             'data': {'fallback': True},
         }), 503
 
-    sector_text, stock_rows = _build_scan_llm_payload(detail)
-    stock_rows = stock_rows[:120]
+    sector_text, stock_rows = _build_scan_llm_payload(header['sectors'], stock_rows_all)
     stock_text = '\n'.join(stock_rows)
-    params = detail.get('params') or {}
+    params = header.get('params') or {}
 
-    user_prompt = f"""扫描时间：{detail.get('scan_time')}
+    user_prompt = f"""扫描时间：{header.get('scan_time')}
 扫描参数：{json.dumps(params, ensure_ascii=False)}
 
 【板块概要】
@@ -1172,7 +1295,7 @@ def scan_ai_summary(scan_id: int):
                     resp.provider, resp.model, len(content) if content else 0, resp.tokens_used)
 
         parsed = get_agent_registry().extract_json(content) if content else None
-        valid_codes = _scan_valid_stock_codes(detail)
+        valid_codes = _scan_valid_stock_codes(stock_rows_all)
 
         if not parsed:
             out = {
@@ -1343,23 +1466,17 @@ def factor_prompt_generate():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def _find_stock_in_scan_detail(detail: dict, code: str):
-    """在单次扫描结果中查找股票；(stock_row, sector_name, sector_change) 或 None。"""
+def _find_stock_in_scan(scan_id: int, code: str):
+    """在单次扫描结果中查找股票（按 scan_id + code 索引查询）；(stock_row, sector_name, sector_change) 或 None。"""
     from agent_prompts import normalize_agent_stock_code
 
     target = normalize_agent_stock_code(code)
     if not target:
         return None
-    for sec_name, block in (detail.get('results') or {}).items():
-        try:
-            sec_chg = float(block.get('change') or 0)
-        except (TypeError, ValueError):
-            sec_chg = 0.0
-        for s in block.get('stocks') or []:
-            c = normalize_agent_stock_code(s.get('code'))
-            if c == target:
-                return (dict(s), sec_name, sec_chg)
-    return None
+    found = db.get_scan_stock(scan_id, target)
+    if not found:
+        return None
+    return (dict(found['stock']), found['sector_name'], found['sector_change'])
 
 
 def _normalize_stock_ai_parsed(parsed: dict) -> dict:
@@ -1390,8 +1507,8 @@ def scan_stock_ai_analysis(scan_id: int):
     """
     from agent_prompts import normalize_agent_stock_code
 
-    detail = db.get_scan_detail(scan_id)
-    if not detail:
+    header = db.get_scan_sectors(scan_id)
+    if not header:
         return jsonify({'success': False, 'error': '扫描记录不存在'}), 404
 
     body = request.get_json(silent=True) or {}
@@ -1399,7 +1516,7 @@ def scan_stock_ai_analysis(scan_id: int):
     if not raw_code:
         return jsonify({'success': False, 'error': '缺少股票代码'}), 400
 
-    found = _find_stock_in_scan_detail(detail, raw_code)
+    found = _find_stock_in_scan(scan_id, raw_code)
     if not found:
         return jsonify({'success': False, 'error': '该股票不在本次扫描结果中'}), 404
 
@@ -1431,11 +1548,11 @@ def scan_stock_ai_analysis(scan_id: int):
         'tags': tag_str,
     }
 
-    scan_params = detail.get('params') or {}
+    scan_params = header.get('params') or {}
     user_prompt = f"""你正在辅助解读一次「布林带收缩策略」扫描中的单只股票（仅供研究参考，不构成投资建议）。
 
 【扫描背景】
-扫描时间：{detail.get('scan_time')}
+扫描时间：{header.get('scan_time')}
 扫描参数：{json.dumps(scan_params, ensure_ascii=False)}
 
 【标的快照】（JSON）
@@ -1530,7 +1647,7 @@ def delete_scan(scan_id: int):
     success = db.delete_scan(scan_id)
 
     if success:
-        invalidate('scan/history')
+        delete_key('scan/history')
         return jsonify({
             'success': True,
             'message': '删除成功'
@@ -1542,34 +1659,62 @@ def delete_scan(scan_id: int):
         }), 404
 
 
+# 个股详情展示的 K 线根数（与 prepare_kline_data 的 tail(60) 配合，留足指标预热期）
+DETAIL_KLINE_BARS = 120
+# 本地日线历史上限（约 6 年），月线约可得 68 根
+MAX_DAILY_HISTORY = 1500
+
+
+def _load_daily_history(code: str, min_bars: int) -> Optional[_pd.DataFrame]:
+    """
+    读取本地前复权日线历史，供日/周/月/N日线共用。
+    优先用不复权日线 + 复权因子（除权只需更新因子，历史可增量续写），
+    不可得时回退为直接抓取前复权日线。
+    """
+    from utils.kline_adjust import load_daily_history
+
+    try:
+        df = load_daily_history(code, min_bars, max_bars=MAX_DAILY_HISTORY)
+        if df is not None and not df.empty:
+            return df
+    except Exception as e:
+        logger.warning(f"{code} 不复权日线复权失败，回退前复权抓取: {e}")
+
+    from utils.ths_crawler import get_stock_kline_sina
+
+    df = get_stock_kline_sina(code, days=min_bars, interval='daily')
+    if df is None or df.empty:
+        return None
+    # 只为尚无本地历史的股票落库；已有不复权历史时写入层跳过（一次因子抓取失败不应冲掉长历史）
+    db.save_kline_raw_cache_deferred(code, df)
+    return df
+
+
 @strategy_bp.route('/api/stock/<code>')
 def get_stock_detail(code: str):
-    """获取单只股票详情"""
+    """获取单只股票详情（周/月/N日线由本地日线重采样，按周期分别缓存）"""
     global last_api_request_time
     last_api_request_time = 0
     API_REQUEST_INTERVAL = 1.0
 
-    # 读取并验证 interval 参数
-    interval_arg = request.args.get('interval', 'daily')
-    if interval_arg not in ('daily', 'weekly', 'monthly'):
-        interval_arg = 'daily'
+    from utils.kline_resample import normalize_interval, resample_daily_bars, trading_days_per_bar
 
-    from utils.ths_crawler import get_stock_kline_sina
+    # 读取并验证 interval 参数：daily | weekly | monthly | Nd
+    interval_arg = normalize_interval(request.args.get('interval', 'daily')) or 'daily'
 
     if not code or not code.isdigit() or len(code) != 6:
         return jsonify({'success': False, 'error': '无效的股票代码'})
 
     try:
-        # 缓存暂不支持 interval 分开存储，共用现有缓存
-        cached_data = db.get_kline_cache(code)
+        cached_data = db.get_kline_cache(code, interval=interval_arg)
         if cached_data and 'vp_obv' in cached_data:
-            logger.info(f"[CACHE HIT] 股票 {code} 使用缓存数据")
+            logger.info(f"[CACHE HIT] 股票 {code} ({interval_arg}) 使用缓存数据")
             return jsonify({'success': True, 'data': cached_data, 'cached': True})
 
         if cached_data and 'vp_obv' not in cached_data:
             logger.info(f"[CACHE STALE] 股票 {code} 缓存缺少量能画像数据，重新获取")
 
-        logger.info(f"[CACHE MISS] 股票 {code} 从新浪API获取数据")
+        logger.info(f"[CACHE MISS] 股票 {code} ({interval_arg}) 由本地日线计算")
 
         current_time = time.time()
         time_since_last = current_time - last_api_request_time
@@ -1580,11 +1725,17 @@ def get_stock_detail(code: str):
 
         from bollinger_squeeze_strategy import BollingerSqueezeStrategy
 
-        df = get_stock_kline_sina(code, days=120, interval=interval_arg)
+        need_days = min(MAX_DAILY_HISTORY, DETAIL_KLINE_BARS * trading_days_per_bar(interval_arg))
+        daily_df = _load_daily_history(code, need_days)
 
-        if df is None or df.empty:
+        if daily_df is None or daily_df.empty:
             return jsonify({'success': False, 'error': '数据获取失败，请稍后重试'})
 
+        df = resample_daily_bars(daily_df, interval_arg)
+        if df is None or df.empty:
+            return jsonify({'success': False, 'error': '数据处理失败'})
+        df = df.tail(DETAIL_KLINE_BARS).reset_index(drop=True)
+
         strategy = BollingerSqueezeStrategy()
         df = strategy.calculate_bollinger_bands(df)
         df = strategy.calculate_squeeze_signal(df)
@@ -1596,24 +1747,8 @@ def get_stock_detail(code: str):
         if data is None:
             return jsonify({'success': False, 'error': '数据处理失败'})
 
-        db.save_kline_cache(code, data)
-        logger.info(f"[CACHE SAVE] 股票 {code} 数据已缓存")
-
-        # 同时写入 Raw 缓存（TV 图表直读，不再重抓）
-        # kline_cache 里 candles/volumes 的 time 字段就是日期字符串
-        if data.get('candles'):
-            raw_bars = []
-            for c in data['candles']:
-                raw_bars.append({
-                    'date': c.get('time', ''),
-                    'open':  c.get('open'),
-                    'high':  c.get('high'),
-                    'low':   c.get('low'),
-                    'close': c.get('close'),
-                    'volume': 0.0,
-                })
-            if raw_bars:
-                db.save_kline_raw_cache(code, _pd.DataFrame(raw_bars))
+        db.save_kline_cache_deferred(code, data, interval=interval_arg)
+        logger.info(f"[CACHE SAVE] 股票 {code} ({interval_arg}) 数据已提交缓存")
 
         return jsonify({'success': True, 'data': data, 'cached': False})
 
@@ -1644,157 +1779,123 @@ def clear_all_cache():
         return jsonify({'success': False, 'error': str(e)})
 
 
-@strategy_bp.route('/api/watchlist/enriched')
-def get_watchlist_enriched():
-    """
-    获取自选列表（含实时行情 + 迷你K线）
-    并行查询行情数据，返回 close/pct_change/amount/vol 等字段
-    Redis 缓存 15s（外部 API 调用较重）
-    """
-    # 缓存 key 包含股票代码列表，添加/删除自选时自动失效
-    cache_key = 'watchlist/enriched'
-    hit = get(cache_key)
-    if hit is not None:
-        return jsonify({'success': True, 'data': hit})
+@strategy_bp.route('/api/cache/stats')
+def get_cache_stats():
+    """缓存层运行状态（后端、L1、降级内存缓存用量、各命名空间命中率 / 耗时 / 字节数）"""
+    return jsonify({'success': True, 'data': cache_stats()})
+
 
+@strategy_bp.route('/api/cache/metrics')
+def get_cache_metrics():
+    """缓存指标（Prometheus 文本格式，按命名空间；多 worker 时为处理本次请求的 worker）"""
+    from flask import Response
+    return Response(cache_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@strategy_bp.route('/api/db/pool/stats')
+def get_db_pool_stats():
+    """数据库连接池状态（本 worker）：借出中 / 空闲 / 使用率、等待耗时、超时与健康检查失败次数"""
+    return jsonify({'success': True, 'data': db.pool_stats()})
+
+
+@strategy_bp.route('/api/db/write-queue/stats')
+def get_db_write_queue_stats():
+    """异步写队列状态（本 worker）：队列深度、峰值、合并 / 写入 / 失败次数、批次耗时"""
+    return jsonify({'success': True, 'data': db.write_queue_stats()})
+
+
+@strategy_bp.route('/api/db/tables')
+def get_db_table_sizes():
+    """各表行数与占用（数据 / 索引 / 空闲 MB，information_schema 估算值）"""
     try:
-        stocks = db.get_watchlist()
-        if not stocks:
-            return jsonify({'success': True, 'data': []})
+        return jsonify({'success': True, 'data': db.get_table_sizes()})
+    except Exception as e:
+        logger.error(f"获取表大小失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@strategy_bp.route('/api/db/maintenance', methods=['POST'])
+def run_db_maintenance():
+    """手动执行一次数据库整理（过期缓存删除、历史归档、表空间回收），同步返回结果"""
+    from db_maintenance import run_maintenance
+    result = run_maintenance()
+    return jsonify(result), (200 if result.get('success') else 409)
+
+
+# 自选行情过期后仍可先返回旧值的秒数（后台刷新）；增删自选会清除缓存，不受此窗口影响
+WATCHLIST_ENRICHED_SWR = 45
 
-        codes = []
-        for s in stocks:
-            code = s.get('stock_code') or s.get('code') or ''
-            codes.append(code)
 
-        # 东方财富批量行情接口（优先），失败后用新浪备选
-        secids = []
+def _build_watchlist_enriched() -> list:
+    """自选列表 + 实时行情 + 迷你K线（最近10日收盘价）。"""
+    stocks = db.get_watchlist()
+    if not stocks:
+        return []
+
+    codes = []
+    for s in stocks:
+        code = s.get('stock_code') or s.get('code') or ''
+        codes.append(code)
+
+    # 统一行情服务：东财批量优先，缺失代码走新浪批量兜底
+    price_map = get_quotes(codes)
+
+    # 迷你K线（最近10日收盘价，用于缩略图）
+    mini_kline_map = {}
+    try:
+        from utils.ths_crawler import get_stock_kline_sina
+        import pandas as pd
         for c in codes:
-            m = "1" if c.startswith(("6", "9")) else "0"
-            secids.append(f"{m}.{c}")
-        price_map = {}
-        try:
-            resp = requests.get(
-                "http://push2.eastmoney.com/api/qt/ulist/get",
-                params={
-                    "fltt": "2",
-                    "secids": ",".join(secids),
-                    "fields": "f2,f3,f4,f5,f6,f7,f8,f10,f12,f14,f15,f16,f17,f18,f20,f62",
-                },
-                timeout=8,
-            )
-            raw = resp.text
             try:
-                items = json.loads(raw).get('data', {}).get('diff', [])
+                df = get_stock_kline_sina(c, days=15)
+                if df is not None and len(df) > 0:
+                    closes = df['close'].astype(str).tolist()[-10:]
+                    dates = pd.to_datetime(df['date']).astype(str).tolist()[-10:]
+                    mini_kline_map[c] = {'dates': dates, 'closes': closes}
             except Exception:
-                items = []
-            for item in items:
-                code = str(item.get('f12', ''))
-                cap = _eastmoney_mkt_cap_yuan(item)
-                price_map[code] = {
-                    'close':      item.get('f2'),
-                    'pct_change': item.get('f3'),
-                    'change':     item.get('f4'),
-                    'volume':     item.get('f5'),
-                    'amount':     item.get('f6'),
-                    'high':       item.get('f15'),
-                    'low':        item.get('f16'),
-                    'open':       item.get('f17'),
-                    'prev_close': item.get('f18'),
-                    'turnover':   item.get('f8'),
-                    'qty_ratio':  item.get('f10'),
-                    'mkt_cap':    cap,
-                }
-        except Exception as e:
-            logger.warning(f"东方财富批量行情获取失败: {e}")
+                pass
+    except Exception as e:
+        logger.warning(f"迷你K线获取失败: {e}")
+
+    result = []
+    for s in stocks:
+        code = s.get('stock_code') or s.get('code') or ''
+        p = price_map.get(code, {})
+        mk = mini_kline_map.get(code, {})
+        result.append({
+            **s,
+            'code':        code,
+            'name':        s.get('stock_name') or s.get('name') or '',
+            'sector':      s.get('sector_name') or s.get('sector') or '',
+            'close':       p.get('close'),
+            'pct_change':  p.get('pct_change'),
+            'change_amt':   p.get('change'),
+            'volume':       p.get('volume'),
+            'amount':       p.get('amount'),
+            'high':         p.get('high'),
+            'low':          p.get('low'),
+            'open':         p.get('open'),
+            'prev_close':   p.get('prev_close'),
+            'turnover':     p.get('turnover'),
+            'qty_ratio':    p.get('qty_ratio'),
+            'mkt_cap':      p.get('mkt_cap'),
+            'mini_kline':   mk,
+        })
 
-        # 备选：新浪实时行情（分批请求，每批20只）
-        if not price_map:
-            try:
-                for batch in [codes[i:i+20] for i in range(0, len(codes), 20)]:
-                    sina_codes = ",".join(
-                        f"{'sh' if c.startswith(('6','9')) else 'sz'}{c}" for c in batch
-                    )
-                    resp = requests.get(
-                        f"http://hq.sinajs.cn/list={sina_codes}",
-                        headers={"Referer": "http://finance.sina.com.cn", "User-Agent": "Mozilla/5.0"},
-                        timeout=8,
-                    )
-                    if resp.status_code == 200:
-                        for line in resp.text.strip().split("\n"):
-                            if "=" not in line:
-                                continue
-                            sym = line.split('="')[0].split("_")[-1]
-                            raw = line.split('="')[1].rstrip('";\r\n')
-                            parts = raw.split(",")
-                            if len(parts) < 32:
-                                continue
-                            code = sym[2:] if sym.startswith(("sh", "sz")) else sym
-                            prev_close = float(parts[2]) if parts[2] else 0
-                            close_price = float(parts[3]) if parts[3] else 0
-                            change = round(close_price - prev_close, 3) if prev_close else 0
-                            pct_change = round((change / prev_close) * 100, 2) if prev_close else 0
-                            price_map[code] = {
-                                'close': close_price,
-                                'pct_change': pct_change,
-                                'change': change,
-                                'volume': float(parts[8]) if parts[8] else 0,
-                                'amount': float(parts[9]) if parts[9] else 0,
-                                'high': float(parts[4]) if parts[4] else 0,
-                                'low': float(parts[5]) if parts[5] else 0,
-                                'open': float(parts[1]) if parts[1] else 0,
-                                'prev_close': prev_close,
-                                'turnover': 0,
-                                'qty_ratio': None,
-                                'mkt_cap': None,
-                            }
-            except Exception as e2:
-                logger.warning(f"新浪批量行情获取失败: {e2}")
-
-        # 迷你K线（最近10日收盘价，用于缩略图）
-        mini_kline_map = {}
-        try:
-            from utils.ths_crawler import get_stock_kline_sina
-            import pandas as pd
-            for c in codes:
-                try:
-                    df = get_stock_kline_sina(c, days=15)
-                    if df is not None and len(df) > 0:
-                        closes = df['close'].astype(str).tolist()[-10:]
-                        dates = pd.to_datetime(df['date']).astype(str).tolist()[-10:]
-                        mini_kline_map[c] = {'dates': dates, 'closes': closes}
-                except Exception:
-                    pass
-        except Exception as e:
-            logger.warning(f"迷你K线获取失败: {e}")
+    return result
 
-        result = []
-        for s in stocks:
-            code = s.get('stock_code') or s.get('code') or ''
-            p = price_map.get(code, {})
-            mk = mini_kline_map.get(code, {})
-            result.append({
-                **s,
-                'code':        code,
-                'name':        s.get('stock_name') or s.get('name') or '',
-                'sector':      s.get('sector_name') or s.get('sector') or '',
-                'close':       p.get('close'),
-                'pct_change':  p.get('pct_change'),
-                'change_amt':   p.get('change'),
-                'volume':       p.get('volume'),
-                'amount':       p.get('amount'),
-                'high':         p.get('high'),
-                'low':          p.get('low'),
-                'open':         p.get('open'),
-                'prev_close':   p.get('prev_close'),
-                'turnover':     p.get('turnover'),
-                'qty_ratio':    p.get('qty_ratio'),
-                'mkt_cap':      p.get('mkt_cap'),
-                'mini_kline':   mk,
-            })
 
-        _cache_set(cache_key, result, ttl=15)
-        return jsonify({'success': True, 'data': result})
+@strategy_bp.route('/api/watchlist/enriched')
+def get_watchlist_enriched():
+    """
+    获取自选列表（含实时行情 + 迷你K线）
+    并行查询行情数据，返回 close/pct_change/amount/vol 等字段
+    Redis 缓存 15s（外部 API 调用较重），过期后 WATCHLIST_ENRICHED_SWR 秒内先返回旧值
+    """
+    try:
+        data = _cached('watchlist/enriched', ttl=15, fetch_fn=_build_watchlist_enriched,
+                       swr=WATCHLIST_ENRICHED_SWR)
+        return jsonify({'success': True, 'data': data})
     except Exception as e:
         logger.error(f"自选股 enriched 加载失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -2017,6 +2118,7 @@ def stocks_status():
             'success': True,
             'count': total,
             'needs_sync': total == 0,
+            'search_index': db.stock_search_index_stats(),
         })
     except Exception as e:
         logger.error(f"获取股票状态失败: {e}")
@@ -2083,6 +2185,9 @@ def sync_stocks():
                     logger.warning(f"[StockSync] 备用方案（全市场快照）失败: {e}")
 
             logger.info(f"[StockSync] 同步完成，共写入 {saved} 条股票记录")
+            if saved:
+                indexed = db.refresh_stock_search_index()
+                logger.info(f"[StockSync] 搜索索引已刷新，收录 {indexed} 只股票")
 
         except Exception as e:
             logger.error(f"[StockSync] 同步过程异常: {e}")
@@ -2105,6 +2210,19 @@ def sync_stocks():
     })
 
 
+@strategy_bp.route('/api/kline/eod-ingest', methods=['POST'])
+def trigger_eod_ingest():
+    """
+    手动触发收盘后日线批量入库（全 A 快照 → 当日日线追加到本地历史）。
+    请求体可选: { "trade_date": "YYYY-MM-DD" }
+    """
+    from eod_ingest import ingest_eod_bars
+
+    data = request.get_json(silent=True) or {}
+    result = ingest_eod_bars(data.get('trade_date'))
+    return jsonify(result), (200 if result.get('success') else 500)
+
+
 @strategy_bp.route('/api/stocks/quotes', methods=['POST'])
 def get_stocks_quotes():
     """
@@ -2120,37 +2238,7 @@ def get_stocks_quotes():
         if not codes:
             return jsonify({'success': True, 'data': {}})
 
-        codes = [str(c).strip() for c in codes if str(c).strip()]
-        results = {}
-        for code in codes:
-            result = _get_quote_sina(code)
-            if result:
-                results[code] = result
-            else:
-                mkt = "1" if code.startswith(("6", "9")) else "0"
-                try:
-                    resp = requests.get(
-                        "http://push2.eastmoney.com/api/qt/ulist/get",
-                        params={
-                            "fltt": "2", "secids": f"{mkt}.{code}",
-                            "fields": "f2,f3,f4,f5,f6,f8,f10,f12,f14,f15,f16,f17,f18,f20,f62",
-                        },
-                        timeout=8,
-                    )
-                    items = resp.json().get('data', {}).get('diff', [])
-                    if items:
-                        item = items[0]
-                        results[code] = {
-                            'code': code, 'name': item.get('f14', ''),
-                            'close': item.get('f2'), 'pct_change': item.get('f3'),
-                            'change': item.get('f4'), 'volume': item.get('f5'),
-                            'amount': item.get('f6'), 'turnover': item.get('f8'),
-                            'qty_ratio': item.get('f10'), 'high': item.get('f15'),
-                            'low': item.get('f16'), 'open': item.get('f17'),
-                            'prev_close': item.get('f18'),
-                        }
-                except Exception:
-                    pass
+        results = get_quotes(codes)
 
         return jsonify({'success': True, 'data': results})
     except Exception as e:
@@ -2161,54 +2249,17 @@ def get_stocks_quotes():
 @strategy_bp.route('/api/stock/<code>/quote')
 def get_stock_quote(code: str):
     """
-    获取单只股票实时行情。
-    优先使用新浪接口（更稳定），东方财富作为备选。
+    获取单只股票实时行情（统一行情服务，东财优先、新浪兜底）。
     返回字段与前端 Watchlist.vue 期望一致。
     """
     try:
         if not code or not code.isdigit() or len(code) != 6:
             return jsonify({'success': False, 'error': '无效股票代码'}), 400
 
-        result = _get_quote_sina(code)
+        result = get_quote(code)
         if result:
             return jsonify({'success': True, **result})
 
-        # 备选：东方财富批量接口
-        mkt = "1" if code.startswith(("6", "9")) else "0"
-        secid = f"{mkt}.{code}"
-        try:
-            resp = requests.get(
-                "http://push2.eastmoney.com/api/qt/ulist/get",
-                params={
-                    "fltt": "2",
-                    "secids": secid,
-                    "fields": "f2,f3,f4,f5,f6,f8,f10,f12,f14,f15,f16,f17,f18,f20,f62",
-                },
-                timeout=8,
-            )
-            items = resp.json().get('data', {}).get('diff', [])
-            if items:
-                item = items[0]
-                return jsonify({
-                    'success': True,
-                    'code': code,
-                    'name': item.get('f14', ''),
-                    'close': item.get('f2'),
-                    'pct_change': item.get('f3'),
-                    'change': item.get('f4'),
-                    'volume': item.get('f5'),
-                    'amount': item.get('f6'),
-                    'turnover': item.get('f8'),
-                    'qty_ratio': item.get('f10'),
-                    'high': item.get('f15'),
-                    'low': item.get('f16'),
-                    'open': item.get('f17'),
-                    'prev_close': item.get('f18'),
-                    'mkt_cap': _eastmoney_mkt_cap_yuan(item),
-                })
-        except Exception:
-            pass
-
         return jsonify({'success': False, 'error': '未找到行情数据'}), 404
 
     except requests.exceptions.Timeout:
@@ -2218,81 +2269,6 @@ def get_stock_quote(code: str):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def _get_quote_sina(code: str) -> Optional[dict]:
-    """
-    使用新浪实时行情接口获取股票数据。
-    返回格式: {code, name, close, pct_change, change, volume, amount,
-               turnover, qty_ratio, high, low, open, prev_close, mkt_cap}
-    """
-    prefix = "sh" if code.startswith(("6", "9")) else "sz"
-    try:
-        resp = requests.get(
-            f"http://hq.sinajs.cn/list={prefix}{code}",
-            headers={
-                "Referer": "http://finance.sina.com.cn",
-                "User-Agent": "Mozilla/5.0",
-            },
-            timeout=8,
-        )
-        if resp.status_code != 200:
-            return None
-        text = resp.text.strip()
-        if "=" not in text or text.count(",") < 30:
-            return None
-
-        raw = text.split('="')[1].rstrip('";')
-        parts = raw.split(",")
-        if len(parts) < 32:
-            return None
-
-        def _f(val: str) -> Optional[float]:
-            try:
-                v = float(val)
-                return None if v == 0 else v
-            except Exception:
-                return None
-
-        name = parts[0]
-        prev_close = _f(parts[2])   # 昨收
-        open_price = _f(parts[1])   # 今开
-        close_price = _f(parts[3])  # 最新价
-        high_price = _f(parts[4])   # 最高
-        low_price = _f(parts[5])    # 最低
-        volume = float(parts[8]) if parts[8] else 0   # 成交量（手）
-        amount = float(parts[9]) if parts[9] else 0   # 成交额（元）
-        date_str = parts[30] if len(parts) > 30 else ""
-        time_str = parts[31] if len(parts) > 31 else ""
-
-        pct_change = 0.0
-        change = 0.0
-        if prev_close and close_price:
-            change = round(close_price - prev_close, 3)
-            pct_change = round((change / prev_close) * 100, 2)
-
-        turnover = 0.0
-        qty_ratio = None
-        mkt_cap = None
-
-        return {
-            "code": code,
-            "name": name,
-            "close": close_price,
-            "pct_change": pct_change,
-            "change": change,
-            "volume": volume,
-            "amount": amount,
-            "turnover": turnover,
-            "qty_ratio": qty_ratio,
-            "high": high_price,
-            "low": low_price,
-            "open": open_price,
-            "prev_close": prev_close,
-            "mkt_cap": mkt_cap,
-        }
-    except Exception:
-        return None
-
-
 def _enrich_stocks_realtime(structured: dict) -> None:
     """
     批量获取推荐股票的实时行情，并回填到 structured['recommendedStocks'] 中。
@@ -2317,32 +2293,10 @@ def _enrich_stocks_realtime(structured: dict) -> None:
     if not codes_to_fetch:
         return
 
-    # 批量查询（新浪优先，逐个降级东方财富）
+    # 一次批量查询全部缺失代码
+    quotes = get_quotes(codes_to_fetch)
     for code in codes_to_fetch:
-        q = _get_quote_sina(code)
-        if not q:
-            # 备选东方财富
-            mkt = "1" if code.startswith(("6", "9")) else "0"
-            try:
-                resp = requests.get(
-                    "http://push2.eastmoney.com/api/qt/ulist/get",
-                    params={
-                        "fltt": "2", "secids": f"{mkt}.{code}",
-                        "fields": "f2,f3,f4,f12,f14",
-                    },
-                    timeout=8,
-                )
-                items = resp.json().get('data', {}).get('diff', [])
-                if items:
-                    item = items[0]
-                    q = {
-                        'close': item.get('f2'),
-                        'pct_change': item.get('f3'),
-                        'name': item.get('f14', ''),
-                    }
-            except Exception:
-                pass
-
+        q = quotes.get(code)
         if q and q.get('close'):
             idx = code_index[code]
             recs[idx]['price'] = q['close']
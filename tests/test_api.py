@@ -354,6 +354,30 @@ class TestScanAPI:
         # 恢复状态
         app_module.scan_status['is_scanning'] = False
 
+    def test_fetched_klines_served_locally_next_scan(self, test_db):
+        """测试网络抓取的日线入库后，下次扫描由本地历史命中"""
+        import strategy_routes as sr
+
+        code = '600000'
+        end = pd.Timestamp(sr._last_closed_session())
+        dates = pd.bdate_range(end=end, periods=60)
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'open': 10.0, 'high': 10.5, 'low': 9.8, 'close': 10.2,
+            'volume': 1e6, 'amount': 1.02e7, 'turnover': 1.0,
+        })
+        try:
+            with patch.object(sr, '_is_trading_hours', return_value=False):
+                assert code not in sr._load_local_scan_klines([code], 120, 20)
+                assert sr._persist_scan_klines({code: df}) == 1
+                local = sr._load_local_scan_klines([code], 120, 20)
+            assert code in local
+            assert len(local[code]) == 60
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute('DELETE FROM kline_raw_cache WHERE stock_code = %s', (code,))
+                conn.commit()
+
 
 class TestStockDetailAPI:
     """股票详情接口测试"""
@@ -410,10 +434,44 @@ class TestCacheAPI:
         """测试清理缓存"""
         response = client.delete('/api/cache/clear')
         data = json.loads(response.data)
-        
+
         assert data['success'] is True
 
 
+class TestMarketSnapshotAPI:
+    """全市场快照接口测试"""
+
+    def test_enrich_copies_shared_hit_and_keeps_ttl(self, client):
+        """补全在副本上进行，不改缓存共享对象；写回沿用剩余 TTL"""
+        shared = {'up_count': 1, 'down_count': 1, 'top_gainers': [{'code': '600000', 'industry': ''}]}
+
+        def enrich(snap):
+            for row in snap['top_gainers']:
+                row['industry'] = '银行'
+
+        with patch('market_routes.cached', return_value=shared), \
+             patch('market_routes.peek_market_snapshot_cache', return_value=None), \
+             patch('market_routes.enrich_snapshot_industries', side_effect=enrich), \
+             patch('market_routes.get_with_ttl', return_value=(shared, 12.5)), \
+             patch('market_routes.set') as mock_set:
+            data = json.loads(client.get('/api/market/snapshot').data)
+
+        assert data['data']['top_gainers'][0]['industry'] == '银行'
+        assert shared['top_gainers'][0]['industry'] == ''
+        assert mock_set.call_args.kwargs['ttl'] == 12
+
+    def test_unchanged_snapshot_not_rewritten(self, client):
+        """无需补全、也未择优时不重写缓存（不把陈旧快照续成新鲜）"""
+        shared = {'up_count': 1, 'down_count': 1, 'top_gainers': [{'code': '600000', 'industry': '银行'}]}
+        with patch('market_routes.cached', return_value=shared), \
+             patch('market_routes.peek_market_snapshot_cache', return_value=None), \
+             patch('market_routes.set') as mock_set:
+            data = json.loads(client.get('/api/market/snapshot').data)
+
+        assert data['data'] == shared
+        mock_set.assert_not_called()
+
+
 class TestWatchlistAPI:
     """自选股接口测试"""
     
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一缓存层单元测试
+==================
+
+使用内存版 Redis 替身测试两级缓存：
+- L1 命中不访问 Redis
+- set / delete / invalidate 同步丢弃 L1 并广播失效
+- L1 容量上限（LRU）与前缀 TTL 规则；失效订阅在频道空闲时不误清空
+- cached() / route_cached() 并发未命中只重算一次
+- route_cached 按查询参数分 key、缓存响应 body，If-None-Match 返回 304
+- cached(swr=N) 陈旧窗口内返回旧值，后台只刷新一次
+- 命名空间版本：invalidate 只 INCR，不 SCAN / FLUSHDB
+- get_many / set_many / delete_many 一次往返
+- 按命名空间的命中率、耗时、字节数指标
+"""
+
+import fnmatch
+import json
+import threading
+import time
+
+import pytest
+
+import cache
+
+
+class _FakePipeline:
+    def __init__(self, r):
+        self._r, self._ops = r, []
+
+    def __getattr__(self, op):
+        def _queue(*args):
+            self._ops.append((op, args))
+            return self
+        return _queue
+
+    def execute(self):
+        self._r.round_trips += 1
+        return [getattr(self._r, op)(*args) for op, args in self._ops]
+
+
+class FakeRedis:
+    """最小 Redis 替身：记录 GET 次数与发布的消息"""
+
+    def __init__(self):
+        self.data, self.gets, self.published, self.round_trips = {}, 0, [], 0
+
+    def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    def ttl(self, key):
+        return 60 if key in self.data else -2
+
+    def setex(self, key, ttl, payload):
+        self.data[key] = payload
+
+    def delete(self, *keys):
+        for k in keys:
+            self.data.pop(k, None)
+
+    def scan(self, cursor, match='*', count=200):
+        return 0, [k for k in self.data if fnmatch.fnmatch(k, match)]
+
+    def flushdb(self):
+        self.data.clear()
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    def publish(self, channel, message):
+        self.published.append(json.loads(message))
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, token, *args):
+        if self.data.get(key) != token:
+            return 0
+        if 'del' in script:
+            del self.data[key]
+        return 1
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key) or 0) + 1
+        return self.data[key]
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = FakeRedis()
+    monkeypatch.setattr(cache, '_redis', r)
+    monkeypatch.setattr(cache, '_redis_available', True)
+    cache._l1_drop()
+    cache._ns_forget()
+    yield r
+    cache._l1_drop()
+    cache._ns_forget()
+
+
+class TestL1Cache:
+    """L1 进程内缓存测试"""
+
+    def test_hot_read_served_from_l1(self, fake_redis):
+        fake_redis.setex(cache._redis_key('market/overview'), 60, json.dumps({'a': 1}))
+
+        assert cache.get('market/overview') == {'a': 1}
+        assert cache.get('market/overview') == {'a': 1}
+        assert fake_redis.gets == 1
+
+    def test_set_then_get_skips_redis(self, fake_redis):
+        cache.set('scan/history', [1, 2], ttl=30)
+        assert cache.get('scan/history') == [1, 2]
+        assert fake_redis.gets == 0
+        assert fake_redis.published[-1]['k'] == 'scan/history'
+
+    def test_invalidate_drops_l1_and_broadcasts(self, fake_redis):
+        cache.set('market/a', 1, ttl=30)
+        cache.set('other/b', 2, ttl=30)
+        cache.invalidate('market/')
+
+        assert cache.get('market/a') is None
+        assert cache.get('other/b') == 2
+        assert fake_redis.published[-1] == {'o': cache._L1_ORIGIN, 'k': None, 'p': 'market/', 'ns': 'market', 'v': 1}
+
+    def test_delete_key_drops_l1(self, fake_redis):
+        cache.set('market/a', 1, ttl=30)
+        cache.delete_key('market/a')
+        assert cache.get('market/a') is None
+
+    def test_remote_invalidation_message(self, fake_redis):
+        cache.set('market/a', 1, ttl=30)
+        fake_redis.data[cache._redis_key('market/a')] = json.dumps(2)   # 其他 worker 写入新值
+        assert cache.get('market/a') == 1            # L1 仍是旧值
+        cache._l1_drop(key='market/a')               # 收到失效广播
+        assert cache.get('market/a') == 2
+
+    def test_lru_bound(self, fake_redis, monkeypatch):
+        monkeypatch.setattr(cache, 'L1_MAX_ENTRIES', 2)
+        for k in ('a', 'b', 'c'):
+            cache.set(k, k, ttl=30)
+        assert list(cache._l1) == ['b', 'c']
+
+    def test_dataframe_roundtrip_through_redis(self, fake_redis):
+        import pandas as pd
+        df = pd.DataFrame({'date': ['2024-01-02', '2024-01-03'], 'close': [10.0, 10.5]})
+        cache.set('junge/kline:600000', df, ttl=30)
+        cache._l1_drop()
+        assert isinstance(fake_redis.data[cache._redis_key('junge/kline:600000')], bytes)
+        pd.testing.assert_frame_equal(cache.get('junge/kline:600000'), df)
+
+    def test_listener_survives_idle_channel(self, fake_redis):
+        """频道空闲（get_message 超时返回 None）不清空 L1；收到广播只丢对应 key；断线异常上抛"""
+        import redis
+
+        class _FakePubSub:
+            def __init__(self, messages):
+                self.messages, self.closed = messages, False
+
+            def subscribe(self, channel):
+                pass
+
+            def get_message(self, timeout=None):
+                if not self.messages:
+                    raise redis.ConnectionError('connection lost')
+                return self.messages.pop(0)
+
+            def close(self):
+                self.closed = True
+
+        cache.set('market/a', 1, ttl=30)
+        cache.set('market/b', 2, ttl=30)
+        remote = json.dumps({'o': 'other', 'k': 'market/a', 'p': None})
+        pubsub = _FakePubSub([None, None, {'data': remote}, None])
+        fake_redis.pubsub = lambda ignore_subscribe_messages=True: pubsub
+
+        with pytest.raises(redis.ConnectionError):
+            cache._l1_listen(fake_redis)
+        assert 'market/a' not in cache._l1
+        assert cache.get('market/b') == 2
+        assert pubsub.closed
+
+    def test_ttl_rules(self, monkeypatch):
+        monkeypatch.setattr(cache, 'L1_TTL_RULES', {'market/': 5, 'market/live/': 0})
+        assert cache._l1_ttl_for('market/overview', 60) == 5
+        assert cache._l1_ttl_for('market/overview', 3) == 3
+        assert cache._l1_ttl_for('market/live/x', 60) == 0
+        assert cache._l1_ttl_for('x', 60) == cache.L1_DEFAULT_TTL
+
+
+class TestNamespaceVersions:
+    """命名空间版本失效测试"""
+
+    def test_keys_embed_namespace_version(self, fake_redis):
+        cache.set('junge/kline:600000', 1, ttl=30)
+        assert 'junge:v0.0/kline:600000' in fake_redis.data
+
+    def test_namespace_invalidate_is_one_incr(self, fake_redis, monkeypatch):
+        for i in range(50):
+            cache.set(f'junge/kline:{i}', i, ttl=30)
+        cache.set('market/a', 'keep', ttl=30)
+        monkeypatch.setattr(fake_redis, 'scan', lambda *a, **kw: pytest.fail('SCAN not expected'))
+
+        cache.invalidate('junge/')
+        cache._l1_drop()
+
+        assert fake_redis.data['nsver:junge'] == 1
+        assert cache.get('junge/kline:3') is None
+        assert cache.get('market/a') == 'keep'
+        cache.set('junge/kline:3', 'new', ttl=30)
+        assert 'junge:v0.1/kline:3' in fake_redis.data
+
+    def test_invalidate_all_bumps_global_generation(self, fake_redis, monkeypatch):
+        cache.set('market/a', 1, ttl=30)
+        fake_redis.data['unrelated'] = 'x'
+        monkeypatch.setattr(fake_redis, 'flushdb', lambda: pytest.fail('FLUSHDB not expected'))
+
+        cache.invalidate()
+        assert cache.get('market/a') is None
+        assert fake_redis.data['unrelated'] == 'x'
+        assert cache._redis_key('market/a') == 'market:v1.0/a'
+
+    def test_remote_bump_applied_from_broadcast(self, fake_redis):
+        cache.set('ticai/all', 1, ttl=30)
+        fake_redis.incr('nsver:ticai')                # 其他 worker 失效
+        cache._ns_remember('ticai', 1)               # 收到广播
+        cache._l1_drop(prefix='ticai/')
+        assert cache.get('ticai/all') is None
+
+    def test_sub_prefix_scans_current_version_only(self, fake_redis):
+        cache.set('scan/history', 1, ttl=30)
+        cache.set('scan/hot-sectors', 2, ttl=30)
+        cache.invalidate('scan/hist')
+        cache._l1_drop()
+        assert cache.get('scan/history') is None
+        assert cache.get('scan/hot-sectors') == 2
+
+    def test_short_prefix_keeps_version_counters(self, fake_redis):
+        cache.invalidate('news/')
+        cache.invalidate('n')
+        assert fake_redis.data['nsver:news'] == 1
+
+
+class TestMultiKey:
+    """批量读写测试"""
+
+    def test_get_many_one_round_trip(self, fake_redis):
+        cache.set_many({f'quote/{i}': {'close': i} for i in range(20)}, ttl=30)
+        cache._l1_drop()
+        fake_redis.round_trips = 0
+
+        hits = cache.get_many([f'quote/{i}' for i in range(25)])
+        assert len(hits) == 20 and hits['quote/7'] == {'close': 7}
+        assert fake_redis.round_trips == 1
+
+        fake_redis.round_trips = 0
+        assert cache.get_many(['quote/1', 'quote/2']) == {'quote/1': {'close': 1}, 'quote/2': {'close': 2}}
+        assert fake_redis.round_trips == 0      # 全部命中 L1
+
+    def test_set_many_broadcasts_once(self, fake_redis):
+        cache.set_many({'quote/a': 1, 'quote/b': 2}, ttl=30)
+        assert fake_redis.round_trips == 1
+        assert fake_redis.published[-1]['ks'] == ['quote/a', 'quote/b']
+
+    def test_delete_many(self, fake_redis):
+        cache.set_many({'quote/a': 1, 'quote/b': 2, 'quote/c': 3}, ttl=30)
+        cache.delete_many(['quote/a', 'quote/b'])
+        assert cache.get_many(['quote/a', 'quote/b', 'quote/c']) == {'quote/c': 3}
+
+    def test_memory_fallback(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.set_many({'m/a': 1, 'm/b': 2}, ttl=30)
+        assert cache.get_many(['m/a', 'm/b', 'm/c']) == {'m/a': 1, 'm/b': 2}
+        cache.delete_many(['m/a'])
+        assert cache.get_many(['m/a', 'm/b']) == {'m/b': 2}
+
+
+class TestMetrics:
+    """按命名空间的观测指标测试"""
+
+    @pytest.fixture(autouse=True)
+    def _reset(self, monkeypatch):
+        monkeypatch.setattr(cache, '_metrics', {})
+
+    def test_hits_misses_and_bytes(self, fake_redis):
+        cache.set('market/a', {'v': 1}, ttl=30)
+        cache.get('market/a')                     # L1
+        cache._l1_drop()
+        cache.get('market/a')                     # Redis
+        cache.get('market/missing')
+
+        m = cache.namespace_stats()['market']
+        assert (m['hits_l1'], m['hits_redis'], m['misses'], m['sets']) == (1, 1, 1, 1)
+        assert m['hit_ratio'] == round(2 / 3, 4)
+        assert m['bytes_written'] > 0 and m['bytes_read'] == m['bytes_written']
+        assert m['get_latency']['count'] == 3
+
+    def test_redis_errors_counted(self, fake_redis, monkeypatch):
+        def boom(*a, **kw):
+            raise ConnectionError('down')
+        monkeypatch.setattr(fake_redis, 'setex', boom)
+        cache.set('scan/x', 1, ttl=30)
+        assert cache.namespace_stats()['scan']['redis_errors'] == 1
+
+    def test_stale_counted(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.set('swrm/a', 1, ttl=5)
+        cache.cached('swrm/a', 30, lambda: 2, swr=60)
+        assert cache.namespace_stats()['swrm']['stale'] == 1
+
+    def test_prometheus_text(self, fake_redis):
+        cache.get('ticai/all')
+        text = cache.prometheus_metrics()
+        assert 'facstock_cache_lookups_total{namespace="ticai",result="miss"} 1' in text
+        assert 'facstock_cache_op_duration_seconds_count{namespace="ticai",op="get"} 1' in text
+        assert 'le="+Inf"' in text
+
+
+class TestBoundedMemCache:
+    """Redis 不可用时的降级内存缓存测试"""
+
+    def _mem(self, **kw):
+        return cache._BoundedMemCache(kw.get('max_entries', 100), kw.get('max_bytes', 10_000))
+
+    def test_entry_bound_evicts_lru(self):
+        mem = self._mem(max_entries=2)
+        mem.set('a', 1, 60, 1)
+        mem.set('b', 2, 60, 1)
+        mem.get('a')
+        mem.set('c', 3, 60, 1)
+        assert mem.get('b') is None
+        assert mem.get('a') == 1
+        assert mem.stats()['evictions'] == 1
+
+    def test_byte_bound(self):
+        mem = self._mem(max_bytes=100)
+        mem.set('a', 'x', 60, 60)
+        mem.set('b', 'y', 60, 60)
+        assert mem.get('a') is None
+        assert mem.stats()['bytes'] == 60
+
+    def test_sweep_removes_expired(self):
+        mem = self._mem()
+        mem.set('a', 1, -1, 10)
+        mem.set('b', 2, 60, 10)
+        assert mem.sweep() == 1
+        assert mem.stats()['entries'] == 1
+        assert mem.stats()['bytes'] == 10
+
+    def test_prefix_invalidate(self):
+        mem = self._mem()
+        for k in ('junge/kline:600000', 'junge/kline:000001', 'junge/hot_sectors', 'market/x'):
+            mem.set(k, 1, 60, 1)
+        mem.invalidate('junge/kline:')
+        assert mem.stats()['entries'] == 2
+        mem.invalidate('jun')
+        assert mem.get('market/x') == 1
+        assert mem.stats()['entries'] == 1
+        mem.invalidate()
+        assert mem.stats()['entries'] == 0
+
+    def test_fallback_path_uses_bounded_cache(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.set('t/a', {'v': 1}, ttl=30)
+        assert cache.get('t/a') == {'v': 1}
+        assert cache.stats()['backend'] == 'memory'
+        cache.delete_key('t/a')
+        assert cache.get('t/a') is None
+
+
+class TestSingleflight:
+    """击穿保护测试"""
+
+    def test_concurrent_misses_fetch_once(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.invalidate('sf/')
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'v': 1}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.cached('sf/a', 30, slow_fetch)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert results == [{'v': 1}] * 8
+
+    def test_waits_for_other_worker_lease(self, fake_redis, monkeypatch):
+        fake_redis.data['lease:sf/b'] = 'other-worker'
+
+        def other_worker_finishes():
+            time.sleep(0.1)
+            fake_redis.data[cache._redis_key('sf/b')] = json.dumps({'v': 'theirs'})
+
+        threading.Thread(target=other_worker_finishes).start()
+        assert cache.cached('sf/b', 30, lambda: {'v': 'mine'}) == {'v': 'theirs'}
+
+    def test_waits_while_lease_held_then_takes_over(self, fake_redis):
+        fake_redis.data['lease:sf/c'] = 'other-worker'
+        calls = []
+
+        def lease_expires():
+            time.sleep(0.3)
+            assert not calls                      # 租约仍被持有时不重算
+            fake_redis.data.pop('lease:sf/c')     # 持有方崩溃，租约过期
+
+        t = threading.Thread(target=lease_expires)
+        t.start()
+        assert cache.cached('sf/c', 30, lambda: calls.append(1) or 1) == 1
+        t.join()
+        assert calls == [1]
+
+        assert cache.cached('sf/d', 30, lambda: 2) == 2
+        assert 'lease:sf/d' not in fake_redis.data
+
+    def test_lease_wait_is_bounded(self, fake_redis, monkeypatch):
+        monkeypatch.setattr(cache, 'LEASE_WAIT_MAX', 0.2)
+        fake_redis.data['lease:sf/h'] = 'other-worker'   # 持有方一直续期（上游挂起）
+
+        start = time.monotonic()
+        assert cache.cached('sf/h', 30, lambda: 'mine') == 'mine'
+        assert time.monotonic() - start < 2
+        assert fake_redis.data['lease:sf/h'] == 'other-worker'
+
+    def test_local_follower_wait_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        monkeypatch.setattr(cache, 'LEASE_WAIT_MAX', 0.1)
+        cache.invalidate('sf/')
+        release = threading.Event()
+
+        t = threading.Thread(target=lambda: cache.cached('sf/hang', 30, lambda: release.wait(5) and 'late'))
+        t.start()
+        time.sleep(0.05)
+        with pytest.raises(TimeoutError):
+            cache.cached('sf/hang', 30, lambda: 'mine')
+        release.set()
+        t.join()
+
+    def test_unrelated_keys_do_not_block_and_nested_fetch(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.invalidate('sf/')
+        release = threading.Event()
+
+        def slow():
+            release.wait(2)
+            return 'slow'
+
+        t = threading.Thread(target=lambda: cache.cached('sf/slow', 30, slow))
+        t.start()
+        time.sleep(0.05)
+        # 计算中嵌套读取其它 key 不会互相阻塞 / 死锁
+        outer = cache.cached('sf/outer', 30, lambda: cache.cached('sf/inner', 30, lambda: 'in') + '!')
+        assert outer == 'in!'
+        release.set()
+        t.join()
+
+    def test_followers_get_leader_error(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.invalidate('sf/')
+        calls, errors = [], []
+
+        def failing():
+            calls.append(1)
+            time.sleep(0.1)
+            raise RuntimeError('boom')
+
+        def call():
+            try:
+                cache.cached('sf/e', 30, failing)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert errors == ['boom'] * 4
+
+
+class TestStaleWhileRevalidate:
+    """过期后先返回旧值、后台刷新测试"""
+
+    @pytest.fixture
+    def mem_backend(self, monkeypatch):
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.invalidate('swr/')
+
+    def _wait_refresh(self):
+        deadline = time.time() + 2
+        while cache._swr_inflight and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_fresh_value_not_refreshed(self, mem_backend):
+        calls = []
+        cache.cached('swr/a', 30, lambda: calls.append(1) or 'v1', swr=60)
+        assert cache.cached('swr/a', 30, lambda: calls.append(1) or 'v2', swr=60) == 'v1'
+        assert len(calls) == 1
+
+    def test_stale_value_served_and_refreshed_once(self, mem_backend):
+        cache.set('swr/b', 'old', ttl=10)          # 剩余 TTL ≤ swr → 陈旧
+        gate = threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            gate.wait(1)
+            return 'new'
+
+        before = cache.stats()['swr']['stale']
+        assert cache.cached('swr/b', 30, slow_fetch, swr=60) == 'old'
+        assert cache.cached('swr/b', 30, slow_fetch, swr=60) == 'old'
+        gate.set()
+        self._wait_refresh()
+
+        assert len(calls) == 1
+        assert cache.get('swr/b') == 'new'
+        assert cache.stats()['swr']['stale'] - before == 2
+        assert cache.cached('swr/b', 30, slow_fetch, swr=60) == 'new'
+
+    def test_refresh_error_keeps_stale_value(self, mem_backend):
+        cache.set('swr/c', 'old', ttl=10)
+
+        def boom():
+            raise RuntimeError('上游超时')
+
+        before = cache.stats()['swr']['refresh_errors']
+        assert cache.cached('swr/c', 30, boom, swr=60) == 'old'
+        self._wait_refresh()
+        assert cache.get('swr/c') == 'old'
+        assert cache.stats()['swr']['refresh_errors'] - before == 1
+
+    def test_redis_remaining_ttl_drives_staleness(self, fake_redis, monkeypatch):
+        fake_redis.data[cache._redis_key('swr/d')] = json.dumps('old')
+        monkeypatch.setattr(fake_redis, 'ttl', lambda key: 5)
+        assert cache.cached('swr/d', 30, lambda: 'new', swr=60) == 'old'
+        self._wait_refresh()
+        assert cache._decode(fake_redis.data[cache._redis_key('swr/d')]) == 'new'
+        assert 'lease:swr/d' not in fake_redis.data
+
+
+class TestRouteCached:
+    """route_cached：查询参数分 key、缓存响应 body、ETag / 304"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from flask import Blueprint, Flask, jsonify, request
+
+        monkeypatch.setattr(cache, '_redis', object())
+        monkeypatch.setattr(cache, '_redis_available', False)
+        cache.invalidate('rc/')
+        bp = Blueprint('rc', __name__)
+        self.calls = []
+
+        @cache.route_cached(bp, '/flow', 'rc/flow', ttl=30, query_args=('kind',))
+        def flow():
+            kind = request.args.get('kind', 'industry')
+            self.calls.append(kind)
+            if kind == 'bad':
+                return jsonify({'success': False, 'error': 'x'}), 500
+            return jsonify({'success': True, 'data': {'kind': kind}})
+
+        app = Flask(__name__)
+        app.register_blueprint(bp)
+        return app.test_client()
+
+    def test_hit_replays_body_with_etag(self, client):
+        first = client.get('/flow?kind=concept&page=1')
+        second = client.get('/flow?page=2&kind=concept')
+        assert self.calls == ['concept']
+        assert second.get_json() == {'success': True, 'data': {'kind': 'concept'}}
+        assert second.data == first.data
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert cache.get('rc/flow?kind=concept')['e'] == first.headers['ETag']
+
+    def test_query_args_split_keys(self, client):
+        client.get('/flow')
+        client.get('/flow?kind=region')
+        client.get('/flow?kind=region')
+        assert self.calls == ['industry', 'region']
+
+    def test_if_none_match_returns_304(self, client):
+        etag = client.get('/flow').headers['ETag']
+        resp = client.get('/flow', headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.data == b''
+        assert resp.headers['ETag'] == etag
+        assert client.get('/flow', headers={'If-None-Match': '"other"'}).status_code == 200
+
+    def test_errors_not_cached(self, client):
+        assert client.get('/flow?kind=bad').status_code == 500
+        assert client.get('/flow?kind=bad').status_code == 500
+        assert self.calls == ['bad', 'bad']
+
+    def test_legacy_value_treated_as_miss(self, client):
+        cache.set('rc/flow', [1, 2], ttl=30)
+        assert client.get('/flow').get_json()['data'] == {'kind': 'industry'}
+        assert self.calls == ['industry']
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存编解码单元测试
+==================
+
+测试内容：
+- 各序列化器 × 压缩算法往返一致
+- DataFrame / ndarray 按列往返（dtype、列名、索引）
+- 旧 JSON 条目（str / bytes）仍可读取
+- 头字节协商与未知头报错
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import cache_codec
+from utils.cache_codec import decode, encode
+
+
+def _codecs():
+    sers = [s for s in (cache_codec.SER_JSON, cache_codec.SER_ORJSON, cache_codec.SER_MSGPACK)
+            if cache_codec._available(s)]
+    comps = [cache_codec.COMP_NONE, cache_codec.COMP_ZLIB]
+    if cache_codec.zstandard is not None:
+        comps.append(cache_codec.COMP_ZSTD)
+    return [(s, c) for s in sers for c in comps]
+
+
+def _kline(n=300):
+    return pd.DataFrame({
+        'date': pd.date_range('2024-01-02', periods=n, freq='D').strftime('%Y-%m-%d'),
+        'close': np.linspace(10, 12, n),
+        'volume': np.arange(n, dtype=np.int64) * 100,
+        'ts': pd.date_range('2024-01-02', periods=n, freq='D'),
+        'limit': np.arange(n) % 7 == 0,
+    })
+
+
+@pytest.mark.parametrize('ser,comp', _codecs())
+class TestRoundTrip:
+    """往返测试"""
+
+    def test_plain_values(self, ser, comp):
+        value = {'code': '600000', 'name': '浦发银行', 'list': [1, 2.5, None, True], 'nested': {'a': [{'b': 'c'}] * 300}}
+        assert decode(encode(value, ser, comp)) == value
+
+    def test_dataframe(self, ser, comp):
+        df = _kline()
+        df.loc[3, 'close'] = np.nan
+        out = decode(encode({'df': df, 'n': 1}, ser, comp))
+        assert out['n'] == 1
+        pd.testing.assert_frame_equal(out['df'], df)
+
+    def test_dataframe_index_and_ndarray(self, ser, comp):
+        df = _kline(5).set_index('date')
+        arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+        out = decode(encode([df, arr], ser, comp))
+        pd.testing.assert_frame_equal(out[0], df)
+        np.testing.assert_array_equal(out[1], arr)
+        assert out[1].dtype == np.float32 and out[1].flags.writeable
+
+    def test_numpy_scalars(self, ser, comp):
+        assert decode(encode({'x': np.int64(3), 'y': np.float64(1.5)}, ser, comp)) == {'x': 3, 'y': 1.5}
+
+
+class TestCompatibility:
+    """旧格式兼容与格式协商"""
+
+    def test_legacy_json_still_reads(self):
+        value = {'data': [1, 2], 'name': '题材'}
+        legacy = json.dumps(value, ensure_ascii=False)
+        assert decode(legacy) == value
+        assert decode(legacy.encode('utf-8')) == value
+
+    def test_plain_json_mode_writes_legacy_format(self):
+        raw = encode({'a': 1}, cache_codec.SER_JSON, cache_codec.COMP_NONE)
+        assert json.loads(raw) == {'a': 1}
+
+    def test_binary_entries_have_header(self):
+        raw = encode({'a': 'x' * 5000}, cache_codec.SER_JSON, cache_codec.COMP_ZLIB)
+        assert raw[0] >= 0x80
+        assert len(raw) < 5000
+
+    def test_small_payload_not_compressed(self):
+        raw = encode({'a': 1}, cache_codec.SER_JSON, cache_codec.COMP_ZLIB)
+        assert json.loads(raw) == {'a': 1}
+
+    def test_unknown_header(self):
+        with pytest.raises(ValueError):
+            decode(bytes((0xF7,)) + b'xx')
+
+    def test_dataframe_smaller_than_legacy_rows(self):
+        df = _kline(250).drop(columns=['ts'])
+        legacy = json.dumps({'columns': list(df.columns), 'data': df.values.tolist()}, ensure_ascii=False)
+        assert len(encode(df, comp=cache_codec.COMP_NONE)) < len(legacy.encode('utf-8'))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据源录制 / 回放单元测试
+=========================
+
+测试内容：
+- record 模式写盘，replay 模式离线读取同一结果
+- 录制键忽略 timeout / headers，与 kwargs 顺序无关
+- 回放缺失、上游异常回放、错误注入
+"""
+
+import pandas as pd
+import pytest
+
+from utils import data_replay
+from utils.data_replay import ReplayMissError, http_get, replay_call, wrap_akshare
+
+
+@pytest.fixture
+def replay_env(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATA_REPLAY_DIR', str(tmp_path))
+    monkeypatch.delenv('DATA_REPLAY_ERROR_RATE', raising=False)
+    monkeypatch.delenv('DATA_REPLAY_LATENCY_MS', raising=False)
+
+    def set_mode(mode):
+        monkeypatch.setenv('DATA_SOURCE_MODE', mode)
+    return set_mode
+
+
+class _FakeAk:
+    def __init__(self):
+        self.calls = 0
+
+    def stock_zh_a_daily(self, symbol, adjust=''):
+        self.calls += 1
+        return pd.DataFrame({'date': ['2024-01-02'], 'close': [10.0], 'symbol': [symbol]})
+
+
+class TestRecordReplay:
+    """录制回放测试"""
+
+    def test_live_mode_passthrough(self, replay_env):
+        replay_env('live')
+        ak = _FakeAk()
+        assert wrap_akshare(ak) is ak
+
+    def test_akshare_record_then_replay(self, replay_env):
+        ak = _FakeAk()
+        replay_env('record')
+        recorded = wrap_akshare(ak).stock_zh_a_daily(symbol='sh600000', adjust='qfq')
+
+        replay_env('replay')
+        replayed = wrap_akshare(None).stock_zh_a_daily(adjust='qfq', symbol='sh600000')
+
+        assert ak.calls == 1
+        pd.testing.assert_frame_equal(recorded, replayed)
+        with pytest.raises(ReplayMissError):
+            wrap_akshare(None).stock_zh_a_daily(symbol='sz000001', adjust='qfq')
+
+    def test_http_get_ignores_transport_kwargs(self, replay_env, monkeypatch):
+        class _Resp:
+            status_code = 200
+            text = '{"data": {"diff": []}}'
+            url = 'http://x'
+
+        monkeypatch.setattr('requests.get', lambda url, **kw: _Resp())
+        replay_env('record')
+        http_get('http://x', params={'a': 1, 'b': 2}, timeout=3)
+
+        replay_env('replay')
+        resp = http_get('http://x', params={'b': 2, 'a': 1}, timeout=10, headers={'UA': 'y'})
+        assert resp.json() == {'data': {'diff': []}}
+        resp.raise_for_status()
+
+    def test_upstream_error_is_replayed(self, replay_env):
+        def boom():
+            raise ValueError('空数据')
+
+        replay_env('record')
+        with pytest.raises(ValueError):
+            replay_call('ak.boom', boom)
+        replay_env('replay')
+        with pytest.raises(ValueError):
+            replay_call('ak.boom', boom)
+
+    def test_error_injection_is_deterministic(self, replay_env, monkeypatch):
+        replay_env('record')
+        replay_call('ak.ok', lambda: 1)
+
+        replay_env('replay')
+        monkeypatch.setenv('DATA_REPLAY_ERROR_RATE', '1')
+        with pytest.raises(ConnectionError):
+            replay_call('ak.ok', lambda: 1)
+
+        monkeypatch.setenv('DATA_REPLAY_ERROR_RATE', '0.5')
+
+        def run():
+            data_replay._call_counter.clear()
+            out = []
+            for _ in range(20):
+                try:
+                    out.append(replay_call('ak.ok', lambda: 1))
+                except ConnectionError:
+                    out.append(None)
+            return out
+
+        first = run()
+        assert first == run()
+        assert None in first and 1 in first
@@ -23,6 +23,7 @@
 import pytest
 import os
 import json
+import threading
 from datetime import datetime, timedelta
 
 # 设置测试数据库名
@@ -42,6 +43,7 @@ def test_db():
         cursor = conn.cursor()
         cursor.execute('DELETE FROM kline_cache')
         cursor.execute('DELETE FROM sector_stocks_cache')
+        cursor.execute('DELETE FROM scan_result_stocks')
         cursor.execute('DELETE FROM scan_results')
         cursor.execute('DELETE FROM ai_reports')
         cursor.execute('DELETE FROM watchlist')
@@ -55,6 +57,7 @@ def test_db():
         cursor = conn.cursor()
         cursor.execute('DELETE FROM kline_cache')
         cursor.execute('DELETE FROM sector_stocks_cache')
+        cursor.execute('DELETE FROM scan_result_stocks')
         cursor.execute('DELETE FROM scan_results')
         cursor.execute('DELETE FROM ai_reports')
         cursor.execute('DELETE FROM watchlist')
@@ -170,6 +173,68 @@ class TestScanRecordManagement:
         assert detail['results']['银行']['change'] == 2.5
         assert len(detail['results']['银行']['stocks']) == 2
     
+    def test_save_sector_result_normalized_rows(self, test_db):
+        """测试个股逐行写入 scan_result_stocks，并可按条件 / 代码查询"""
+        scan_id = test_db.create_scan_record()
+        test_db.save_sector_result(scan_id, '银行', 2.5, [
+            {'code': '000001', 'name': '平安银行', 'total_score': 75, 'grade': 'A', 'tags': ['窄幅股']},
+            {'code': '000002', 'name': '万科A', 'total_score': 60, 'grade': 'B', 'bb_width_pct': float('nan')},
+        ])
+        test_db.save_sector_result(scan_id, '半导体', 3.1, [
+            {'code': '688981', 'name': '中芯国际', 'total_score': 88, 'grade': 'S'},
+        ])
+
+        detail = test_db.get_scan_detail(scan_id)
+        assert [s['code'] for s in detail['results']['银行']['stocks']] == ['000001', '000002']
+        assert detail['results']['银行']['stocks'][0]['tags'] == ['窄幅股']
+
+        top = test_db.get_scan_top_stocks(scan_id, limit=2)
+        assert [s['code'] for s in top] == ['688981', '000001']
+        assert [s['code'] for s in test_db.query_scan_stocks(scan_id, grades=['B'])] == ['000002']
+        assert len(test_db.query_scan_stocks(scan_id, min_score=70)) == 2
+        assert len(test_db.query_scan_stocks(scan_id, sector='半导体')) == 1
+
+        history = test_db.get_stock_scan_history('000001')
+        assert history[0]['scan_id'] == scan_id
+        assert history[0]['total_score'] == 75
+
+    def test_scan_stock_lookups(self, test_db, capsys):
+        """测试按 scan_id + code 查单只股票、存在性与板块头，缺 code 的个股计数告警"""
+        scan_id = test_db.create_scan_record({'period': 20})
+        test_db.save_sector_result(scan_id, '银行', 2.5, [
+            {'code': '000001', 'name': '平安银行', 'total_score': 75},
+            {'name': '无代码'},
+        ])
+        assert '1 条个股缺少 code' in capsys.readouterr().out
+
+        found = test_db.get_scan_stock(scan_id, '000001')
+        assert found['stock']['name'] == '平安银行'
+        assert found['sector_name'] == '银行'
+        assert found['sector_change'] == 2.5
+        assert test_db.get_scan_stock(scan_id, '600000') is None
+        assert test_db.query_scan_stocks(scan_id)[0]['sector_name'] == '银行'
+
+        assert test_db.scan_exists(scan_id)
+        assert not test_db.scan_exists(99999)
+        header = test_db.get_scan_sectors(scan_id)
+        assert header['params'] == {'period': 20}
+        assert header['sectors'] == {'银行': 2.5}
+        assert test_db.get_scan_sectors(99999) is None
+
+    def test_scan_stock_lookup_legacy_rows(self, test_db):
+        """测试旧扫描（个股整块存在 stocks_json）仍可按代码查到"""
+        scan_id = test_db.create_scan_record()
+        with test_db.get_connection() as conn:
+            conn.cursor().execute(
+                'INSERT INTO scan_results (scan_id, sector_name, sector_change, stocks_json) '
+                'VALUES (%s, %s, %s, %s)',
+                (scan_id, '券商', 1.5, json.dumps([{'code': '600030', 'name': '中信证券'}])),
+            )
+        found = test_db.get_scan_stock(scan_id, '600030')
+        assert found['stock']['name'] == '中信证券'
+        assert found['sector_change'] == 1.5
+        assert test_db.get_scan_stock(scan_id, '000001') is None
+
     def test_get_scan_list(self, test_db):
         """测试获取扫描记录列表"""
         # 创建多条记录
@@ -179,6 +244,19 @@ class TestScanRecordManagement:
         records = test_db.get_scan_list(limit=3)
         
         assert len(records) == 3
+
+    def test_get_scan_list_materialized_counts(self, test_db):
+        """测试列表页的股票数 / 板块数 / 评级分布来自写入时物化的计数"""
+        scan_id = test_db.create_scan_record()
+        test_db.save_sector_result(scan_id, '银行', 1.0, [
+            {'code': '000001', 'grade': 'A'}, {'code': '000002', 'grade': 'C'},
+        ])
+        test_db.save_sector_result(scan_id, '券商', 2.0, [{'code': '600030', 'grade': 'A'}])
+
+        record = test_db.get_scan_list(limit=1)[0]
+        assert record['stock_count'] == 3
+        assert record['sector_count'] == 2
+        assert record['grade_counts'] == {'S': 0, 'A': 2, 'B': 0, 'C': 1}
     
     def test_get_scan_detail_not_found(self, test_db):
         """测试获取不存在的扫描记录"""
@@ -425,3 +503,201 @@ class TestDatabaseEdgeCases:
         
         cached = test_db.get_kline_cache('000001')
         assert len(cached['candles']) == 99
+
+
+class TestBulkWrites:
+    """批量写入测试"""
+
+    def test_upsert_stocks_batch_chunked(self, test_db, monkeypatch):
+        """多块写入全部落库，再次写入走更新"""
+        monkeypatch.setattr(test_db, 'BULK_CHUNK_SIZE', 7)
+        stocks = [{'code': f'BT{i:04d}', 'name': f'测试{i}', 'pinyin': 'ceshi', 'pinyin_abbr': 'cs',
+                   'market_type': 'sz'} for i in range(20)]
+        try:
+            assert test_db.upsert_stocks_batch(stocks) == 20
+            stocks[0]['name'] = '改名'
+            assert test_db.upsert_stocks_batch(stocks[:1]) == 1
+            with test_db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM stocks WHERE code = 'BT0000'")
+                assert cursor.fetchone()['name'] == '改名'
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute("DELETE FROM stocks WHERE code LIKE 'BT%%'")
+                conn.commit()
+
+    def test_bad_row_only_skips_itself(self, test_db):
+        """某块出错时逐行重试，仅跳过坏行"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        rows = [(f'B{i:05d}', today, '{}', None) for i in range(5)]
+        rows[2] = (None, today, '{}', None)          # stock_code NOT NULL
+        stats = test_db.executemany_chunked(
+            'REPLACE INTO kline_cache (stock_code, cache_date, data_json, data_blob) VALUES (%s, %s, %s, %s)',
+            rows, chunk_size=10)
+        assert stats['rows'] == 4 and stats['failed'] == 1
+        with test_db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) AS n FROM kline_cache WHERE stock_code LIKE 'B0%%'")
+            assert cursor.fetchone()['n'] == 4
+
+
+class TestNamedLock:
+    """跨进程互斥锁测试"""
+
+    def test_non_blocking_and_released(self, test_db):
+        result = []
+
+        def other_worker():
+            with test_db.named_lock('facstock_test_lock') as got:
+                result.append(got)
+
+        with test_db.named_lock('facstock_test_lock') as ok:
+            assert ok
+            t = threading.Thread(target=other_worker)
+            t.start()
+            t.join()
+            assert result == [False]
+        with test_db.named_lock('facstock_test_lock') as ok:
+            assert ok
+
+
+class TestAppendDailyBars:
+    """收盘日线追加测试"""
+
+    def _seed(self, db, code):
+        hist = [{'date': '2024-06-03', 'open': 10, 'high': 10.2, 'low': 9.9, 'close': 10,
+                 'volume': 1000, 'amount': 1e6, 'turnover': 1}]
+        assert db.save_kline_raw_cache(code, hist, adjust='none')
+
+    def test_unadjusted_ex_dividend_refreshes_factors(self, test_db, monkeypatch):
+        code = '600000'
+        bar = {'open': 9.5, 'high': 9.6, 'low': 9.4, 'close': 9.5, 'volume': 1000,
+               'amount': 9.5e5, 'turnover': 1, 'prev_close': 9.5}
+        try:
+            self._seed(test_db, code)
+            # 因子未更新到当日：不追加，计入 stale
+            monkeypatch.setattr(test_db, 'fetch_hfq_factors', lambda c: [{'date': '2024-01-02', 'factor': 1.0}])
+            stats = test_db.append_daily_bars({code: bar}, '2024-06-04')
+            assert (stats['appended'], stats['stale']) == (0, 1)
+
+            factors = [{'date': '2024-01-02', 'factor': 1.0}, {'date': '2024-06-04', 'factor': 1.05}]
+            monkeypatch.setattr(test_db, 'fetch_hfq_factors', lambda c: factors)
+            stats = test_db.append_daily_bars({code: bar}, '2024-06-04')
+            assert (stats['appended'], stats['factors_refreshed']) == (1, 1)
+            assert test_db.get_adj_factors(code) == factors
+            raw = test_db.get_kline_raw_cache(code, adjust='none', any_date=True)
+            assert [b['date'] for b in raw['bars']] == ['2024-06-03', '2024-06-04']
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute('DELETE FROM kline_raw_cache WHERE stock_code = %s', (code,))
+                conn.cursor().execute('DELETE FROM kline_adj_factor WHERE stock_code = %s', (code,))
+                conn.commit()
+
+    def test_qfq_batch_does_not_replace_unadjusted_history(self, test_db):
+        import pandas as pd
+        qfq = pd.DataFrame([{'date': '2024-06-05', 'open': 9, 'high': 9.1, 'low': 8.9, 'close': 9,
+                             'volume': 1000, 'amount': 9e5, 'turnover': 1}])
+        try:
+            self._seed(test_db, '600000')
+            saved = test_db.save_kline_raw_cache_batch([('600000', qfq), ('600001', qfq)])
+            assert saved == 1
+            raw = test_db.get_kline_raw_cache('600000', adjust='none', any_date=True)
+            assert [b['date'] for b in raw['bars']] == ['2024-06-03']
+            assert test_db.get_kline_raw_cache('600001')['bars'][0]['date'] == '2024-06-05'
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute("DELETE FROM kline_raw_cache WHERE stock_code IN ('600000', '600001')")
+                conn.commit()
+
+    def test_qfq_single_writes_keep_unadjusted_history(self, test_db):
+        qfq = [{'date': '2024-06-05', 'open': 9, 'high': 9.1, 'low': 8.9, 'close': 9, 'volume': 1000}]
+        try:
+            self._seed(test_db, '600000')
+            assert test_db.save_kline_raw_cache('600000', qfq)
+            test_db.save_kline_raw_cache_deferred('600000', qfq)
+            assert test_db.flush_pending_writes(timeout=5)
+            raw = test_db.get_kline_raw_cache('600000', adjust='none', any_date=True)
+            assert [b['date'] for b in raw['bars']] == ['2024-06-03']
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute("DELETE FROM kline_raw_cache WHERE stock_code = '600000'")
+                conn.commit()
+
+
+class TestAgentAnalysisHistory:
+    """Agent 分析历史分页与投影测试"""
+
+    def test_keyset_pagination_and_projection(self, test_db):
+        agent = 'test_agent'
+        try:
+            for day in ('2024-01-01', '2024-01-02', '2024-01-03'):
+                test_db.save_agent_analysis_history(
+                    agent, day, [{'code': '000001'}], {'stance': 'bull'},
+                    raw_response='原始' * 1000, thinking='思考', stance='bull')
+
+            page1 = test_db.get_agent_analysis_history(agent, limit=2, fields='list')
+            assert [r['report_date'] for r in page1] == ['2024-01-03', '2024-01-02']
+            assert page1[0]['holdings_snapshot'] == [{'code': '000001'}]
+            assert 'raw_response_text' not in page1[0] and 'thinking_text' not in page1[0]
+
+            page2 = test_db.get_agent_analysis_history(agent, limit=2, before=page1[-1]['report_date'],
+                                                       fields='meta')
+            assert [r['report_date'] for r in page2] == ['2024-01-01']
+            assert 'analysis_result' not in page2[0]
+
+            blob = test_db.get_agent_analysis_blob(agent, page2[0]['id'], 'thinking_text')
+            assert blob['thinking_text'] == '思考'
+            assert test_db.get_latest_agent_analysis(agent)['raw_response_text'] == '原始' * 1000
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute('DELETE FROM agent_analysis_history WHERE agent_id = %s', (agent,))
+                conn.commit()
+
+
+class TestWriteBehind:
+    """异步写队列接入测试"""
+
+    def test_short_batch_write_raises_for_retry(self, test_db):
+        """批量写少写了行时抛异常，队列据此逐条重试并计失败"""
+        rows = [('000001', {'a': 1}), ('000002', {'a': 2})]
+        with pytest.raises(RuntimeError):
+            test_db._fail_on_short(lambda r: len(r) - 1)(rows)
+        test_db._fail_on_short(lambda r: len(r))(rows)
+
+    def test_deferred_kline_cache_read_your_writes(self, test_db):
+        data = {'candles': [{'time': '2024-01-01', 'close': 10.0}]}
+        test_db.save_kline_cache_deferred('000001', data, interval='weekly')
+        assert test_db.get_kline_cache('000001', interval='weekly') == data
+        assert test_db.flush_pending_writes(timeout=5)
+        assert test_db.write_queue_stats()['depth'] == 0
+        assert test_db.get_kline_cache('000001', interval='weekly') == data
+        assert test_db.get_kline_cache('000001') is None
+
+    def test_deferred_progress_does_not_override_status(self, test_db):
+        scan_id = test_db.create_scan_record()
+        test_db.update_scan_progress_deferred(scan_id, 40, '计算指标...')
+        test_db.update_scan_progress_deferred(scan_id, 60, '计算指标...')
+        assert test_db.flush_pending_writes(timeout=5)
+        assert test_db.get_scan_detail(scan_id)['progress'] == 60
+
+        test_db.update_scan_progress_deferred(scan_id, 90, '计算指标...')
+        test_db.update_scan_status(scan_id, 'completed')
+        test_db.update_scan_progress(scan_id, 95, '保存结果...')
+        assert test_db.flush_pending_writes(timeout=5)
+        assert test_db.get_scan_detail(scan_id)['progress'] == 100
+
+    def test_sync_raw_write_supersedes_pending(self, test_db):
+        code = '000001'
+        old = [{'date': '2024-01-02', 'open': 1, 'high': 2, 'low': 1, 'close': 2, 'volume': 10}]
+        new = old + [{'date': '2024-01-03', 'open': 2, 'high': 3, 'low': 2, 'close': 3, 'volume': 20}]
+        try:
+            test_db.save_kline_raw_cache_deferred(code, old)
+            assert len(test_db.get_kline_raw_cache(code)['bars']) == 1
+            assert test_db.save_kline_raw_cache(code, new, adjust='none')
+            assert test_db.flush_pending_writes(timeout=5)
+            cached = test_db.get_kline_raw_cache(code, adjust='none')
+            assert [b['date'] for b in cached['bars']] == ['2024-01-02', '2024-01-03']
+        finally:
+            with test_db.get_connection() as conn:
+                conn.cursor().execute('DELETE FROM kline_raw_cache WHERE stock_code = %s', (code,))
+                conn.commit()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库保留策略与整理单元测试
+============================
+
+使用假 db 对象测试（不连 MySQL）：
+- 保留天数与删除界限
+- 历史数据先完整归档（gzip JSONL）再删除
+- 空闲空间阈值判断
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import db_maintenance as dm
+
+
+class _FakeDB:
+    def __init__(self, tables):
+        self.tables = tables
+        self.deleted_scans = []
+        self.purged = {}
+
+    def fetch_rows_before(self, table, col, cutoff, after_id=0, limit=500):
+        rows = [r for r in self.tables[table] if str(r[col])[:10] < cutoff and r['id'] > after_id]
+        return sorted(rows, key=lambda r: r['id'])[:limit]
+
+    def fetch_rows_by_ids(self, table, col, ids):
+        return [r for r in self.tables[table] if r[col] in ids]
+
+    def delete_scans(self, ids):
+        self.deleted_scans.extend(ids)
+        return len(ids)
+
+    def delete_rows_before(self, table, col, cutoff):
+        self.purged[table] = cutoff
+        return 0
+
+
+class TestDbMaintenance:
+    """保留策略测试"""
+
+    def test_cutoff_and_env_override(self, monkeypatch):
+        assert dm.cutoff_date(30, date(2024, 3, 31)) == '2024-03-01'
+        monkeypatch.setenv('RETENTION_NEWS_CACHE_DAYS', '7')
+        db = _FakeDB({})
+        dm._purge_caches(db, date(2024, 3, 31))
+        assert db.purged['news_cache'] == '2024-03-24'
+        assert db.purged['kline_cache'] == '2024-03-29'
+
+    def test_scans_archived_before_delete(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(dm, 'ARCHIVE_DIR', str(tmp_path))
+        db = _FakeDB({
+            'scan_records': [
+                {'id': 1, 'scan_time': datetime(2023, 1, 5, 15, 0)},
+                {'id': 2, 'scan_time': datetime(2024, 3, 30, 15, 0)},
+            ],
+            'scan_results': [{'id': 10, 'scan_id': 1, 'sector_change': Decimal('1.25')}],
+            'scan_result_stocks': [{'id': 100, 'scan_id': 1, 'code': '600000'}],
+        })
+        result = dm._archive_scans(db, date(2024, 3, 31))
+        assert db.deleted_scans == [1]
+        assert result['archived_rows'] == 3
+
+        rows = dm.read_archive(result['file'])
+        assert [r['table'] for r in rows] == ['scan_records', 'scan_results', 'scan_result_stocks']
+        assert rows[0]['row']['scan_time'] == '2023-01-05T15:00:00'
+        assert rows[1]['row']['sector_change'] == 1.25
+
+    def test_nothing_to_archive_leaves_no_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(dm, 'ARCHIVE_DIR', str(tmp_path))
+        db = _FakeDB({'scan_records': [], 'scan_results': [], 'scan_result_stocks': []})
+        assert dm._archive_scans(db, date(2024, 3, 31))['file'] is None
+        assert list(tmp_path.iterdir()) == []
+
+    def test_tables_to_compact(self):
+        sizes = [
+            {'table': 'news_cache', 'total_mb': 100, 'free_mb': 200},
+            {'table': 'kline_raw_cache', 'total_mb': 2000, 'free_mb': 100},
+            {'table': 'watchlist', 'total_mb': 0.1, 'free_mb': 0.5},
+        ]
+        assert dm.tables_to_compact(sizes, min_free_mb=64, min_free_ratio=0.3) == ['news_cache']
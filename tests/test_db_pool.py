@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接池单元测试
+====================
+
+使用假连接测试：
+- 连接复用、池满等待与超时
+- 空闲连接健康检查、最长寿命、损坏连接丢弃
+- fork 后不复用父进程连接
+"""
+
+import threading
+import time
+
+import pytest
+
+from utils import db_pool
+from utils.db_pool import ConnectionPool, PoolTimeout
+
+
+class _FakeConn:
+    def __init__(self):
+        self.open = True
+        self.ping_ok = True
+        self.pings = 0
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.ping_ok:
+            raise ConnectionError('gone away')
+
+    def close(self):
+        self.open = False
+
+
+def _pool(**kw):
+    made = []
+
+    def connect():
+        made.append(_FakeConn())
+        return made[-1]
+
+    return ConnectionPool(connect, **kw), made
+
+
+class TestConnectionPool:
+    """连接池测试"""
+
+    def test_reuses_connection(self):
+        pool, made = _pool(max_size=2)
+        for _ in range(5):
+            pool.release(pool.acquire())
+        assert len(made) == 1
+        st = pool.stats()
+        assert st['checkouts'] == 5 and st['size'] == 1 and st['idle'] == 1 and st['in_use'] == 0
+
+    def test_waits_for_release_then_times_out(self):
+        pool, _ = _pool(max_size=1, timeout=0.5)
+        conn = pool.acquire()
+        threading.Timer(0.05, pool.release, args=(conn,)).start()
+        assert pool.acquire() is conn
+        assert pool.stats()['waits'] == 1
+        assert pool.stats()['utilization'] == 1.0
+
+        pool.timeout = 0.05
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        assert pool.stats()['timeouts'] == 1
+
+    def test_stale_idle_connection_is_pinged_and_replaced(self):
+        pool, made = _pool(ping_interval=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.ping_ok = False
+        fresh = pool.acquire()
+        assert fresh is not conn and not conn.open
+        assert pool.stats()['ping_failures'] == 1
+        assert pool.stats()['size'] == 1
+
+    def test_max_lifetime_and_broken(self):
+        pool, made = _pool(max_lifetime=0.01)
+        conn = pool.acquire()
+        time.sleep(0.02)
+        pool.release(conn)
+        assert not conn.open and pool.stats()['size'] == 0
+
+        pool.max_lifetime = 1800
+        conn = pool.acquire()
+        pool.release(conn, broken=True)
+        assert not conn.open and pool.stats()['idle'] == 0
+
+    def test_fork_discards_inherited_connections(self, monkeypatch):
+        pool, made = _pool()
+        inherited = pool.acquire()
+        pool.release(inherited)
+        monkeypatch.setattr(db_pool.os, 'getpid', lambda: -1)
+        conn = pool.acquire()
+        assert conn is not inherited
+        assert inherited.open          # 不 close 父进程的连接
+        assert pool.stats()['size'] == 1
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+收盘后日线批量入库单元测试
+==========================
+
+测试全 A 快照 → 当日日线的转换：
+- 代码前缀规范化
+- 停牌 / 无成交过滤
+- 成交量单位统一为「股」
+"""
+
+import pandas as pd
+
+from eod_ingest import spot_to_daily_bars
+
+
+def _spot(rows):
+    return pd.DataFrame(rows, columns=['代码', '名称', '今开', '最高', '最低', '最新价',
+                                       '成交量', '成交额', '换手率', '昨收'])
+
+
+class TestSpotToDailyBars:
+    """快照转换测试"""
+
+    def test_em_snapshot_volume_in_lots(self):
+        """东财快照成交量为「手」：成交额 ≈ 成交量 × 100 × 价格"""
+        bars = spot_to_daily_bars(_spot([
+            ['600000', '浦发银行', 10.0, 10.5, 9.9, 10.2, 1000, 1000 * 100 * 10.2, 0.5, 10.0],
+        ]))
+        assert bars['600000']['volume'] == 100000
+        assert bars['600000']['close'] == 10.2
+        assert bars['600000']['prev_close'] == 10.0
+
+    def test_sina_snapshot_prefixed_codes_in_shares(self):
+        bars = spot_to_daily_bars(_spot([
+            ['sz000001', '平安银行', 12.0, 12.3, 11.8, 12.1, 500000, 500000 * 12.1, None, 12.0],
+        ]))
+        assert list(bars) == ['000001']
+        assert bars['000001']['volume'] == 500000
+        assert bars['000001']['turnover'] is None
+
+    def test_suspended_and_invalid_rows_skipped(self):
+        bars = spot_to_daily_bars(_spot([
+            ['600001', '停牌股', 0, 0, 0, 0, 0, 0, 0, 10.0],
+            ['abc', '无效', 1, 1, 1, 1, 100, 100, 0, 1],
+        ]))
+        assert bars == {}
+
+    def test_missing_columns(self):
+        assert spot_to_daily_bars(pd.DataFrame({'代码': ['600000']})) == {}
+        assert spot_to_daily_bars(None) == {}
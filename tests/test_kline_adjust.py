@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线复权单元测试
+================
+
+测试不复权日线 + 后复权因子在读取时的复权计算：
+- 因子按日期生效区间匹配
+- 前复权以最新因子为基准，最新价不变
+- 增量日线合并
+- 增量抓取失败时不回写旧历史
+"""
+
+import sys
+import types
+
+import pandas as pd
+
+from utils import kline_adjust
+from utils.kline_adjust import apply_adjustment, merge_bars, normalize_adjust
+
+
+def _raw():
+    """2024-01-04 除权：不复权收盘价从 20 跳到 10"""
+    return pd.DataFrame({
+        'date': ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05'],
+        'open': [20.0, 20.0, 10.0, 10.0],
+        'high': [21.0, 21.0, 11.0, 11.0],
+        'low': [19.0, 19.0, 9.0, 9.0],
+        'close': [20.0, 20.0, 10.0, 11.0],
+        'volume': [100.0, 100.0, 200.0, 200.0],
+        'pct_change': [0.0, 0.0, -0.5, 0.1],
+    })
+
+
+FACTORS = [
+    {'date': '1900-01-01', 'factor': 1.0},
+    {'date': '2024-01-04', 'factor': 2.0},
+]
+
+
+class TestApplyAdjustment:
+    """复权计算测试"""
+
+    def test_qfq_keeps_latest_price(self):
+        out = apply_adjustment(_raw(), FACTORS, 'qfq')
+        assert out['close'].tolist() == [10.0, 10.0, 10.0, 11.0]
+        assert out['high'].tolist() == [10.5, 10.5, 11.0, 11.0]
+        assert out['volume'].tolist() == [100.0, 100.0, 200.0, 200.0]
+        assert out['pct_change'].tolist() == [0.0, 0.0, 0.0, 0.1]
+
+    def test_hfq_keeps_earliest_price(self):
+        out = apply_adjustment(_raw(), FACTORS, 'hfq')
+        assert out['close'].tolist() == [20.0, 20.0, 20.0, 22.0]
+
+    def test_none_or_no_factors_passthrough(self):
+        assert apply_adjustment(_raw(), FACTORS, 'none')['close'].tolist() == [20.0, 20.0, 10.0, 11.0]
+        assert apply_adjustment(_raw(), [], 'qfq')['close'].tolist() == [20.0, 20.0, 10.0, 11.0]
+
+    def test_bars_before_first_factor_use_first(self):
+        factors = [{'date': '2024-01-03', 'factor': 1.0}, {'date': '2024-01-04', 'factor': 2.0}]
+        out = apply_adjustment(_raw(), factors, 'qfq')
+        assert out['close'].tolist()[0] == 10.0
+
+    def test_normalize_adjust(self):
+        assert normalize_adjust('QFQ') == 'qfq'
+        assert normalize_adjust('') == 'none'
+        assert normalize_adjust(None) == 'none'
+
+
+class TestMergeBars:
+    """增量日线合并测试"""
+
+    def test_new_rows_override_same_day(self):
+        old = _raw()
+        new = pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-08'],
+            'open': [10.0, 11.0], 'high': [12.0, 12.0], 'low': [9.0, 10.0],
+            'close': [11.5, 12.0], 'volume': [300.0, 300.0], 'pct_change': [0.0, 0.0],
+        })
+        out = merge_bars(old, new)
+        assert out['date'].tolist()[-2:] == ['2024-01-05', '2024-01-08']
+        assert out['close'].tolist()[-2:] == [11.5, 12.0]
+        assert len(out) == 5
+
+    def test_empty_inputs(self):
+        assert merge_bars(None, pd.DataFrame()) is None
+
+
+class TestLoadDailyHistory:
+    """本地日线历史读取测试"""
+
+    def test_failed_increment_not_saved_as_fresh(self, monkeypatch):
+        saved = []
+        fake_db = types.SimpleNamespace(
+            get_kline_raw_cache=lambda code, adjust='qfq', any_date=False:
+                {'bars': _raw().to_dict('records'), 'adjust': 'none'} if any_date else None,
+            get_adj_factors=lambda code: FACTORS,
+            save_kline_raw_cache=lambda *a, **kw: saved.append(a),
+            save_adj_factors=lambda *a: saved.append(a),
+        )
+        monkeypatch.setitem(sys.modules, 'database', fake_db)
+        monkeypatch.setattr(kline_adjust, 'fetch_unadjusted_daily', lambda *a, **kw: None)
+
+        out = kline_adjust.load_daily_history('600000', 4)
+        assert out['close'].tolist() == [10.0, 10.0, 10.0, 11.0]
+        assert saved == []
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线周期重采样单元测试
+======================
+
+测试由日线派生周线 / 月线 / N 日线的正确性，包括：
+- 周期参数规范化
+- OHLCV 聚合口径
+- 周期边界（跨周、跨月）
+"""
+
+import pandas as pd
+import pytest
+
+from utils.kline_resample import normalize_interval, resample_daily_bars, trading_days_per_bar
+
+
+def _daily(dates, closes):
+    """构造日线：open=close-0.5，high=close+1，low=close-1，volume/amount 递增"""
+    n = len(dates)
+    return pd.DataFrame({
+        'date': dates,
+        'open': [c - 0.5 for c in closes],
+        'high': [c + 1 for c in closes],
+        'low': [c - 1 for c in closes],
+        'close': closes,
+        'volume': [100.0 * (i + 1) for i in range(n)],
+        'amount': [1000.0 * (i + 1) for i in range(n)],
+        'turnover': [1.0] * n,
+        'pct_change': [0.0] * n,
+    })
+
+
+class TestNormalizeInterval:
+    """周期参数规范化测试"""
+
+    def test_named_intervals(self):
+        assert normalize_interval('daily') == 'daily'
+        assert normalize_interval('Weekly') == 'weekly'
+        assert normalize_interval(' monthly ') == 'monthly'
+
+    def test_n_day_interval(self):
+        assert normalize_interval('3d') == '3d'
+        assert normalize_interval('05d') == '5d'
+        assert trading_days_per_bar('3d') == 3
+
+    def test_invalid_interval(self):
+        assert normalize_interval('1d') is None
+        assert normalize_interval('61d') is None
+        assert normalize_interval('hourly') is None
+        assert normalize_interval(None) is None
+
+
+class TestResampleDailyBars:
+    """日线聚合测试"""
+
+    def test_weekly_aggregation(self):
+        """跨两周：2024-01-04/05 为第一周，01-08 ~ 01-10 为第二周"""
+        df = _daily(
+            ['2024-01-04', '2024-01-05', '2024-01-08', '2024-01-09', '2024-01-10'],
+            [10.0, 11.0, 12.0, 9.0, 13.0],
+        )
+        out = resample_daily_bars(df, 'weekly')
+
+        assert out['date'].tolist() == ['2024-01-05', '2024-01-10']
+        assert out['open'].tolist() == [9.5, 11.5]
+        assert out['high'].tolist() == [12.0, 14.0]
+        assert out['low'].tolist() == [9.0, 8.0]
+        assert out['close'].tolist() == [11.0, 13.0]
+        assert out['volume'].tolist() == [300.0, 1200.0]
+        assert out['amount'].tolist() == [3000.0, 12000.0]
+        assert out['pct_change'].tolist() == [0.0, round(13.0 / 11.0 - 1, 4)]
+
+    def test_monthly_aggregation(self):
+        df = _daily(['2024-01-30', '2024-01-31', '2024-02-01'], [10.0, 12.0, 11.0])
+        out = resample_daily_bars(df, 'monthly')
+
+        assert out['date'].tolist() == ['2024-01-31', '2024-02-01']
+        assert out['close'].tolist() == [12.0, 11.0]
+        assert out['turnover'].tolist() == [2.0, 1.0]
+
+    def test_n_day_aligned_to_latest(self):
+        """N 日线从最新一根向前对齐，最后一根始终是完整的 N 日"""
+        dates = ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05', '2024-01-08']
+        df = _daily(dates, [1.0, 2.0, 3.0, 4.0, 5.0])
+        out = resample_daily_bars(df, '2d')
+
+        assert out['date'].tolist() == ['2024-01-02', '2024-01-04', '2024-01-08']
+        assert out['volume'].tolist() == [100.0, 500.0, 900.0]
+
+    def test_unsorted_input(self):
+        df = _daily(['2024-01-05', '2024-01-04'], [11.0, 10.0])
+        out = resample_daily_bars(df, 'weekly')
+        assert out['open'].tolist() == [9.5]
+        assert out['close'].tolist() == [11.0]
+
+    def test_daily_passthrough_and_empty(self):
+        df = _daily(['2024-01-04'], [10.0])
+        assert resample_daily_bars(df, 'daily')['close'].tolist() == [10.0]
+        assert resample_daily_bars(pd.DataFrame(), 'weekly') is None
+
+    def test_invalid_interval_raises(self):
+        with pytest.raises(ValueError):
+            resample_daily_bars(_daily(['2024-01-04'], [10.0]), 'yearly')
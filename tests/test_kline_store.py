@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线缓存二进制格式单元测试
+==========================
+
+测试内容：
+- 日线 bars / 图表 payload 往返后与原 JSON 结构一致（None、布尔、整数保持）
+- table() 列式输入与 dict 列表编码结果一致
+- 体积明显小于 JSON；版本号不符时拒绝解码
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import kline_store
+
+
+def _bars(n=500):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2022-01-03', periods=n).strftime('%Y-%m-%d')
+    return [{
+        'date': d,
+        'open': round(float(10 + rng.random()), 2),
+        'high': round(float(11 + rng.random()), 2),
+        'low': round(float(9 + rng.random()), 2),
+        'close': round(float(10 + rng.random()), 2),
+        'volume': int(rng.integers(1e5, 1e7)),
+        'amount': None if i % 50 == 0 else round(float(rng.random() * 1e8), 2),
+    } for i, d in enumerate(dates)]
+
+
+class TestKlineStore:
+    """K 线缓存编解码测试"""
+
+    def test_raw_payload_roundtrip_and_size(self):
+        payload = {'bars': _bars(), 'cols': ['date', 'open', 'high', 'low', 'close', 'volume', 'amount'],
+                   'adjust': 'none'}
+        blob = kline_store.encode(payload)
+        assert kline_store.is_encoded(blob)
+        assert kline_store.decode(blob) == payload
+        assert len(json.dumps(payload)) / len(blob) > 3
+
+    def test_chart_payload_roundtrip(self):
+        times = [f'2024-01-{d:02d}' for d in range(1, 21)]
+        payload = {
+            'candles': [{'time': t, 'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5} for t in times],
+            'volumes': [{'time': t, 'value': 100.0, 'color': '#ef5350'} for t in times],
+            'bb_width': [None, None] + [1.5] * 18,
+            'vp_color': [0, 1] * 10,
+            'vp_lxtp': [True, False] * 10,
+            'cmf': [],
+            'latest': {'close': 1.5, 'pct_change': float('nan'), 'date': '2024-01-20'},
+            'odd': {'__t__': 1, '__a__': [1, 2, 3, 4]},
+        }
+        out = kline_store.decode(kline_store.encode(payload))
+        assert out['latest']['pct_change'] is None
+        out['latest']['pct_change'] = payload['latest']['pct_change'] = None
+        assert out == payload
+        assert type(out['vp_color'][0]) is int and type(out['vp_lxtp'][0]) is bool
+
+    def test_table_matches_record_list(self):
+        bars = _bars(20)
+        cols = {k: [b[k] for b in bars] for k in bars[0]}
+        cols['close'] = np.array(cols['close'])
+        assert kline_store.decode(kline_store.encode({'bars': kline_store.table(cols)})) == {'bars': bars}
+        with pytest.raises(ValueError):
+            kline_store.table({'a': [1, 2], 'b': [1]})
+
+    def test_rejects_unknown_version(self):
+        blob = bytearray(kline_store.encode({'a': 1}))
+        blob[3] = kline_store.FORMAT_VERSION + 1
+        with pytest.raises(ValueError):
+            kline_store.decode(bytes(blob))
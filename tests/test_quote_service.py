@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一实时行情服务单元测试
+========================
+
+测试内容：
+- 东财批量请求合并（多只股票一次请求）
+- 东财缺失代码走新浪批量兜底
+- 按代码短时缓存
+"""
+
+import json
+
+import pytest
+
+import cache
+from utils import quote_service
+
+
+class _Resp:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+
+def _em_item(code, price, pct):
+    return {'f12': code, 'f14': f'股票{code}', 'f2': price, 'f3': pct, 'f4': 0.1,
+            'f5': 1000, 'f6': 1e6, 'f8': 1.5, 'f10': '-', 'f15': price, 'f16': price,
+            'f17': price, 'f18': price, 'f20': 5e9, 'f62': '-'}
+
+
+def _sina_line(code, prev_close, close):
+    fields = ['新浪股票', '10.0', str(prev_close), str(close), '11.0', '9.0'] + ['0'] * 2 \
+        + ['123400', '5000000'] + ['0'] * 20 + ['2024-01-05', '15:00:00', '00']
+    sym = ('sh' if code.startswith('6') else 'sz') + code
+    return f'var hq_str_{sym}="{",".join(fields)}";'
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """替换 requests.get：记录调用，东财只返回 em_codes 中的股票"""
+    calls = []
+    state = {'em_codes': set()}
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        calls.append(url)
+        if 'eastmoney' in url:
+            codes = [s.split('.')[1] for s in params['secids'].split(',')]
+            diff = [_em_item(c, 10.5, 2.0) for c in codes if c in state['em_codes']]
+            return _Resp(json.dumps({'data': {'diff': diff} if diff else None}))
+        symbols = url.split('list=')[1].split(',')
+        return _Resp('\n'.join(_sina_line(s[2:], 10.0, 11.0) for s in symbols))
+
+    monkeypatch.setattr('requests.get', fake_get)
+    # 固定走进程内降级缓存，避免连接本机 Redis
+    monkeypatch.setattr(cache, '_redis', object())
+    monkeypatch.setattr(cache, '_redis_available', False)
+    cache.invalidate('quote/')
+    yield calls, state
+    cache.invalidate('quote/')
+
+
+class TestGetQuotes:
+    """批量行情测试"""
+
+    def test_batched_eastmoney_single_request(self, fake_upstream):
+        calls, state = fake_upstream
+        codes = [f'{600000 + i}' for i in range(100)]
+        state['em_codes'] = set(codes)
+
+        quotes = quote_service.get_quotes(codes)
+
+        assert len(quotes) == 100
+        assert len(calls) == 1
+        q = quotes['600000']
+        assert q['close'] == 10.5
+        assert q['pct_change'] == 2.0
+        assert q['qty_ratio'] is None
+        assert q['mkt_cap'] == 5e9
+
+    def test_sina_fallback_for_missing(self, fake_upstream):
+        calls, state = fake_upstream
+        state['em_codes'] = {'600000'}
+
+        quotes = quote_service.get_quotes(['600000', '000001', '000001', 'bad'])
+
+        assert set(quotes) == {'600000', '000001'}
+        assert len(calls) == 2
+        q = quotes['000001']
+        assert q['close'] == 11.0
+        assert q['pct_change'] == 10.0
+        assert q['volume'] == 1234.0
+
+    def test_cached_within_ttl(self, fake_upstream):
+        calls, state = fake_upstream
+        state['em_codes'] = {'600000', '600001'}
+
+        quote_service.get_quotes(['600000'])
+        quotes = quote_service.get_quotes(['600000', '600001'])
+
+        assert set(quotes) == {'600000', '600001'}
+        assert len(calls) == 2
+
+    def test_get_prices_skips_invalid(self, fake_upstream):
+        _, state = fake_upstream
+        state['em_codes'] = {'600000'}
+        assert quote_service.get_prices(['600000']) == {'600000': 10.5}
+        assert quote_service.get_quotes([]) == {}
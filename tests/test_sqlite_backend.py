@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 后端单元测试
+===================
+
+测试内容：
+- MySQL 建表语句翻译（自增主键、普通 / 唯一索引、前缀长度）
+- ON DUPLICATE KEY UPDATE ... VALUES() / INSERT IGNORE 语义
+- DELETE ... LIMIT 分批删除
+- DATE / DATETIME 往返类型
+- 全新目录下以 SQLite 后端启动即建好全部表（含 news_cache）
+"""
+
+import os
+import subprocess
+import sys
+from datetime import date, datetime
+
+from utils import sqlite_backend
+
+
+def _conn(tmp_path):
+    conn = sqlite_backend.connect(str(tmp_path / 't.db'))
+    cur = conn.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS demo (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            code VARCHAR(10) NOT NULL,
+            title VARCHAR(500),
+            d DATE,
+            ts DATETIME DEFAULT CURRENT_TIMESTAMP,
+            v INT DEFAULT 0,
+            UNIQUE KEY uk_code (code),
+            INDEX idx_title (title(200))
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+    conn.commit()
+    return conn, cur
+
+
+class TestSQLiteBackend:
+    """SQLite 翻译层测试"""
+
+    def test_create_table_indexes(self, tmp_path):
+        conn, cur = _conn(tmp_path)
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'demo'")
+        names = {r['name'] for r in cur.fetchall()}
+        # 唯一键保留为表约束（供 ON CONFLICT 使用），普通索引单独建、带表名前缀
+        assert 'demo_idx_title' in names
+        assert any(n.startswith('sqlite_autoindex_demo') for n in names)
+        cur.execute('INSERT INTO demo (code) VALUES (%s)', ('a',))
+        assert cur.lastrowid == 1
+        conn.close()
+
+    def test_upsert_and_ignore(self, tmp_path):
+        conn, cur = _conn(tmp_path)
+        sql = '''INSERT INTO demo (code, v) VALUES (%s, %s)
+                 ON DUPLICATE KEY UPDATE v = VALUES(v), ts = NOW()'''
+        cur.executemany(sql, [('a', 1), ('b', 2)])
+        cur.execute(sql, ('a', 5))
+        cur.execute('INSERT IGNORE INTO demo (code, v) VALUES (%s, %s)', ('b', 9))
+        cur.execute('SELECT code, v FROM demo ORDER BY code')
+        assert [(r['code'], r['v']) for r in cur.fetchall()] == [('a', 5), ('b', 2)]
+        conn.close()
+
+    def test_delete_limit_and_dates(self, tmp_path):
+        conn, cur = _conn(tmp_path)
+        cur.executemany('INSERT INTO demo (code, d) VALUES (%s, %s)',
+                        [(str(i), date(2024, 1, i + 1)) for i in range(5)])
+        assert cur.execute('DELETE FROM demo WHERE d < %s LIMIT 2', ('2024-01-05',)) == 2
+        cur.execute("SELECT d, ts FROM demo WHERE code LIKE '%%' ORDER BY d")
+        rows = cur.fetchall()
+        assert [r['d'] for r in rows] == [date(2024, 1, 3), date(2024, 1, 4), date(2024, 1, 5)]
+        assert isinstance(rows[0]['ts'], datetime)
+        conn.close()
+
+    def test_fresh_start_creates_all_tables(self, tmp_path):
+        path = tmp_path / 'nested' / 'facstock.db'
+        env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=str(path), DB_WRITE_BEHIND='0')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.run(
+            [sys.executable, '-c', 'import database as db; print(db.save_news_items('
+             '[{"title": "t", "content": "c", "time": "2024-01-02 10:00:00"}]))'],
+            cwd=root, env=env, capture_output=True, text=True, timeout=60,
+        )
+        assert proc.returncode == 0, proc.stderr
+        assert 'WARN' not in proc.stdout
+        assert proc.stdout.strip().splitlines()[-1] == '1'
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+股票搜索内存索引单元测试
+========================
+
+测试内容：
+- 排序档位与原 SQL 一致：代码相等 > 代码前缀 > 首字母相等 > 首字母前缀 > 名称前缀 > 包含
+- 名称 / 拼音子串匹配、大小写不敏感
+- limit 截断、返回副本
+"""
+
+from utils.stock_search import StockSearchIndex
+
+
+def _stock(code, name, pinyin, abbr, market='sz'):
+    return {'code': code, 'name': name, 'pinyin': pinyin, 'pinyin_abbr': abbr,
+            'market_type': market, 'sector': None}
+
+
+STOCKS = [
+    _stock('600519', '贵州茅台', 'guizhoumaotai', 'gzmt', 'sh'),
+    _stock('000858', '五粮液', 'wuliangye', 'wly'),
+    _stock('000001', '平安银行', 'pinganyinhang', 'payh'),
+    _stock('601318', '中国平安', 'zhongguopingan', 'zgpa', 'sh'),
+    _stock('002594', '比亚迪', 'biyadi', 'byd'),
+    _stock('300750', '宁德时代', 'ningdeshidai', 'ndsd'),
+    _stock('000002', '万科A', 'wankeA', 'wka'),
+]
+
+
+def _codes(results):
+    return [r['code'] for r in results]
+
+
+class TestStockSearchIndex:
+    """搜索索引测试"""
+
+    def test_code_exact_then_prefix(self):
+        index = StockSearchIndex(STOCKS)
+        assert _codes(index.search('000001')) == ['000001']
+        assert _codes(index.search('0000')) == ['000001', '000002']
+        assert _codes(index.search('60')) == ['600519', '601318']
+
+    def test_tier_order(self):
+        index = StockSearchIndex(STOCKS)
+        # 首字母前缀 (payh) 排在名称 / 拼音包含 (中国平安) 之前
+        assert _codes(index.search('pa')) == ['000001', '601318']
+        assert _codes(index.search('平安')) == ['000001', '601318']
+        assert _codes(index.search('byd')) == ['002594']
+
+    def test_substring_and_case(self):
+        index = StockSearchIndex(STOCKS)
+        assert _codes(index.search('maotai')) == ['600519']
+        assert _codes(index.search('时代')) == ['300750']
+        assert _codes(index.search('GZMT')) == ['600519']
+        assert _codes(index.search('万科a')) == ['000002']
+        assert index.search('不存在') == []
+        assert index.search('   ') == []
+
+    def test_limit_and_copy(self):
+        index = StockSearchIndex(STOCKS)
+        res = index.search('0', limit=2)
+        assert _codes(res) == ['000001', '000002']
+        res[0]['name'] = 'x'
+        assert index.search('000001')[0]['name'] == '平安银行'
+        assert index.stats()['stocks'] == len(STOCKS)
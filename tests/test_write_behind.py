@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库异步写队列单元测试
+========================
+
+使用内存写入函数测试：
+- 同 key 合并（last-write-wins）、批量写入
+- 批量失败逐条重试、失败计数
+- 队列满时同步写、关闭时写完队列
+- supersede 撤销排队项并等待在途写入
+"""
+
+import threading
+import time
+
+from utils.write_behind import WriteBehindQueue
+
+
+def _queue(**kwargs):
+    store, batches = {}, []
+
+    def write_one(key, value):
+        if value == 'bad':
+            raise ValueError('bad value')
+        store[key] = value
+
+    def write_many(rows):
+        batches.append(len(rows))
+        if any(v == 'bad' for _, v in rows):
+            raise ValueError('batch failed')
+        store.update(rows)
+
+    q = WriteBehindQueue(**kwargs)
+    q.register('kv', write_one, write_many)
+    return q, store, batches
+
+
+class TestWriteBehindQueue:
+    """异步写队列测试"""
+
+    def test_coalesce_and_batch(self):
+        q, store, batches = _queue(flush_interval=5)
+        for i in range(3):
+            q.submit('kv', 'a', 'a', i)
+        q.submit('kv', 'b', 'b', 'x')
+        assert q.peek('kv', 'a') == ('a', 2)
+        assert q.depth() == 2
+        assert q.flush(timeout=2)
+        assert store == {'a': 2, 'b': 'x'}
+        assert batches == [2]
+        st = q.stats()
+        assert (st['submitted'], st['coalesced'], st['written'], st['depth']) == (4, 2, 2, 0)
+        q.close()
+
+    def test_batch_failure_falls_back_to_rows(self):
+        q, store, _ = _queue(flush_interval=5)
+        q.submit('kv', 'a', 'a', 1)
+        q.submit('kv', 'b', 'b', 'bad')
+        assert q.flush(timeout=2)
+        assert store == {'a': 1}
+        st = q.stats()
+        assert (st['written'], st['failed']) == (1, 1)
+        assert 'bad value' in st['last_error']
+        q.close()
+
+    def test_full_queue_writes_synchronously(self):
+        q, store, _ = _queue(max_pending=1, flush_interval=5)
+        assert q.submit('kv', 'a', 'a', 1) is True
+        assert q.submit('kv', 'a', 'a', 2) is True      # 已在队列中的 key 仍合并
+        assert q.submit('kv', 'b', 'b', 3) is False     # 新 key 同步写
+        assert store == {'b': 3}
+        assert q.stats()['sync_writes'] == 1
+        q.close()
+        assert store == {'a': 2, 'b': 3}
+
+    def test_close_drains_and_discard(self):
+        q, store, _ = _queue(flush_interval=5)
+        q.submit('kv', 'a', 'a', 1)
+        q.submit('kv', 'b', 'b', 2)
+        assert q.discard('kv', 'b')
+        assert q.close(timeout=2)
+        assert store == {'a': 1}
+        assert q.submit('kv', 'c', 'c', 3) is False
+        assert store['c'] == 3
+        assert not q.stats()['worker_alive']
+
+    def test_supersede_waits_for_inflight_write(self):
+        started, release = threading.Event(), threading.Event()
+        store = {}
+
+        def slow_write(key, value):
+            started.set()
+            release.wait(2)
+            store[key] = value
+
+        q = WriteBehindQueue(flush_interval=0)
+        q.register('kv', slow_write)
+        q.submit('kv', 'a', 'a', 'old')
+        assert started.wait(2)
+        q.submit('kv', 'a', 'a', 'queued')
+
+        done = []
+        t = threading.Thread(target=lambda: done.append(q.supersede('kv', 'a')))
+        t.start()
+        time.sleep(0.05)
+        assert not done                 # 在途写入未完成前一直等待
+        release.set()
+        t.join(2)
+        assert done == [True]           # 排队中的新值被撤销
+        store['a'] = 'sync'             # 调用方随后的同步写不会被覆盖
+        assert q.flush(timeout=2)
+        assert store == {'a': 'sync'}
+        q.close()
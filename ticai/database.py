@@ -4,7 +4,7 @@
 import json
 from datetime import datetime, date
 from typing import List, Dict, Optional
-from database import get_connection, get_db_config
+from database import get_connection, get_db_config, BULK_CHUNK_SIZE
 import pymysql
 
 
@@ -125,7 +125,8 @@ def save_report(report_date: date, market_change: float, themes_data: Dict) -> i
             )
             report_id = cursor.lastrowid
 
-        # 保存推荐股票
+        # 保存推荐股票：先组装全部行，再按块多行 INSERT（与报表头同一事务，整体成功或回滚）
+        rows = []
         for theme_name, theme_data in themes_data.items():
             for stock in theme_data.get("stocks", []):
                 price_str = stock.get("price", "0")
@@ -152,15 +153,7 @@ def save_report(report_date: date, market_change: float, themes_data: Dict) -> i
                 elif open_change >= 5 and change_pct >= 9.9:
                     is_buyable, unbuyable_reason = 0, "高开秒板"
 
-                cursor.execute('''
-                    INSERT INTO ticai_recommended_stocks (
-                        report_id, theme_name, stock_code, stock_name,
-                        recommend_price, change_pct, score, role, role_reason,
-                        `signal`, volume_level, strength, is_weak_to_strong,
-                        is_front_runner, front_runner_tags, market_cap, amount, turnover_rate,
-                        open_change, is_buyable, unbuyable_reason
-                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ''', (
+                rows.append((
                     report_id, theme_name,
                     stock.get("code", ""), stock.get("name", ""),
                     price, change_pct, stock.get("score", 0),
@@ -175,6 +168,17 @@ def save_report(report_date: date, market_change: float, themes_data: Dict) -> i
                     turnover, open_change, is_buyable, unbuyable_reason
                 ))
 
+        for i in range(0, len(rows), BULK_CHUNK_SIZE):
+            cursor.executemany('''
+                INSERT INTO ticai_recommended_stocks (
+                    report_id, theme_name, stock_code, stock_name,
+                    recommend_price, change_pct, score, role, role_reason,
+                    `signal`, volume_level, strength, is_weak_to_strong,
+                    is_front_runner, front_runner_tags, market_cap, amount, turnover_rate,
+                    open_change, is_buyable, unbuyable_reason
+                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            ''', rows[i:i + BULK_CHUNK_SIZE])
+
         print(f"✅ 报表保存成功: {report_date}, {themes_count}个题材, {stocks_count}只股票")
         return report_id
 
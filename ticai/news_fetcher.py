@@ -2,13 +2,14 @@
 # 支持多数据源：新浪财经、同花顺、东方财富
 
 import json as _json
-import time
 import re
 import requests
 from datetime import datetime, date, time as dt_time
 from typing import List, Dict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from cache import get as cache_get, set as cache_set, delete_key as cache_delete
+
 try:
     import akshare as ak
 except ImportError:
@@ -19,10 +20,9 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
 }
 
-# 缓存
-_news_cache = {}
-_cache_time = {}
-NEWS_CACHE_TTL = 180  # 3分钟缓存（内存缓存，用于单次会话内快速返回）
+# 缓存（统一缓存层 'news/src/' 命名空间，各 worker 共享）
+_CACHE_NS = 'news/src/'
+NEWS_CACHE_TTL = 180  # 3分钟缓存（用于短时间内快速返回）
 DB_CACHE_TTL = 30 * 60  # 30分钟（数据库缓存TTL）
 
 # 重大利好关键词
@@ -56,14 +56,11 @@ STOCK_NAME_SUFFIXES = ["股份", "科技", "电子", "集团", "新材", "智能
 
 
 def _get_cached(key):
-    if key in _news_cache and time.time() - _cache_time.get(key, 0) < NEWS_CACHE_TTL:
-        return _news_cache[key]
-    return None
+    return cache_get(_CACHE_NS + key)
 
 
 def _set_cache(key, value):
-    _news_cache[key] = value
-    _cache_time[key] = time.time()
+    cache_set(_CACHE_NS + key, value, ttl=NEWS_CACHE_TTL)
 
 
 # ============ 多源新闻获取 ============
@@ -516,9 +513,7 @@ def fetch_all_news(limit_per_source: int = 30, force: bool = False) -> List[Dict
     force=True：跳过 DB 短路与本条内存缓存，强制重新抓取并写库。
     """
     if force:
-        key = f"all_news_{limit_per_source}"
-        _news_cache.pop(key, None)
-        _cache_time.pop(key, None)
+        cache_delete(f"{_CACHE_NS}all_news_{limit_per_source}")
 
     # ── 1. 查数据库缓存（近 7 日，含昨日；force 时跳过以便真正拉新） ───────
     if not force:
@@ -599,8 +594,8 @@ def fetch_all_news(limit_per_source: int = 30, force: bool = False) -> List[Dict
         # ── 4. 回存数据库（去重写入） ─────────────────────────────────
         try:
             import database
-            saved = database.save_news_items(unique_news)
-            print(f"📰 新闻聚合完成: 共{len(unique_news)}条 (去重后), 新增入库{saved}条")
+            queued = database.save_news_items_deferred(unique_news)
+            print(f"📰 新闻聚合完成: 共{len(unique_news)}条 (去重后), 已提交入库{queued}条")
         except Exception as e:
             print(f"[WARN] 新闻入库失败: {e}")
             print(f"📰 新闻聚合完成: 共{len(unique_news)}条 (去重后)")
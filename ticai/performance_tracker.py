@@ -1,40 +1,20 @@
 """
 收益跟踪模块 - 每日更新推荐股票的实盘收益
 """
-import requests
 from datetime import datetime, date, timedelta
 from typing import List, Dict
 from ticai.database import get_stocks_for_tracking, save_performance, get_connection
-from ticai.config import REQUEST_TIMEOUT
-
-_price_cache = {}
-
+from utils.quote_service import get_prices
 
 def get_batch_prices(stock_codes: List[str]) -> Dict[str, float]:
-    """批量获取股票价格"""
+    """批量获取股票价格（统一行情服务）"""
     if not stock_codes:
         return {}
-    prices = {}
     try:
-        secids = []
-        for code in stock_codes:
-            market = "1" if code.startswith(("6", "9")) else "0"
-            secids.append(f"{market}.{code}")
-
-        url = "http://push2.eastmoney.com/api/qt/ulist/get"
-        params = {"fltt": "2", "secids": ",".join(secids), "fields": "f2,f12"}
-        resp = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
-        data = resp.json()
-
-        if data.get("data") and data["data"].get("diff"):
-            for item in data["data"]["diff"]:
-                code = item.get("f12", "")
-                price = item.get("f2", 0)
-                if code and price and price != "-":
-                    prices[code] = float(price)
+        return get_prices(stock_codes)
     except Exception as e:
         print(f"批量获取价格失败: {e}")
-    return prices
+        return {}
 
 
 def is_trading_day(check_date: date = None) -> bool:
@@ -17,11 +17,14 @@ from ticai.database import (
 from ticai.performance_tracker import update_all_performance, get_today_performance_report
 # cache.py 在项目根目录
 try:
-    from cache import get, set, invalidate
+    from cache import get, set, invalidate, cached
 except ImportError:
     import sys, os
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from cache import get, set, invalidate
+    from cache import get, set, invalidate, cached
+
+# 题材总览过期后仍可先返回旧值的秒数：pipeline 耗时数十秒，期间请求直接拿旧报表，后台刷新
+TICAI_ALL_SWR = 300
 
 try:
     import akshare as ak
@@ -89,24 +92,32 @@ def get_all_data():
     """
     获取所有热门题材及其推荐股票。
     读取顺序：
-      1. Redis 缓存（TTL 60s，刷新后自动失效）
+      1. Redis 缓存（TTL 60s，过期后 TICAI_ALL_SWR 秒内先返回旧值、后台刷新；手动刷新时清除）
       2. MySQL 今日报表（持久存储，次日自动换新）
       3. 完整 pipeline（MySQL 也为空时降级执行）
     """
-    hit = get('ticai/all')
-    if hit is not None:
-        return jsonify({"success": True, "data": hit.get('data', {}), "market_change": hit.get('market_change', 0), "source": "cache"})
+    sources = []
+
+    def _load():
+        # ── 2. 尝试从 MySQL 读今日报表 ────────────────────────────
+        db_report = get_report_by_date(date.today())
+        if db_report is not None:
+            sources.append("mysql")
+            return _build_api_payload_from_db(db_report)
+        # ── 3. 降级：跑完整 pipeline ─────────────────────────────
+        sources.append("pipeline")
+        return _fetch_and_build_all_data()
 
-    # ── 2. 尝试从 MySQL 读今日报表 ────────────────────────────────
-    from datetime import date
-    db_report = get_report_by_date(date.today())
-    if db_report is not None:
-        payload = _build_api_payload_from_db(db_report)
-        set('ticai/all', payload, ttl=60)
-        return jsonify({"success": True, "data": payload.get('data', {}), "market_change": payload.get('market_change', 0), "source": "mysql"})
+    try:
+        payload = cached('ticai/all', ttl=60, fetch_fn=_load, swr=TICAI_ALL_SWR)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
 
-    # ── 3. 降级：跑完整 pipeline ─────────────────────────────────
-    return _fetch_and_build_all_data()
+    # 本次请求同步计算时 sources 非空；后台刷新写入的不算
+    source = sources[0] if sources else "cache"
+    return jsonify({"success": True, "data": payload.get('data', {}), "market_change": payload.get('market_change', 0), "source": source})
 
 
 def _build_api_payload_from_db(db_report: dict) -> dict:
@@ -181,90 +192,83 @@ def _build_api_payload_from_db(db_report: dict) -> dict:
     return {"data": sorted_result, "market_change": market_change}
 
 
-def _fetch_and_build_all_data():
+def _fetch_and_build_all_data() -> dict:
     """
-    完整 pipeline：爬虫 → 分析 → 存 MySQL → 设 Redis → 返回。
+    完整 pipeline：爬虫 → 分析 → 存 MySQL → 返回 payload（Redis 由调用方 cached() 写入）。
     """
-    try:
-        print("\n" + "=" * 60)
-        print("📊 MySQL 无今日报表，执行完整 pipeline（爬虫 + 分析）")
-        print("=" * 60)
-
-        market_change = get_market_index_change()
-        print(f"📈 大盘涨跌: {market_change:+.2f}%")
-
-        theme_data = fetch_all_themes_with_stocks(theme_limit=8)
-        news_list = fetch_cls_news(50)
-
-        result = {}
-        for theme_name, data in theme_data.items():
-            stocks = data.get("stocks", [])
-            theme_info = data.get("info", {})
-            history = data.get("history", {})
-            hot_score = data.get("hot_score", 0)
-
-            theme_change = theme_info.get("change_pct", 0) or 0
-            emotion = calculate_theme_emotion(theme_info, stocks)
-            formatted_stocks = analyze_and_format_stocks(stocks, market_change, theme_change)
-
-            fund_tags = []
-            if history.get("continuous_up", 0) >= 2:
-                fund_tags.append(f"连涨{history['continuous_up']}日")
-            if history.get("continuous_inflow", 0) >= 2:
-                fund_tags.append(f"连续{history['continuous_inflow']}日流入")
-            if history.get("total_change_3d", 0) >= 5:
-                fund_tags.append(f"3日涨{history['total_change_3d']:.1f}%")
-
-            quality = evaluate_theme_quality(theme_name, theme_info, stocks, history)
-            news_factor = evaluate_theme_news_factor(theme_name, news_list, stocks)
-
-            result[theme_name] = {
-                "info": {
-                    "change_pct": theme_change,
-                    "up_count": theme_info.get("up_count", 0),
-                    "down_count": theme_info.get("down_count", 0),
-                },
-                "history": {
-                    "continuous_up": history.get("continuous_up", 0),
-                    "continuous_inflow": history.get("continuous_inflow", 0),
-                    "total_change_3d": round(history.get("total_change_3d", 0), 2),
-                    "total_inflow_3d": round(history.get("total_inflow_3d", 0) / 100000000, 2),
-                    "is_hot": history.get("is_hot", False),
-                    "fund_tags": fund_tags,
-                },
-                "hot_score": hot_score,
-                "market_change": market_change,
-                "quality": quality,
-                "news": news_factor,
-                "emotion": {
-                    "stage": emotion["stage"],
-                    "stage_desc": emotion["stage_desc"],
-                    "score": emotion["emotion_score"],
-                    "color": get_stage_color(emotion["stage"]),
-                    "advice": get_stage_advice(emotion["stage"]),
-                    "metrics": emotion["metrics"],
-                },
-                "stocks": formatted_stocks,
-            }
+    print("\n" + "=" * 60)
+    print("📊 MySQL 无今日报表，执行完整 pipeline（爬虫 + 分析）")
+    print("=" * 60)
 
-        sorted_result = dict(
-            sorted(result.items(), key=lambda x: x[1].get("hot_score", 0), reverse=True)
-        )
-        print(f"\n✅ 数据获取完成，共 {len(sorted_result)} 个题材\n")
+    market_change = get_market_index_change()
+    print(f"📈 大盘涨跌: {market_change:+.2f}%")
 
-        # 保存 MySQL（报表持久化）+ Redis（短期缓存）
-        try:
-            save_report(date.today(), market_change, sorted_result)
-        except Exception as save_err:
-            print(f"⚠️ 保存报表失败: {save_err}")
+    theme_data = fetch_all_themes_with_stocks(theme_limit=8)
+    news_list = fetch_cls_news(50)
 
-        payload = {"data": sorted_result, "market_change": market_change}
-        set('ticai/all', payload, ttl=60)
-        return jsonify({"success": True, "data": sorted_result, "market_change": market_change, "source": "pipeline"})
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = {}
+    for theme_name, data in theme_data.items():
+        stocks = data.get("stocks", [])
+        theme_info = data.get("info", {})
+        history = data.get("history", {})
+        hot_score = data.get("hot_score", 0)
+
+        theme_change = theme_info.get("change_pct", 0) or 0
+        emotion = calculate_theme_emotion(theme_info, stocks)
+        formatted_stocks = analyze_and_format_stocks(stocks, market_change, theme_change)
+
+        fund_tags = []
+        if history.get("continuous_up", 0) >= 2:
+            fund_tags.append(f"连涨{history['continuous_up']}日")
+        if history.get("continuous_inflow", 0) >= 2:
+            fund_tags.append(f"连续{history['continuous_inflow']}日流入")
+        if history.get("total_change_3d", 0) >= 5:
+            fund_tags.append(f"3日涨{history['total_change_3d']:.1f}%")
+
+        quality = evaluate_theme_quality(theme_name, theme_info, stocks, history)
+        news_factor = evaluate_theme_news_factor(theme_name, news_list, stocks)
+
+        result[theme_name] = {
+            "info": {
+                "change_pct": theme_change,
+                "up_count": theme_info.get("up_count", 0),
+                "down_count": theme_info.get("down_count", 0),
+            },
+            "history": {
+                "continuous_up": history.get("continuous_up", 0),
+                "continuous_inflow": history.get("continuous_inflow", 0),
+                "total_change_3d": round(history.get("total_change_3d", 0), 2),
+                "total_inflow_3d": round(history.get("total_inflow_3d", 0) / 100000000, 2),
+                "is_hot": history.get("is_hot", False),
+                "fund_tags": fund_tags,
+            },
+            "hot_score": hot_score,
+            "market_change": market_change,
+            "quality": quality,
+            "news": news_factor,
+            "emotion": {
+                "stage": emotion["stage"],
+                "stage_desc": emotion["stage_desc"],
+                "score": emotion["emotion_score"],
+                "color": get_stage_color(emotion["stage"]),
+                "advice": get_stage_advice(emotion["stage"]),
+                "metrics": emotion["metrics"],
+            },
+            "stocks": formatted_stocks,
+        }
+
+    sorted_result = dict(
+        sorted(result.items(), key=lambda x: x[1].get("hot_score", 0), reverse=True)
+    )
+    print(f"\n✅ 数据获取完成，共 {len(sorted_result)} 个题材\n")
+
+    # 保存 MySQL（报表持久化）
+    try:
+        save_report(date.today(), market_change, sorted_result)
+    except Exception as save_err:
+        print(f"⚠️ 保存报表失败: {save_err}")
+
+    return {"data": sorted_result, "market_change": market_change}
 
 
 @ticai_bp.route('/api/ticai/refresh', methods=['POST'])
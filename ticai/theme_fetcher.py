@@ -9,10 +9,10 @@ from utils.ths_crawler import (
     fetch_ths_industry_stocks,
 )
 from ticai.config import MAX_WORKERS, STOCKS_PER_THEME
+from cache import get as cache_get, set as cache_set
 
-# 缓存
-_cache = {}
-_cache_time = {}
+# 缓存（统一缓存层 'theme/' 命名空间，各 worker 共享）
+_CACHE_NS = 'theme/'
 CACHE_TTL = 300
 
 EXCLUDE_KEYWORDS = [
@@ -30,14 +30,11 @@ _EM_CODE_MAP_TTL = 3600  # 1小时刷新一次
 
 
 def _get_cached(key):
-    if key in _cache and time.time() - _cache_time.get(key, 0) < CACHE_TTL:
-        return _cache[key]
-    return None
+    return cache_get(_CACHE_NS + key)
 
 
 def _set_cache(key, value):
-    _cache[key] = value
-    _cache_time[key] = time.time()
+    cache_set(_CACHE_NS + key, value, ttl=CACHE_TTL)
 
 
 def _safe_float(val, default=0.0):
@@ -69,7 +69,7 @@ def _ensure_kline_payload(code: str) -> dict | None:
     优先级：
     1. kline_raw_cache  — Raw OHLCV，当日有效（最快路径）
     2. kline_cache      — 策略注解数据（含 candles 结构），命中时回写 Raw
-    3. 网络抓取         — 新浪原始数据，存入两个缓存
+    3. 网络抓取         — 不复权日线 + 复权因子（失败回退前复权），异步存入两个缓存
 
     返回 {'bars': [...]} 或 {'candles': [...]}，tv_history 兼容两种格式。
     """
@@ -104,20 +104,26 @@ def _ensure_kline_payload(code: str) -> dict | None:
             raw_bars.append(bar)
         if raw_bars:
             import pandas as _pd
-            db.save_kline_raw_cache(code, _pd.DataFrame(raw_bars))
+            db.save_kline_raw_cache_deferred(code, _pd.DataFrame(raw_bars))
         return cached
     logger.info('[TV] %s strategy cache MISS', code)
 
-    # 两层缓存均未命中，网络抓取
+    # 两层缓存均未命中，网络抓取（不复权日线 + 复权因子，已写入 Raw 缓存）
+    from utils.kline_adjust import load_daily_history
     from utils.ths_crawler import get_stock_kline_sina
 
     try:
-        df = get_stock_kline_sina(code, days=120)
+        try:
+            df = load_daily_history(code, 120)
+        except Exception as e:
+            logger.warning('[TV] %s unadjusted history failed: %s', code, e)
+            df = None
         if df is None or df.empty:
-            return None
-
-        # 保存 Raw OHLCV（供 TV 图表用）
-        db.save_kline_raw_cache(code, df)
+            df = get_stock_kline_sina(code, days=120)
+            if df is None or df.empty:
+                return None
+            # 保存 Raw OHLCV（供 TV 图表用）
+            db.save_kline_raw_cache_deferred(code, df)
 
         # 构建 candles/volumes 结构并缓存
         candles, volumes = [], []
@@ -142,7 +148,7 @@ def _ensure_kline_payload(code: str) -> dict | None:
             volumes.append({'time': d, 'value': vol, 'color': color})
 
         payload = {'candles': candles, 'volumes': volumes}
-        db.save_kline_cache(code, payload)
+        db.save_kline_cache_deferred(code, payload)
         return payload
 
     except Exception as e:
@@ -203,8 +209,36 @@ def tv_quotes():
 
 @tv_udf_bp.route('/search')
 def tv_search():
-    """UDF search：移动端图表未开放搜索，返回空数组即可。"""
-    return jsonify([])
+    """
+    UDF search：与 /api/stocks/search 共用内存搜索索引。
+
+    Query params: query, type, exchange, limit
+    """
+    query = (request.args.get('query') or '').strip()
+    exchange = (request.args.get('exchange') or '').strip().upper()
+    limit = max(1, min(50, request.args.get('limit', 30, type=int)))
+    if not query:
+        return jsonify([])
+    try:
+        stocks = db.search_stocks(query, limit=limit if not exchange else 50)
+    except Exception as e:
+        logger.warning('tv search %s: %s', query, e)
+        return jsonify([])
+
+    out = []
+    for s in stocks:
+        exch = _exchange_for_code(s['code'])
+        if exchange and exch != exchange:
+            continue
+        out.append({
+            'symbol': s['code'],
+            'full_name': f"{exch}:{s['code']}",
+            'description': s.get('name') or s['code'],
+            'exchange': exch,
+            'ticker': f"{exch}:{s['code']}",
+            'type': 'stock',
+        })
+    return jsonify(out[:limit])
 
 
 @tv_udf_bp.route('/symbols')
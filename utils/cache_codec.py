@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存序列化编解码
+================
+
+cache.set 原先一律 json.dumps，DataFrame 只能先转成 {'columns', 'data'} 行列表再存，
+编码慢、体积大、读回还要逐列 to_numeric。本模块提供可插拔的二进制编码：
+
+- 序列化：msgpack（优先）/ orjson / 标准库 json，按可用性自动选择
+- 压缩：zstd（需 zstandard）/ zlib，超过 CACHE_COMPRESS_MIN 字节才压缩
+- numpy 数组与 DataFrame 按列存原始内存缓冲区（数值 / 布尔 / 无时区日期列零拷贝），
+  字符串等 object 列存列表；读回 dtype、列名、非默认索引保持一致
+
+格式协商：二进制条目首字节为头字节 0x80 | 序列化器 << 4 | 标记 <<3 | 压缩算法。
+合法 JSON 首字节一定是 ASCII（< 0x80），因此旧的 JSON 条目（str 或 bytes）照常读取。
+CACHE_CODEC=json 且无需压缩 / 无 DataFrame 时直接写纯 JSON，滚动发布期间旧 worker 仍可读。
+注意：orjson 把普通 float 的 NaN 写成 null（DataFrame / ndarray 缓冲区内的 NaN 不受影响）。
+
+环境变量：
+    CACHE_CODEC         auto | msgpack | orjson | json（默认 auto：msgpack > orjson > json）
+    CACHE_COMPRESS      auto | zstd | zlib | none（默认 auto：zstd > zlib）
+    CACHE_COMPRESS_MIN  压缩阈值字节数（默认 1024）
+
+基准：python -m utils.cache_codec
+"""
+
+import base64
+import json
+import os
+import time
+import zlib
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SER_JSON = 'json'
+SER_ORJSON = 'orjson'
+SER_MSGPACK = 'msgpack'
+
+COMP_NONE = 'none'
+COMP_ZLIB = 'zlib'
+COMP_ZSTD = 'zstd'
+
+_SER_IDS = {SER_JSON: 1, SER_ORJSON: 2, SER_MSGPACK: 3}
+_COMP_IDS = {COMP_NONE: 0, COMP_ZLIB: 1, COMP_ZSTD: 2}
+_SER_NAMES = {v: k for k, v in _SER_IDS.items()}
+_COMP_NAMES = {v: k for k, v in _COMP_IDS.items()}
+
+_HEADER_FLAG = 0x80
+_TAGGED_FLAG = 0x08   # JSON 类序列化中含 __df__ / __nd__ 标记对象，读回需还原
+
+# msgpack 扩展类型
+_EXT_NDARRAY = 1
+_EXT_DATAFRAME = 2
+
+COMPRESS_MIN = int(os.environ.get('CACHE_COMPRESS_MIN', 1024))
+_ZSTD_LEVEL = 3
+_ZLIB_LEVEL = 1
+
+
+def _available(ser: str) -> bool:
+    return ser == SER_JSON or (ser == SER_ORJSON and orjson is not None) or (ser == SER_MSGPACK and msgpack is not None)
+
+
+def default_serializer() -> str:
+    choice = os.environ.get('CACHE_CODEC', 'auto').strip().lower()
+    if choice in _SER_IDS and _available(choice):
+        return choice
+    for ser in (SER_MSGPACK, SER_ORJSON):
+        if _available(ser):
+            return ser
+    return SER_JSON
+
+
+def default_compression() -> str:
+    choice = os.environ.get('CACHE_COMPRESS', 'auto').strip().lower()
+    if choice == COMP_NONE or choice == COMP_ZLIB:
+        return choice
+    if choice in (COMP_ZSTD, 'auto') and zstandard is not None:
+        return COMP_ZSTD
+    return COMP_ZLIB
+
+
+# ─── numpy / DataFrame 拆分与还原 ─────────────────────────────────────────────
+
+def _is_raw_dtype(dtype) -> bool:
+    """可直接存内存缓冲区的 dtype：数值、布尔、无时区 datetime64 / timedelta64。"""
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM'
+
+
+def _nd_parts(arr: np.ndarray) -> list:
+    """ndarray → [dtype.str, shape, bytes | list]"""
+    if _is_raw_dtype(arr.dtype):
+        return [arr.dtype.str, list(arr.shape), np.ascontiguousarray(arr).tobytes()]
+    return ['O', list(arr.shape), arr.tolist()]
+
+
+def _nd_from_parts(parts: list, copy: bool = True) -> np.ndarray:
+    dtype, shape, buf = parts
+    if dtype == 'O':
+        arr = np.empty(len(buf), dtype=object)
+        arr[:] = buf
+        return arr.reshape(shape) if len(shape) > 1 else arr
+    arr = np.frombuffer(buf, dtype=np.dtype(dtype)).reshape(shape)
+    return arr.copy() if copy else arr   # frombuffer 只读
+
+
+def _df_parts(df: pd.DataFrame) -> dict:
+    """DataFrame → {'c': 列名, 't': 列 dtype 名, 'd': 列数据, 'i': 非默认索引}"""
+    cols, dtypes, data = [], [], []
+    for i, col in enumerate(df.columns):
+        s = df.iloc[:, i]
+        cols.append(col)
+        dtypes.append(str(s.dtype))
+        values = s.to_numpy() if _is_raw_dtype(s.dtype) else s.to_numpy(dtype=object)
+        data.append(_nd_parts(values))
+
+    index = None
+    if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+        index = [_nd_parts(df.index.to_numpy()), df.index.name]
+    return {'c': cols, 't': dtypes, 'd': data, 'i': index}
+
+
+def _df_from_parts(parts: dict) -> pd.DataFrame:
+    columns = {}
+    for i, (col_parts, dtype) in enumerate(zip(parts['d'], parts['t'])):
+        s = pd.Series(_nd_from_parts(col_parts, copy=False), copy=True)
+        if col_parts[0] == 'O' and dtype != 'object':
+            try:
+                s = s.astype(dtype)   # str / category 等扩展类型
+            except (TypeError, ValueError):
+                pass
+        columns[i] = s
+
+    index = None
+    if parts.get('i'):
+        idx_parts, name = parts['i']
+        index = pd.Index(_nd_from_parts(idx_parts), name=name)
+
+    df = pd.DataFrame(columns) if columns else pd.DataFrame(index=index)
+    df.columns = list(parts['c'])   # 按位置设置列名，允许重名 / 非字符串列名
+    if index is not None:
+        df.index = index
+    return df
+
+
+def _scalar(obj: Any):
+    """numpy 标量、Timestamp 等转为可序列化的 Python 原生值；无法处理返回 NotImplemented。"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    return NotImplemented
+
+
+# ─── 各序列化器 ───────────────────────────────────────────────────────────────
+
+def _msgpack_default(obj: Any):
+    if isinstance(obj, pd.DataFrame):
+        return msgpack.ExtType(_EXT_DATAFRAME, _msgpack_pack(_df_parts(obj)))
+    if isinstance(obj, np.ndarray):
+        return msgpack.ExtType(_EXT_NDARRAY, _msgpack_pack(_nd_parts(obj)))
+    value = _scalar(obj)
+    if value is NotImplemented:
+        raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+    return value
+
+
+def _msgpack_pack(value: Any) -> bytes:
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    parts = msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=_msgpack_ext_hook)
+    if code == _EXT_DATAFRAME:
+        return _df_from_parts(parts)
+    if code == _EXT_NDARRAY:
+        return _nd_from_parts(parts)
+    return msgpack.ExtType(code, data)
+
+
+def _tagged_default(tagged: list):
+    """JSON 类序列化的 default 钩子：DataFrame / ndarray 转为标记对象，二进制缓冲区 base64。"""
+    def _b64(parts: list) -> list:
+        dtype, shape, buf = parts
+        return [dtype, shape, base64.b64encode(buf).decode('ascii') if dtype != 'O' else buf]
+
+    def default(obj: Any):
+        if isinstance(obj, pd.DataFrame):
+            tagged.append(True)
+            parts = _df_parts(obj)
+            parts['d'] = [_b64(p) for p in parts['d']]
+            if parts['i']:
+                parts['i'] = [_b64(parts['i'][0]), parts['i'][1]]
+            return {'__df__': parts}
+        if isinstance(obj, np.ndarray):
+            tagged.append(True)
+            return {'__nd__': _b64(_nd_parts(obj))}
+        value = _scalar(obj)
+        if value is NotImplemented:
+            raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+        return value
+    return default
+
+
+def _untag(value: Any) -> Any:
+    """还原 _tagged_default 产生的标记对象。"""
+    def _unb64(parts: list) -> list:
+        dtype, shape, buf = parts
+        return [dtype, shape, base64.b64decode(buf) if dtype != 'O' else buf]
+
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if '__df__' in value:
+                parts = value['__df__']
+                parts['d'] = [_unb64(p) for p in parts['d']]
+                if parts.get('i'):
+                    parts['i'] = [_unb64(parts['i'][0]), parts['i'][1]]
+                return _df_from_parts(parts)
+            if '__nd__' in value:
+                return _nd_from_parts(_unb64(value['__nd__']))
+        return {k: _untag(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_untag(v) for v in value]
+    return value
+
+
+def _serialize(value: Any, ser: str) -> tuple[bytes, bool]:
+    """返回 (序列化结果, 是否含标记对象)"""
+    if ser == SER_MSGPACK:
+        return _msgpack_pack(value), False
+    tagged: list = []
+    if ser == SER_ORJSON:
+        body = orjson.dumps(value, default=_tagged_default(tagged), option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(value, ensure_ascii=False, default=_tagged_default(tagged)).encode('utf-8')
+    return body, bool(tagged)
+
+
+def _deserialize(body: bytes, ser: str, tagged: bool) -> Any:
+    if ser == SER_MSGPACK:
+        if msgpack is None:
+            raise ValueError('cache entry encoded with msgpack, but msgpack is not installed')
+        return msgpack.unpackb(body, raw=False, strict_map_key=False, ext_hook=_msgpack_ext_hook)
+    if ser == SER_ORJSON and orjson is not None:
+        value = orjson.loads(body)
+    else:
+        value = json.loads(body)   # orjson 写入的也是标准 JSON
+    return _untag(value) if tagged else value
+
+
+def _compress(body: bytes, comp: str) -> bytes:
+    if comp == COMP_ZSTD:
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(body)
+    if comp == COMP_ZLIB:
+        return zlib.compress(body, _ZLIB_LEVEL)
+    return body
+
+
+def _decompress(body: bytes, comp: str) -> bytes:
+    if comp == COMP_ZSTD:
+        if zstandard is None:
+            raise ValueError('cache entry compressed with zstd, but zstandard is not installed')
+        return zstandard.ZstdDecompressor().decompress(body)
+    if comp == COMP_ZLIB:
+        return zlib.decompress(body)
+    return body
+
+
+# ─── 对外接口 ─────────────────────────────────────────────────────────────────
+
+def encode(value: Any, ser: Optional[str] = None, comp: Optional[str] = None) -> bytes:
+    """
+    编码缓存值。
+
+    Args:
+        ser: 序列化器，默认按 CACHE_CODEC 选择
+        comp: 压缩算法，默认按 CACHE_COMPRESS 选择；小于 CACHE_COMPRESS_MIN 字节不压缩
+    """
+    ser = ser or default_serializer()
+    comp = comp or default_compression()
+    body, tagged = _serialize(value, ser)
+    if comp != COMP_NONE and len(body) >= COMPRESS_MIN:
+        body = _compress(body, comp)
+    else:
+        comp = COMP_NONE
+    if ser == SER_JSON and comp == COMP_NONE and not tagged:
+        return body   # 纯 JSON，旧版本可读
+    header = _HEADER_FLAG | (_SER_IDS[ser] << 4) | (_TAGGED_FLAG if tagged else 0) | _COMP_IDS[comp]
+    return bytes((header,)) + body
+
+
+def decode(raw: Any) -> Any:
+    """解码缓存值：带头字节的二进制条目，或旧的纯 JSON（str / bytes）。"""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if not raw or raw[0] < _HEADER_FLAG:
+        return json.loads(raw)
+    header = raw[0]
+    ser = _SER_NAMES.get((header >> 4) & 0x07)
+    comp = _COMP_NAMES.get(header & 0x07)
+    if ser is None or comp is None:
+        raise ValueError(f'unknown cache codec header: 0x{header:02x}')
+    body = _decompress(memoryview(raw)[1:], comp)
+    return _deserialize(bytes(body), ser, bool(header & _TAGGED_FLAG))
+
+
+# ─── 基准 ─────────────────────────────────────────────────────────────────────
+
+def _bench_payloads() -> dict:
+    """扫描结果（嵌套 dict 列表）与 K 线 DataFrame 两类典型负载。"""
+    rng = np.random.default_rng(0)
+    n = 250
+    close = 10 + rng.standard_normal(n).cumsum() * 0.1
+    kline = pd.DataFrame({
+        'date': pd.date_range('2024-01-02', periods=n, freq='B').strftime('%Y-%m-%d'),
+        'open': close + rng.standard_normal(n) * 0.05,
+        'high': close + 0.2,
+        'low': close - 0.2,
+        'close': close,
+        'volume': rng.integers(1e5, 1e7, n).astype(float),
+        'amount': rng.random(n) * 1e8,
+        'turnover': rng.random(n) * 5,
+    })
+    scan = [{
+        'code': f'{600000 + i:06d}', 'name': f'股票{i}', 'sector': '半导体',
+        'score': float(rng.random() * 100), 'grade': 'A', 'bandwidth': float(rng.random() * 10),
+        'squeeze_days': int(rng.integers(1, 20)), 'pct_change': float(rng.standard_normal()),
+        'tags': ['放量', '多头排列'],
+        'kline': {'dates': kline['date'].tolist()[-60:], 'closes': kline['close'].round(2).tolist()[-60:]},
+    } for i in range(200)]
+    return {'scan': scan, 'kline': kline}
+
+
+def _legacy_kline(df: pd.DataFrame) -> dict:
+    """旧写法：DataFrame → {'columns', 'data'}"""
+    return {'columns': list(df.columns), 'data': df.values.tolist()}
+
+
+def _timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run_benchmark(repeat: int = 200) -> list:
+    """对比旧 JSON 与各可用编码组合的体积与编解码耗时（微秒）。"""
+    payloads = _bench_payloads()
+    rows = []
+
+    for name, value in payloads.items():
+        legacy = _legacy_kline(value) if isinstance(value, pd.DataFrame) else value
+
+        def _legacy_decode(raw, is_df=isinstance(value, pd.DataFrame)):
+            d = json.loads(raw)
+            return pd.DataFrame(d['data'], columns=d['columns']) if is_df else d
+
+        raw = json.dumps(legacy, ensure_ascii=False)
+        rows.append({
+            'payload': name, 'codec': 'legacy-json', 'bytes': len(raw.encode('utf-8')),
+            'encode_us': _timeit(lambda: json.dumps(_legacy_kline(value) if isinstance(value, pd.DataFrame) else value,
+                                                    ensure_ascii=False), repeat),
+            'decode_us': _timeit(lambda: _legacy_decode(raw), repeat),
+        })
+
+        for ser in (SER_JSON, SER_ORJSON, SER_MSGPACK):
+            if not _available(ser):
+                continue
+            for comp in (COMP_NONE, COMP_ZLIB, COMP_ZSTD):
+                if comp == COMP_ZSTD and zstandard is None:
+                    continue
+                blob = encode(value, ser, comp)
+                rows.append({
+                    'payload': name, 'codec': f'{ser}+{comp}', 'bytes': len(blob),
+                    'encode_us': _timeit(lambda: encode(value, ser, comp), repeat),
+                    'decode_us': _timeit(lambda: decode(blob), repeat),
+                })
+    return rows
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+    print(tabulate(run_benchmark(), headers='keys', floatfmt='.1f'))
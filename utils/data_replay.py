@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行情数据源录制 / 回放
+=====================
+
+扫描、TradingView 历史、回测依赖 akshare / 东财 / 新浪 / 同花顺在线接口，无网络时无法运行，
+性能改动也无法复现对比。本模块在数据源边界（ths_crawler / market_data 的 _get_ak() 与
+直接 HTTP 请求）提供可插拔的录制回放层：
+
+- live   （默认）直接请求上游，零开销
+- record 请求上游，同时把结果写入磁盘
+- replay 只读磁盘，不访问网络；可注入固定延迟与错误率，结果确定可复现
+
+环境变量：
+    DATA_SOURCE_MODE        live | record | replay
+    DATA_REPLAY_DIR         录制目录（默认 <项目根>/data/replay）
+    DATA_REPLAY_LATENCY_MS  回放时每次调用的模拟延迟（毫秒，默认 0）
+    DATA_REPLAY_ERROR_RATE  回放时模拟失败的概率 0~1（默认 0），失败抛 ConnectionError
+    DATA_REPLAY_SEED        错误注入随机种子（默认 0），同一种子同一调用序列结果一致
+
+录制键 = 调用名 + 参数（忽略 timeout / headers 等不影响结果的参数），与调用时间无关。
+ProcessPoolExecutor 子进程继承环境变量，扫描的多进程 K 线抓取同样生效。
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+MODE_LIVE = 'live'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+_DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'replay')
+
+# 不参与录制键的参数（只影响传输，不影响返回内容）
+_IGNORED_KWARGS = {'timeout', 'headers', 'impersonate', 'proxies', 'verify', 'session', 'getter', 'encoding'}
+
+_counter_lock = threading.Lock()
+_call_counter: Dict[str, int] = {}
+
+
+class ReplayMissError(LookupError):
+    """回放模式下没有对应录制。数据源兜底链会像普通失败一样尝试下一个源。"""
+
+
+class RecordedResponse:
+    """可序列化的 HTTP 响应（兼容 requests / curl_cffi 常用属性）。"""
+
+    def __init__(self, status_code: int, text: str, url: str = ''):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+        self.encoding = 'utf-8'   # 已按录制时的编码解码，调用方再设置无影响
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode('utf-8')
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    def json(self):
+        import json
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            import requests
+            raise requests.HTTPError(f'{self.status_code} for url: {self.url}')
+
+
+def get_mode() -> str:
+    mode = os.environ.get('DATA_SOURCE_MODE', MODE_LIVE).strip().lower()
+    return mode if mode in (MODE_RECORD, MODE_REPLAY) else MODE_LIVE
+
+
+def _replay_dir() -> str:
+    return os.environ.get('DATA_REPLAY_DIR') or _DEFAULT_DIR
+
+
+def _freeze(value: Any) -> Any:
+    """dict / list 转为有序元组，保证录制键与参数顺序无关。"""
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _call_key(name: str, args: tuple, kwargs: dict) -> str:
+    kw = {k: v for k, v in kwargs.items() if k not in _IGNORED_KWARGS}
+    raw = repr((name, _freeze(args), _freeze(kw))).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _path_for(name: str, key: str) -> str:
+    safe = ''.join(ch if ch.isalnum() or ch in '._-' else '_' for ch in name)
+    return os.path.join(_replay_dir(), safe, f'{key}.pkl')
+
+
+def _inject_faults(name: str, key: str):
+    """回放时的延迟与错误注入（按 种子 + 录制键 + 第 N 次调用 确定）。"""
+    latency_ms = float(os.environ.get('DATA_REPLAY_LATENCY_MS', 0) or 0)
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000.0)
+
+    error_rate = float(os.environ.get('DATA_REPLAY_ERROR_RATE', 0) or 0)
+    if error_rate <= 0:
+        return
+    with _counter_lock:
+        n = _call_counter.get(key, 0)
+        _call_counter[key] = n + 1
+    seed = os.environ.get('DATA_REPLAY_SEED', '0')
+    digest = hashlib.sha1(f'{seed}:{key}:{n}'.encode('utf-8')).hexdigest()
+    if int(digest[:8], 16) / 0xFFFFFFFF < error_rate:
+        raise ConnectionError(f'[Replay] 模拟上游失败: {name}')
+
+
+def _load(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save(path: str, value: Any):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def replay_call(name: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    按当前模式执行一次数据源调用。
+
+    Args:
+        name: 调用名（如 'ak.stock_zh_a_daily'），决定录制目录
+        fn: 实际的上游调用
+    """
+    mode = get_mode()
+    if mode == MODE_LIVE:
+        return fn(*args, **kwargs)
+
+    key = _call_key(name, args, kwargs)
+    path = _path_for(name, key)
+    if mode == MODE_REPLAY:
+        _inject_faults(name, key)
+        if not os.path.exists(path):
+            raise ReplayMissError(f'[Replay] 无录制数据: {name} {args} {kwargs}')
+        recorded = _load(path)
+        if isinstance(recorded, BaseException):
+            raise recorded
+        return recorded
+
+    # record：上游异常同样录制，回放时按原样抛出，保证兜底链行为一致
+    try:
+        value = fn(*args, **kwargs)
+    except Exception as e:
+        try:
+            _save(path, e)
+        except Exception:
+            pass   # 部分异常对象不可序列化，此时不录制
+        raise
+    _save(path, value)
+    return value
+
+
+def http_get(url: str, *, getter: Optional[Callable] = None, session=None,
+             encoding: Optional[str] = None, **kwargs):
+    """
+    可录制的 HTTP GET。录制 / 回放时返回 RecordedResponse。
+
+    Args:
+        getter: 自定义 GET 函数（如 curl_cffi.requests.get），默认 requests.get
+        session: requests.Session（优先于 getter）
+        encoding: 响应编码（如同花顺页面 'gbk'），录制前按此解码
+    """
+    def _get():
+        if session is not None:
+            resp = session.get(url, **kwargs)
+        elif getter is not None:
+            resp = getter(url, **kwargs)
+        else:
+            import requests
+            resp = requests.get(url, **kwargs)
+        if encoding:
+            resp.encoding = encoding
+        return resp
+
+    if get_mode() == MODE_LIVE:
+        return _get()
+
+    def _fetch():
+        resp = _get()
+        return RecordedResponse(resp.status_code, resp.text, str(getattr(resp, 'url', url)))
+
+    # url / params 只用于计算录制键，实际请求由闭包完成
+    return replay_call('http.get', lambda *_a, **_kw: _fetch(), url, **kwargs)
+
+
+class _ReplayAk:
+    """akshare 代理：函数调用经 replay_call 录制 / 回放。"""
+
+    def __init__(self, ak_module):
+        self._ak = ak_module
+
+    def __getattr__(self, attr: str):
+        target = getattr(self._ak, attr) if self._ak is not None else None
+        if target is not None and not callable(target):
+            return target
+
+        def _call(*args, **kwargs):
+            if target is None:
+                raise ReplayMissError(f'[Replay] akshare 不可用: {attr}')
+            return target(*args, **kwargs)
+
+        return lambda *args, **kwargs: replay_call(f'ak.{attr}', _call, *args, **kwargs)
+
+
+def wrap_akshare(ak_module):
+    """live 模式原样返回 akshare；录制 / 回放模式返回代理（回放时 akshare 可不可导入均可）。"""
+    if get_mode() == MODE_LIVE:
+        return ak_module
+    return _ReplayAk(ak_module)
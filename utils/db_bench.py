@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量写入基准
+============
+
+对比逐行 INSERT（旧写法）与 database.executemany_chunked 多行写入的吞吐（行/秒）：
+
+- 全市场股票同步：5000 只股票 upsert 到 stocks
+- 新闻批量入库：500 条新闻 INSERT IGNORE 到 news_cache
+
+需要可用的 MySQL；写入独立库 BENCH_MYSQL_DATABASE（默认 stock_scanner_bench，总是覆盖
+MYSQL_DATABASE），与应用库同名时拒绝运行。测试数据使用 BN 前缀代码 / bench 来源，结束后删除。
+
+运行：python -m utils.db_bench
+"""
+
+import os
+import time
+from datetime import date, datetime
+
+APP_DATABASE = os.environ.get('MYSQL_DATABASE', 'stock_scanner')
+BENCH_DATABASE = os.environ.get('BENCH_MYSQL_DATABASE', 'stock_scanner_bench')
+if BENCH_DATABASE == APP_DATABASE:
+    raise RuntimeError(f'BENCH_MYSQL_DATABASE 与应用库同名（{APP_DATABASE}），拒绝在应用库上跑基准')
+# 导入 database 时即按 MYSQL_DATABASE 建连接配置（并执行 init_db），须先切到独立库
+os.environ['MYSQL_DATABASE'] = BENCH_DATABASE
+
+import database as db  # noqa: E402
+
+_STOCK_SQL = '''
+    INSERT INTO stocks (code, name, pinyin, pinyin_abbr, market_type, sector, updatetime)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        name = VALUES(name),
+        pinyin = VALUES(pinyin),
+        pinyin_abbr = VALUES(pinyin_abbr),
+        market_type = COALESCE(VALUES(market_type), market_type),
+        sector = VALUES(sector),
+        updatetime = VALUES(updatetime)
+'''
+
+_NEWS_SQL = '''
+    INSERT IGNORE INTO news_cache
+    (news_date, source, title, content, time_str, url, news_hash)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+def _stock_rows(n: int, tag: str) -> list:
+    now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return [(f'BN{i:06d}', f'基准股{tag}{i}', f'jizhungu{i}', 'jzg', 'sz', '基准板块', now_str)
+            for i in range(n)]
+
+
+def _news_rows(n: int, tag: str) -> list:
+    today = date.today()
+    rows = []
+    for i in range(n):
+        title = f'基准新闻 {tag} {i}'
+        content = '正文' * 200
+        rows.append((today, 'bench', title, content, '09:30', '', db._compute_news_hash(title, content)))
+    return rows
+
+
+def _per_row(sql: str, rows: list) -> None:
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for row in rows:
+            cursor.execute(sql, row)
+        conn.commit()
+
+
+def _cleanup() -> None:
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM stocks WHERE code LIKE 'BN%%'")
+        cursor.execute("DELETE FROM news_cache WHERE source = 'bench'")
+        conn.commit()
+
+
+def _measure(case: str, mode: str, fn, n: int) -> dict:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {'case': case, 'mode': mode, 'rows': n, 'seconds': elapsed,
+            'rows_per_sec': n / elapsed if elapsed else float('inf')}
+
+
+def run_benchmark(stocks: int = 5000, news: int = 500) -> list:
+    """每个场景先逐行写一遍、清理后再批量写一遍，返回各自的耗时与行/秒。"""
+    # database 可能已在本模块之前按应用配置导入，此时连的仍是应用库
+    if db.DB_BACKEND != 'mysql' or db.DB_CONFIG['database'] != BENCH_DATABASE:
+        raise RuntimeError(f"基准只写 MySQL 独立库 {BENCH_DATABASE}，当前连接 "
+                           f"{db.DB_BACKEND}:{db.DB_CONFIG['database']}，拒绝运行")
+    # 独立库可能尚不存在：建库并建齐表（stocks / news_cache 等）
+    db.init_db()
+    results = []
+    try:
+        for case, sql, make, n in (('stocks_upsert', _STOCK_SQL, _stock_rows, stocks),
+                                   ('news_insert_ignore', _NEWS_SQL, _news_rows, news)):
+            _cleanup()
+            rows = make(n, 'a')
+            results.append(_measure(case, 'per-row', lambda: _per_row(sql, rows), n))
+            _cleanup()
+            rows = make(n, 'b')
+            results.append(_measure(case, f'bulk({db.BULK_CHUNK_SIZE})',
+                                    lambda: db.executemany_chunked(sql, rows), n))
+    finally:
+        _cleanup()
+    return results
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+    print(tabulate(run_benchmark(), headers='keys', floatfmt='.3f'))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接池
+============
+
+database.get_connection() 的底层：复用已建立的连接，省去每次调用的 TCP + 认证握手。
+
+- 线程安全、有上限：连接数达到 max_size 时借出方等待归还，超过 timeout 抛 PoolTimeout
+- 健康检查：空闲超过 ping_interval 秒的连接借出前先 ping，失败即丢弃重建
+- 最长寿命：创建超过 max_lifetime 秒的连接归还 / 借出时关闭（避开服务端 wait_timeout）
+- 按 worker 独立：fork 后（pid 变化）丢弃继承来的连接，不与父进程共用 socket
+- 指标：借出次数、等待耗时、使用率峰值、健康检查失败、超时次数（见 stats()）
+
+与具体驱动无关，connect 为返回新连接的无参函数；连接需支持 ping / close。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class ConnectionPool:
+    """有界连接池；空闲连接后进先出，尽量复用热连接，让冷连接自然老化。"""
+
+    def __init__(self, connect: Callable[[], Any], max_size: int = 8, timeout: float = 10,
+                 max_lifetime: float = 1800, ping_interval: float = 30):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self._cond = threading.Condition()
+        self._idle: deque = deque()          # (conn, 创建时间, 最近归还时间)
+        self._born: dict[int, float] = {}     # id(借出中的连接) → 创建时间
+        self._size = 0                        # 已打开的连接数（空闲 + 借出）
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0, 'created': 0, 'closed': 0, 'waits': 0, 'timeouts': 0,
+            'ping_failures': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'peak_in_use': 0,
+        }
+
+    # ── 内部 ────────────────────────────────────────────────────────────────
+
+    def _check_fork(self):
+        """fork 后继承来的连接与父进程共用 socket：只丢引用、不 close（close 会向服务端发 QUIT）。"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._born.clear()
+            self._size = 0
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+
+    def _healthy(self, conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.info('[DBPool] 连接健康检查失败，重建: %s', e)
+            with self._cond:
+                self._stats['ping_failures'] += 1
+            return False
+
+    # ── 借出 / 归还 ─────────────────────────────────────────────────────────
+
+    def acquire(self):
+        """借出一个可用连接；池满时最多等待 timeout 秒。"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                self._check_fork()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f'等待数据库连接超时（{self.timeout}s，池大小 {self.max_size}）')
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, born, last_used = self._idle.pop()
+                else:
+                    conn, born, last_used = None, 0.0, 0.0
+                    self._size += 1
+
+            now = time.monotonic()
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                born = now
+                with self._cond:
+                    self._stats['created'] += 1
+            elif now - born > self.max_lifetime:
+                self._close(conn)
+                continue
+            elif now - last_used > self.ping_interval and not self._healthy(conn):
+                self._close(conn)
+                continue
+            break
+
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._cond:
+            self._born[id(conn)] = born
+            st = self._stats
+            st['checkouts'] += 1
+            st['waits'] += int(waited)
+            st['wait_ms_total'] += wait_ms
+            st['wait_ms_max'] = max(st['wait_ms_max'], wait_ms)
+            st['peak_in_use'] = max(st['peak_in_use'], len(self._born))
+        return conn
+
+    def release(self, conn, broken: bool = False):
+        """归还连接；broken=True（如 rollback 失败）或超过最长寿命时直接关闭。"""
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            born = self._born.pop(id(conn), None)
+        if born is None:
+            # 池重置前借出的连接，不再计入
+            return
+        now = time.monotonic()
+        if broken or now - born > self.max_lifetime or not getattr(conn, 'open', True):
+            self._close(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, born, now))
+            self._cond.notify()
+
+    def close_all(self):
+        """关闭全部空闲连接（借出中的归还时照常处理）。"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            st = dict(self._stats)
+            in_use = len(self._born)
+            st.update({
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'utilization': round(in_use / self.max_size, 3) if self.max_size else 0.0,
+                'wait_ms_avg': round(st['wait_ms_total'] / st['checkouts'], 3) if st['checkouts'] else 0.0,
+                'wait_ms_total': round(st['wait_ms_total'], 3),
+                'wait_ms_max': round(st['wait_ms_max'], 3),
+            })
+        return st
+
+
+def pool_size_from_env(default: int = 8) -> int:
+    """MYSQL_POOL_SIZE：每个 worker 的连接上限；0 表示不使用连接池（每次新建连接）。"""
+    try:
+        return max(0, int(os.environ.get('MYSQL_POOL_SIZE', default)))
+    except ValueError:
+        return default
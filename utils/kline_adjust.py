@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线复权
+========
+
+本地只保存不复权日线（kline_raw_cache, adjust='none'）+ 每只股票的后复权因子序列
+（kline_adj_factor），前/后复权在读取时向量化计算。分红送转只会让因子表多一行，
+无需重新下载整段前复权历史。
+
+复权口径（与新浪 hfq-factor 一致）：
+- 后复权 hfq = 不复权价 × hfq_factor(当日)
+- 前复权 qfq = 不复权价 × hfq_factor(当日) / hfq_factor(最新)
+- 成交量 / 成交额 / 换手率不复权
+- 因子序列为 [{date, factor}]，每个因子自其 date 起生效，直到下一行
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ADJUST_NONE = 'none'
+ADJUST_QFQ = 'qfq'
+ADJUST_HFQ = 'hfq'
+
+_PRICE_COLS = ('open', 'high', 'low', 'close')
+
+
+def normalize_adjust(adjust: Optional[str]) -> str:
+    """规范化复权参数：'qfq' | 'hfq' | 'none'（'' / None 视为 'none'）。"""
+    s = str(adjust or '').strip().lower()
+    if s in (ADJUST_QFQ, ADJUST_HFQ):
+        return s
+    return ADJUST_NONE
+
+
+def _factor_per_bar(dates: pd.Series, factors: List[Dict]) -> np.ndarray:
+    """按日期为每根 K 线匹配生效中的后复权因子（早于首个因子日期的取首个因子）。"""
+    f_df = pd.DataFrame(factors)
+    f_df['date'] = f_df['date'].astype(str).str[:10]
+    f_df['factor'] = pd.to_numeric(f_df['factor'], errors='coerce')
+    f_df = f_df.dropna().sort_values('date')
+    if f_df.empty:
+        return np.ones(len(dates))
+
+    f_dates = f_df['date'].to_numpy()
+    f_vals = f_df['factor'].to_numpy(dtype=float)
+    idx = np.searchsorted(f_dates, dates.astype(str).str[:10].to_numpy(), side='right') - 1
+    return f_vals[np.clip(idx, 0, len(f_vals) - 1)]
+
+
+def apply_adjustment(df: pd.DataFrame, factors: Optional[List[Dict]], adjust: str = ADJUST_QFQ) -> pd.DataFrame:
+    """
+    对不复权日线施加复权。
+
+    Args:
+        df: 不复权日线（含 date/open/high/low/close，其余列原样保留）
+        factors: 后复权因子序列 [{date, factor}]；为空表示从未除权
+        adjust: 'qfq' | 'hfq' | 'none'
+
+    Returns:
+        复权后的新 DataFrame（按日期升序，pct_change 按复权收盘价重算）
+    """
+    adjust = normalize_adjust(adjust)
+    out = df.copy()
+    out['date'] = out['date'].astype(str).str[:10]
+    out = out.sort_values('date').reset_index(drop=True)
+    if adjust == ADJUST_NONE or not factors or out.empty:
+        return out
+
+    mult = _factor_per_bar(out['date'], factors)
+    if adjust == ADJUST_QFQ:
+        mult = mult / mult[-1]
+    for col in _PRICE_COLS:
+        if col in out.columns:
+            out[col] = (pd.to_numeric(out[col], errors='coerce') * mult).round(3)
+    if 'pct_change' in out.columns:
+        out['pct_change'] = out['close'].pct_change().fillna(0.0).round(4)
+    return out
+
+
+def merge_bars(old: Optional[pd.DataFrame], new: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """合并本地历史与增量日线，同一交易日以新数据为准。"""
+    frames = [f for f in (old, new) if f is not None and not f.empty]
+    if not frames:
+        return None
+    merged = pd.concat(frames, ignore_index=True)
+    merged['date'] = merged['date'].astype(str).str[:10]
+    merged = merged.drop_duplicates('date', keep='last').sort_values('date')
+    return merged.reset_index(drop=True)
+
+
+# ──────────────────────────── 数据源 ────────────────────────────
+
+def fetch_unadjusted_daily(stock_code: str, days: int = 120,
+                           start_date: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    抓取不复权日线：东方财富（支持起始日期增量）→ 新浪。
+
+    Args:
+        stock_code: 6 位股票代码
+        days: 返回最近天数
+        start_date: 'YYYY-MM-DD'，仅抓取该日及以后的数据（增量更新）
+    """
+    from utils.ths_crawler import (
+        _get_ak, _no_http_proxy_env, _requests_no_proxy, _normalize_kline_df,
+    )
+
+    start = (start_date or '2010-01-01').replace('-', '')
+    try:
+        with _no_http_proxy_env(), _requests_no_proxy():
+            df = _get_ak().stock_zh_a_hist(
+                symbol=stock_code, period='daily', adjust='',
+                start_date=start, end_date='20500101',
+            )
+        df = df.rename(columns={
+            '日期': 'date', '开盘': 'open', '收盘': 'close',
+            '最高': 'high', '最低': 'low', '成交量': 'volume',
+            '成交额': 'amount', '换手率': 'turnover',
+        })
+        df = _normalize_kline_df(df, days)
+        if df is not None and not df.empty:
+            return df
+    except Exception as e:
+        print(f"[ADJ] {stock_code} 东财不复权日线失败: {e}")
+
+    try:
+        symbol = f'sh{stock_code}' if stock_code.startswith('6') else f'sz{stock_code}'
+        with _no_http_proxy_env(), _requests_no_proxy():
+            df = _get_ak().stock_zh_a_daily(symbol=symbol, adjust='')
+        df = _normalize_kline_df(df, days)
+        if df is not None and start_date:
+            df = df[df['date'] >= start_date[:10]].reset_index(drop=True)
+        return df if df is not None and not df.empty else None
+    except Exception as e:
+        print(f"[ADJ] {stock_code} 新浪不复权日线失败: {e}")
+        return None
+
+
+def fetch_hfq_factors(stock_code: str) -> Optional[List[Dict]]:
+    """
+    抓取后复权因子序列（新浪，每次除权一行，数据量很小）。
+
+    Returns:
+        [{date, factor}]；抓取失败返回 None，从未除权返回 []
+    """
+    from utils.ths_crawler import _get_ak, _no_http_proxy_env, _requests_no_proxy
+
+    symbol = f'sh{stock_code}' if stock_code.startswith('6') else f'sz{stock_code}'
+    try:
+        with _no_http_proxy_env(), _requests_no_proxy():
+            df = _get_ak().stock_zh_a_daily(symbol=symbol, adjust='hfq-factor')
+    except Exception as e:
+        print(f"[ADJ] {stock_code} 复权因子获取失败: {e}")
+        return None
+    if df is None or df.empty:
+        return []
+    df = df.reset_index() if 'date' not in df.columns else df
+    return [
+        {'date': str(d)[:10], 'factor': float(f)}
+        for d, f in zip(df['date'], pd.to_numeric(df['hfq_factor'], errors='coerce'))
+        if pd.notna(f)
+    ]
+
+
+def load_daily_history(stock_code: str, min_bars: int, adjust: str = ADJUST_QFQ,
+                       max_bars: int = 1500) -> Optional[pd.DataFrame]:
+    """
+    读取复权日线，至少 min_bars 根。
+
+    1. 当日不复权缓存 + 因子 → 直接复权返回
+    2. 有历史不复权缓存 → 只抓最后一个交易日之后的增量 + 最新因子
+    3. 否则抓取整段不复权日线 + 因子
+
+    Returns:
+        复权后的日线 DataFrame；不复权数据或因子均不可得时返回 None
+    """
+    import database as db
+
+    raw = db.get_kline_raw_cache(stock_code, adjust=adjust)
+    bars = (raw or {}).get('bars') or []
+    if len(bars) >= min_bars:
+        return pd.DataFrame(bars)
+
+    stale = db.get_kline_raw_cache(stock_code, adjust=ADJUST_NONE, any_date=True)
+    old = pd.DataFrame(stale['bars']) if stale and stale.get('bars') else None
+    if old is not None and len(old) >= min_bars:
+        last_date = str(old['date'].astype(str).str[:10].max())
+        new = fetch_unadjusted_daily(stock_code, days=max_bars, start_date=last_date)
+        if new is None or new.empty:
+            # 增量抓取失败：旧历史照常复权返回，但不回写（回写会带上今天的 cache_date，当天都被当作新鲜数据）
+            factors = db.get_adj_factors(stock_code)
+            if factors is None:
+                return None
+            return apply_adjustment(old.tail(max_bars).reset_index(drop=True), factors, adjust)
+        fresh = merge_bars(old, new)
+    else:
+        fresh = fetch_unadjusted_daily(stock_code, days=max(min_bars, 1))
+    if fresh is None or fresh.empty:
+        return None
+
+    factors = fetch_hfq_factors(stock_code)
+    if factors is None:
+        factors = db.get_adj_factors(stock_code)
+        if factors is None:
+            return None
+    else:
+        db.save_adj_factors(stock_code, factors)
+
+    fresh = fresh.tail(max_bars).reset_index(drop=True)
+    db.save_kline_raw_cache(stock_code, fresh, adjust=ADJUST_NONE)
+    return apply_adjustment(fresh, factors, adjust)
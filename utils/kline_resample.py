@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线周期重采样
+==============
+
+由本地日线历史派生周线 / 月线 / N 日线，切换图表周期时无需再请求上游。
+
+聚合规则（与东财/新浪周线、月线口径一致）：
+- open   → 周期内第一根日线开盘价
+- high   → 周期内最高价
+- low    → 周期内最低价
+- close  → 周期内最后一根日线收盘价
+- volume / amount / turnover → 周期内求和
+- date   → 周期内最后一个交易日（'YYYY-MM-DD'）
+- pct_change → 按相邻周期收盘价重新计算（与 ths_crawler._normalize_kline_df 一致）
+"""
+
+import re
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# 周期 → 每根 K 线约含的交易日数（用于估算需要多少日线历史）
+_TRADING_DAYS_PER_BAR = {'daily': 1, 'weekly': 5, 'monthly': 22}
+
+_N_DAY_RE = re.compile(r'^(\d{1,2})d$')
+_N_DAY_MIN, _N_DAY_MAX = 2, 60
+
+_SUM_COLS = ('volume', 'amount', 'turnover')
+
+
+def normalize_interval(interval: Optional[str]) -> Optional[str]:
+    """
+    规范化周期参数，无效时返回 None。
+
+    支持：'daily' | 'weekly' | 'monthly' | 'Nd'（N 日线，2 ≤ N ≤ 60，如 '3d'）
+    """
+    s = str(interval or '').strip().lower()
+    if s in _TRADING_DAYS_PER_BAR:
+        return s
+    m = _N_DAY_RE.match(s)
+    if m and _N_DAY_MIN <= int(m.group(1)) <= _N_DAY_MAX:
+        return f'{int(m.group(1))}d'
+    return None
+
+
+def trading_days_per_bar(interval: str) -> int:
+    """每根 K 线对应的交易日数（N 日线即 N）。"""
+    if interval in _TRADING_DAYS_PER_BAR:
+        return _TRADING_DAYS_PER_BAR[interval]
+    m = _N_DAY_RE.match(interval or '')
+    return int(m.group(1)) if m else 1
+
+
+def _group_keys(dates: pd.Series, interval: str) -> pd.Series:
+    """计算每根日线所属的周期分组键。"""
+    if interval == 'weekly':
+        return dates.dt.to_period('W-SUN')
+    if interval == 'monthly':
+        return dates.dt.to_period('M')
+    n = trading_days_per_bar(interval)
+    # N 日线从最新一根向前对齐，保证最后一根始终由最近 N 个交易日组成
+    back = np.arange(len(dates))[::-1] // n
+    return pd.Series(-back, index=dates.index)
+
+
+def resample_daily_bars(df: pd.DataFrame, interval: str) -> Optional[pd.DataFrame]:
+    """
+    将日线 DataFrame 聚合为指定周期。
+
+    Args:
+        df: 日线数据（至少含 date/open/high/low/close/volume，可选 amount/turnover）
+        interval: 'daily' | 'weekly' | 'monthly' | 'Nd'
+
+    Returns:
+        聚合后的 DataFrame（列与输入一致，按日期升序）；输入为空时返回 None
+    """
+    if df is None or df.empty:
+        return None
+    interval = normalize_interval(interval)
+    if interval is None:
+        raise ValueError('无效的 K 线周期')
+
+    df = df.copy()
+    df['date'] = df['date'].astype(str).str[:10]
+    df = df.sort_values('date').reset_index(drop=True)
+    if interval == 'daily':
+        return df
+
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    valid = dates.notna()
+    df, dates = df[valid].reset_index(drop=True), dates[valid].reset_index(drop=True)
+    if df.empty:
+        return None
+
+    agg = {'date': 'last', 'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}
+    for col in _SUM_COLS:
+        if col in df.columns:
+            agg[col] = 'sum'
+
+    out = df.groupby(_group_keys(dates, interval), sort=True).agg(agg).reset_index(drop=True)
+    out['pct_change'] = out['close'].pct_change().fillna(0.0).round(4)
+
+    cols = [c for c in df.columns if c in out.columns]
+    return out[cols]
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K 线缓存的紧凑二进制格式
+========================
+
+kline_cache / kline_raw_cache 原先存冗长 JSON（每根 K 线、每个指标点都重复 time / open / ... 键名）。
+本模块把同样的数据结构按列存储并压缩，读回结构与原 JSON 完全一致：
+
+- 键集合相同的 dict 列表（bars、candles、volumes、bb_upper ...）→ 按列转置，键名只存一次
+- 数值 / 布尔列表 → 原始 little-endian 缓冲区（int64 / float64 / bool），None 以 NaN 表示
+- 其余结构（字符串列、标量、短列表）留在 JSON 元数据里
+- 整体 zlib 压缩；格式：MAGIC(3) + 版本(1) + zlib(元数据长度 uint32 + 元数据 JSON + 各缓冲区)
+
+编码 / 解码对数值列都是向量化的（numpy 整列转换），不逐行构造。
+table() 可直接传入列数组（如 DataFrame 各列），省去先拼 dict 列表再编码。
+
+只依赖标准库 + numpy，不随部署环境的可选依赖变化，适合落库长期保存。
+"""
+
+import json
+import math
+import struct
+import zlib
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+MAGIC = b'KLN'
+FORMAT_VERSION = 1
+
+_ZLIB_LEVEL = 6
+_MIN_ARRAY_LEN = 4          # 更短的数值列表直接留在 JSON 里
+_TABLE = '__t__'            # {'__t__': [键...], 'c': [列...]}：dict 列表按列转置
+_ARRAY = '__a__'            # {'__a__': [缓冲区序号, dtype, 长度, 是否含 None]}
+_ESCAPE = '__d__'           # 原数据里恰好含上述标记键的 dict
+
+
+class _Table:
+    """列式表：编码结果与等长 dict 列表相同，读回为 [{col: value}, ...]"""
+
+    def __init__(self, columns: Dict[str, Sequence]):
+        lengths = {len(v) for v in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f'table columns have different lengths: {sorted(lengths)}')
+        self.columns = columns
+
+
+def table(columns: Dict[str, Sequence]) -> _Table:
+    """以列数组（list / ndarray / Series）构造表，编码时数值列直接取缓冲区。"""
+    return _Table(columns)
+
+
+def is_encoded(raw: Any) -> bool:
+    return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:3]) == MAGIC
+
+
+# ─── 编码 ─────────────────────────────────────────────────────────────────────
+
+def _numeric_array(values) -> tuple:
+    """尝试把列转成数值数组，返回 (ndarray, 是否含 None)；非数值列返回 (None, False)。"""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        arr = values
+        if arr.dtype.kind in 'iu':
+            return arr.astype('<i8', copy=False), False
+        if arr.dtype.kind == 'b':
+            return arr, False
+        arr = arr.astype('<f8', copy=False)
+        return arr, bool(np.isnan(arr).any())
+
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    elif not isinstance(values, list):
+        values = list(values)
+    if not values:
+        return None, False
+
+    kinds = set()
+    for v in values:
+        if v is None:
+            kinds.add('none')
+        elif isinstance(v, bool):
+            kinds.add('bool')
+        elif isinstance(v, int):
+            kinds.add('int')
+        elif isinstance(v, float):
+            kinds.add('float')
+        else:
+            return None, False
+    if kinds == {'bool'}:
+        return np.array(values, dtype='?'), False
+    if 'bool' in kinds or kinds == {'none'}:
+        return None, False
+    if kinds == {'int'}:
+        try:
+            return np.array(values, dtype='<i8'), False
+        except OverflowError:
+            return None, False
+    arr = np.array([np.nan if v is None else v for v in values] if 'none' in kinds else values, dtype='<f8')
+    return arr, bool(np.isnan(arr).any())
+
+
+class _Encoder:
+    def __init__(self):
+        self.buffers: list = []
+
+    def _array(self, arr: np.ndarray, has_none: bool) -> dict:
+        self.buffers.append(np.ascontiguousarray(arr).tobytes())
+        return {_ARRAY: [len(self.buffers) - 1, arr.dtype.str, int(arr.shape[0]), has_none]}
+
+    def _column(self, values) -> Any:
+        arr, has_none = _numeric_array(values)
+        if arr is not None and (len(arr) >= _MIN_ARRAY_LEN or isinstance(values, np.ndarray)):
+            return self._array(arr, has_none)
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        return self.walk(list(values))
+
+    def _table(self, keys: list, columns: list) -> dict:
+        return {_TABLE: keys, 'c': [self._column(col) for col in columns]}
+
+    def walk(self, value: Any) -> Any:
+        if isinstance(value, _Table):
+            return self._table(list(value.columns), list(value.columns.values()))
+        if isinstance(value, dict):
+            out = {k: self.walk(v) for k, v in value.items()}
+            return {_ESCAPE: out} if (_TABLE in value or _ARRAY in value or _ESCAPE in value) else out
+        if isinstance(value, (list, tuple)):
+            if len(value) >= 2 and all(isinstance(v, dict) for v in value):
+                keys = list(value[0])
+                key_set = set(keys)
+                if all(len(v) == len(keys) and v.keys() == key_set for v in value):
+                    return self._table(keys, [[v[k] for v in value] for k in keys])
+            if len(value) >= _MIN_ARRAY_LEN:
+                arr, has_none = _numeric_array(value)
+                if arr is not None:
+                    return self._array(arr, has_none)
+            return [self.walk(v) for v in value]
+        if isinstance(value, np.ndarray):
+            return self._column(value)
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return value
+
+
+def encode(value: Any) -> bytes:
+    """编码任意 JSON 兼容结构（可含 table() / ndarray），返回带格式头的压缩字节串。"""
+    enc = _Encoder()
+    meta = json.dumps(enc.walk(value), ensure_ascii=False, separators=(',', ':'),
+                      allow_nan=False, default=_json_default).encode('utf-8')
+    body = b''.join([struct.pack('<I', len(meta)), meta, *enc.buffers])
+    return MAGIC + bytes((FORMAT_VERSION,)) + zlib.compress(body, _ZLIB_LEVEL)
+
+
+def _json_default(v):
+    if hasattr(v, 'isoformat'):
+        return v.isoformat()
+    if hasattr(v, 'item'):
+        return v.item()
+    raise TypeError(f'Object of type {type(v).__name__} is not serializable')
+
+
+# ─── 解码 ─────────────────────────────────────────────────────────────────────
+
+class _Decoder:
+    def __init__(self, body: bytes, offset: int, meta: Any):
+        self.body = body
+        self.meta = meta
+        self.buffers = []
+        self._offset = offset
+
+    def _arrays(self, node: Any, out: list):
+        """按出现顺序收集数组描述，以计算各缓冲区偏移（编码时按同一顺序追加）。"""
+        if isinstance(node, dict):
+            if _ARRAY in node:
+                out.append(node[_ARRAY])
+                return
+            if _ESCAPE in node and len(node) == 1:
+                node = node[_ESCAPE]
+            for v in node.values():
+                self._arrays(v, out)
+        elif isinstance(node, list):
+            for v in node:
+                self._arrays(v, out)
+
+    def _prepare(self):
+        specs: list = []
+        self._arrays(self.meta, specs)
+        specs.sort(key=lambda s: s[0])
+        offset = self._offset
+        for _, dtype, n, _ in specs:
+            size = np.dtype(dtype).itemsize * n
+            self.buffers.append((offset, size))
+            offset += size
+
+    def _array(self, spec: list) -> list:
+        idx, dtype, n, has_none = spec
+        offset, size = self.buffers[idx]
+        arr = np.frombuffer(self.body, dtype=np.dtype(dtype), count=n, offset=offset)
+        if has_none:
+            obj = arr.astype(object)
+            obj[np.isnan(arr)] = None
+            return obj.tolist()
+        return arr.tolist()
+
+    def walk(self, node: Any) -> Any:
+        if isinstance(node, dict):
+            if _ARRAY in node:
+                return self._array(node[_ARRAY])
+            if _TABLE in node:
+                keys = node[_TABLE]
+                columns = [self.walk(c) for c in node['c']]
+                return [dict(zip(keys, row)) for row in zip(*columns)]
+            if _ESCAPE in node and len(node) == 1:
+                return {k: self.walk(v) for k, v in node[_ESCAPE].items()}
+            return {k: self.walk(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [self.walk(v) for v in node]
+        return node
+
+    def run(self) -> Any:
+        self._prepare()
+        return self.walk(self.meta)
+
+
+def decode(raw: Any) -> Any:
+    """解码 encode() 的结果；版本不支持时抛 ValueError。"""
+    raw = bytes(raw)
+    if raw[:3] != MAGIC:
+        raise ValueError('not a kline_store blob')
+    version = raw[3]
+    if version != FORMAT_VERSION:
+        raise ValueError(f'unsupported kline_store format version: {version}')
+    body = zlib.decompress(raw[4:])
+    (meta_len,) = struct.unpack_from('<I', body, 0)
+    meta = json.loads(body[4:4 + meta_len].decode('utf-8'))
+    return _Decoder(body, 4 + meta_len, meta).run()
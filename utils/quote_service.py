@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一实时行情服务
+================
+
+扫描收尾、自选股、题材收益跟踪、AI 推荐回填、/api/stocks/quotes 等所有实时报价统一走这里：
+- 任意代码集合按批合并为东财 push2 ulist 请求（每批 QUOTE_BATCH_SIZE 只）
+- 东财未返回的代码再按批走新浪 hq.sinajs.cn 兜底
+- 按代码缓存 QUOTE_TTL 秒（cache.py，跨 worker 共享），短时间内重复查询不再请求上游
+
+100 只股票通常只需 1 次请求（东财全部命中），最多 2~3 次。
+
+返回字段统一为：
+    {code, name, close, pct_change, change, volume, amount, turnover,
+     qty_ratio, high, low, open, prev_close, mkt_cap}
+成交量单位统一为「手」，成交额为「元」，缺失值为 None。
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from cache import get_many as _cache_get_many, set_many as _cache_set_many
+from utils.data_replay import http_get
+
+logger = logging.getLogger(__name__)
+
+QUOTE_TTL = 5               # 单只股票行情缓存秒数
+QUOTE_BATCH_SIZE = 100      # 单次上游请求最多包含的代码数
+REQUEST_TIMEOUT = 8
+
+_EM_ULIST_URL = 'http://push2.eastmoney.com/api/qt/ulist/get'
+_EM_FIELDS = 'f2,f3,f4,f5,f6,f8,f10,f12,f14,f15,f16,f17,f18,f20,f62'
+_SINA_URL = 'http://hq.sinajs.cn/list='
+_SINA_HEADERS = {'Referer': 'http://finance.sina.com.cn', 'User-Agent': 'Mozilla/5.0'}
+
+
+def _quote_key(code: str) -> str:
+    return f'quote/{code}'
+
+
+def _em_secid(code: str) -> str:
+    return f"{'1' if code.startswith(('6', '9')) else '0'}.{code}"
+
+
+def _sina_symbol(code: str) -> str:
+    return f"{'sh' if code.startswith(('6', '9')) else 'sz'}{code}"
+
+
+def _num(v) -> Optional[float]:
+    """东财 '-' / 空串 / 非数字 → None"""
+    if v is None or v == '' or v == '-':
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _eastmoney_mkt_cap_yuan(item: dict) -> Optional[float]:
+    """东财 ulist 条目：总市值优先 f20，其次 f62（单位：元）。"""
+    if not item:
+        return None
+    for k in ('f20', 'f62'):
+        x = _num(item.get(k))
+        if x is not None and x > 0:
+            return x
+    return None
+
+
+def _parse_em_item(item: dict) -> Optional[Dict]:
+    code = str(item.get('f12', '') or '')
+    if not code:
+        return None
+    return {
+        'code': code,
+        'name': item.get('f14', '') or '',
+        'close': _num(item.get('f2')),
+        'pct_change': _num(item.get('f3')),
+        'change': _num(item.get('f4')),
+        'volume': _num(item.get('f5')),
+        'amount': _num(item.get('f6')),
+        'turnover': _num(item.get('f8')),
+        'qty_ratio': _num(item.get('f10')),
+        'high': _num(item.get('f15')),
+        'low': _num(item.get('f16')),
+        'open': _num(item.get('f17')),
+        'prev_close': _num(item.get('f18')),
+        'mkt_cap': _eastmoney_mkt_cap_yuan(item),
+    }
+
+
+def _parse_sina_line(line: str) -> Optional[Dict]:
+    """解析一行 var hq_str_sh600000="名称,今开,昨收,现价,最高,最低,...";"""
+    if '="' not in line:
+        return None
+    sym = line.split('="')[0].split('_')[-1]
+    parts = line.split('="')[1].rstrip('";\r\n').split(',')
+    if len(parts) < 32:
+        return None
+
+    def _price(val: str) -> Optional[float]:
+        v = _num(val)
+        return None if not v else v
+
+    prev_close = _price(parts[2])
+    close = _price(parts[3])
+    change = pct_change = 0.0
+    if prev_close and close:
+        change = round(close - prev_close, 3)
+        pct_change = round(change / prev_close * 100, 2)
+    volume = _num(parts[8])
+    return {
+        'code': sym[2:] if sym.startswith(('sh', 'sz')) else sym,
+        'name': parts[0],
+        'close': close,
+        'pct_change': pct_change,
+        'change': change,
+        'volume': volume / 100 if volume is not None else None,   # 新浪为「股」，统一成「手」
+        'amount': _num(parts[9]),
+        'turnover': None,
+        'qty_ratio': None,
+        'high': _price(parts[4]),
+        'low': _price(parts[5]),
+        'open': _price(parts[1]),
+        'prev_close': prev_close,
+        'mkt_cap': None,
+    }
+
+
+def _fetch_em_batch(codes: List[str]) -> Dict[str, Dict]:
+    resp = http_get(
+        _EM_ULIST_URL,
+        params={'fltt': '2', 'secids': ','.join(_em_secid(c) for c in codes), 'fields': _EM_FIELDS},
+        timeout=REQUEST_TIMEOUT,
+    )
+    items = (json.loads(resp.text).get('data') or {}).get('diff') or []
+    out = {}
+    for item in items:
+        q = _parse_em_item(item)
+        if q:
+            out[q['code']] = q
+    return out
+
+
+def _fetch_sina_batch(codes: List[str]) -> Dict[str, Dict]:
+    resp = http_get(
+        _SINA_URL + ','.join(_sina_symbol(c) for c in codes),
+        headers=_SINA_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+    )
+    if resp.status_code != 200:
+        return {}
+    out = {}
+    for line in resp.text.strip().split('\n'):
+        q = _parse_sina_line(line)
+        if q:
+            out[q['code']] = q
+    return out
+
+
+def _fetch_upstream(codes: List[str]) -> Dict[str, Dict]:
+    """东财批量优先，未返回的代码走新浪批量兜底。"""
+    result: Dict[str, Dict] = {}
+    for batch in _chunks(codes, QUOTE_BATCH_SIZE):
+        try:
+            result.update(_fetch_em_batch(batch))
+        except Exception as e:
+            logger.warning('[Quote] 东财批量行情失败 (%d 只): %s', len(batch), e)
+
+    missing = [c for c in codes if c not in result]
+    for batch in _chunks(missing, QUOTE_BATCH_SIZE):
+        try:
+            result.update(_fetch_sina_batch(batch))
+        except Exception as e:
+            logger.warning('[Quote] 新浪批量行情失败 (%d 只): %s', len(batch), e)
+    return result
+
+
+def get_quotes(codes: Iterable[str], ttl: int = QUOTE_TTL) -> Dict[str, Dict]:
+    """
+    批量获取实时行情。
+
+    Args:
+        codes: 6 位股票代码（可重复、可含空白，自动去重）
+        ttl: 单只行情缓存秒数
+
+    Returns:
+        {code: quote}；上游未返回的代码不在结果中
+    """
+    wanted: List[str] = []
+    seen = set()
+    for c in codes or []:
+        c = str(c or '').strip()
+        if len(c) == 6 and c.isdigit() and c not in seen:
+            seen.add(c)
+            wanted.append(c)
+    if not wanted:
+        return {}
+
+    # 整批一次 Redis 往返读取 / 写回
+    hits = _cache_get_many([_quote_key(c) for c in wanted])
+    result: Dict[str, Dict] = {c: hits[_quote_key(c)] for c in wanted if _quote_key(c) in hits}
+
+    to_fetch = [c for c in wanted if c not in result]
+    if to_fetch:
+        fetched = _fetch_upstream(to_fetch)
+        _cache_set_many({_quote_key(c): q for c, q in fetched.items()}, ttl=ttl)
+        result.update(fetched)
+    return result
+
+
+def get_quote(code: str, ttl: int = QUOTE_TTL) -> Optional[Dict]:
+    """获取单只股票实时行情，失败返回 None。"""
+    return get_quotes([code], ttl=ttl).get(str(code or '').strip())
+
+
+def get_prices(codes: Iterable[str]) -> Dict[str, float]:
+    """批量获取最新价 {code: close}，仅包含有效价格（> 0）。"""
+    return {
+        c: q['close']
+        for c, q in get_quotes(codes).items()
+        if q.get('close') and q['close'] > 0
+    }
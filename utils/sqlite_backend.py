@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 后端
+===========
+
+database.py 默认连 MySQL（pymysql + DictCursor）。DB_BACKEND=sqlite 时改用本模块的连接，
+单机零依赖即可跑通扫描流程、API 与 tests/ 下的数据库测试，便于本地基准与 CI。
+
+接口与 pymysql 连接保持一致（cursor / commit / rollback / close / ping），业务 SQL 不用改：
+
+- 占位符：%s → ?，%% → %（与 pymysql 一样只在带参数时转换）
+- 建表：去掉 ENGINE / CHARSET / COMMENT / ON UPDATE，ENUM → TEXT，
+  INT AUTO_INCREMENT PRIMARY KEY → INTEGER PRIMARY KEY AUTOINCREMENT，
+  行内 INDEX / KEY → 单独 CREATE INDEX（索引名加表名前缀，SQLite 索引名全库唯一；去掉前缀长度），
+  UNIQUE KEY → UNIQUE 约束，DEFAULT CURRENT_TIMESTAMP → 本地时间
+- DML：INSERT IGNORE → INSERT OR IGNORE，ON DUPLICATE KEY UPDATE / VALUES(col)
+  → ON CONFLICT DO UPDATE / excluded.col，IF() → IIF()，NOW() / CURDATE() / DATE_SUB(..., INTERVAL n DAY)
+  → SQLite 日期函数，DELETE ... LIMIT n → rowid 子查询，OPTIMIZE TABLE → VACUUM，
+  一条 ALTER TABLE 多个 ADD COLUMN → 逐条执行（MODIFY COLUMN 忽略，SQLite 列类型不强制）
+- 取值：行以 dict 返回；DATE / DATETIME / TIMESTAMP 列读回 date / datetime（与 pymysql 相同），
+  JSON 列仍是文本，由调用方在 Python 中解析；REGEXP 由 Python re 实现
+
+连接开启 WAL（读写并发）、synchronous=NORMAL、外键约束与 busy_timeout。
+"""
+
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+BUSY_TIMEOUT_MS = 10000
+
+
+# ─── 类型适配 ─────────────────────────────────────────────────────────────────
+
+def _to_date(raw: bytes):
+    s = raw.decode()
+    try:
+        return date.fromisoformat(s[:10])
+    except ValueError:
+        return s
+
+
+def _to_datetime(raw: bytes):
+    s = raw.decode()
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        return s
+
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_adapter(Decimal, float)
+for _np_type in (np.int64, np.int32, np.int16, np.int8, np.uint32, np.uint16, np.uint8):
+    sqlite3.register_adapter(_np_type, int)
+sqlite3.register_adapter(np.bool_, bool)
+sqlite3.register_converter('DATE', _to_date)
+sqlite3.register_converter('DATETIME', _to_datetime)
+sqlite3.register_converter('TIMESTAMP', _to_datetime)
+
+
+def _regexp(pattern, value) -> bool:
+    return value is not None and re.search(pattern, str(value)) is not None
+
+
+# ─── SQL 转换 ─────────────────────────────────────────────────────────────────
+
+_LOCAL_NOW = "datetime('now', 'localtime')"
+_LOCAL_TODAY = "date('now', 'localtime')"
+
+
+def _split_top_level(body: str) -> List[str]:
+    """按顶层逗号切分（忽略括号与引号内的逗号）"""
+    parts, depth, quote, start = [], 0, None, 0
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(body[start:i].strip())
+            start = i + 1
+        i += 1
+    parts.append(body[start:].strip())
+    return [p for p in parts if p]
+
+
+_COMMENT_RE = re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.|'')*'", re.I)
+_INDEX_RE = re.compile(r'^(?:INDEX|KEY)\s+`?(\w+)`?\s*(\(.*\))$', re.I | re.S)
+_UNIQUE_RE = re.compile(r'^UNIQUE\s+(?:KEY|INDEX)\s+`?\w+`?\s*(\(.*\))$', re.I | re.S)
+
+
+def _translate_column(item: str) -> str:
+    item = _COMMENT_RE.sub('', item)
+    item = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', item, flags=re.I)
+    item = re.sub(r'\s+(?:CHARACTER\s+SET|COLLATE)\s+\w+', '', item, flags=re.I)
+    item = re.sub(r'\bUNSIGNED\b', '', item, flags=re.I)
+    item = re.sub(r'\bENUM\s*\([^)]*\)', 'TEXT', item, flags=re.I)
+    item = re.sub(r'DEFAULT\s+CURRENT_TIMESTAMP', f'DEFAULT ({_LOCAL_NOW})', item, flags=re.I)
+    if re.search(r'\bAUTO_INCREMENT\b', item, re.I):
+        name = item.split()[0]
+        return f'{name} INTEGER PRIMARY KEY AUTOINCREMENT'
+    if re.search(r'\bPRIMARY\s+KEY\b', item, re.I) and not re.search(r'\bNOT\s+NULL\b', item, re.I):
+        # MySQL 主键隐含 NOT NULL；SQLite 非整数主键允许 NULL（历史兼容行为），需显式声明
+        item = re.sub(r'\bPRIMARY\s+KEY\b', 'NOT NULL PRIMARY KEY', item, flags=re.I)
+    return item
+
+
+def _index_columns(cols: str) -> str:
+    """去掉 MySQL 前缀索引长度：(title(200)) → (title)"""
+    return re.sub(r'`?(\w+)`?\s*\(\d+\)', r'\1', cols)
+
+
+def _translate_create_table(sql: str) -> List[str]:
+    m = re.match(r'\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*\((.*)\)[^)]*$', sql, re.I | re.S)
+    if not m:
+        return [sql]
+    if_not_exists, table, body = m.group(1) or '', m.group(2), m.group(3)
+    columns, indexes = [], []
+    for item in _split_top_level(body):
+        im = _INDEX_RE.match(item)
+        if im:
+            indexes.append(f'CREATE INDEX IF NOT EXISTS {table}_{im.group(1)} ON {table} {_index_columns(im.group(2))}')
+            continue
+        um = _UNIQUE_RE.match(item)
+        if um:
+            columns.append(f'UNIQUE {_index_columns(um.group(1))}')
+            continue
+        if re.match(r'^FULLTEXT\b', item, re.I):
+            continue
+        columns.append(_translate_column(item))
+    create = f'CREATE TABLE {if_not_exists}{table} (\n    ' + ',\n    '.join(columns) + '\n)'
+    return [create] + indexes
+
+
+def _translate_alter(sql: str) -> List[str]:
+    m = re.match(r'\s*ALTER\s+TABLE\s+`?(\w+)`?\s+(.*)$', sql, re.I | re.S)
+    if not m:
+        return [sql]
+    table = m.group(1)
+    out = []
+    for clause in _split_top_level(m.group(2)):
+        if re.match(r'^ADD\s+(COLUMN\s+)?', clause, re.I):
+            col = re.sub(r'^ADD\s+(COLUMN\s+)?', '', clause, flags=re.I)
+            out.append(f'ALTER TABLE {table} ADD COLUMN {_translate_column(col)}')
+        # MODIFY / CHANGE COLUMN：SQLite 列类型与可空性由应用层保证，跳过
+    return out
+
+
+def _translate_dml(sql: str) -> str:
+    sql = re.sub(r'\bINSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.I)
+    dup = re.search(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', sql, re.I)
+    if dup:
+        tail = re.sub(r'\bVALUES\s*\(\s*`?(\w+)`?\s*\)', r'excluded.\1', sql[dup.end():], flags=re.I)
+        sql = sql[:dup.start()] + 'ON CONFLICT DO UPDATE SET' + tail
+    sql = re.sub(
+        r'DATE_SUB\(\s*(CURDATE|NOW)\(\)\s*,\s*INTERVAL\s+(%s|\d+)\s+DAY\s*\)',
+        lambda m: (f"{'date' if m.group(1).upper() == 'CURDATE' else 'datetime'}"
+                   f"('now', 'localtime', '-' || {m.group(2)} || ' days')"),
+        sql, flags=re.I)
+    sql = re.sub(r'\bNOW\(\)', _LOCAL_NOW, sql, flags=re.I)
+    sql = re.sub(r'\bCURDATE\(\)', _LOCAL_TODAY, sql, flags=re.I)
+    sql = re.sub(r'\bIF\(', 'IIF(', sql)
+    sql = re.sub(r'\bAS\s+(?:UNSIGNED|SIGNED)\b', 'AS INTEGER', sql, flags=re.I)
+    m = re.match(r'\s*DELETE\s+FROM\s+`?(\w+)`?\s+WHERE\s+(.*?)\s+LIMIT\s+(%s|\d+)\s*$', sql, re.I | re.S)
+    if m:
+        sql = (f'DELETE FROM {m.group(1)} WHERE rowid IN '
+               f'(SELECT rowid FROM {m.group(1)} WHERE {m.group(2)} LIMIT {m.group(3)})')
+    if re.match(r'\s*OPTIMIZE\s+TABLE\b', sql, re.I):
+        sql = 'VACUUM'
+    return sql
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str, has_args: bool = True) -> tuple:
+    """MySQL 方言 SQL → SQLite 语句元组（建表 / ALTER 可能拆成多条）"""
+    head = sql.lstrip()[:20].upper()
+    if head.startswith('CREATE TABLE'):
+        stmts = _translate_create_table(sql)
+    elif head.startswith('ALTER TABLE'):
+        stmts = _translate_alter(sql)
+    else:
+        stmts = [_translate_dml(sql)]
+    if has_args:
+        stmts = [s.replace('%s', '?').replace('%%', '%') for s in stmts]
+    return tuple(stmts)
+
+
+# ─── 连接 / 游标 ───────────────────────────────────────────────────────────────
+
+def _dict_row(cursor, row):
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """仿 pymysql DictCursor：execute / executemany / fetchone / fetchall / rowcount / lastrowid"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._cur = conn.cursor()
+        self.rowcount = -1
+
+    def execute(self, sql: str, args: Optional[Sequence[Any]] = None) -> int:
+        stmts = translate(sql, args is not None)
+        for stmt in stmts:
+            if args is not None and '?' in stmt:
+                self._cur.execute(stmt, tuple(args))
+            else:
+                self._cur.execute(stmt)
+        self.rowcount = self._cur.rowcount
+        return self.rowcount
+
+    def executemany(self, sql: str, seq_of_args) -> int:
+        seq = [tuple(a) for a in seq_of_args]
+        if not seq:
+            self.rowcount = 0
+            return 0
+        (stmt,) = translate(sql, True)
+        self._cur.executemany(stmt, seq)
+        self.rowcount = self._cur.rowcount
+        return self.rowcount
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size)
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection:
+    """仿 pymysql 连接（autocommit=False）；可交给 utils.db_pool.ConnectionPool 复用"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._conn.row_factory = _dict_row
+        self._conn.create_function('REGEXP', 2, _regexp, deterministic=True)
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'foreign_keys=ON',
+                       f'busy_timeout={BUSY_TIMEOUT_MS}'):
+            self._conn.execute(f'PRAGMA {pragma}')
+        self.open = True
+
+    def cursor(self) -> SQLiteCursor:
+        return SQLiteCursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect: bool = False):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._conn.close()
+
+
+def connect(path: str) -> SQLiteConnection:
+    return SQLiteConnection(path)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+股票搜索内存索引
+================
+
+stocks 表的 LIKE '%kw%' 无法走索引，每次按键都全表扫描。本模块把全部股票装进进程内索引：
+
+- 前缀索引：代码、拼音首字母、名称各一张有序键表，bisect 定位前缀区间（等价于前缀 trie，更省内存）
+- 子串索引：名称 / 拼音 / 首字母的全部后缀（名称 n-gram）放进一张有序表，子串查询 = 后缀前缀查询
+
+匹配与排序规则与原 SQL 一致（大小写不敏感，同 utf8mb4 默认排序规则）：
+    0 代码完全相等  1 代码前缀  2 首字母完全相等  3 首字母前缀  4 名称前缀  5 名称 / 拼音 / 首字母包含
+同一档内按代码升序。原 SQL 的 WHERE 不含代码前缀，这里补上（排序档位本就为它预留）。
+
+按档位依次取结果，凑够 limit 即停，常见查询只需查前缀表。
+"""
+
+import heapq
+from bisect import bisect_left
+from typing import Dict, Iterable, List
+
+_FIELDS = ('code', 'name', 'pinyin', 'pinyin_abbr', 'market_type', 'sector')
+_KEY_END = '\U0010ffff'
+
+
+class _KeyTable:
+    """有序 (键, 行号) 表，支持前缀区间查询。"""
+
+    def __init__(self, pairs: Iterable[tuple]):
+        pairs = sorted(set(pairs))
+        self.keys = [k for k, _ in pairs]
+        self.rows = [i for _, i in pairs]
+
+    def prefix(self, kw: str) -> List[int]:
+        lo = bisect_left(self.keys, kw)
+        hi = bisect_left(self.keys, kw + _KEY_END, lo)
+        return self.rows[lo:hi]
+
+    def exact(self, kw: str) -> List[int]:
+        lo = bisect_left(self.keys, kw)
+        hi = lo
+        while hi < len(self.keys) and self.keys[hi] == kw:
+            hi += 1
+        return self.rows[lo:hi]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class StockSearchIndex:
+    """只读股票搜索索引；刷新时整体重建后替换引用，查询无需加锁。"""
+
+    def __init__(self, stocks: Iterable[Dict]):
+        rows = sorted(({f: s.get(f) for f in _FIELDS} for s in stocks if s.get('code')),
+                      key=lambda s: s['code'])
+        self._stocks = rows
+        code, abbr, name, sub = [], [], [], []
+        for i, s in enumerate(rows):
+            code.append((str(s['code']).lower(), i))
+            a = (s.get('pinyin_abbr') or '').lower()
+            n = (s.get('name') or '').lower()
+            if a:
+                abbr.append((a, i))
+            if n:
+                name.append((n, i))
+            for text in (n, (s.get('pinyin') or '').lower(), a):
+                sub.extend((text[j:], i) for j in range(len(text)))
+        self._code = _KeyTable(code)
+        self._abbr = _KeyTable(abbr)
+        self._name = _KeyTable(name)
+        self._sub = _KeyTable(sub)
+
+    def __len__(self):
+        return len(self._stocks)
+
+    def stats(self) -> Dict[str, int]:
+        return {'stocks': len(self._stocks), 'code_keys': len(self._code), 'abbr_keys': len(self._abbr),
+                'name_keys': len(self._name), 'substring_keys': len(self._sub)}
+
+    def search(self, keyword: str, limit: int = 20) -> List[Dict]:
+        """返回 [{code, name, pinyin, pinyin_abbr, market_type, sector}, ...]，排序同原 SQL。"""
+        kw = (keyword or '').strip().lower()
+        if not kw or limit <= 0:
+            return []
+
+        picked: List[int] = []
+        seen = set()
+
+        def take(idxs):
+            """把本档命中按代码（行号）升序追加，只取还差的条数"""
+            need = limit - len(picked)
+            for i in heapq.nsmallest(need, set(idxs).difference(seen)):
+                seen.add(i)
+                picked.append(i)
+            return len(picked) >= limit
+
+        # 代码前缀区间本身按代码有序，只需前 limit + 1 条（可能含已取的完全相等项）
+        tiers = (
+            lambda: self._code.exact(kw),                   # 0 代码相等
+            lambda: self._code.prefix(kw)[:limit + 1],      # 1 代码前缀
+            lambda: self._abbr.exact(kw),                   # 2 首字母相等
+            lambda: self._abbr.prefix(kw),                  # 3 首字母前缀
+            lambda: self._name.prefix(kw),                  # 4 名称前缀
+            lambda: self._sub.prefix(kw),                   # 5 名称 / 拼音 / 首字母包含
+        )
+        for tier in tiers:
+            if take(tier()):
+                break
+        return [dict(self._stocks[i]) for i in picked[:limit]]
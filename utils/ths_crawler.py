@@ -21,6 +21,8 @@ import pandas as pd
 import threading
 from typing import List, Dict, Optional, Tuple
 
+from utils.data_replay import http_get, wrap_akshare
+
 # Lazy import of akshare to avoid py_mini_racer crash on import
 def _get_ak():
     global ak
@@ -28,7 +30,7 @@ def _get_ak():
         import akshare as ak
     except Exception:
         import akshare as ak
-    return ak
+    return wrap_akshare(ak)
 
 
 # ──────────────────────────── 代理绕过 ──────────────────────────────────
@@ -257,7 +259,7 @@ def _fetch_em2(stock_code: str, days: int, interval: str = 'daily') -> Optional[
             'end': '20500101',
             'lmt': str(days),
         }
-        r = requests.get(url, params=params, timeout=10)
+        r = http_get(url, params=params, timeout=10)
         r.raise_for_status()
         json_data = r.json()
         klines = (json_data.get('data', {}) or {}).get('klines', []) or []
@@ -367,9 +369,8 @@ def fetch_ths_industry_stocks(industry_code: str, industry_name: str = '') -> Li
 
     try:
         time.sleep(random.uniform(0.3, 0.8))
-        resp = requests.get(url, headers=HEADERS, timeout=15)
+        resp = http_get(url, headers=HEADERS, timeout=15, encoding='gbk')
         resp.raise_for_status()
-        resp.encoding = 'gbk'
 
         from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, 'html.parser')
@@ -503,7 +504,7 @@ def get_today_realtime_bar(stock_code: str) -> Optional[Dict]:
             'User-Agent': 'Mozilla/5.0',
         }
         with _requests_no_proxy() as s:
-            resp = s.get(url, params=params, headers=headers, timeout=8)
+            resp = http_get(url, session=s, params=params, headers=headers, timeout=8)
         json_data = resp.json()
         data = json_data.get('data') or {}
         # 提取当日 K 线数据字段
@@ -749,9 +750,8 @@ def _get_ths_industry_list() -> pd.DataFrame:
     url = 'https://q.10jqka.com.cn/thshy/'
 
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=15)
+        resp = http_get(url, headers=HEADERS, timeout=15, encoding='gbk')
         resp.raise_for_status()
-        resp.encoding = 'gbk'
 
         from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, 'html.parser')
@@ -850,9 +850,8 @@ def get_ths_concept_list() -> pd.DataFrame:
     url = 'https://q.10jqka.com.cn/thsgn/'
 
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=15)
+        resp = http_get(url, headers=HEADERS, timeout=15, encoding='gbk')
         resp.raise_for_status()
-        resp.encoding = 'gbk'
 
         from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, 'html.parser')
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库异步写队列（write-behind）
+================================
+
+K 线缓存回写、新闻入库、扫描进度这类写入失败不影响结果，却在请求 / 扫描线程里同步等待数据库。
+本模块把它们放进进程内队列，由后台线程攒批写入：
+
+- 合并：同一 (kind, key) 未写入前再次提交，只保留最新参数（last-write-wins），保持原排队位置
+- 攒批：每批最多 batch_size 条，满批或等待 flush_interval 秒后写入；同类写入注册了
+  write_many 时一次批量写（如 executemany），失败再逐条重试
+- 背压：积压达到 max_pending 时新 key 改为在调用线程同步写，不丢数据、内存有上限
+- 关闭：进程退出（atexit）时写完队列；flush() 可显式等待队列清空
+- 指标：队列深度、峰值、合并次数、批次数、失败次数（见 stats()）
+
+只在本进程内可见，未写入的数据可通过 peek() 读到；跨 worker 的读方在写入前读不到（缓存未命中时重算）。
+同一 key 另有同步写入路径时，同步写前调用 supersede()，避免排队中的旧值随后覆盖新值。
+与具体写入函数无关，写失败只记日志，不向提交方抛异常。
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """按 (kind, key) 合并的有界异步写队列，单后台线程写入。"""
+
+    def __init__(self, max_pending: int = 5000, batch_size: int = 200, flush_interval: float = 0.5):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writers: Dict[str, tuple] = {}
+        self._pending: OrderedDict = OrderedDict()    # (kind, key) → args
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._inflight_keys: Dict[tuple, int] = {}    # 正在写入的 (kind, key) → 条数
+        self._flushing = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._atexit = False
+        self._pid = os.getpid()
+        self._stats = {
+            'submitted': 0, 'coalesced': 0, 'written': 0, 'failed': 0, 'batches': 0,
+            'sync_writes': 0, 'peak_depth': 0, 'write_ms_total': 0.0,
+        }
+        self._last_error: Optional[str] = None
+
+    def register(self, kind: str, write_one: Callable, write_many: Optional[Callable[[List[tuple]], Any]] = None):
+        """注册一类写入：write_one(*args) 单条写；write_many([args, ...]) 可选的批量写"""
+        self._writers[kind] = (write_one, write_many)
+
+    # ── 提交 / 查询 ─────────────────────────────────────────────────────────
+
+    def submit(self, kind: str, key: Any, *args) -> bool:
+        """
+        提交一次写入。返回 True 表示已入队；False 表示队列已满 / 已关闭，已在当前线程同步写完。
+        """
+        if kind not in self._writers:
+            raise KeyError(f'未注册的写入类型: {kind}')
+        item = (kind, key)
+        with self._cond:
+            self._check_fork()
+            queued = not self._closed and (item in self._pending or len(self._pending) < self.max_pending)
+            if queued:
+                if item in self._pending:
+                    self._stats['coalesced'] += 1
+                self._pending[item] = args
+                self._stats['submitted'] += 1
+                self._stats['peak_depth'] = max(self._stats['peak_depth'], len(self._pending))
+                self._ensure_worker()
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+            else:
+                self._stats['sync_writes'] += 1
+        if not queued:
+            self._write_batch([(kind, key, args)])
+        return queued
+
+    def peek(self, kind: str, key: Any) -> Optional[tuple]:
+        """尚未写入的最新参数（读己之写）；不在队列中返回 None"""
+        with self._cond:
+            return self._pending.get((kind, key))
+
+    def discard(self, kind: str, key: Any) -> bool:
+        """撤销尚未写入的一项（后续同步写会覆盖它时使用）"""
+        with self._cond:
+            return self._pending.pop((kind, key), None) is not None
+
+    def supersede(self, kind: str, key: Any, timeout: float = 10) -> bool:
+        """
+        同步写同一 key 之前调用：撤销排队中的旧值，并等待正在写入的旧值落库，
+        保证随后的同步写不会被旧值覆盖。返回是否撤销了排队项。
+        """
+        item = (kind, key)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            dropped = self._pending.pop(item, None) is not None
+            while self._inflight_keys.get(item):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning('[WriteBehind] 等待 %s 写入超时', item)
+                    break
+                self._cond.wait(remaining)
+            return dropped
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._inflight
+
+    # ── 刷新 / 关闭 ─────────────────────────────────────────────────────────
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的写入全部完成；超时返回 False"""
+        if self._closed:
+            return self.close(10 if timeout is None else timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._check_fork()
+            if self._pending:
+                self._ensure_worker()
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._inflight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: float = 10) -> bool:
+        """停止后台线程并写完队列；之后的提交改为同步写"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        # 后台线程未启动 / 已退出时由当前线程写完剩余部分
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                break
+            self._write_batch(batch)
+            with self._cond:
+                self._done_batch(batch)
+        with self._cond:
+            left = len(self._pending) + self._inflight
+        if left:
+            logger.warning('[WriteBehind] 关闭时仍有 %d 条未写入', left)
+        return not left
+
+    # ── 内部 ────────────────────────────────────────────────────────────────
+
+    def _check_fork(self):
+        """fork 后队列内容归父进程写入，子进程丢弃副本、重新起后台线程"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._pending.clear()
+            self._inflight = 0
+            self._inflight_keys.clear()
+            self._thread = None
+
+    def _worker_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_worker(self):
+        if self._closed or self._worker_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+        if not self._atexit:
+            atexit.register(self.close)
+            self._atexit = True
+
+    def _take_batch(self) -> List[tuple]:
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            (kind, key), args = self._pending.popitem(last=False)
+            batch.append((kind, key, args))
+            self._inflight_keys[(kind, key)] = self._inflight_keys.get((kind, key), 0) + 1
+        self._inflight += len(batch)
+        return batch
+
+    def _done_batch(self, batch: List[tuple]):
+        """批次写完（持锁调用）"""
+        self._inflight -= len(batch)
+        for kind, key, _ in batch:
+            item = (kind, key)
+            n = self._inflight_keys.get(item, 0) - 1
+            if n > 0:
+                self._inflight_keys[item] = n
+            else:
+                self._inflight_keys.pop(item, None)
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # 攒批窗口：未满批时再等一会儿，让同 key 的后续写入合并进来
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed and not self._flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._done_batch(batch)
+
+    def _write_batch(self, batch: List[tuple]):
+        """按类型分组写入；批量写失败时逐条重试，单条失败只计数"""
+        start = time.perf_counter()
+        groups: Dict[str, List[tuple]] = {}
+        for kind, _, args in batch:
+            groups.setdefault(kind, []).append(args)
+        written = failed = 0
+        for kind, rows in groups.items():
+            write_one, write_many = self._writers[kind]
+            if write_many is not None and len(rows) > 1:
+                try:
+                    write_many(rows)
+                    written += len(rows)
+                    continue
+                except Exception as e:
+                    logger.warning('[WriteBehind] %s 批量写入失败，逐条重试: %s', kind, e)
+            for args in rows:
+                try:
+                    write_one(*args)
+                    written += 1
+                except Exception as e:
+                    failed += 1
+                    self._last_error = f'{kind}: {e}'
+                    logger.warning('[WriteBehind] %s 写入失败: %s', kind, e)
+        with self._cond:
+            self._stats['written'] += written
+            self._stats['failed'] += failed
+            self._stats['batches'] += 1
+            self._stats['write_ms_total'] += (time.perf_counter() - start) * 1000
+
+    def stats(self) -> dict:
+        with self._cond:
+            st = dict(self._stats)
+            by_kind: Dict[str, int] = {}
+            for kind, _ in self._pending:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+            st.update({
+                'pid': self._pid,
+                'depth': len(self._pending),
+                'in_flight': self._inflight,
+                'depth_by_kind': by_kind,
+                'max_pending': self.max_pending,
+                'worker_alive': self._worker_alive(),
+                'closed': self._closed,
+                'write_ms_avg': round(st['write_ms_total'] / st['batches'], 3) if st['batches'] else 0.0,
+                'write_ms_total': round(st['write_ms_total'], 3),
+                'last_error': self._last_error,
+            })
+        return st